@@ -0,0 +1,138 @@
+"""add materialized tracker_last_position table
+
+Revision ID: 0020_tracker_last_position
+Revises: 0019_alert_subscriptions
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0020_tracker_last_position"
+down_revision = "0019_alert_subscriptions"
+branch_labels = None
+depends_on = None
+
+
+_NUMERIC_DIAG = (
+    ("confidence", float),
+    ("matches", int),
+    ("matches_wifi", int),
+    ("matches_cell", int),
+    ("rssi_diff_avg_db", float),
+    ("cell_diff_avg_db", float),
+    ("tiles_considered", int),
+    ("spread_m", float),
+    ("anchors_considered", int),
+    ("clusters_total", int),
+    ("clusters_used", int),
+)
+
+
+def _float_or_none(v):
+    try:
+        return float(v) if v is not None else None
+    except Exception:
+        return None
+
+
+def _row_from_point(r) -> dict:
+    try:
+        meta = json.loads(r.raw_json) if r.raw_json else {}
+        if not isinstance(meta, dict):
+            meta = {}
+    except Exception:
+        meta = {}
+
+    flags = meta.get("flags") or []
+    src = meta.get("src") or meta.get("source")
+    if not src:
+        src = "wifi_est" if r.kind == "est" else (str(r.kind) if r.kind else "app")
+
+    extra = {}
+    for k, cast in _NUMERIC_DIAG:
+        if k in meta:
+            try:
+                extra[k] = cast(meta.get(k))
+            except Exception:
+                extra[k] = meta.get(k)
+    for k in ("method", "tile_id", "anchor_ts"):
+        if k in meta:
+            extra[k] = str(meta.get(k))
+
+    device_id = meta.get("device_id")
+    return {
+        "user_id": r.user_id,
+        "device_id": str(device_id)[:32] if device_id else None,
+        "session_id": r.session_id,
+        "ts": r.ts,
+        "lat": r.lat,
+        "lon": r.lon,
+        "accuracy_m": r.accuracy_m,
+        "kind": r.kind,
+        "speed_mps": _float_or_none(meta.get("speed_mps")),
+        "bearing_deg": _float_or_none(meta.get("bearing_deg")),
+        "flags_json": json.dumps(flags if isinstance(flags, list) else [], ensure_ascii=False),
+        "source": str(src)[:32],
+        "extra_json": json.dumps(extra, ensure_ascii=False) if extra else None,
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+def upgrade() -> None:
+    table = op.create_table(
+        "tracker_last_position",
+        sa.Column("user_id", sa.String(length=32), nullable=False),
+        sa.Column("device_id", sa.String(length=32), nullable=True),
+        sa.Column("session_id", sa.Integer(), nullable=True),
+        sa.Column("ts", sa.DateTime(), nullable=True),
+        sa.Column("lat", sa.Float(), nullable=True),
+        sa.Column("lon", sa.Float(), nullable=True),
+        sa.Column("accuracy_m", sa.Float(), nullable=True),
+        sa.Column("kind", sa.String(length=16), nullable=True),
+        sa.Column("speed_mps", sa.Float(), nullable=True),
+        sa.Column("bearing_deg", sa.Float(), nullable=True),
+        sa.Column("flags_json", sa.Text(), nullable=True),
+        sa.Column("source", sa.String(length=32), nullable=True),
+        sa.Column("extra_json", sa.Text(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_index("ix_tracker_last_position_device_id", "tracker_last_position", ["device_id"], unique=False)
+    op.create_index("ix_tracker_last_position_ts", "tracker_last_position", ["ts"], unique=False)
+
+    # backfill: последняя точка (с координатами) на пользователя; точки без ts —
+    # только если других нет (в Postgres NULL при DESC иначе идёт первым)
+    bind = op.get_bind()
+    res = bind.execute(sa.text(
+        """
+        SELECT user_id, session_id, ts, lat, lon, accuracy_m, kind, raw_json
+        FROM (
+            SELECT user_id, session_id, ts, lat, lon, accuracy_m, kind, raw_json,
+                   row_number() OVER (PARTITION BY user_id ORDER BY ts DESC NULLS LAST, id DESC) AS rn
+            FROM tracking_points
+            WHERE lat IS NOT NULL AND lon IS NOT NULL
+        ) t
+        WHERE rn = 1
+        """
+    ).columns(ts=sa.DateTime()))
+    batch = []
+    for r in res.fetchall():
+        batch.append(_row_from_point(r))
+        if len(batch) >= 1000:
+            op.bulk_insert(table, batch)
+            batch = []
+    if batch:
+        op.bulk_insert(table, batch)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tracker_last_position_ts", table_name="tracker_last_position")
+    op.drop_index("ix_tracker_last_position_device_id", table_name="tracker_last_position")
+    op.drop_table("tracker_last_position")
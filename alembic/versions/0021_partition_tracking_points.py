@@ -0,0 +1,213 @@
+"""range-partition tracking_points and tracker_device_health_log by ts (Postgres)
+
+Revision ID: 0021_partition_tracking_points
+Revises: 0020_tracker_last_position
+Create Date: 2026-10-18
+
+На Postgres обе таблицы пересоздаются как ``PARTITION BY RANGE (ts)``:
+- партиции по дню или неделе (TRACKING_PARTITION_INTERVAL=day|week),
+  от самой старой точки (не глубже _MAX_BACKFILL_PERIODS периодов) до
+  TRACKING_PARTITION_PREMAKE периодов вперёд, плюс ``<table>_default``;
+- PK становится (id, ts) — ключ партиционирования обязан входить в PK;
+- данные переливаются INSERT .. SELECT, индексы пересоздаются теми же именами.
+
+Дальше партиции создаёт/удаляет app.maintenance.partitions (retention).
+На SQLite и прочих СУБД миграция ничего не делает.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0021_partition_tracking_points"
+down_revision = "0020_tracker_last_position"
+branch_labels = None
+depends_on = None
+
+
+_TABLES = ("tracking_points", "tracker_device_health_log")
+
+# старее — в default-партицию (её чистит retention обычным DELETE)
+_MAX_BACKFILL_PERIODS = 400
+
+
+def _interval() -> str:
+    v = (os.environ.get("TRACKING_PARTITION_INTERVAL") or "day").strip().lower()
+    return "week" if v.startswith("week") else "day"
+
+
+def _period_start(dt: datetime, interval: str) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    d = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "week":
+        d -= timedelta(days=d.weekday())
+    return d
+
+
+def _step(interval: str) -> timedelta:
+    return timedelta(days=7 if interval == "week" else 1)
+
+
+def _is_partitioned(conn, table: str) -> bool:
+    return conn.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :t AND pg_table_is_visible(c.oid)"
+    ), {"t": table}).first() is not None
+
+
+def _table_exists(conn, table: str) -> bool:
+    return conn.execute(sa.text("SELECT to_regclass(:t)"), {"t": table}).scalar() is not None
+
+
+def _columns(conn, table: str) -> list:
+    rows = conn.execute(sa.text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = :t AND table_schema = current_schema() ORDER BY ordinal_position"
+    ), {"t": table}).all()
+    return [r[0] for r in rows]
+
+
+def _plain_indexes(conn, table: str) -> list:
+    """(name, indexdef) индексов, не обслуживающих PK/UNIQUE-констрейнты."""
+    return conn.execute(sa.text(
+        "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+        "WHERE i.tablename = :t AND i.schemaname = current_schema() "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = to_regclass(quote_ident(i.indexname)))"
+    ), {"t": table}).all()
+
+
+def _index_columns(indexdef: str) -> list:
+    m = re.search(r"USING \w+ \((.*)\)", indexdef)
+    if not m:
+        return []
+    return [c.strip().split(" ")[0].strip('"') for c in m.group(1).split(",")]
+
+
+def _rename_indexes(conn, table: str, suffix: str) -> None:
+    rows = conn.execute(sa.text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :t AND schemaname = current_schema()"
+    ), {"t": table}).all()
+    for (name,) in rows:
+        new = (name[: 63 - len(suffix)] + suffix)
+        op.execute(f'ALTER INDEX "{name}" RENAME TO "{new}"')
+
+
+def _serial_sequence(conn, table: str):
+    return conn.execute(sa.text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table}).scalar()
+
+
+def _partition_table(conn, table: str) -> None:
+    if not _table_exists(conn, table) or _is_partitioned(conn, table):
+        return
+
+    interval = _interval()
+    step = _step(interval)
+    premake = int(os.environ.get("TRACKING_PARTITION_PREMAKE") or 7)
+    legacy = f"{table}_legacy"
+
+    indexes = _plain_indexes(conn, table)
+    cols = _columns(conn, table)
+    seq = _serial_sequence(conn, table)
+    min_ts = conn.execute(sa.text(f'SELECT min(ts) FROM "{table}"')).scalar()
+
+    op.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+    _rename_indexes(conn, legacy, "_legacy")
+    if seq:
+        # sequence принадлежит колонке legacy-таблицы; отвязываем, иначе DROP её удалит
+        op.execute(f"ALTER SEQUENCE {seq} OWNED BY NONE")
+
+    op.execute(f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) PARTITION BY RANGE (ts)')
+    op.execute(f'ALTER TABLE "{table}" ALTER COLUMN ts SET NOT NULL')
+    op.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, ts)')
+    if table == "tracking_points":
+        op.execute(
+            'ALTER TABLE "tracking_points" ADD CONSTRAINT "uq_tracking_points_session_ts_kind" '
+            "UNIQUE (session_id, ts, kind)"
+        )
+        op.execute(
+            'ALTER TABLE "tracking_points" ADD CONSTRAINT "tracking_points_session_id_fkey" '
+            "FOREIGN KEY (session_id) REFERENCES tracking_sessions (id)"
+        )
+    for _name, indexdef in indexes:
+        if " UNIQUE " in indexdef.upper() and "ts" not in _index_columns(indexdef):
+            # уникальный индекс без ключа партиционирования на партиционированной таблице невозможен
+            continue
+        op.execute(indexdef)
+
+    op.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+    now_start = _period_start(datetime.now(timezone.utc), interval)
+    lo = _period_start(min_ts, interval) if min_ts else now_start
+    lo = max(lo, now_start - step * _MAX_BACKFILL_PERIODS)
+    end = now_start + step * (premake + 1)
+    while lo < end:
+        hi = lo + step
+        op.execute(
+            f'CREATE TABLE "{table}_p{lo:%Y%m%d}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{lo:%Y-%m-%d %H:%M:%S}') TO ('{hi:%Y-%m-%d %H:%M:%S}')"
+        )
+        lo = hi
+
+    col_list = ", ".join(f'"{c}"' for c in cols)
+    select_list = ", ".join("COALESCE(ts, now() AT TIME ZONE 'utc')" if c == "ts" else f'"{c}"' for c in cols)
+    op.execute(f'INSERT INTO "{table}" ({col_list}) SELECT {select_list} FROM "{legacy}"')
+    op.execute(f'DROP TABLE "{legacy}"')
+    if seq:
+        op.execute(f'ALTER SEQUENCE {seq} OWNED BY "{table}".id')
+
+
+def _unpartition_table(conn, table: str) -> None:
+    if not _table_exists(conn, table) or not _is_partitioned(conn, table):
+        return
+
+    part = f"{table}_part"
+    indexes = _plain_indexes(conn, table)
+    cols = _columns(conn, table)
+    seq = _serial_sequence(conn, table)
+
+    op.execute(f'ALTER TABLE "{table}" RENAME TO "{part}"')
+    _rename_indexes(conn, part, "_part")
+    if seq:
+        op.execute(f"ALTER SEQUENCE {seq} OWNED BY NONE")
+
+    op.execute(f'CREATE TABLE "{table}" (LIKE "{part}" INCLUDING DEFAULTS)')
+    op.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id)')
+    if table == "tracking_points":
+        op.execute(
+            'ALTER TABLE "tracking_points" ADD CONSTRAINT "uq_tracking_points_session_ts_kind" '
+            "UNIQUE (session_id, ts, kind)"
+        )
+        op.execute(
+            'ALTER TABLE "tracking_points" ADD CONSTRAINT "tracking_points_session_id_fkey" '
+            "FOREIGN KEY (session_id) REFERENCES tracking_sessions (id)"
+        )
+    for _name, indexdef in indexes:
+        op.execute(indexdef)
+
+    col_list = ", ".join(f'"{c}"' for c in cols)
+    op.execute(f'INSERT INTO "{table}" ({col_list}) SELECT {col_list} FROM "{part}"')
+    op.execute(f'DROP TABLE "{part}" CASCADE')
+    if seq:
+        op.execute(f'ALTER SEQUENCE {seq} OWNED BY "{table}".id')
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        return
+    for table in _TABLES:
+        _partition_table(conn, table)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        return
+    for table in _TABLES:
+        _unpartition_table(conn, table)
@@ -0,0 +1,141 @@
+"""promote speed/bearing/flags/src/confidence from raw_json to tracking_points columns
+
+Revision ID: 0022_tracking_point_columns
+Revises: 0021_partition_tracking_points
+Create Date: 2026-10-18
+
+flags хранится битовой маской (app.tracker.point_fields): jump=1, est=2.
+"""
+
+from __future__ import annotations
+
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0022_tracking_point_columns"
+down_revision = "0021_partition_tracking_points"
+branch_labels = None
+depends_on = None
+
+
+_FLAG_BITS = (("jump", 1), ("est", 2))
+
+
+def _float_or_none(v):
+    try:
+        return float(v) if v is not None else None
+    except Exception:
+        return None
+
+
+def _backfill_postgres() -> None:
+    # Безопасные парсеры: NULL для невалидного JSON/числа вместо ошибки.
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION _safe_text_to_jsonb(src text)
+        RETURNS jsonb
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            IF src IS NULL OR btrim(src) = '' THEN
+                RETURN NULL;
+            END IF;
+            RETURN src::jsonb;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END;
+        $$;
+        """
+    )
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION _safe_text_to_float(src text)
+        RETURNS double precision
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            RETURN src::double precision;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END;
+        $$;
+        """
+    )
+    flag_expr = " | ".join(
+        f"(CASE WHEN jsonb_typeof(j->'flags') = 'array' AND j->'flags' ? '{name}' THEN {bit} ELSE 0 END)"
+        for name, bit in _FLAG_BITS
+    )
+    op.execute(
+        f"""
+        UPDATE tracking_points AS tp
+        SET speed_mps = _safe_text_to_float(s.j->>'speed_mps'),
+            bearing_deg = _safe_text_to_float(s.j->>'bearing_deg'),
+            flags = {flag_expr},
+            src = left(NULLIF(COALESCE(NULLIF(s.j->>'src', ''), s.j->>'source'), ''), 32),
+            confidence = _safe_text_to_float(s.j->>'confidence')
+        FROM (
+            SELECT id, ts, _safe_text_to_jsonb(raw_json) AS j
+            FROM tracking_points
+            WHERE raw_json IS NOT NULL
+        ) s
+        WHERE tp.id = s.id AND tp.ts IS NOT DISTINCT FROM s.ts
+          AND s.j IS NOT NULL AND jsonb_typeof(s.j) = 'object'
+        """
+    )
+    op.execute("DROP FUNCTION IF EXISTS _safe_text_to_float(text);")
+    op.execute("DROP FUNCTION IF EXISTS _safe_text_to_jsonb(text);")
+
+
+def _backfill_generic() -> None:
+    # Fallback для SQLite/других БД в dev/test: разбираем Python-ом.
+    bind = op.get_bind()
+    rows = list(bind.execute(sa.text("SELECT id, raw_json FROM tracking_points WHERE raw_json IS NOT NULL")))
+    for row in rows:
+        try:
+            meta = json.loads(row[1]) if row[1] else {}
+        except Exception:
+            meta = {}
+        if not isinstance(meta, dict) or not meta:
+            continue
+        flags = meta.get("flags")
+        names = {str(f) for f in flags} if isinstance(flags, list) else set()
+        src = meta.get("src") or meta.get("source")
+        bind.execute(
+            sa.text(
+                "UPDATE tracking_points SET speed_mps = :speed, bearing_deg = :bearing, flags = :flags, "
+                "src = :src, confidence = :confidence WHERE id = :id"
+            ),
+            {
+                "speed": _float_or_none(meta.get("speed_mps")),
+                "bearing": _float_or_none(meta.get("bearing_deg")),
+                "flags": sum(bit for name, bit in _FLAG_BITS if name in names),
+                "src": str(src)[:32] if src else None,
+                "confidence": _float_or_none(meta.get("confidence")),
+                "id": row[0],
+            },
+        )
+
+
+def upgrade() -> None:
+    op.add_column("tracking_points", sa.Column("speed_mps", sa.Float(), nullable=True))
+    op.add_column("tracking_points", sa.Column("bearing_deg", sa.Float(), nullable=True))
+    op.add_column("tracking_points", sa.Column("flags", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("tracking_points", sa.Column("src", sa.String(length=32), nullable=True))
+    op.add_column("tracking_points", sa.Column("confidence", sa.Float(), nullable=True))
+
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        _backfill_postgres()
+    else:
+        _backfill_generic()
+
+
+def downgrade() -> None:
+    op.drop_column("tracking_points", "confidence")
+    op.drop_column("tracking_points", "src")
+    op.drop_column("tracking_points", "flags")
+    op.drop_column("tracking_points", "bearing_deg")
+    op.drop_column("tracking_points", "speed_mps")
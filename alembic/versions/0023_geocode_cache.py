@@ -0,0 +1,39 @@
+"""add persistent geocode_cache table for Nominatim results
+
+Revision ID: 0023_geocode_cache
+Revises: 0022_tracking_point_columns
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0023_geocode_cache"
+down_revision = "0022_tracking_point_columns"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "geocode_cache",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=8), nullable=False),
+        sa.Column("lang", sa.String(length=16), nullable=False),
+        sa.Column("query_key", sa.String(length=255), nullable=False),
+        sa.Column("results_json", sa.Text(), nullable=False),
+        sa.Column("fetched_limit", sa.Integer(), nullable=False),
+        sa.Column("fetched_at", sa.DateTime(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("kind", "lang", "query_key", name="uq_geocode_cache_key"),
+    )
+    op.create_index("ix_geocode_cache_expires_at", "geocode_cache", ["expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_geocode_cache_expires_at", table_name="geocode_cache")
+    op.drop_table("geocode_cache")
@@ -0,0 +1,51 @@
+"""add tile_download_jobs table for background offline tile downloads
+
+Revision ID: 0024_tile_download_jobs
+Revises: 0023_geocode_cache
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0024_tile_download_jobs"
+down_revision = "0023_geocode_cache"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tile_download_jobs",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("set_name", sa.String(length=64), nullable=False),
+        sa.Column("target_dir", sa.String(length=512), nullable=False),
+        sa.Column("params_json", sa.Text(), nullable=False),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.Column("cursor", sa.Integer(), nullable=False),
+        sa.Column("done", sa.Integer(), nullable=False),
+        sa.Column("downloaded", sa.Integer(), nullable=False),
+        sa.Column("skipped", sa.Integer(), nullable=False),
+        sa.Column("failed", sa.Integer(), nullable=False),
+        sa.Column("failed_json", sa.Text(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_by", sa.String(length=64), nullable=True),
+        sa.Column("worker", sa.String(length=128), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tile_download_jobs_status", "tile_download_jobs", ["status"], unique=False)
+    op.create_index("ix_tile_download_jobs_set_name", "tile_download_jobs", ["set_name"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tile_download_jobs_set_name", table_name="tile_download_jobs")
+    op.drop_index("ix_tile_download_jobs_status", table_name="tile_download_jobs")
+    op.drop_table("tile_download_jobs")
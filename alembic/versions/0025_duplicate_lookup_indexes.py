@@ -0,0 +1,45 @@
+"""add spatial and normalized-name indexes for duplicate detection
+
+Revision ID: 0025_duplicate_lookup_indexes
+Revises: 0024_tile_download_jobs
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0025_duplicate_lookup_indexes"
+down_revision = "0024_tile_download_jobs"
+branch_labels = None
+depends_on = None
+
+TABLES = ("addresses", "pending_markers")
+# должно совпадать с app.services.duplicate_service.PG_NAME_SQL
+NAME_SQL = "lower(btrim(regexp_replace(name, '\\s+', ' ', 'g')))"
+
+
+def upgrade() -> None:
+    # SQLite: дубликаты ищутся по сеточному индексу в памяти процесса
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    for table in TABLES:
+        # ST_DWithin(geom::geography, ..., метры) использует только индекс по выражению
+        op.execute(sa.text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_geog ON {table} USING GIST ((geom::geography))"
+        ))
+        op.execute(sa.text(f"CREATE INDEX IF NOT EXISTS ix_{table}_name_norm ON {table} (({NAME_SQL}))"))
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    for table in TABLES:
+        op.execute(sa.text(f"DROP INDEX IF EXISTS ix_{table}_name_norm"))
+        op.execute(sa.text(f"DROP INDEX IF EXISTS ix_{table}_geog"))
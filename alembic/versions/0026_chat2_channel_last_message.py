@@ -0,0 +1,46 @@
+"""denormalize last message id/preview onto chat2_channels
+
+Revision ID: 0026_chat2_channel_last_message
+Revises: 0025_duplicate_lookup_indexes
+Create Date: 2026-10-18
+
+Список каналов chat2 берёт превью из канала, а не запросом на канал
+(event_chat.unread). Существующие каналы заполняются по последнему сообщению.
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0026_chat2_channel_last_message"
+down_revision = "0025_duplicate_lookup_indexes"
+branch_labels = None
+depends_on = None
+
+# должно совпадать с event_chat.unread.PREVIEW_LEN
+PREVIEW_LEN = 200
+
+
+def upgrade() -> None:
+    op.add_column("chat2_channels", sa.Column("last_message_id", sa.String(length=36), nullable=True))
+    op.add_column("chat2_channels", sa.Column("last_message_preview", sa.String(length=256), nullable=True))
+
+    last = (
+        "(SELECT {expr} FROM chat2_messages m WHERE m.channel_id = chat2_channels.id "
+        "ORDER BY m.created_at DESC LIMIT 1)"
+    )
+    preview = f"substr(coalesce(m.text, m.kind, ''), 1, {PREVIEW_LEN})"
+    op.execute(sa.text(
+        "UPDATE chat2_channels SET "
+        f"last_message_id = {last.format(expr='m.id')}, "
+        f"last_message_preview = {last.format(expr=preview)} "
+        "WHERE last_message_at IS NOT NULL"
+    ))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("chat2_channels") as batch_op:
+        batch_op.drop_column("last_message_preview")
+        batch_op.drop_column("last_message_id")
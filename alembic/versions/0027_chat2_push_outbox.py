@@ -0,0 +1,50 @@
+"""chat2 push outbox
+
+Revision ID: 0027_chat2_push_outbox
+Revises: 0026_chat2_channel_last_message
+Create Date: 2026-10-18
+
+Push-уведомления chat2 отправляются не в HTTP-запросе, а фоновым
+воркером из этой очереди (event_chat.push_outbox).
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0027_chat2_push_outbox"
+down_revision = "0026_chat2_channel_last_message"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "chat2_push_outbox",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("channel_id", sa.String(length=36), nullable=False),
+        sa.Column("message_id", sa.String(length=36), nullable=True),
+        sa.Column("sender_type", sa.String(length=16), nullable=True),
+        sa.Column("sender_id", sa.String(length=64), nullable=True),
+        sa.Column("title", sa.String(length=256), nullable=False),
+        sa.Column("body", sa.Text, nullable=False),
+        sa.Column("data_json", sa.Text, nullable=True),
+        sa.Column("tokens_json", sa.Text, nullable=True),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("next_attempt_at", sa.DateTime, nullable=False),
+        sa.Column("claimed_by", sa.String(length=32), nullable=True),
+        sa.Column("locked_until", sa.DateTime, nullable=True),
+        sa.Column("last_error", sa.String(length=256), nullable=True),
+        sa.Column("created_at", sa.DateTime, nullable=False),
+    )
+    op.create_index("ix_chat2_push_outbox_status_next", "chat2_push_outbox", ["status", "next_attempt_at"])
+    op.create_index("ix_chat2_push_outbox_claimed_by", "chat2_push_outbox", ["claimed_by"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat2_push_outbox_claimed_by", table_name="chat2_push_outbox")
+    op.drop_index("ix_chat2_push_outbox_status_next", table_name="chat2_push_outbox")
+    op.drop_table("chat2_push_outbox")
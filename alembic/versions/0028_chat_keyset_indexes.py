@@ -0,0 +1,68 @@
+"""keyset indexes for chat history
+
+Revision ID: 0028_chat_keyset_indexes
+Revises: 0027_chat2_push_outbox
+Create Date: 2026-10-18
+
+История и синхронизация чатов листаются по ключу (created_at, id)
+(app.services.keyset). Индексы (<канал/диалог>, created_at) заменяются
+на (<канал/диалог>, created_at, id): страница — переход по индексу
+к позиции без сортировки и без дочитывания строк с равным created_at.
+"""
+
+from __future__ import annotations
+
+from alembic import op
+from sqlalchemy import inspect
+
+
+revision = "0028_chat_keyset_indexes"
+down_revision = "0027_chat2_push_outbox"
+branch_labels = None
+depends_on = None
+
+# (таблица, колонка-ключ, старый индекс, новый индекс)
+_INDEXES = (
+    ("chat2_messages", "channel_id", "ix_chat2_messages_channel_created", "ix_chat2_messages_channel_created_id"),
+    ("chat_messages", "user_id", "ix_chat_messages_user_created", "ix_chat_messages_user_created_id"),
+)
+
+
+def _table_exists(conn, name: str) -> bool:
+    try:
+        return name in inspect(conn).get_table_names()
+    except Exception:
+        return False
+
+
+def _index_exists(conn, table: str, index_name: str) -> bool:
+    try:
+        for ix in inspect(conn).get_indexes(table):
+            if ix.get("name") == index_name:
+                return True
+    except Exception:
+        return False
+    return False
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    for table, key, old, new in _INDEXES:
+        if not _table_exists(conn, table):
+            continue
+        if not _index_exists(conn, table, new):
+            op.create_index(new, table, [key, "created_at", "id"])
+        # новый индекс покрывает все запросы старого (тот же префикс)
+        if _index_exists(conn, table, old):
+            op.drop_index(old, table_name=table)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    for table, key, old, new in _INDEXES:
+        if not _table_exists(conn, table):
+            continue
+        if not _index_exists(conn, table, old):
+            op.create_index(old, table, [key, "created_at"])
+        if _index_exists(conn, table, new):
+            op.drop_index(new, table_name=table)
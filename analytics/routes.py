@@ -9,7 +9,7 @@ from datetime import datetime, timedelta, timezone
 from compat_flask import jsonify, make_response, request
 
 from . import bp
-from ..services.analytics_service import build_summary, build_audit_log, build_period_text
+from ..services.analytics_service import build_audit_log, get_period_text, get_summary
 
 
 @bp.get('/summary')
@@ -32,7 +32,7 @@ def summary():
         zone_val = int(zone_param) if zone_param else None
     except (ValueError, TypeError):
         zone_val = None
-    data = build_summary(days_val, zone_val)
+    data = get_summary(days_val, zone_val)
     return jsonify(data)
 
 
@@ -50,7 +50,7 @@ def text():
     except (ValueError, TypeError):
         days_val = 7
 
-    data = build_period_text(days_val)
+    data = get_period_text(days_val)
     return jsonify(data)
 
 
@@ -73,7 +73,7 @@ def summary_csv():
         zone_val = int(zone_param) if zone_param else None
     except (ValueError, TypeError):
         zone_val = None
-    data = build_summary(days_val, zone_val)
+    data = get_summary(days_val, zone_val)
 
     lines = []
     # Основные агрегаты
@@ -141,7 +141,7 @@ def summary_xlsx():
         zone_val = int(zone_param) if zone_param else None
     except (ValueError, TypeError):
         zone_val = None
-    data = build_summary(days_val, zone_val)
+    data = get_summary(days_val, zone_val)
 
     wb = Workbook()
     ws = wb.active
@@ -61,6 +61,10 @@ def create_app(config_class: type = Config) -> Flask:
     )
     app.config.from_object(config_class)
 
+    # кэши ответов (app.cache) живут в процессе — новое приложение начинает с пустых
+    from app.cache import reset as reset_response_caches
+    reset_response_caches()
+
     # ── Extensions ────────────────────────────────────────────
     from app.extensions import init_extensions
     init_extensions(app)
@@ -81,6 +85,7 @@ def create_app(config_class: type = Config) -> Flask:
     from app.duty import bp as duty_bp
     from app.event_chat import bp as event_chat_bp
     from app.general import bp as general_bp
+    from app.geo import bp as geo_bp
     from app.geocode import bp as geocode_bp
     from app.handshake import bp as handshake_bp
     from app.incidents import bp as incidents_bp
@@ -88,6 +93,7 @@ def create_app(config_class: type = Config) -> Flask:
     from app.notifications import bp as notifications_bp
     from app.objects import bp as objects_bp
     from app.offline import bp as offline_bp
+    from app.offline import tiles_bp
     from app.pending import bp as pending_bp
     from app.realtime import bp as realtime_bp
     from app.requests import bp as requests_bp
@@ -98,9 +104,9 @@ def create_app(config_class: type = Config) -> Flask:
 
     # Blueprints with url_prefix already set
     for bp_obj in [
-        admin_users_bp, analytics_bp, chat_bp, event_chat_bp,
+        admin_users_bp, analytics_bp, chat_bp, event_chat_bp, geo_bp,
         handshake_bp, incidents_bp, maintenance_bp, notifications_bp,
-        realtime_bp, terminals_bp, video_bp,
+        realtime_bp, terminals_bp, tiles_bp, video_bp,
     ]:
         app.register_blueprint(bp_obj)
 
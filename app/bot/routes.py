@@ -16,7 +16,6 @@ import tempfile
 from threading import Thread
 from typing import Any, Dict, List, Optional
 
-import requests
 from openai import OpenAI
 from compat_flask import Response, jsonify, request, current_app, render_template, g
 
@@ -26,13 +25,14 @@ from ..helpers import parse_coord, in_range
 from ..models import Address, PendingMarker, PendingHistory
 from ..extensions import db
 from ..db_compat import ensure_sqlite_schema_minimal
-from ..helpers import haversine_m  # для возможного использования
 
 from . import bp
 from ..sockets import broadcast_event_sync
 from ..security.api_keys import require_bot_api_key
 from ..security.rate_limit import check_rate_limit
 from ..services.ai_vision_service import analyze_incident_photo
+from ..services import duplicate_service, nominatim_service
+from ..services.geocode_service import search_offline
 from ..services.voice_service import enqueue_voice_incident
 from .middlewares.telegram_webapp_security import enforce_telegram_init_data, validate_telegram_init_data
 
@@ -184,59 +184,6 @@ def bot_voice_incident() -> Response:
     return jsonify(result), 202
 
 
-def find_duplicate_db(name: str, lat: Optional[float], lon: Optional[float], threshold_m: int = 100) -> Optional[Dict[str, Any]]:
-    """
-    Найти возможный дубликат среди существующих адресов и ожидающих заявок.
-
-    Поиск выполняется сначала среди адресов, затем среди pending‑заявок.
-    Критерии совпадения:
-      * если координаты переданы, используется расстояние по формуле haversine.
-        Если расстояние меньше threshold_m, считаем точку дубликатом.
-      * если координаты отсутствуют, сравниваем названия в нижнем регистре.
-
-    :param name: название новой точки
-    :param lat: широта (может быть None)
-    :param lon: долгота (может быть None)
-    :param threshold_m: максимальное расстояние для совпадения (метры)
-    :return: словарь {"type": "address"|"pending", "id": int} или None
-    """
-    nm = (name or '').strip().lower()
-    # Проверяем адреса. В старой схеме базы addresses.zone_id может отсутствовать,
-    # поэтому возможен OperationalError при выборке. Отлавливаем и игнорируем.
-    try:
-        addresses_list = Address.query.all()
-    except OperationalError:
-        addresses_list = []
-    for addr in addresses_list:
-        # Сравнение по координатам
-        if lat is not None and lon is not None and addr.lat is not None and addr.lon is not None:
-            try:
-                dist = haversine_m(lat, lon, float(addr.lat), float(addr.lon))
-                if dist <= threshold_m:
-                    return {'type': 'address', 'id': addr.id}
-            except Exception:
-                pass
-        # Сравнение по названию
-        if nm and (addr.name or '').strip().lower() == nm:
-            return {'type': 'address', 'id': addr.id}
-    # Проверяем pending заявки. Аналогично перехватываем ошибку
-    try:
-        pending_list = PendingMarker.query.all()
-    except OperationalError:
-        pending_list = []
-    for p in pending_list:
-        if lat is not None and lon is not None and p.lat is not None and p.lon is not None:
-            try:
-                dist = haversine_m(lat, lon, float(p.lat), float(p.lon))
-                if dist <= threshold_m:
-                    return {'type': 'pending', 'id': p.id}
-            except Exception:
-                pass
-        if nm and (p.name or '').strip().lower() == nm:
-            return {'type': 'pending', 'id': p.id}
-    return None
-
-
 @bp.post('/markers')
 def add_marker_from_bot() -> Response:
     """
@@ -339,28 +286,19 @@ def add_marker_from_bot() -> Response:
     if not in_range(lat, lon):
         coords: Optional[tuple] = None
         if name:
-            # сначала офлайн: загружаем offline geocode файл (если есть)
+            # сначала офлайн: индекс offline geocode файла (если есть)
             try:
-                offline_path = current_app.config.get('OFFLINE_GEOCODE_FILE')
-                if offline_path and os.path.isfile(offline_path):
-                    with open(offline_path, 'r', encoding='utf-8') as fh:
-                        offline_data = json.load(fh)
-                        for entry in offline_data:
-                            disp = (entry.get('display_name') or entry.get('address') or '').lower()
-                            if name.lower() in disp:
-                                lat = parse_coord(entry.get('lat'))
-                                lon = parse_coord(entry.get('lon'))
-                                coords = (lat, lon)
-                                break
+                found = search_offline(name, 1)
+                if found:
+                    lat = parse_coord(found[0].get('lat'))
+                    lon = parse_coord(found[0].get('lon'))
+                    coords = (lat, lon)
             except Exception:
                 coords = None
         # если offline ничего не дал — онлайн (Nominatim)
         if not coords and name:
             try:
-                params = {'q': name, 'format': 'json', 'limit': 1}
-                headers = {'User-Agent': 'map-v12-app'}
-                r = requests.get('https://nominatim.openstreetmap.org/search', params=params, headers=headers, timeout=10)
-                jdata = r.json()
+                jdata = nominatim_service.search(name, 1)
                 if jdata:
                     lat_val = float(jdata[0].get('lat'))
                     lon_val = float(jdata[0].get('lon'))
@@ -380,7 +318,7 @@ def add_marker_from_bot() -> Response:
     dup: Optional[Dict[str, Any]] = None
     if dedupe and not force:
         # ищем среди адресов и pending
-        dup = find_duplicate_db(name, lat, lon)
+        dup = duplicate_service.find_duplicate(name, lat, lon)
     if dup:
         return jsonify({'status': 'duplicate', 'duplicate_of': dup}), 200
     # создаём новую заявку. id автоматически назначит база данных
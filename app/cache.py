@@ -0,0 +1,368 @@
+"""Общий кэш ответов тяжёлых эндпоинтов (аналитика, геокодер).
+
+Два уровня:
+
+- LRU в процессе (OrderedDict, TTL на запись), не больше CACHE_MAX_ENTRIES
+  записей на кэш;
+- Redis (если задан REDIS_URL и CACHE_REDIS=1) — общий для воркеров
+  gunicorn; значения хранятся в JSON с TTL (SET EX).
+
+`get_or_compute` — single-flight: при одновременных промахах по одному
+ключу значение вычисляет один поток, остальные ждут его результат. С Redis
+то же между процессами: лидер берёт ``SET NX`` lock, остальные опрашивают
+значение до истечения lock'а.
+
+Инвалидация: `invalidate(name)` очищает локальный уровень и увеличивает
+«поколение» кэша в Redis; поколение входит в ключ, поэтому старые записи
+других воркеров перестают читаться (локальные копии — не позже чем через
+GEN_CHECK_SEC). Записи моделей, привязанных через `invalidate_on`
+(Address/PendingMarker/PendingHistory/Zone -> "analytics"), инвалидируют
+кэш сами — по событиям сессии SQLAlchemy после commit.
+
+Счётчики (observability.metrics): ``cache_<name>_hits_total``,
+``cache_<name>_misses_total``, ``cache_<name>_invalidations_total``.
+
+Значения из кэша общие для всех вызывающих — не мутировать.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set, Tuple, Type
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .observability.metrics import inc_counter
+
+try:  # redis — опциональный уровень
+    import redis
+except Exception:  # pragma: no cover
+    redis = None  # type: ignore
+
+
+DEFAULT_MAX_ENTRIES = 256
+GEN_CHECK_SEC = 1.0
+REDIS_RETRY_SEC = 30.0
+LOCK_MS = 5000
+
+_MISSING = object()
+
+
+def _config(name: str, default: Any) -> Any:
+    try:
+        from compat_flask import current_app
+
+        value = current_app.config.get(name)
+        return default if value is None else value
+    except Exception:
+        return default
+
+
+_redis_clients: Dict[str, Any] = {}
+_redis_down_until = 0.0
+
+
+def _redis():
+    """Клиент Redis для кэша или None (нет REDIS_URL, выключено, недавно падал)."""
+    if redis is None or str(_config("CACHE_REDIS", "1")).strip().lower() in ("0", "false", "no", "off"):
+        return None
+    url = str(_config("REDIS_URL", "") or "").strip()
+    if not url or time.monotonic() < _redis_down_until:
+        return None
+    client = _redis_clients.get(url)
+    if client is None:
+        try:
+            client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=0.5, socket_connect_timeout=0.5)
+        except Exception:
+            return None
+        _redis_clients[url] = client
+    return client
+
+
+def _redis_failed() -> None:
+    # Redis недоступен — не ждём таймаут на каждом запросе, работаем локально
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SEC
+
+
+class ResponseCache:
+    """Именованный кэш: LRU в процессе + опционально Redis."""
+
+    def __init__(self, name: str, *, maxsize: Optional[int] = None) -> None:
+        self.name = name
+        self._maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._gen = 0
+        self._gen_checked = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    # --- поколение (межпроцессная инвалидация) ---
+
+    def _gen_key(self) -> str:
+        return f"cache:{self.name}:gen"
+
+    def _generation(self, r) -> int:
+        if r is None:
+            return self._gen
+        now = time.monotonic()
+        if now - self._gen_checked >= GEN_CHECK_SEC:
+            try:
+                self._gen = int(r.get(self._gen_key()) or 0)
+            except Exception:
+                _redis_failed()
+            self._gen_checked = now
+        return self._gen
+
+    def _redis_key(self, key: str, gen: int) -> str:
+        return f"cache:{self.name}:{gen}:{key}"
+
+    # --- локальный уровень ---
+
+    def _get_local(self, key: str, gen: int) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires, item_gen, value = item
+            if item_gen != gen or expires <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value: Any, ttl: float, gen: int) -> None:
+        maxsize = self._maxsize or int(_config("CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, gen, value)
+            self._data.move_to_end(key)
+            while len(self._data) > max(1, maxsize):
+                self._data.popitem(last=False)
+
+    # --- API ---
+
+    def get(self, key: str, default: Any = None) -> Any:
+        r = _redis()
+        gen = self._generation(r)
+        value = self._get_local(key, gen)
+        if value is not _MISSING:
+            return value
+        if r is not None:
+            try:
+                raw = r.get(self._redis_key(key, gen))
+            except Exception:
+                _redis_failed()
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                try:
+                    ttl = r.ttl(self._redis_key(key, gen))
+                except Exception:
+                    ttl = 1
+                self._set_local(key, value, max(1, int(ttl or 1)), gen)
+                return value
+        return default
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        r = _redis()
+        self._store(key, value, ttl, r, self._generation(r))
+
+    def _store(self, key: str, value: Any, ttl: float, r, gen: int) -> None:
+        # gen — поколение на момент начала вычисления: если кэш успели
+        # инвалидировать, запись уходит в старое поколение и не читается
+        if ttl <= 0:
+            return
+        self._set_local(key, value, ttl, gen)
+        if r is not None:
+            try:
+                r.set(self._redis_key(key, gen), json.dumps(value, ensure_ascii=False, default=str), ex=max(1, int(ttl)))
+            except Exception:
+                _redis_failed()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: float) -> Any:
+        """Значение из кэша или compute() — один раз на ключ при одновременных промахах."""
+        if ttl <= 0:
+            return compute()
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            self._hit()
+            return value
+
+        with self._lock:
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                self._inflight[key] = threading.Event()
+        if waiter is not None:
+            waiter.wait(timeout=LOCK_MS / 1000.0)
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                self._hit()
+                return value
+            # лидер упал или не успел — считаем сами
+            self._miss()
+            return compute()
+
+        try:
+            value = self._compute_shared(key, compute, ttl)
+            return value
+        finally:
+            with self._lock:
+                done = self._inflight.pop(key, None)
+            if done is not None:
+                done.set()
+
+    def _compute_shared(self, key: str, compute: Callable[[], Any], ttl: float) -> Any:
+        r = _redis()
+        gen = self._generation(r)
+        lock_key = None
+        if r is not None:
+            lock_key = f"{self._redis_key(key, gen)}:lock"
+            try:
+                if not r.set(lock_key, "1", nx=True, px=LOCK_MS):
+                    # считает другой процесс — ждём его значение
+                    deadline = time.monotonic() + LOCK_MS / 1000.0
+                    while time.monotonic() < deadline:
+                        time.sleep(0.05)
+                        raw = r.get(self._redis_key(key, gen))
+                        if raw is not None:
+                            value = json.loads(raw)
+                            self._set_local(key, value, ttl, gen)
+                            self._hit()
+                            return value
+                    lock_key = None
+            except Exception:
+                _redis_failed()
+                lock_key = None
+        self._miss()
+        try:
+            value = compute()
+            self._store(key, value, ttl, r, gen)
+            return value
+        finally:
+            if lock_key is not None:
+                try:
+                    r.delete(lock_key)
+                except Exception:
+                    pass
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._data.clear()
+        inc_counter(f"cache_{self.name}_invalidations_total")
+        r = _redis()
+        if r is not None:
+            try:
+                self._gen = int(r.incr(self._gen_key()))
+                self._gen_checked = time.monotonic()
+                return
+            except Exception:
+                _redis_failed()
+        # без Redis поколение локальное: вычисления, начатые до инвалидации,
+        # пишут в старое поколение и не переживают её
+        with self._lock:
+            self._gen += 1
+
+    def _hit(self) -> None:
+        self.hits += 1
+        inc_counter(f"cache_{self.name}_hits_total")
+
+    def _miss(self) -> None:
+        self.misses += 1
+        inc_counter(f"cache_{self.name}_misses_total")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._data)
+        return {"entries": size, "hits": self.hits, "misses": self.misses, "generation": self._gen}
+
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str) -> ResponseCache:
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(name, ResponseCache(name))
+    return cache
+
+
+def cached(name: str, key: str, compute: Callable[[], Any], ttl: float) -> Any:
+    """Сокращение для ``get_cache(name).get_or_compute(key, compute, ttl)``."""
+    return get_cache(name).get_or_compute(key, compute, ttl)
+
+
+def invalidate(*names: str) -> None:
+    for name in names:
+        get_cache(name).invalidate()
+
+
+def reset() -> None:
+    """Забыть локальный уровень всех кэшей (новое приложение в том же процессе).
+
+    Кэши живут в процессе, а не в приложении: без сброса значения,
+    посчитанные одним create_app() (например, в соседнем тесте), читались
+    бы другим. Redis-уровень не трогается — он общий для воркеров.
+    """
+    with _caches_lock:
+        _caches.clear()
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in sorted(_caches.items())}
+
+
+# --- инвалидация по записям моделей ---
+
+_model_caches: Dict[Type[Any], Set[str]] = {}
+_listeners_installed = False
+
+
+def invalidate_on(model: Type[Any], *names: str) -> None:
+    """Сбрасывать кэши names после commit, в котором менялись строки model.
+
+    Ловятся и ORM-изменения (add/изменение/delete объектов), и bulk
+    ``query(...).update()/delete()``.
+    """
+    _model_caches.setdefault(model, set()).update(names)
+    _install_listeners()
+
+
+def _touch(session: Session, model: Any) -> None:
+    for cls, names in _model_caches.items():
+        if isinstance(model, type) and issubclass(model, cls) or isinstance(model, cls):
+            session.info.setdefault("_cache_invalidate", set()).update(names)
+
+
+def _install_listeners() -> None:
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    _listeners_installed = True
+
+    @event.listens_for(Session, "before_flush")
+    def _before_flush(session, flush_context, instances):  # noqa: ANN001
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            _touch(session, obj)
+
+    @event.listens_for(Session, "do_orm_execute")
+    def _bulk(state):  # noqa: ANN001
+        if (state.is_update or state.is_delete) and state.bind_mapper is not None:
+            _touch(state.session, state.bind_mapper.class_)
+
+    @event.listens_for(Session, "after_commit")
+    def _after_commit(session):  # noqa: ANN001
+        names = session.info.pop("_cache_invalidate", None)
+        if names:
+            invalidate(*sorted(names))
+
+    @event.listens_for(Session, "after_rollback")
+    def _after_rollback(session):  # noqa: ANN001
+        session.info.pop("_cache_invalidate", None)
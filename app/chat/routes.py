@@ -18,9 +18,10 @@ API поддерживает следующие операции:
 ответа.
 """
 
+import json
 from typing import Any, Dict
 
-from compat_flask import jsonify, request, abort, current_app, session
+from compat_flask import Response, jsonify, request, abort, current_app, session, stream_with_context
 
 from . import bp
 from ..helpers import require_admin
@@ -31,6 +32,8 @@ from ..services.chat_service import (
     get_history,
     get_history_paged,
     get_history_before,
+    get_history_page,
+    iter_history,
     send_message,
     set_status,
     mark_read_by_admin,
@@ -86,6 +89,14 @@ def api_list_conversations():
     return jsonify(items)
 
 
+def _stream_json_array(items):
+    """Сериализовать итератор словарей в JSON-массив по частям."""
+    yield "["
+    for i, item in enumerate(items):
+        yield ("," if i else "") + json.dumps(item, ensure_ascii=False)
+    yield "]"
+
+
 @bp.get("/<user_id>")
 def api_get_history(user_id: str):
     require_admin(min_role="viewer")
@@ -98,6 +109,12 @@ def api_get_history(user_id: str):
 
     Дополнительно (для infinite-scroll вверх в UI):
       - before_id=<int> : вернуть сообщения, которые *старше* указанного сообщения
+      - cursor=<str> : keyset-страница старше курсора (без cursor — последние
+        ``limit``); курсор следующей страницы — в заголовке ``X-Next-Cursor``
+
+    Выгрузка всей переписки:
+      - stream=1 : вся история (ASC) потоковым JSON-массивом, читается из БД
+        пачками; ``limit`` — необязательный предел числа сообщений
 
     По умолчанию все сообщения пользователя считаются прочитанными
     администратором (сбрасывается счётчик непрочитанных).
@@ -118,6 +135,33 @@ def api_get_history(user_id: str):
         )
         return jsonify(history)
 
+    if "cursor" in request.args:
+        try:
+            history, next_cursor = get_history_page(
+                user_id=str(user_id),
+                cursor=request.args.get("cursor") or None,
+                limit=request.args.get("limit", 200),
+                mark_as_read=False,
+            )
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+        resp = jsonify(history)
+        if next_cursor:
+            resp.headers["X-Next-Cursor"] = next_cursor
+        return resp
+
+    if str(request.args.get("stream", "0")).strip().lower() in ("1", "true", "yes"):
+        try:
+            max_messages = int(request.args["limit"]) if "limit" in request.args else None
+        except Exception:
+            max_messages = None
+        mark_read_by_admin(str(user_id))
+        return Response(
+            stream_with_context(_stream_json_array(iter_history(str(user_id), max_messages=max_messages))),
+            mimetype="application/json",
+            headers={"Cache-Control": "no-store"},
+        )
+
     # backward-friendly: если клиент не передал пагинацию — отдаём последние N
     has_paging = ("limit" in request.args) or ("offset" in request.args) or ("tail" in request.args)
     if has_paging:
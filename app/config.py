@@ -138,6 +138,28 @@ class Config:
     DOWNLOAD_TILES_DIR = os.path.join(BASE_DIR, "data", "tiles_download")
     TILES_SETS_DIR = os.path.join(BASE_DIR, "data", "tiles_sets")
     ACTIVE_TILES_FILE = os.path.join(BASE_DIR, "data", "tiles_active_set.txt")
+    # Фоновая загрузка офлайн-тайлов (задания tile_download_jobs): шаблон URL источника,
+    # параллельных запросов на задание и повторов на тайл (с экспоненциальной паузой).
+    TILE_DOWNLOAD_URL = os.environ.get("TILE_DOWNLOAD_URL", "https://tile.openstreetmap.org/{z}/{x}/{y}.png")
+    TILE_DOWNLOAD_USER_AGENT = os.environ.get("TILE_DOWNLOAD_USER_AGENT", "map-v12-offline")
+    TILE_DOWNLOAD_CONCURRENCY = int(os.environ.get("TILE_DOWNLOAD_CONCURRENCY", 4))
+    TILE_DOWNLOAD_RETRIES = int(os.environ.get("TILE_DOWNLOAD_RETRIES", 3))
+    # Отдача тайлов (/tiles/...): LRU в памяти процесса для тайлов упакованных наборов
+    # с уровней до TILE_CACHE_MAX_ZOOM включительно; TILE_CACHE_MAX_BYTES=0 — без кэша.
+    TILE_CACHE_MAX_BYTES = int(os.environ.get("TILE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    TILE_CACHE_MAX_ZOOM = int(os.environ.get("TILE_CACHE_MAX_ZOOM", 12))
+    # Поиск дубликатов заявок бота (app.services.duplicate_service): без PostGIS —
+    # сеточный индекс в памяти процесса, полностью пересобирается не реже чем раз в
+    # DUPLICATE_INDEX_MAX_AGE_SEC (чтобы увидеть записи других процессов).
+    DUPLICATE_INDEX_MAX_AGE_SEC = float(os.environ.get("DUPLICATE_INDEX_MAX_AGE_SEC", 60))
+    # /api/geo/clusters: пирамида кластеров слоя в памяти процесса, обновляется по commit;
+    # полная пересборка (записи других процессов) — не реже чем раз в CLUSTER_INDEX_MAX_AGE_SEC.
+    CLUSTER_INDEX_MAX_AGE_SEC = float(os.environ.get("CLUSTER_INDEX_MAX_AGE_SEC", 60))
+    # /api/geo/tiles: кэш готовых MVT-тайлов в памяти процесса, бюджет в байтах на слой
+    # (0 — без кэша). Тайлы вытесняются по commit изменённых строк; записи других
+    # процессов сбрасывают кэш не позже чем через VECTOR_TILE_MAX_AGE_SEC.
+    VECTOR_TILE_CACHE_MAX_BYTES = int(os.environ.get("VECTOR_TILE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    VECTOR_TILE_MAX_AGE_SEC = float(os.environ.get("VECTOR_TILE_MAX_AGE_SEC", 60))
 
     # Настройки логирования. Можно переопределить через переменные окружения
     # LOG_LEVEL и LOG_FILE. По умолчанию уровень INFO и вывод только в консоль.
@@ -151,6 +173,24 @@ class Config:
     ANALYTICS_CACHE_SECONDS = int(os.environ.get("ANALYTICS_CACHE_SECONDS", 60))
     # Таймаут кэша для результатов геокодера (секунды)
     GEOCODE_CACHE_SECONDS = int(os.environ.get("GEOCODE_CACHE_SECONDS", 600))
+    # Кэш ответов (app/cache.py): записей в LRU на кэш; CACHE_REDIS=1 — второй уровень
+    # в Redis (REDIS_URL), общий для воркеров, с межпроцессной инвалидацией.
+    CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 256))
+    CACHE_REDIS = os.environ.get("CACHE_REDIS", "1")
+    # Nominatim (онлайн-геокодер): не больше NOMINATIM_RPS запросов в секунду на процесс
+    # (политика OSM — 1/с), NOMINATIM_CONCURRENCY параллельных запросов при пересборке
+    # офлайн-базы. Ответы хранятся в таблице geocode_cache: найденное — GEOCODE_PERSIST_TTL_DAYS,
+    # «ничего не найдено» — GEOCODE_NEGATIVE_TTL_HOURS; ошибки upstream не кэшируются.
+    # NOMINATIM_MAX_WAIT — сколько секунд /api/geocode ждёт свободный слот; дольше — 503
+    # с Retry-After, чтобы запросы не занимали воркеры в очереди к limiter'у.
+    NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+    NOMINATIM_USER_AGENT = os.environ.get("NOMINATIM_USER_AGENT", "map-v12-geocode")
+    NOMINATIM_RPS = float(os.environ.get("NOMINATIM_RPS", 1.0))
+    NOMINATIM_CONCURRENCY = int(os.environ.get("NOMINATIM_CONCURRENCY", 2))
+    NOMINATIM_TIMEOUT = float(os.environ.get("NOMINATIM_TIMEOUT", 10))
+    NOMINATIM_MAX_WAIT = float(os.environ.get("NOMINATIM_MAX_WAIT", 2))
+    GEOCODE_PERSIST_TTL_DAYS = float(os.environ.get("GEOCODE_PERSIST_TTL_DAYS", 30))
+    GEOCODE_NEGATIVE_TTL_HOURS = float(os.environ.get("GEOCODE_NEGATIVE_TTL_HOURS", 24))
 
     # --- Realtime (WebSocket / SSE) ---
     # Порт отдельного WS-сервера (dev/legacy режим). В проде рекомендуем ASGI-вариант (/ws на том же порту).
@@ -160,12 +200,45 @@ class Config:
     REALTIME_TOKEN_TTL_SEC = int(os.environ.get("REALTIME_TOKEN_TTL_SEC", 600))
     # Разрешённые Origin'ы для WS (через запятую). Если пусто — разрешаем same-site и Origin=None (CLI).
     REALTIME_ALLOWED_ORIGINS = os.environ.get("REALTIME_ALLOWED_ORIGINS", "").strip()
+    # Исходящая очередь на каждого WS-клиента (сообщений) и политика при переполнении:
+    # drop_oldest | coalesce (склеить события об одной сущности) | disconnect.
+    REALTIME_CLIENT_QUEUE_SIZE = int(os.environ.get("REALTIME_CLIENT_QUEUE_SIZE", 256))
+    REALTIME_OVERFLOW_POLICY = os.environ.get("REALTIME_OVERFLOW_POLICY", "drop_oldest").strip().lower()
+    # Тик склейки событий местоположения в кадры positions (мс, 250..1000; 0 = выключить).
+    REALTIME_COALESCE_TICK_MS = int(os.environ.get("REALTIME_COALESCE_TICK_MS", 250))
     # --- Redis (опционально) ---
     # Используется для:
     #  - Pub/Sub для realtime (чтобы события доходили до всех воркеров/реплик)
     #  - Дистрибутивного lock для scheduler worker (чтобы не было двойного запуска)
     REDIS_URL = os.environ.get("REDIS_URL", settings.redis_url).strip()
     REALTIME_REDIS_CHANNEL = os.environ.get("REALTIME_REDIS_CHANNEL", "mapv12:realtime").strip()
+    # Очередь сохранения телеметрии: pubsub (канал telemetry_save_queue) | stream (Redis Streams,
+    # consumer group, ack + reclaim, несколько consumer'ов). В stream-режиме единственный
+    # publisher — telemetry_node (Rust, читает те же переменные окружения): он пишет с
+    # MAXLEN ~ TELEMETRY_STREAM_MAXLEN и отвечает 503, когда длина > TELEMETRY_STREAM_BACKPRESSURE_LEN.
+    TELEMETRY_QUEUE_MODE = os.environ.get("TELEMETRY_QUEUE_MODE", "pubsub").strip().lower()
+    TELEMETRY_STREAM_KEY = os.environ.get("TELEMETRY_STREAM_KEY", "telemetry_save_stream").strip()
+    TELEMETRY_STREAM_GROUP = os.environ.get("TELEMETRY_STREAM_GROUP", "telemetry_writers").strip()
+    TELEMETRY_STREAM_MAXLEN = int(os.environ.get("TELEMETRY_STREAM_MAXLEN", 1_000_000))
+    TELEMETRY_STREAM_BACKPRESSURE_LEN = int(os.environ.get("TELEMETRY_STREAM_BACKPRESSURE_LEN", 500_000))
+    TELEMETRY_STREAM_CLAIM_IDLE_MS = int(os.environ.get("TELEMETRY_STREAM_CLAIM_IDLE_MS", 60_000))
+    # Записи, доставленные больше N раз (пачка стабильно не сохраняется), переносятся
+    # в dead-letter стрим (по умолчанию <TELEMETRY_STREAM_KEY>:dead) и подтверждаются.
+    TELEMETRY_STREAM_MAX_DELIVERIES = int(os.environ.get("TELEMETRY_STREAM_MAX_DELIVERIES", 5))
+    TELEMETRY_STREAM_DEAD_KEY = os.environ.get("TELEMETRY_STREAM_DEAD_KEY", "").strip()
+    # Запись пачек телеметрии в tracking_points: auto (COPY на Postgres, executemany иначе) |
+    # copy | executemany | orm. Размер пачки и интервал сброса адаптивные в этих пределах.
+    TELEMETRY_BULK_METHOD = os.environ.get("TELEMETRY_BULK_METHOD", "auto").strip().lower()
+    TELEMETRY_BATCH_MIN = int(os.environ.get("TELEMETRY_BATCH_MIN", 50))
+    TELEMETRY_BATCH_MAX = int(os.environ.get("TELEMETRY_BATCH_MAX", 5000))
+    TELEMETRY_FLUSH_MIN_MS = int(os.environ.get("TELEMETRY_FLUSH_MIN_MS", 100))
+    TELEMETRY_FLUSH_MAX_MS = int(os.environ.get("TELEMETRY_FLUSH_MAX_MS", 1000))
+    # Упрощение треков (tracker/track_processing.py) для /api/duty/admin/tracking и итогов
+    # сессии: допуск — 1 px на этом zoom; метод dp (Дуглас–Пекер) | vw (Висвалингам).
+    # Точки «туда-обратно» быстрее TRACK_JUMP_MAX_SPEED_MPS считаются скачками GPS.
+    TRACK_SIMPLIFY_ZOOM = int(os.environ.get("TRACK_SIMPLIFY_ZOOM", 16))
+    TRACK_SIMPLIFY_METHOD = os.environ.get("TRACK_SIMPLIFY_METHOD", "dp").strip().lower()
+    TRACK_JUMP_MAX_SPEED_MPS = float(os.environ.get("TRACK_JUMP_MAX_SPEED_MPS", 70))
 
 
     # --- MAX indoor / hysteresis tuning (field calibration) ---
@@ -250,6 +323,11 @@ class Config:
     METRICS_API_KEY = os.environ.get("METRICS_API_KEY", "").strip()
 
     # --- Rate limits ---
+    # security/rate_limit.py: общий пул соединений Redis на процесс; RATE_LIMIT_LOCAL_BATCH=N —
+    # резервировать в Redis до N запросов за раз и отдавать их из памяти процесса
+    # (только для лимитов >= 10*N; 0 — каждый запрос проверяется в Redis).
+    RATE_LIMIT_REDIS_POOL_SIZE = int(os.environ.get("RATE_LIMIT_REDIS_POOL_SIZE", "50"))
+    RATE_LIMIT_LOCAL_BATCH = int(os.environ.get("RATE_LIMIT_LOCAL_BATCH", "0"))
     RATE_LIMIT_LOGIN_PER_MINUTE = int(os.environ.get("RATE_LIMIT_LOGIN_PER_MINUTE", "10"))
     RATE_LIMIT_CHAT_PER_MINUTE = int(os.environ.get("RATE_LIMIT_CHAT_PER_MINUTE", "120"))
 
@@ -271,6 +349,24 @@ class Config:
     CHAT2_SEND_RATE_LIMIT = int(os.environ.get("CHAT2_SEND_RATE_LIMIT", str(RATE_LIMIT_CHAT_PER_MINUTE)))
     CHAT2_UPLOAD_RATE_WINDOW_SEC = float(os.environ.get("CHAT2_UPLOAD_RATE_WINDOW_SEC", "60"))
     CHAT2_UPLOAD_RATE_LIMIT = int(os.environ.get("CHAT2_UPLOAD_RATE_LIMIT", os.environ.get("RATE_LIMIT_MEDIA_UPLOAD_PER_MINUTE", "20")))
+    # Общие лимиты chat2 поверх лимита отправителя (Redis при REDIS_URL, иначе — процесс);
+    # 0 — правило выключено. Канал — защита от флуда в одну комнату, global — от шторма в целом.
+    CHAT2_CHANNEL_RATE_WINDOW_SEC = float(os.environ.get("CHAT2_CHANNEL_RATE_WINDOW_SEC", "60"))
+    CHAT2_CHANNEL_RATE_LIMIT = int(os.environ.get("CHAT2_CHANNEL_RATE_LIMIT", "120"))
+    CHAT2_GLOBAL_RATE_WINDOW_SEC = float(os.environ.get("CHAT2_GLOBAL_RATE_WINDOW_SEC", "60"))
+    CHAT2_GLOBAL_RATE_LIMIT = int(os.environ.get("CHAT2_GLOBAL_RATE_LIMIT", "0"))
+
+    # Push-уведомления chat2: очередь chat2_push_outbox разбирает фоновый воркер
+    # (поток web-процесса и/или задача Celery dispatch_chat2_push). Пачка записей,
+    # одновременных запросов к FCM (размер пула httpx), попыток до статуса failed.
+    CHAT2_PUSH_ENABLED = os.environ.get("CHAT2_PUSH_ENABLED", "0") == "1"
+    FCM_SERVER_KEY = os.environ.get("FCM_SERVER_KEY", "")
+    FCM_URL = os.environ.get("FCM_URL", "https://fcm.googleapis.com/fcm/send")
+    CHAT2_PUSH_INPROCESS_WORKER = os.environ.get("CHAT2_PUSH_INPROCESS_WORKER", "1") == "1"
+    CHAT2_PUSH_BATCH_SIZE = int(os.environ.get("CHAT2_PUSH_BATCH_SIZE", "100"))
+    CHAT2_PUSH_CONCURRENCY = int(os.environ.get("CHAT2_PUSH_CONCURRENCY", "20"))
+    CHAT2_PUSH_TIMEOUT_SEC = float(os.environ.get("CHAT2_PUSH_TIMEOUT_SEC", "5"))
+    CHAT2_PUSH_MAX_ATTEMPTS = int(os.environ.get("CHAT2_PUSH_MAX_ATTEMPTS", "5"))
 
     # --- Retention / cleanup (best-effort, opt-in) ---
     # Tracks (GNSS/indoor points) are the largest dataset.
@@ -281,6 +377,10 @@ class Config:
     RETENTION_INCIDENTS_DAYS = int(os.environ.get("RETENTION_INCIDENTS_DAYS", "180"))
     # Safety: delete only resolved/closed incidents unless explicitly disabled.
     RETENTION_DELETE_ONLY_CLOSED = (os.environ.get("RETENTION_DELETE_ONLY_CLOSED", "1") or "1").strip().lower() in {"1","true","yes","y"}
+    # Postgres: tracking_points / tracker_device_health_log are range-partitioned by ts
+    # (migration 0021). Partition size: "day" or "week"; how many future periods to pre-create.
+    TRACKING_PARTITION_INTERVAL = (os.environ.get("TRACKING_PARTITION_INTERVAL", "day") or "day").strip().lower()
+    TRACKING_PARTITION_PREMAKE = int(os.environ.get("TRACKING_PARTITION_PREMAKE", "7"))
     # If enabled, run cleanup once on app start (not recommended for multi-worker prod).
     RETENTION_RUN_ON_STARTUP = os.environ.get("RETENTION_RUN_ON_STARTUP", "0") == "1"
 
@@ -344,6 +444,10 @@ class Config:
             "task": "app.tasks.mutation_testing.run_ai_mutation_on_critical_modules",
             "schedule": float(os.environ.get("AI_MUTATION_CRITICAL_INTERVAL_SEC", str(7 * 24 * 3600))),
         },
+        "dispatch-chat2-push": {
+            "task": "app.tasks.push_outbox.dispatch_chat2_push",
+            "schedule": float(os.environ.get("CHAT2_PUSH_DISPATCH_INTERVAL_SEC", "5")),
+        },
         "daily-tactical-briefing": {
             "task": "app.tasks.operational_tasks.daily_tactical_briefing",
             "schedule": crontab(hour=8, minute=0),
@@ -377,6 +481,9 @@ class TestingConfig(Config):
     ENABLE_INTERNAL_SCHEDULERS = False
     # Не кэшируем статику, чтобы снапшоты/тесты были предсказуемыми
     SEND_FILE_MAX_AGE_DEFAULT = 0
+    # И ответы аналитики/геокодера: тесты, проверяющие кэш, включают его сами
+    ANALYTICS_CACHE_SECONDS = 0
+    GEOCODE_CACHE_SECONDS = 0
 class ProductionConfig(Config):
     # В продакшене по умолчанию считаем, что есть HTTPS.
     SESSION_COOKIE_SECURE = os.environ.get("SESSION_COOKIE_SECURE", "1") == "1"
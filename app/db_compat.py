@@ -112,6 +112,10 @@ def ensure_sqlite_schema_minimal() -> bool:
             ("chat_dialogs", "display_name", "display_name VARCHAR(256)"),
             ("chat_dialogs", "last_notified_admin_msg_id", "last_notified_admin_msg_id INTEGER NOT NULL DEFAULT 0"),
             ("chat_dialogs", "last_seen_admin_msg_id", "last_seen_admin_msg_id INTEGER NOT NULL DEFAULT 0"),
+
+            # chat2: последнее сообщение канала (миграция 0026)
+            ("chat2_channels", "last_message_id", "last_message_id VARCHAR(36)"),
+            ("chat2_channels", "last_message_preview", "last_message_preview VARCHAR(256)"),
         ]
     )
 
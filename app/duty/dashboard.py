@@ -0,0 +1,237 @@
+"""Снимок dashboard'а дежурной части (``/api/duty/admin/dashboard``).
+
+Раньше dashboard для каждой открытой смены отдельно ходил в БД за активной
+сессией, последними точками, обедом, устройством, health и KPI — при 300
+нарядах это тысячи запросов на одно обновление панели.
+
+Здесь всё грузится пачками: один set-based запрос на каждый вид данных,
+"последняя запись на пользователя/сессию" выбирается оконной функцией
+``row_number() OVER (PARTITION BY ...)`` (на Postgres это аналог
+``DISTINCT ON``, на SQLite тоже работает). Число запросов не зависит от
+количества смен. JSON-ответ совпадает с прежним.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import desc, func, select
+from sqlalchemy.orm import aliased
+
+from ..extensions import db
+from ..models import (
+    BreakRequest,
+    DutyShift,
+    SosAlert,
+    TrackerDevice,
+    TrackerDeviceHealth,
+    TrackerLastPosition,
+    TrackingPoint,
+    TrackingSession,
+)
+from ..tracker.last_position import get_last_positions
+
+
+def _top_n_per_group(model, partition_col, order_by: Iterable[Any], criteria: Iterable[Any], n: int = 1) -> List[Any]:
+    """Первые ``n`` строк ``model`` в каждой группе ``partition_col``.
+
+    Результат отсортирован по группе и рангу (т.е. внутри группы — в порядке ``order_by``).
+    """
+    rn = func.row_number().over(partition_by=partition_col, order_by=list(order_by)).label('rn')
+    sub = select(model, rn).where(*criteria).subquery()
+    ent = aliased(model, sub)
+    q = select(ent).where(sub.c.rn <= n).order_by(sub.c[partition_col.key], sub.c.rn)
+    return list(db.session.execute(q).scalars().all())
+
+
+def _group_by(rows: Iterable[Any], attr: str) -> Dict[Any, List[Any]]:
+    out: Dict[Any, List[Any]] = {}
+    for r in rows:
+        out.setdefault(getattr(r, attr), []).append(r)
+    return out
+
+
+def _first_by(rows: Iterable[Any], attr: str) -> Dict[Any, Any]:
+    out: Dict[Any, Any] = {}
+    for r in rows:
+        out.setdefault(getattr(r, attr), r)
+    return out
+
+
+def _point_last(lp: TrackingPoint) -> Dict[str, Any]:
+    from .routes import _last_meta_fields
+
+    last = {
+        'lat': lp.lat,
+        'lon': lp.lon,
+        'ts': lp.ts.isoformat() if lp.ts else None,
+        'session_id': lp.session_id,
+        'accuracy_m': lp.accuracy_m,
+    }
+    meta = _last_meta_fields(lp)
+    if meta:
+        last.update(meta)
+    return last
+
+
+def _last_position_last(lp: TrackerLastPosition) -> Dict[str, Any]:
+    last = {
+        'lat': lp.lat,
+        'lon': lp.lon,
+        'ts': lp.ts.isoformat() if lp.ts else None,
+        'session_id': lp.session_id,
+        'accuracy_m': lp.accuracy_m,
+    }
+    last.update(lp.display_fields())
+    return last
+
+
+def build_dashboard_snapshot(now: datetime) -> Dict[str, Any]:
+    """Собрать JSON dashboard'а фиксированным числом запросов (≈10 на любое число смен)."""
+    from .routes import (
+        DISPLAY_POINT_WINDOW,
+        _compute_device_status,
+        _health_snapshot,
+        _kpi_5m_by_session,
+        _pick_display_point,
+    )
+
+    shifts = DutyShift.query.filter(DutyShift.ended_at == None).order_by(desc(DutyShift.started_at)).all()  # noqa: E711
+    user_ids = sorted({sh.user_id for sh in shifts})
+
+    sessions_by_user: Dict[str, TrackingSession] = {}
+    display_pts: Dict[int, List[TrackingPoint]] = {}
+    breaks_by_user: Dict[str, BreakRequest] = {}
+    dev_by_user: Dict[str, TrackerDevice] = {}
+    health_by_device: Dict[str, TrackerDeviceHealth] = {}
+    health_by_user: Dict[str, TrackerDeviceHealth] = {}
+
+    if user_ids:
+        # активная live-сессия на пользователя
+        sessions_by_user = _first_by(_top_n_per_group(
+            TrackingSession,
+            TrackingSession.user_id,
+            [desc(TrackingSession.started_at)],
+            [TrackingSession.user_id.in_(user_ids), TrackingSession.ended_at == None],  # noqa: E711
+        ), 'user_id')
+
+        # последние точки активных сессий — для гистерезиса display-точки
+        session_ids = sorted(s.id for s in sessions_by_user.values())
+        if session_ids:
+            display_pts = _group_by(_top_n_per_group(
+                TrackingPoint,
+                TrackingPoint.session_id,
+                [desc(TrackingPoint.ts)],
+                [TrackingPoint.session_id.in_(session_ids)],
+                n=DISPLAY_POINT_WINDOW,
+            ), 'session_id')
+
+        breaks_by_user = _first_by(_top_n_per_group(
+            BreakRequest,
+            BreakRequest.user_id,
+            [desc(BreakRequest.requested_at)],
+            [BreakRequest.user_id.in_(user_ids), BreakRequest.status.in_(['requested', 'started'])],
+        ), 'user_id')
+
+        # у одного user_id может быть несколько устройств (перепривязка/ротация):
+        # health берём для "актуального" устройства (по last_seen_at)
+        dev_by_user = _first_by(_top_n_per_group(
+            TrackerDevice,
+            TrackerDevice.user_id,
+            [desc(TrackerDevice.last_seen_at), desc(TrackerDevice.created_at)],
+            [TrackerDevice.user_id.in_(user_ids), TrackerDevice.is_revoked == False],  # noqa: E712
+        ), 'user_id')
+
+        device_ids = sorted(d.public_id for d in dev_by_user.values())
+        if device_ids:
+            health_by_device = _first_by(
+                TrackerDeviceHealth.query.filter(TrackerDeviceHealth.device_id.in_(device_ids)).all(),
+                'device_id',
+            )
+        users_without_dev = [u for u in user_ids if u not in dev_by_user]
+        if users_without_dev:
+            health_by_user = _first_by(_top_n_per_group(
+                TrackerDeviceHealth,
+                TrackerDeviceHealth.user_id,
+                [desc(TrackerDeviceHealth.updated_at)],
+                [TrackerDeviceHealth.user_id.in_(users_without_dev)],
+            ), 'user_id')
+
+    # первый проход: display-точка по активной сессии
+    lasts: Dict[int, Optional[Dict[str, Any]]] = {}
+    last_tss: Dict[int, Optional[datetime]] = {}
+    for sh in shifts:
+        sess = sessions_by_user.get(sh.user_id)
+        last = None
+        last_ts = None
+        if sess:
+            lp = _pick_display_point(display_pts.get(sess.id, []), now)
+            if lp and lp.lat is not None and lp.lon is not None:
+                last = _point_last(lp)
+                last_ts = lp.ts
+            elif sess.last_lat is not None and sess.last_lon is not None:
+                last = {
+                    'lat': sess.last_lat,
+                    'lon': sess.last_lon,
+                    'ts': sess.last_at.isoformat() if sess.last_at else None,
+                    'session_id': sess.id,
+                    'accuracy_m': None,
+                }
+                last_ts = sess.last_at
+        lasts[sh.id] = last
+        last_tss[sh.id] = last_ts
+
+    # второй проход: фолбэк на материализованную последнюю точку — одним запросом по PK
+    need_fallback = sorted({sh.user_id for sh in shifts if not lasts[sh.id]})
+    if need_fallback:
+        last_pos_by_user = get_last_positions(need_fallback)
+        for sh in shifts:
+            if lasts[sh.id]:
+                continue
+            lp = last_pos_by_user.get(sh.user_id)
+            if lp and lp.lat is not None and lp.lon is not None:
+                lasts[sh.id] = _last_position_last(lp)
+                last_tss[sh.id] = lp.ts
+
+    # KPI за 5 минут по всем нужным сессиям — одним агрегирующим запросом
+    kpi_session_ids = sorted({l['session_id'] for l in lasts.values() if l and l.get('session_id')})
+    kpi_by_session = _kpi_5m_by_session(kpi_session_ids, now)
+
+    res_shifts = []
+    for sh in shifts:
+        sess = sessions_by_user.get(sh.user_id)
+        last = lasts[sh.id]
+        br = breaks_by_user.get(sh.user_id)
+        dev = dev_by_user.get(sh.user_id)
+        h = health_by_device.get(dev.public_id) if dev else health_by_user.get(sh.user_id)
+        health, health_age_sec, heartbeat_ts = _health_snapshot(dev, h, now)
+        kpi_session_id = last.get('session_id') if last else None
+
+        res_shifts.append({
+            'shift_id': sh.id,
+            'user_id': sh.user_id,
+            'unit_label': sh.unit_label,
+            'started_at': sh.started_at.isoformat() if sh.started_at else None,
+            'last': last,
+            'tracking_active': bool(sess and sess.ended_at is None),
+            'break': br.to_dict() if br else None,
+            'health': health,
+            'health_age_sec': health_age_sec,
+            'device_status': _compute_device_status(now, last_tss[sh.id], heartbeat_ts),
+            'kpi_5m': kpi_by_session.get(kpi_session_id) if kpi_session_id else None,
+        })
+
+    breaks = BreakRequest.query.filter(BreakRequest.status.in_(['requested', 'started'])).order_by(desc(BreakRequest.requested_at)).all()
+    res_breaks = [b.to_dict() for b in breaks]
+
+    sos_rows = SosAlert.query.filter(SosAlert.status.in_(['open', 'acked'])).order_by(desc(SosAlert.created_at)).limit(50).all()
+    res_sos = [r.to_dict() for r in sos_rows]
+
+    return {
+        'server_time': now.isoformat(),
+        'active_shifts': res_shifts,
+        'breaks': res_breaks,
+        'sos_active': res_sos,
+        'sos_active_count': len(res_sos),
+    }
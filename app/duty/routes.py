@@ -17,7 +17,7 @@ from typing import Any, Dict, List, Optional, Tuple
 
 from compat_flask import current_app, jsonify, request, render_template
 
-from sqlalchemy import desc
+from sqlalchemy import desc, func, select
 
 from . import bp
 from ..extensions import db
@@ -27,6 +27,10 @@ from ..models import DutyShift, DutyEvent, TrackingSession, TrackingPoint, Track
 from app.db.cockroach_utils import retry_on_serialization_failure
 from ..security.api_keys import require_bot_api_key
 from ..security.rate_limit import check_rate_limit
+from ..tracker.last_position import display_fields, get_last_position, upsert_last_position_for
+from ..tracker.point_fields import FLAG_JUMP, has_jump, is_est, mask_to_flags, point_columns, source_of
+from ..tracker.track_processing import Track, find_stops, jump_mask, simplify, simplify_points
+from .dashboard import build_dashboard_snapshot
 
 
 # -------------------------
@@ -69,7 +73,7 @@ def _commit_telemetry_write() -> None:
 
 
 def _tp_meta(tp: Optional[TrackingPoint]) -> Dict[str, Any]:
-    """Достаём доп. поля точки из raw_json (без миграций БД)."""
+    """Полный raw_json точки (диагностика wifi-оценок); базовые поля — в колонках."""
     if not tp:
         return {}
     try:
@@ -79,146 +83,89 @@ def _tp_meta(tp: Optional[TrackingPoint]) -> Dict[str, Any]:
         return {}
 
 def _last_meta_fields(tp: Optional[TrackingPoint]) -> Dict[str, Any]:
-    meta = _tp_meta(tp)
-    out: Dict[str, Any] = {}
+    if tp is None:
+        return {"speed_mps": None, "bearing_deg": None, "flags": []}
+    out: Dict[str, Any] = {
+        "speed_mps": tp.speed_mps,
+        "bearing_deg": tp.bearing_deg,
+        "flags": mask_to_flags(tp.flags),
+        "source": source_of(tp.kind, tp.src),
+    }
+    if tp.confidence is not None:
+        out["confidence"] = tp.confidence
+    # остальная диагностика (matches, method, tile_id, ...) бывает только у wifi-оценок:
+    # raw_json разбираем лишь для них и лишь для одной показываемой точки
+    if is_est(tp.kind, tp.flags, tp.src):
+        for k, v in display_fields(_tp_meta(tp), tp.kind).items():
+            out.setdefault(k, v)
+    return out
 
-    # base fields (used widely in UI)
-    spd = meta.get("speed_mps")
-    brg = meta.get("bearing_deg")
-    flags = meta.get("flags") or []
-    try:
-        out["speed_mps"] = float(spd) if spd is not None else None
-    except Exception:
-        out["speed_mps"] = None
-    try:
-        out["bearing_deg"] = float(brg) if brg is not None else None
-    except Exception:
-        out["bearing_deg"] = None
-    out["flags"] = flags if isinstance(flags, list) else []
+# верхняя граница выборки точек для KPI за 5 минут (на случай частых точек)
+KPI_5M_MAX_POINTS = 500
 
-    # source/mode (MAX indoor diagnostics)
-    src = meta.get("src") or meta.get("source")
-    try:
-        if not src and tp is not None:
-            if tp.kind == "est":
-                src = "wifi_est"
-            elif tp.kind:
-                src = str(tp.kind)
-            else:
-                src = "app"
-    except Exception:
-        pass
-    if src:
-        out["source"] = str(src)
-
-    # numeric diagnostics for estimated points (optional)
-    for k, cast in (
-        ("confidence", float),
-        ("matches", int),
-        ("matches_wifi", int),
-        ("matches_cell", int),
-        ("rssi_diff_avg_db", float),
-        ("cell_diff_avg_db", float),
-        ("tiles_considered", int),
-        ("spread_m", float),
-        ("anchors_considered", int),
-        ("clusters_total", int),
-        ("clusters_used", int),
-    ):
-        if k in meta:
-            try:
-                out[k] = cast(meta.get(k))
-            except Exception:
-                out[k] = meta.get(k)
 
-    # string diagnostics (optional)
-    for k in ("method", "tile_id"):
-        if k in meta:
-            try:
-                out[k] = str(meta.get(k))
-            except Exception:
-                out[k] = meta.get(k)
+def _kpi_5m_select(since: datetime, session_ids: List[int]):
+    """SELECT session_id, points_5m, acc_avg_5m, jumps_5m по последним KPI_5M_MAX_POINTS точкам сессий."""
+    rn = func.row_number().over(partition_by=TrackingPoint.session_id, order_by=desc(TrackingPoint.ts)).label('rn')
+    sub = (select(TrackingPoint.session_id, TrackingPoint.accuracy_m, TrackingPoint.flags, rn)
+           .where(TrackingPoint.session_id.in_(session_ids), TrackingPoint.ts >= since)
+           .subquery())
+    return (select(
+                sub.c.session_id,
+                func.count().label('points_5m'),
+                func.avg(sub.c.accuracy_m).label('acc_avg_5m'),
+                func.count().filter(sub.c.flags.op('&')(FLAG_JUMP) != 0).label('jumps_5m'),
+            )
+            .where(sub.c.rn <= KPI_5M_MAX_POINTS)
+            .group_by(sub.c.session_id))
 
 
-    # timestamps / misc
-    if "anchor_ts" in meta:
-        try:
-            out["anchor_ts"] = str(meta.get("anchor_ts"))
-        except Exception:
-            out["anchor_ts"] = meta.get("anchor_ts")
+def _kpi_5m_row(points: int, acc_avg: Optional[float], jumps: int) -> Dict[str, Any]:
+    return {
+        "points_5m": int(points or 0),
+        "acc_avg_5m": round(float(acc_avg), 1) if acc_avg is not None else None,
+        "jumps_5m": int(jumps or 0),
+    }
+
 
+def _kpi_5m_by_session(session_ids: List[int], now: datetime) -> Dict[int, Dict[str, Any]]:
+    """KPI за 5 минут для набора сессий — один агрегирующий запрос."""
+    if not session_ids:
+        return {}
+    rows = db.session.execute(_kpi_5m_select(now - timedelta(minutes=5), list(session_ids))).all()
+    out = {sid: _kpi_5m_row(0, None, 0) for sid in session_ids}
+    for sid, points, acc_avg, jumps in rows:
+        out[sid] = _kpi_5m_row(points, acc_avg, jumps)
     return out
 
+
 def _kpi_5m_for_session(session_id: Optional[int], now: datetime) -> Optional[Dict[str, Any]]:
     if not session_id:
         return None
-    since = now - timedelta(minutes=5)
     try:
-        # ограничим объём выборки на случай частых точек
-        pts = (TrackingPoint.query
-               .filter_by(session_id=session_id)
-               .filter(TrackingPoint.ts >= since)
-               .order_by(desc(TrackingPoint.ts))
-               .limit(500)
-               .all())
+        return _kpi_5m_by_session([session_id], now)[session_id]
     except Exception:
         return None
 
-    if not pts:
-        return {"points_5m": 0, "acc_avg_5m": None, "jumps_5m": 0}
-
-    accs = [p.accuracy_m for p in pts if p.accuracy_m is not None]
-    acc_avg = None
-    if accs:
-        try:
-            acc_avg = round(sum(accs) / len(accs), 1)
-        except Exception:
-            acc_avg = None
-
-    jumps = 0
-    for p in pts:
-        try:
-            flags = _tp_meta(p).get("flags") or []
-            if isinstance(flags, list) and ("jump" in flags):
-                jumps += 1
-        except Exception:
-            pass
-
-    return {"points_5m": len(pts), "acc_avg_5m": acc_avg, "jumps_5m": jumps}
-
 
 # -------------------------
 # MAX-3: display-point hysteresis (GNSS ↔ indoor estimate)
 # -------------------------
 
-def _is_est_point(tp: Optional[TrackingPoint], meta: Optional[Dict[str, Any]] = None) -> bool:
+# сколько последних точек сессии смотрит гистерезис display-точки
+DISPLAY_POINT_WINDOW = 30
+
+
+def _is_est_point(tp: Optional[TrackingPoint]) -> bool:
     if not tp:
         return False
-    m = meta if isinstance(meta, dict) else _tp_meta(tp)
-    src = (m.get("src") or m.get("source") or "")
-    flags = m.get("flags") or []
-    try:
-        if tp.kind == "est":
-            return True
-    except Exception:
-        pass
-    try:
-        if isinstance(flags, list) and ("est" in flags):
-            return True
-    except Exception:
-        pass
-    return str(src).lower() == "wifi_est"
+    return is_est(tp.kind, tp.flags, tp.src)
 
-def _is_good_gnss(tp: Optional[TrackingPoint], meta: Optional[Dict[str, Any]] = None) -> bool:
+def _is_good_gnss(tp: Optional[TrackingPoint]) -> bool:
     if not tp:
         return False
-    m = meta if isinstance(meta, dict) else _tp_meta(tp)
-    flags = m.get("flags") or []
-    try:
-        if isinstance(flags, list) and ("jump" in flags):
-            return False
-    except Exception:
-        pass
+    if has_jump(tp.flags):
+        return False
     try:
         if tp.kind == "est":
             return False
@@ -245,11 +192,16 @@ def _select_display_point(session_id: int, now: datetime) -> Optional[TrackingPo
         pts: List[TrackingPoint] = (TrackingPoint.query
                                    .filter_by(session_id=session_id)
                                    .order_by(desc(TrackingPoint.ts))
-                                   .limit(30)
+                                   .limit(DISPLAY_POINT_WINDOW)
                                    .all())
     except Exception:
         pts = []
 
+    return _pick_display_point(pts, now)
+
+
+def _pick_display_point(pts: List[TrackingPoint], now: datetime) -> Optional[TrackingPoint]:
+    """Гистерезис выбора точки по уже загруженным последним точкам сессии (новые сверху)."""
     if not pts:
         return None
 
@@ -272,12 +224,12 @@ def _select_display_point(session_id: int, now: datetime) -> Optional[TrackingPo
     gnss_good = []
     gnss_any = None
     for p in pts:
-        meta = _tp_meta(p)
-        if est_tp is None and _is_est_point(p, meta):
+        p_est = _is_est_point(p)
+        if est_tp is None and p_est:
             est_tp = p
-        if gnss_any is None and (not _is_est_point(p, meta)):
+        if gnss_any is None and not p_est:
             gnss_any = p
-        if (not _is_est_point(p, meta)) and _is_good_gnss(p, meta):
+        if not p_est and _is_good_gnss(p):
             gnss_good.append(p)
 
     # freshness windows
@@ -293,7 +245,7 @@ def _select_display_point(session_id: int, now: datetime) -> Optional[TrackingPo
         recent_good = [p for p in gnss_good if _age_sec(p) <= stable_window_sec]
         if len(recent_good) >= 2:
             try:
-                d = _haversine_m(float(recent_good[0].lat), float(recent_good[0].lon), float(recent_good[1].lat), float(recent_good[1].lon))
+                d = haversine_m(float(recent_good[0].lat), float(recent_good[0].lon), float(recent_good[1].lat), float(recent_good[1].lon))
             except Exception:
                 d = 9999.0
             if d <= stable_dist_m:
@@ -391,6 +343,34 @@ def _compute_device_status(now: datetime, last_point_ts: Optional[datetime], hea
     }
 
 
+def _health_snapshot(dev: Optional[TrackerDevice], h: Optional[TrackerDeviceHealth], now: datetime) -> Tuple[Optional[Dict[str, Any]], Optional[int], Optional[datetime]]:
+    """health (dict), возраст health в секундах и heartbeat_ts для статуса устройства.
+
+    heartbeat = max(dev.last_seen_at, health.updated_at).
+    """
+    health = h.to_dict() if h else None
+    health_age_sec = None
+    if h and h.updated_at:
+        try:
+            health_age_sec = int((now - h.updated_at).total_seconds())
+        except Exception:
+            health_age_sec = None
+
+    heartbeat_ts = None
+    try:
+        if dev and dev.last_seen_at:
+            heartbeat_ts = dev.last_seen_at
+    except Exception:
+        heartbeat_ts = None
+    try:
+        if h and h.updated_at:
+            heartbeat_ts = (heartbeat_ts if (heartbeat_ts and heartbeat_ts >= h.updated_at) else h.updated_at)
+    except Exception:
+        pass
+
+    return health, health_age_sec, heartbeat_ts
+
+
 def _log_event(user_id: str, shift_id: Optional[int], event_type: str, actor: str = 'system', payload: Optional[Dict[str, Any]] = None) -> None:
     ev = DutyEvent(
         user_id=str(user_id),
@@ -433,8 +413,8 @@ def _get_or_create_active_shift(user_id: str, unit_label: Optional[str] = None)
 def _get_last_location(user_id: str) -> Optional[Dict[str, Any]]:
     """Последняя известная точка для пользователя.
 
-    Сначала смотрим активную live-сессию (если есть), иначе берём последнюю
-    точку из истории (TrackingPoint).
+    Сначала смотрим активную live-сессию (если есть), иначе берём
+    материализованную последнюю точку (tracker_last_position).
     """
     uid = str(user_id)
     sess = TrackingSession.query.filter_by(user_id=uid, ended_at=None).order_by(desc(TrackingSession.started_at)).first()
@@ -447,7 +427,7 @@ def _get_last_location(user_id: str) -> Optional[Dict[str, Any]]:
             'session_id': sess.id,
         }
 
-    lp = TrackingPoint.query.filter_by(user_id=uid).order_by(desc(TrackingPoint.ts)).first()
+    lp = get_last_position(uid)
     if lp:
         return {
             'lat': lp.lat,
@@ -493,15 +473,23 @@ def _build_route_svg(points: List[TrackingPoint], stops: List[TrackingStop], wid
         # y вверх, в svg вниз
         return (20 + x*(width-40), 20 + (1-y)*(height-40))
 
+    # полилиния: без скачков и упрощённая до ~0.5 px рисунка (за смену — десятки тысяч точек)
+    track = Track.from_points(points)
+    track = track.subset(jump_mask(track, float(current_app.config.get('TRACK_JUMP_MAX_SPEED_MPS', 70))))
+    mid_lat = math.radians((min_lat + max_lat) / 2)
+    m_per_px = max(
+        (max_lon - min_lon) * 111320.0 * math.cos(mid_lat) / (width - 40),
+        (max_lat - min_lat) * 110540.0 / (height - 40),
+    )
     path = []
-    for p in points:
-        x,y = proj(p.lat, p.lon)
+    for k in simplify(track, 0.5 * m_per_px):
+        x,y = proj(track.lat[k], track.lon[k])
         path.append(f"{x:.2f},{y:.2f}")
     polyline = " ".join(path)
 
     # start/end points
-    sx,sy = proj(points[0].lat, points[0].lon)
-    ex,ey = proj(points[-1].lat, points[-1].lon)
+    sx,sy = proj(lats[0], lons[0])
+    ex,ey = proj(lats[-1], lons[-1])
 
     # stops markers
     stop_circles = []
@@ -524,45 +512,46 @@ def _build_route_svg(points: List[TrackingPoint], stops: List[TrackingStop], wid
 
 
 def _compute_stops(points: List[TrackingPoint], radius_m: float = 10.0, min_sec: int = 60) -> List[TrackingStop]:
-    # простой алгоритм: скользящее окно "пока рядом" — считаем сегмент стоянки.
+    # окно "пока рядом с якорем" (tracker/track_processing.find_stops); скачки GPS
+    # внутри стоянки не должны рвать её на части — отбрасываем их заранее.
     stops: List[TrackingStop] = []
     if len(points) < 2:
         return stops
 
-    i = 0
-    while i < len(points)-1:
-        p0 = points[i]
-        j = i+1
-        cluster = [p0]
-        while j < len(points):
-            pj = points[j]
-            if haversine_m(p0.lat, p0.lon, pj.lat, pj.lon) <= radius_m:
-                cluster.append(pj)
-                j += 1
-            else:
-                break
-        if len(cluster) >= 2:
-            dt = (cluster[-1].ts - cluster[0].ts).total_seconds()
-            if dt >= min_sec:
-                lat_c = sum(p.lat for p in cluster)/len(cluster)
-                lon_c = sum(p.lon for p in cluster)/len(cluster)
-                st = TrackingStop(
-                    session_id=points[i].session_id,
-                    start_ts=cluster[0].ts,
-                    end_ts=cluster[-1].ts,
-                    center_lat=lat_c,
-                    center_lon=lon_c,
-                    duration_sec=int(dt),
-                    radius_m=int(radius_m),
-                    points_count=len(cluster),
-                )
-                stops.append(st)
-                i = j
-                continue
-        i += 1
+    track = Track.from_points(points)
+    track = track.subset(jump_mask(track, float(current_app.config.get('TRACK_JUMP_MAX_SPEED_MPS', 70))))
+    for i, j in find_stops(track, radius_m=radius_m, min_sec=min_sec):
+        first, last = points[int(track.index[i])], points[int(track.index[j - 1])]
+        st = TrackingStop(
+            session_id=first.session_id,
+            start_ts=first.ts,
+            end_ts=last.ts,
+            center_lat=float(track.lat[i:j].mean()),
+            center_lon=float(track.lon[i:j].mean()),
+            duration_sec=int((track.t_us[j - 1] - track.t_us[i]) // 1_000_000),
+            radius_m=int(radius_m),
+            points_count=j - i,
+        )
+        stops.append(st)
     return stops
 
 
+def _simplify_params() -> Tuple[Optional[float], Optional[float], str]:
+    """zoom / tolerance_m / method упрощения трека из query (с дефолтами из конфига)."""
+    def _num(name: str) -> Optional[float]:
+        try:
+            v = request.args.get(name)
+            return float(v) if v not in (None, '') else None
+        except (TypeError, ValueError):
+            return None
+
+    zoom = _num('zoom')
+    if zoom is None:
+        zoom = float(current_app.config.get('TRACK_SIMPLIFY_ZOOM', 16))
+    method = (request.args.get('method') or current_app.config.get('TRACK_SIMPLIFY_METHOD') or 'dp').strip().lower()
+    return zoom, _num('tolerance_m'), method
+
+
 def _create_notification(user_id: str, kind: str, text: str, payload: Optional[Dict[str, Any]] = None) -> None:
     n = DutyNotification(
         user_id=str(user_id),
@@ -760,8 +749,9 @@ def api_bot_checkin():
     unit = (data.get('unit_label') or '').strip()[:64] or None
 
     sh = _get_or_create_active_shift(user_id, unit_label=unit)
-    pt = TrackingPoint(session_id=None, user_id=user_id, ts=_utcnow(), lat=lat, lon=lon, accuracy_m=data.get('accuracy_m'), kind='checkin', raw_json=json.dumps(data, ensure_ascii=False))
+    pt = TrackingPoint(session_id=None, user_id=user_id, ts=_utcnow(), lat=lat, lon=lon, accuracy_m=data.get('accuracy_m'), kind='checkin', raw_json=json.dumps(data, ensure_ascii=False), **point_columns(data))
     db.session.add(pt)
+    upsert_last_position_for(pt)
     _log_event(user_id, sh.id, 'CHECKIN', actor='user', payload={'lat': lat, 'lon': lon, 'note': note})
     _commit_telemetry_write()
 
@@ -803,8 +793,9 @@ def api_bot_live_location():
 
     # точка
     ts = _utcnow()
-    pt = TrackingPoint(session_id=sess.id if sess else None, user_id=user_id, ts=ts, lat=lat, lon=lon, accuracy_m=data.get('accuracy_m'), kind='live' if is_live else 'location', raw_json=json.dumps(data, ensure_ascii=False))
+    pt = TrackingPoint(session_id=sess.id if sess else None, user_id=user_id, ts=ts, lat=lat, lon=lon, accuracy_m=data.get('accuracy_m'), kind='live' if is_live else 'location', raw_json=json.dumps(data, ensure_ascii=False), **point_columns(data))
     db.session.add(pt)
+    upsert_last_position_for(pt)
 
     # обновим состояние сессии
     if sess:
@@ -876,12 +867,22 @@ def api_bot_tracking_stop():
     }
     sess.summary_json = json.dumps(summary, ensure_ascii=False)
 
+    # упрощённая геометрия маршрута — только в ответе (в summary_json/журнал не пишем)
+    zoom = float(current_app.config.get('TRACK_SIMPLIFY_ZOOM', 16))
+    idx, simplify_info = simplify_points(
+        points,
+        zoom=zoom,
+        method=current_app.config.get('TRACK_SIMPLIFY_METHOD', 'dp'),
+        max_speed_mps=float(current_app.config.get('TRACK_JUMP_MAX_SPEED_MPS', 70)),
+    )
+    route = {'points': [[points[k].lat, points[k].lon] for k in idx], 'simplify': simplify_info}
+
     sh = _get_active_shift(user_id)
     _log_event(user_id, sh.id if sh else None, 'TRACKING_STOP', actor='user', payload={'session_id': sess.id, 'snapshot': filename, **summary})
     db.session.commit()
 
     broadcast_event_sync('tracking_stopped', {'user_id': user_id, 'shift_id': sh.id if sh else None, 'session_id': sess.id, 'snapshot_url': f"/uploads/{filename}"})
-    return jsonify({'ok': True, 'session_id': sess.id, 'snapshot_url': f"/uploads/{filename}", 'summary': summary})
+    return jsonify({'ok': True, 'session_id': sess.id, 'snapshot_url': f"/uploads/{filename}", 'summary': summary, 'route': route})
 
 
 
@@ -1032,110 +1033,7 @@ def api_bot_set_unit():
 @bp.get('/api/duty/admin/dashboard')
 def api_admin_dashboard():
     require_admin()
-    now = _utcnow()
-    shifts = DutyShift.query.filter(DutyShift.ended_at == None).order_by(desc(DutyShift.started_at)).all()  # noqa: E711
-    res_shifts = []
-    for sh in shifts:
-        # last point: prefer last TrackingPoint (has accuracy_m). Fallback to session.last_*.
-        sess = TrackingSession.query.filter_by(user_id=sh.user_id, ended_at=None).order_by(desc(TrackingSession.started_at)).first()
-        last = None
-        last_ts = None
-
-        if sess:
-            lp = _select_display_point(sess.id, now)
-            if lp and lp.lat is not None and lp.lon is not None:
-                last = {
-                    'lat': lp.lat,
-                    'lon': lp.lon,
-                    'ts': lp.ts.isoformat() if lp.ts else None,
-                    'session_id': lp.session_id,
-                    'accuracy_m': lp.accuracy_m,
-                }
-                last_ts = lp.ts
-                meta = _last_meta_fields(lp)
-                if meta and last:
-                    last.update(meta)
-            elif sess.last_lat is not None and sess.last_lon is not None:
-                last = {
-                    'lat': sess.last_lat,
-                    'lon': sess.last_lon,
-                    'ts': sess.last_at.isoformat() if sess.last_at else None,
-                    'session_id': sess.id,
-                    'accuracy_m': None,
-                }
-                last_ts = sess.last_at
-
-        if not last:
-            lp = TrackingPoint.query.filter_by(user_id=sh.user_id).order_by(desc(TrackingPoint.ts)).first()
-            if lp and lp.lat is not None and lp.lon is not None:
-                last = {
-                    'lat': lp.lat,
-                    'lon': lp.lon,
-                    'ts': lp.ts.isoformat() if lp.ts else None,
-                    'session_id': lp.session_id,
-                    'accuracy_m': lp.accuracy_m,
-                }
-                last_ts = lp.ts
-                meta = _last_meta_fields(lp)
-                if meta and last:
-                    last.update(meta)
-        br = BreakRequest.query.filter_by(user_id=sh.user_id).filter(BreakRequest.status.in_(['requested','started'])).order_by(desc(BreakRequest.requested_at)).first()
-        # last health (Android) if exists
-        # Важно: у одного user_id может быть несколько устройств (перепривязка/ротация).
-        # Поэтому берём health именно для "актуального" устройства (по last_seen_at),
-        # иначе Dashboard может показывать старую health/"нет связи" при наличии новых точек.
-        dev = (
-            TrackerDevice.query
-            .filter(TrackerDevice.user_id == sh.user_id, TrackerDevice.is_revoked == False)  # noqa: E712
-            .order_by(desc(TrackerDevice.last_seen_at), desc(TrackerDevice.created_at))
-            .first()
-        )
-        h = TrackerDeviceHealth.query.filter_by(device_id=dev.public_id).first() if dev else (
-            TrackerDeviceHealth.query.filter_by(user_id=sh.user_id).order_by(desc(TrackerDeviceHealth.updated_at)).first()
-        )
-        health = h.to_dict() if h else None
-        health_age_sec = None
-        if h and h.updated_at:
-            try:
-                health_age_sec = int((now - h.updated_at).total_seconds())
-            except Exception:
-                health_age_sec = None
-
-        heartbeat_ts = None
-        try:
-            if dev and dev.last_seen_at:
-                heartbeat_ts = dev.last_seen_at
-        except Exception:
-            heartbeat_ts = None
-        try:
-            if h and h.updated_at:
-                heartbeat_ts = (heartbeat_ts if (heartbeat_ts and heartbeat_ts >= h.updated_at) else h.updated_at)
-        except Exception:
-            pass
-
-        device_status = _compute_device_status(now, last_ts, heartbeat_ts)
-
-        res_shifts.append({
-            'shift_id': sh.id,
-            'user_id': sh.user_id,
-            'unit_label': sh.unit_label,
-            'started_at': sh.started_at.isoformat() if sh.started_at else None,
-            'last': last,
-            'tracking_active': bool(sess and sess.ended_at is None),
-            'break': br.to_dict() if br else None,
-            'health': health,
-            'health_age_sec': health_age_sec,
-            'device_status': device_status,
-            'kpi_5m': _kpi_5m_for_session(last.get('session_id') if last else None, now),
-        })
-
-    breaks = BreakRequest.query.filter(BreakRequest.status.in_(['requested','started'])).order_by(desc(BreakRequest.requested_at)).all()
-    res_breaks = [b.to_dict() for b in breaks]
-
-    sos_rows = SosAlert.query.filter(SosAlert.status.in_(['open','acked'])).order_by(desc(SosAlert.created_at)).limit(50).all()
-    res_sos = [r.to_dict() for r in sos_rows]
-
-    return jsonify({'server_time': now.isoformat(), 'active_shifts': res_shifts, 'breaks': res_breaks, 'sos_active': res_sos, 'sos_active_count': len(res_sos)})
+    return jsonify(build_dashboard_snapshot(_utcnow()))
 
 
 @bp.get('/api/duty/admin/shift/<int:shift_id>/detail')
@@ -1183,7 +1081,7 @@ def api_admin_shift_detail(shift_id: int):
             last_session_id = active_sess.id
 
     if not last:
-        lp = TrackingPoint.query.filter_by(user_id=sh.user_id).order_by(desc(TrackingPoint.ts)).first()
+        lp = get_last_position(sh.user_id)
         if lp and lp.lat is not None and lp.lon is not None:
             last = {
                 'lat': lp.lat,
@@ -1191,9 +1089,7 @@ def api_admin_shift_detail(shift_id: int):
                 'ts': lp.ts.isoformat() if lp.ts else None,
                 'accuracy_m': lp.accuracy_m,
             }
-            meta = _last_meta_fields(lp)
-            if meta and last:
-                last.update(meta)
+            last.update(lp.display_fields())
             last_ts = lp.ts
             last_session_id = lp.session_id
 
@@ -1218,25 +1114,7 @@ def api_admin_shift_detail(shift_id: int):
     h = TrackerDeviceHealth.query.filter_by(device_id=dev.public_id).first() if dev else (
         TrackerDeviceHealth.query.filter_by(user_id=sh.user_id).order_by(desc(TrackerDeviceHealth.updated_at)).first()
     )
-    health = h.to_dict() if h else None
-    health_age_sec = None
-    if h and h.updated_at:
-        try:
-            health_age_sec = int((now - h.updated_at).total_seconds())
-        except Exception:
-            health_age_sec = None
-
-    heartbeat_ts = None
-    try:
-        if dev and dev.last_seen_at:
-            heartbeat_ts = dev.last_seen_at
-    except Exception:
-        heartbeat_ts = None
-    try:
-        if h and h.updated_at:
-            heartbeat_ts = (heartbeat_ts if (heartbeat_ts and heartbeat_ts >= h.updated_at) else h.updated_at)
-    except Exception:
-        pass
+    health, health_age_sec, heartbeat_ts = _health_snapshot(dev, h, now)
 
     device_status = _compute_device_status(now, last_ts, heartbeat_ts)
 
@@ -1311,16 +1189,33 @@ def api_admin_sos_close(sos_id: int):
 
 @bp.get('/api/duty/admin/tracking/<int:session_id>')
 def api_admin_tracking(session_id: int):
+    """Трек сессии: по умолчанию упрощённый под zoom карты, без скачков.
+
+    Query: zoom (по умолчанию TRACK_SIMPLIFY_ZOOM), tolerance_m (перекрывает zoom),
+    method=dp|vw, raw=1 — все точки как есть.
+    """
     require_admin()
     sess = TrackingSession.query.get(session_id)
     if not sess:
         return jsonify({'error': 'not found'}), 404
     points = TrackingPoint.query.filter_by(session_id=session_id).order_by(TrackingPoint.ts.asc()).all()
     stops = TrackingStop.query.filter_by(session_id=session_id).order_by(TrackingStop.start_ts.asc()).all()
+    simplify_info = None
+    if (request.args.get('raw') or '').strip().lower() not in ('1', 'true', 'yes'):
+        zoom, tolerance_m, method = _simplify_params()
+        idx, simplify_info = simplify_points(
+            points,
+            zoom=zoom,
+            tolerance_m=tolerance_m,
+            method=method,
+            max_speed_mps=float(current_app.config.get('TRACK_JUMP_MAX_SPEED_MPS', 70)),
+        )
+        points = [points[k] for k in idx]
     return jsonify({
         'session': sess.to_dict(),
         'points': [p.to_dict() for p in points],
         'stops': [s.to_dict() for s in stops],
+        'simplify': simplify_info,
         'snapshot_url': f"/uploads/{sess.snapshot_path}" if sess.snapshot_path else None,
     })
 
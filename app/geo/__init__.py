@@ -0,0 +1,13 @@
+"""
+Пакет geo — гео‑API для слоёв карты, общие для нескольких сущностей.
+
+Здесь серверная кластеризация точек (`/api/geo/clusters`,
+:mod:`app.services.cluster_service`) и векторные тайлы слоёв
+(`/api/geo/tiles/<layer>/<z>/<x>/<y>.mvt`, :mod:`app.services.vector_tiles`).
+"""
+
+from compat_flask import Blueprint
+
+bp = Blueprint("geo", __name__, url_prefix="/api/geo")
+
+from . import routes  # noqa: F401
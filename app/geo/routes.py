@@ -0,0 +1,98 @@
+"""Маршруты гео‑API: разбор параметров и права доступа к слоям."""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Optional, Set
+
+from compat_flask import Response, abort, current_app, jsonify, make_response, request
+
+from . import bp
+from ..helpers import get_current_admin, require_admin
+from ..services import cluster_service, vector_tiles
+
+WORLD = (-180.0, -85.0, 180.0, 85.0)
+
+
+def _parse_bbox(raw: str) -> Optional[tuple]:
+    if not raw:
+        return WORLD
+    try:
+        west, south, east, north = (float(v) for v in raw.split(','))
+    except ValueError:
+        return None
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        return None
+    return west, south, east, north
+
+
+def _visible_zones(layer: str) -> Optional[Set[int]]:
+    """Зоны, точки которых видны текущему пользователю (None — все).
+
+    Правила те же, что у списков слоёв: superadmin видит всё; остальным
+    адреса, зоны и заявки — только из их зон (без привязанных зон —
+    ничего, как в ``list_addresses``). У объектов и инцидентов зон нет.
+    """
+    if layer in ('objects', 'incidents'):
+        return None
+    admin = get_current_admin()
+    if admin is None or getattr(admin, 'role', None) == 'superadmin':
+        return None
+    return {z.id for z in admin.zones}
+
+
+@bp.get('/clusters')
+def api_geo_clusters():
+    """Кластеры точек слоя в bbox на зуме z.
+
+    Параметры: layer (addresses|pending|objects), bbox=west,south,east,north
+    (по умолчанию весь мир), z (0..22). Ответ: ``clusters`` —
+    [{lat, lon, count, expansion_zoom}], ``points`` — одиночные точки
+    [{id, lat, lon}] (подробности — через API соответствующего слоя).
+    """
+    layer = (request.args.get('layer') or '').strip()
+    if layer not in cluster_service.LAYERS:
+        return jsonify({'error': 'unknown layer', 'layers': sorted(cluster_service.LAYERS)}), 400
+    if layer in ('pending', 'objects'):
+        require_admin("viewer")
+
+    bbox = _parse_bbox((request.args.get('bbox') or '').strip())
+    if bbox is None:
+        return jsonify({'error': 'invalid bbox'}), 400
+    try:
+        z = int(request.args.get('z', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'invalid zoom'}), 400
+    z = max(0, min(z, cluster_service.MAX_ZOOM))
+
+    max_age = float(current_app.config.get('CLUSTER_INDEX_MAX_AGE_SEC', cluster_service.DEFAULT_MAX_AGE_SEC))
+    result = cluster_service.get_clusters(layer, bbox, z, zones=_visible_zones(layer), max_age=max_age)
+    resp = make_response(jsonify(result))
+    # ответ зависит от пользователя (зоны) — только приватный кэш
+    resp.headers['Cache-Control'] = 'private, max-age=5'
+    return resp
+
+
+@bp.get('/tiles/<layer>/<int:z>/<int:x>/<int:y>.mvt')
+def api_geo_vector_tile(layer: str, z: int, x: int, y: int):
+    """Векторный тайл (MVT) слоя: addresses|incidents|objects|zones.
+
+    В каждой фиче — id и короткие свойства для стилей и фильтров на
+    клиенте; подробности объекта — через API соответствующего слоя.
+    Пустой тайл — 204. Ответ ревалидируется по ETag: кэш на сервере
+    сбрасывается при изменении строк слоя.
+    """
+    if layer not in vector_tiles.LAYERS:
+        abort(404)
+    if layer != 'addresses':
+        require_admin("viewer")
+    try:
+        data = vector_tiles.get_tile(layer, z, x, y, zones=_visible_zones(layer))
+    except ValueError:
+        abort(404)
+    if not data:
+        return Response(status=204)
+    resp = Response(data, mimetype=vector_tiles.MIME_TYPE)
+    resp.set_etag(hashlib.sha1(data).hexdigest()[:20])
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp.make_conditional(request)
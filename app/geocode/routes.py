@@ -9,7 +9,21 @@ from __future__ import annotations
 from compat_flask import jsonify, request, make_response
 
 from . import bp
-from ..services.geocode_service import geocode
+from ..cache import get_cache
+from ..helpers import in_range, parse_coord, require_admin
+from ..services.geocode_service import CACHE_NAME, geocode, offline_index_stats, reverse_geocode
+from ..services.nominatim_service import NominatimBusy, NominatimUnavailable
+
+
+def _upstream_error(exc: NominatimUnavailable):
+    """503 с Retry-After — limiter занят, 502 — Nominatim не ответил; не кэшируется."""
+    if isinstance(exc, NominatimBusy):
+        resp = make_response(jsonify({'error': 'geocoder busy', 'retry_after': exc.retry_after}), 503)
+        resp.headers['Retry-After'] = str(max(1, int(exc.retry_after + 0.999)))
+    else:
+        resp = make_response(jsonify({'error': 'geocoder unavailable'}), 502)
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 
 @bp.get("/geocode")
@@ -22,8 +36,39 @@ def api_geocode():
         limit = 1
     lang = request.args.get('lang', 'ru').strip() or 'ru'
 
-    results = geocode(q=q, limit=limit, lang=lang)
+    try:
+        results = geocode(q=q, limit=limit, lang=lang)
+    except NominatimUnavailable as exc:
+        return _upstream_error(exc)
     resp = make_response(jsonify(results))
     # Геокодер можно кэшировать немного дольше, так как данные редко меняются
     resp.headers['Cache-Control'] = 'public, max-age=300'
     return resp
+
+
+@bp.get("/geocode/reverse")
+def api_geocode_reverse():
+    """Адрес по координатам (Nominatim через постоянный кэш)."""
+    lat = parse_coord(request.args.get('lat'))
+    lon = parse_coord(request.args.get('lon'))
+    if lat is None or lon is None or not in_range(lat, lon):
+        return jsonify({'error': 'invalid coordinates'}), 400
+    lang = request.args.get('lang', 'ru').strip() or 'ru'
+
+    try:
+        results = reverse_geocode(lat, lon, lang=lang)
+    except NominatimUnavailable as exc:
+        return _upstream_error(exc)
+    resp = make_response(jsonify(results))
+    resp.headers['Cache-Control'] = 'public, max-age=300'
+    return resp
+
+
+@bp.get("/geocode/index")
+def api_geocode_index():
+    """Диагностика офлайн‑индекса геокодера: размер, время сборки, память, кэш."""
+    require_admin('viewer')
+    return jsonify({
+        'index': offline_index_stats(),
+        'cache': get_cache(CACHE_NAME).stats(),
+    })
@@ -81,7 +81,7 @@ def haversine_m(lat1, lon1, lat2, lon2) -> float:
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
     a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
-    return 2 * R * math.atan2(math.sqrt(1 - a), math.sqrt(a))
+    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
 def find_duplicate(name: str, lat: Optional[float], lon: Optional[float], items: List[Dict[str, Any]], pending: List[Dict[str, Any]], threshold_m: int = 100):
@@ -90,32 +90,12 @@ def find_duplicate(name: str, lat: Optional[float], lon: Optional[float], items:
     Возвращает dict {'type': 'address'|'pending', 'id': int} либо None.
     Критерий:
       - если есть координаты, ближе threshold_m;
-      - иначе по совпадению имени (регистронезависимо).
+      - либо совпадение нормализованного имени (регистр и пробелы не важны).
+    Реализация — app.services.duplicate_service (сеточный индекс).
     """
-    nm = (name or "").strip().lower()
-    # Смотрим среди сохранённых адресов
-    for it in items:
-        if lat is not None and lon is not None and it.get("lat") is not None:
-            try:
-                dist = haversine_m(lat, lon, float(it["lat"]), float(it["lon"]))
-                if dist <= threshold_m:
-                    return {"type": "address", "id": int(it["id"])}
-            except Exception:
-                pass
-        if nm and (it.get("name") or it.get("address") or "").strip().lower() == nm:
-            return {"type": "address", "id": int(it["id"])}
-    # Среди ожидающих
-    for it in pending:
-        if lat is not None and lon is not None and it.get("lat") is not None:
-            try:
-                dist = haversine_m(lat, lon, float(it["lat"]), float(it["lon"]))
-                if dist <= threshold_m:
-                    return {"type": "pending", "id": int(it["id"])}
-            except Exception:
-                pass
-        if nm and (it.get("name") or "").strip().lower() == nm:
-            return {"type": "pending", "id": int(it["id"])}
-    return None
+    from .services.duplicate_service import find_duplicate_in_items
+
+    return find_duplicate_in_items(name, lat, lon, items, pending, threshold_m)
 
 
 def require_admin(min_role: str = "editor") -> None:
@@ -0,0 +1,207 @@
+"""Range partitions by ``ts`` for the large append-only logs.
+
+``tracking_points`` and ``tracker_device_health_log`` are converted to
+declarative range partitions on Postgres by migration 0021 (daily or weekly,
+see TRACKING_PARTITION_INTERVAL). This module keeps them healthy at runtime:
+
+- ``ensure_future_partitions()`` pre-creates partitions for the next
+  TRACKING_PARTITION_PREMAKE periods, so inserts never land in the
+  ``<table>_default`` catch-all partition;
+- ``purge_older_than()`` drops whole partitions whose upper bound is at or
+  below the cutoff instead of a long ``DELETE ... WHERE ts < cutoff``
+  (no table bloat, no long row locks). Rows in a partially expired boundary
+  partition stay until the whole period expires.
+
+On SQLite (dev/tests) and on non-partitioned Postgres tables everything
+falls back to the plain ``DELETE``.
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from compat_flask import current_app
+from sqlalchemy import text
+
+from ..extensions import db
+
+
+PARTITIONED_TABLES = ("tracking_points", "tracker_device_health_log")
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def _cfg(key: str, default: Any) -> Any:
+    try:
+        return current_app.config.get(key, default)
+    except Exception:
+        return default
+
+
+def partition_interval() -> str:
+    v = str(_cfg("TRACKING_PARTITION_INTERVAL", "day") or "day").strip().lower()
+    return "week" if v.startswith("week") else "day"
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def period_start(dt: datetime, interval: str) -> datetime:
+    """Period start (naive UTC): midnight of the day or Monday of the week."""
+    d = _naive_utc(dt).replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "week":
+        d -= timedelta(days=d.weekday())
+    return d
+
+
+def next_period(start: datetime, interval: str) -> datetime:
+    return start + timedelta(days=7 if interval == "week" else 1)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def _is_postgres() -> bool:
+    try:
+        return db.session.get_bind().dialect.name == "postgresql"
+    except Exception:
+        return False
+
+
+def is_partitioned(table: str) -> bool:
+    """True if ``table`` is a partitioned Postgres table."""
+    if not _is_postgres():
+        return False
+    row = db.session.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = :t AND pg_table_is_visible(c.oid)"
+        ),
+        {"t": table},
+    ).first()
+    return row is not None
+
+
+def parse_bound(expr: str) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """``FOR VALUES FROM ('...') TO ('...')`` -> (lower, upper); DEFAULT -> (None, None)."""
+    m = _BOUND_RE.search(expr or "")
+    if not m:
+        return None, None
+    return datetime.fromisoformat(m.group(1)), datetime.fromisoformat(m.group(2))
+
+
+def list_partitions(table: str) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """Partitions of ``table`` as (name, lower, upper), DEFAULT first, then ascending."""
+    rows = db.session.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :t AND pg_table_is_visible(p.oid)"
+        ),
+        {"t": table},
+    ).all()
+    out = [(str(name), *parse_bound(expr)) for name, expr in rows]
+    out.sort(key=lambda r: (r[1] is not None, r[1] or datetime.min))
+    return out
+
+
+def _partition_ddl(table: str, name: str, lo: datetime, hi: datetime) -> str:
+    return (
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{lo:%Y-%m-%d %H:%M:%S}') TO ('{hi:%Y-%m-%d %H:%M:%S}')"
+    )
+
+
+def ensure_future_partitions(now: Optional[datetime] = None, *, ahead: Optional[int] = None) -> Dict[str, List[str]]:
+    """Create missing partitions from the current period up to ``ahead`` periods ahead.
+
+    Each CREATE runs in its own savepoint: a partition that cannot be created
+    (e.g. the DEFAULT partition already holds rows for that range, or a
+    concurrent worker won the race) is logged and skipped, and neither the
+    other partitions nor the caller's transaction are lost.
+
+    Returns {table: [created partitions]}. Does not commit.
+    """
+    created: Dict[str, List[str]] = {}
+    if not _is_postgres():
+        return created
+
+    interval = partition_interval()
+    if ahead is None:
+        ahead = int(_cfg("TRACKING_PARTITION_PREMAKE", 7) or 7)
+    start = period_start(now or datetime.now(timezone.utc), interval)
+
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(table):
+            continue
+        existing = {name for name, _lo, _hi in list_partitions(table)}
+        lo = start
+        for _ in range(max(1, int(ahead) + 1)):
+            hi = next_period(lo, interval)
+            name = partition_name(table, lo)
+            if name not in existing:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(text(_partition_ddl(table, name, lo, hi)))
+                except Exception:
+                    current_app.logger.warning("partition %s: create failed, skipped", name, exc_info=True)
+                else:
+                    created.setdefault(table, []).append(name)
+            lo = hi
+    return created
+
+
+def drop_partitions_before(table: str, cutoff: datetime, *, dry_run: bool = False) -> Dict[str, Any]:
+    """Drop partitions of ``table`` that lie entirely before ``cutoff``. Does not commit.
+
+    Row count is the pg_class.reltuples estimate: an exact count would be
+    the very full scan we are trying to avoid.
+    """
+    cutoff = _naive_utc(cutoff)
+    dropped: List[str] = []
+    rows = 0
+    for name, _lo, hi in list_partitions(table):
+        if hi is None or hi > cutoff:
+            continue
+        est = db.session.execute(
+            text("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relname = :n"), {"n": name}
+        ).scalar()
+        rows += int(est or 0)
+        dropped.append(name)
+        if not dry_run:
+            db.session.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+    return {"partitions": dropped, "rows": rows}
+
+
+def purge_older_than(model: Any, cutoff: datetime, *, dry_run: bool = False) -> int:
+    """Remove ``model`` rows with ``ts < cutoff``: drop partitions on Postgres, DELETE otherwise.
+
+    Returns the number of removed rows (an estimate for dropped partitions).
+    Does not commit.
+    """
+    table = model.__tablename__
+    if not is_partitioned(table):
+        q = db.session.query(model).filter(model.ts < cutoff)
+        return int(q.count()) if dry_run else int(q.delete(synchronize_session=False))
+
+    res = drop_partitions_before(table, cutoff, dry_run=dry_run)
+    n = int(res["rows"])
+
+    # rows outside every range (clock skew, very old backfills) live in the DEFAULT partition
+    params = {"c": _naive_utc(cutoff)}
+    for default, lo, _hi in list_partitions(table):
+        if lo is not None:
+            continue
+        if dry_run:
+            n += int(db.session.execute(text(f'SELECT count(*) FROM "{default}" WHERE ts < :c'), params).scalar() or 0)
+        else:
+            n += int(db.session.execute(text(f'DELETE FROM "{default}" WHERE ts < :c'), params).rowcount or 0)
+    return n
@@ -18,6 +18,7 @@ from typing import Any, Dict, List
 from compat_flask import current_app
 
 from ..extensions import db
+from .partitions import ensure_future_partitions, purge_older_than
 from ..models import (
     TrackingPoint,
     TrackingStop,
@@ -29,6 +30,7 @@ from ..models import (
 try:
     # Optional: chat2 models may be absent in older bundles
     from ..event_chat.models import Message as Chat2Message
+    from ..event_chat.unread import forget_previews_before as forget_chat2_previews_before
 except Exception:  # pragma: no cover
     Chat2Message = None  # type: ignore
 
@@ -87,7 +89,7 @@ def run_retention_cleanup(*, dry_run: bool = False) -> Dict[str, Any]:
     cutoff_chat_dt = now - timedelta(days=cfg["chat_days"])
     cutoff_inc_dt = now - timedelta(days=cfg["incidents_days"])
 
-    # TrackingPoint.ts is epoch milliseconds
+    # kept in the report for compatibility; TrackingPoint.ts itself is a DateTime
     cutoff_track_ts = int(cutoff_track_dt.timestamp() * 1000)
 
     report: Dict[str, Any] = {
@@ -95,6 +97,7 @@ def run_retention_cleanup(*, dry_run: bool = False) -> Dict[str, Any]:
         "now_utc": now.isoformat() + "Z",
         "cutoffs": {
             "tracks_ts_ms": cutoff_track_ts,
+            "tracks_ts": cutoff_track_dt.isoformat(),
             "chat_created_at": cutoff_chat_dt.isoformat() + "Z",
             "incidents_updated_at": cutoff_inc_dt.isoformat() + "Z",
         },
@@ -109,17 +112,19 @@ def run_retention_cleanup(*, dry_run: bool = False) -> Dict[str, Any]:
     }
 
     # --- Tracks ---
-    q_points = db.session.query(TrackingPoint).filter(TrackingPoint.ts < cutoff_track_ts)
+    # On partitioned Postgres tracking_points expired partitions are dropped
+    # as a whole (see maintenance.partitions); elsewhere it is a plain DELETE.
+    if not dry_run:
+        report["partitions_created"] = ensure_future_partitions(now)
+    report["deleted"]["tracking_points"] = purge_older_than(TrackingPoint, cutoff_track_dt, dry_run=dry_run)
+
     q_stops = db.session.query(TrackingStop).filter(
-        (TrackingStop.end_ts.isnot(None) & (TrackingStop.end_ts < cutoff_track_ts))
-        | (TrackingStop.end_ts.is_(None) & (TrackingStop.start_ts < cutoff_track_ts))
+        (TrackingStop.end_ts.isnot(None) & (TrackingStop.end_ts < cutoff_track_dt))
+        | (TrackingStop.end_ts.is_(None) & (TrackingStop.start_ts < cutoff_track_dt))
     )
-
     if dry_run:
-        report["deleted"]["tracking_points"] = int(q_points.count())
         report["deleted"]["tracking_stops"] = int(q_stops.count())
     else:
-        report["deleted"]["tracking_points"] = int(q_points.delete(synchronize_session=False))
         report["deleted"]["tracking_stops"] = int(q_stops.delete(synchronize_session=False))
 
     # --- Chat2 ---
@@ -129,6 +134,7 @@ def run_retention_cleanup(*, dry_run: bool = False) -> Dict[str, Any]:
             report["deleted"]["chat2_messages"] = int(q_chat2.count())
         else:
             report["deleted"]["chat2_messages"] = int(q_chat2.delete(synchronize_session=False))
+            forget_chat2_previews_before(cutoff_chat_dt)
 
     # --- Incidents ---
     q_inc = db.session.query(Incident).filter(Incident.updated_at < cutoff_inc_dt)
@@ -701,7 +701,7 @@ class ChatMessage(db.Model):
 
     __tablename__ = 'chat_messages'
     __table_args__ = (
-        db.Index('ix_chat_messages_user_created', 'user_id', 'created_at'),
+        db.Index('ix_chat_messages_user_created_id', 'user_id', 'created_at', 'id'),
     )
     id: int = db.Column(db.Integer, primary_key=True)
     user_id: str = db.Column(db.String(64), nullable=False)
@@ -861,6 +861,14 @@ class TrackingPoint(db.Model):
     lon = db.Column(db.Float, nullable=True)
     accuracy_m = db.Column(db.Float, nullable=True)
     kind = db.Column(db.String(16), default='live')  # live/checkin/location
+
+    # разобранные при приёме поля из raw_json (см. app.tracker.point_fields)
+    speed_mps = db.Column(db.Float, nullable=True)
+    bearing_deg = db.Column(db.Float, nullable=True)
+    flags = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # битовая маска FLAG_*
+    src = db.Column(db.String(32), nullable=True)
+    confidence = db.Column(db.Float, nullable=True)
+
     raw_json = db.Column(db.Text, nullable=True)
 
     def to_dict(self) -> Dict[str, Any]:
@@ -876,6 +884,76 @@ class TrackingPoint(db.Model):
         }
 
 
+class TrackerLastPosition(db.Model):
+    """Последняя известная точка пользователя (материализованная).
+
+    Обновляется upsert'ом в той же транзакции, что и вставка точек
+    (см. app.tracker.last_position), поэтому dashboard/SOS/алертинг читают
+    одну строку по PK вместо сортировки tracking_points и разбора raw_json.
+    Display-поля (скорость, курс, флаги, источник) уже разобраны при приёме.
+    """
+
+    __tablename__ = 'tracker_last_position'
+
+    user_id = db.Column(db.String(32), primary_key=True)
+    device_id = db.Column(db.String(32), nullable=True, index=True)  # TrackerDevice.public_id, если известен
+    session_id = db.Column(db.Integer, nullable=True)
+
+    ts = db.Column(db.DateTime, nullable=True, index=True)
+    lat = db.Column(db.Float, nullable=True)
+    lon = db.Column(db.Float, nullable=True)
+    accuracy_m = db.Column(db.Float, nullable=True)
+    kind = db.Column(db.String(16), nullable=True)
+
+    speed_mps = db.Column(db.Float, nullable=True)
+    bearing_deg = db.Column(db.Float, nullable=True)
+    flags_json = db.Column(db.Text, nullable=True)
+    source = db.Column(db.String(32), nullable=True)
+    # прочие диагностические поля display-точки (confidence, matches, method, ...)
+    extra_json = db.Column(db.Text, nullable=True)
+
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def flags(self) -> list:
+        try:
+            v = json.loads(self.flags_json or '[]')
+            return v if isinstance(v, list) else []
+        except Exception:
+            return []
+
+    def extra(self) -> Dict[str, Any]:
+        try:
+            v = json.loads(self.extra_json or '{}')
+            return v if isinstance(v, dict) else {}
+        except Exception:
+            return {}
+
+    def display_fields(self) -> Dict[str, Any]:
+        """То же, что duty._last_meta_fields() для исходной точки."""
+        out: Dict[str, Any] = {
+            'speed_mps': self.speed_mps,
+            'bearing_deg': self.bearing_deg,
+            'flags': self.flags(),
+        }
+        if self.source:
+            out['source'] = self.source
+        out.update(self.extra())
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'user_id': self.user_id,
+            'device_id': self.device_id,
+            'session_id': self.session_id,
+            'ts': self.ts.isoformat() if self.ts else None,
+            'lat': self.lat,
+            'lon': self.lon,
+            'accuracy_m': self.accuracy_m,
+            'kind': self.kind,
+            **self.display_fields(),
+        }
+
+
 class TrackingStop(db.Model):
     """Стоянка (когда наряд находился в радиусе R)."""
 
@@ -1768,3 +1846,108 @@ class AdminAuditLog(db.Model):
             'action': self.action,
             'payload': self.payload or {},
         }
+
+
+class GeocodeCacheEntry(db.Model):
+    """Постоянный кэш ответов Nominatim (прямое и обратное геокодирование).
+
+    Ключ — (kind, lang, query_key): нормализованный запрос для ``search``,
+    ``"lat,lon"`` с 5 знаками для ``reverse``. Пустой ``results`` —
+    негативная запись («ничего не найдено»), у неё свой, более короткий TTL.
+    Ошибки upstream не сохраняются. См. app.services.nominatim_service.
+    """
+
+    __tablename__ = 'geocode_cache'
+    __table_args__ = (
+        UniqueConstraint('kind', 'lang', 'query_key', name='uq_geocode_cache_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(8), nullable=False)  # search | reverse
+    lang = db.Column(db.String(16), nullable=False, default='ru')
+    query_key = db.Column(db.String(255), nullable=False)
+    results_json = db.Column(db.Text, nullable=False, default='[]')
+    # сколько результатов запрашивали у upstream (для search с большим limit)
+    fetched_limit = db.Column(db.Integer, nullable=False, default=1)
+    fetched_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def results(self) -> list:
+        try:
+            v = json.loads(self.results_json or '[]')
+            return v if isinstance(v, list) else []
+        except Exception:
+            return []
+
+
+class TileDownloadJob(db.Model):
+    """Фоновая загрузка офлайн‑тайлов (см. app.services.tile_download_service).
+
+    Тайлы задания нумеруются подряд по (z, x, y) в пределах ``ranges``;
+    ``cursor`` — сколько первых тайлов уже обработано, с него задание
+    продолжается после перезапуска. ``failed_json`` — тайлы, не скачанные
+    после всех повторов (``"z/x/y"``, не больше MAX_FAILED_KEEP); при resume
+    они пробуются снова.
+    """
+
+    __tablename__ = 'tile_download_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)  # queued|running|done|partial|failed|cancelled
+    set_name = db.Column(db.String(64), nullable=False, index=True)
+    target_dir = db.Column(db.String(512), nullable=False)
+    params_json = db.Column(db.Text, nullable=False, default='{}')  # city, zmin, zmax, ranges, url
+
+    total = db.Column(db.Integer, nullable=False, default=0)
+    cursor = db.Column(db.Integer, nullable=False, default=0)
+    done = db.Column(db.Integer, nullable=False, default=0)
+    downloaded = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    failed_json = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    created_by = db.Column(db.String(64), nullable=True)
+    worker = db.Column(db.String(128), nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def params(self) -> Dict[str, Any]:
+        try:
+            v = json.loads(self.params_json or '{}')
+            return v if isinstance(v, dict) else {}
+        except Exception:
+            return {}
+
+    def failed_tiles(self) -> list:
+        try:
+            v = json.loads(self.failed_json or '[]')
+            return v if isinstance(v, list) else []
+        except Exception:
+            return []
+
+    def to_dict(self) -> Dict[str, Any]:
+        params = self.params()
+        return {
+            'id': self.id,
+            'status': self.status,
+            'set': self.set_name,
+            'city': params.get('city'),
+            'zmin': params.get('zmin'),
+            'zmax': params.get('zmax'),
+            'total': self.total,
+            'done': self.done,
+            'pct': int(self.done * 100 / self.total) if self.total else 100,
+            'downloaded': self.downloaded,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'failed_tiles': self.failed_tiles()[:50],
+            'error': self.error,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
@@ -5,18 +5,35 @@
 чтобы не содержать тяжёлую бизнес‑логику.
 """
 
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from typing import Dict, Any, List
 
-from sqlalchemy import func
+from sqlalchemy import case, func
 from sqlalchemy.exc import OperationalError
 
+from ..cache import cached, invalidate_on
 from ..models import db, Address, PendingMarker, PendingHistory, Zone
 
 
 from typing import Optional
 
 
+# Сводки кэшируются на ANALYTICS_CACHE_SECONDS; любые записи адресов, заявок,
+# истории заявок и зон сбрасывают кэш после commit.
+CACHE_NAME = 'analytics'
+for _model in (Address, PendingMarker, PendingHistory, Zone):
+    invalidate_on(_model, CACHE_NAME)
+
+
+def _cache_seconds() -> int:
+    try:
+        from compat_flask import current_app
+
+        return int(current_app.config.get('ANALYTICS_CACHE_SECONDS', 60) or 0)
+    except Exception:
+        return 0
+
+
 def _pct(part: int, total: int) -> float:
     """Посчитать процент part от total.
 
@@ -112,6 +129,19 @@ def build_period_text(days: int = 7) -> Dict[str, Any]:
     }
 
 
+def get_period_text(days: int = 7) -> Dict[str, Any]:
+    """:func:`build_period_text` через кэш аналитики."""
+    days_clamped = max(1, min(int(days or 7), 365))
+    return cached(CACHE_NAME, f'text:{days_clamped}', lambda: build_period_text(days_clamped), _cache_seconds())
+
+
+def get_summary(days: int = 7, zone_id: Optional[int] = None) -> Dict[str, Any]:
+    """:func:`build_summary` через кэш аналитики (общий для JSON/CSV/XLSX)."""
+    days_clamped = max(1, min(int(days or 7), 365))
+    key = f'summary:{days_clamped}:{zone_id if zone_id is not None else "all"}'
+    return cached(CACHE_NAME, key, lambda: build_summary(days_clamped, zone_id), _cache_seconds())
+
+
 def build_summary(days: int = 7, zone_id: Optional[int] = None) -> Dict[str, Any]:
     """
     Построить сводку аналитики по адресам и заявкам.
@@ -151,14 +181,18 @@ def build_summary(days: int = 7, zone_id: Optional[int] = None) -> Dict[str, Any
     """
     # Ограничиваем значение days, чтобы избежать очень длинных интервалов
     days_clamped = max(1, min(int(days or 7), 365))
+    since = datetime.now(timezone.utc) - timedelta(days=days_clamped)
 
     # --- Базовые агрегаты по адресам ---
 
-    # Считаем количество адресов, с учётом возможного фильтра по зоне
-    addr_query = db.session.query(func.count(Address.id))
+    # Всего адресов и «добавлено за N дней» — одним запросом (условный count)
+    addr_query = db.session.query(
+        func.count(Address.id),
+        func.count(case((Address.created_at >= since, 1))),
+    )
     if zone_id is not None:
         addr_query = addr_query.filter(Address.zone_id == zone_id)
-    total_addresses = (addr_query.scalar() or 0)
+    total_addresses, added_last_n = addr_query.one()
 
     # Распределение по категориям
     cat_query = db.session.query(Address.category, func.count(Address.id))
@@ -189,22 +223,20 @@ def build_summary(days: int = 7, zone_id: Optional[int] = None) -> Dict[str, Any
     # если колонка не найдена.
     if zone_id is None:
         try:
+            # outer join: адреса без зоны приходят строкой zone_id=NULL,
+            # адреса со ссылкой на удалённую зону (Zone.id IS NULL) не считаем
             zone_rows = (
-                db.session.query(Zone.id, Zone.description, func.count(Address.id))
-                .join(Address, Address.zone_id == Zone.id)
-                .group_by(Zone.id, Zone.description)
+                db.session.query(Address.zone_id, Zone.id, func.count(Address.id))
+                .outerjoin(Zone, Address.zone_id == Zone.id)
+                .group_by(Address.zone_id, Zone.id)
                 .all()
             )
-            for zid, description, cnt in zone_rows:
-                label = (description or '').strip() or 'Без описания зоны'
-                by_zone[str(zid)] = int(cnt or 0)
-            # Адреса без зоны
-            no_zone_count = (
-                db.session.query(func.count(Address.id))
-                .filter(Address.zone_id.is_(None))
-                .scalar()
-                or 0
-            )
+            no_zone_count = 0
+            for addr_zone_id, zid, cnt in zone_rows:
+                if addr_zone_id is None:
+                    no_zone_count = int(cnt or 0)
+                elif zid is not None:
+                    by_zone[str(zid)] = int(cnt or 0)
             if no_zone_count:
                 by_zone['none'] = int(no_zone_count)
         except OperationalError:
@@ -215,77 +247,30 @@ def build_summary(days: int = 7, zone_id: Optional[int] = None) -> Dict[str, Any
 
     # --- Агрегаты по заявкам ---
 
-    # Количество ожидающих заявок (pending)
-    pending_query = db.session.query(func.count(PendingMarker.id))
-    if zone_id is not None:
-        pending_query = pending_query.filter(PendingMarker.zone_id == zone_id)
-    pending_count = (pending_query.scalar() or 0)
-
-    # Исторические статусы заявок (approved / rejected)
-    appr_query = db.session.query(func.count(PendingHistory.id)).filter(PendingHistory.status == 'approved')
-    rej_query = db.session.query(func.count(PendingHistory.id)).filter(PendingHistory.status == 'rejected')
-    if zone_id is not None:
-        # Не все записи PendingHistory содержат address_id; выполняем join только если zone_id фильтр задан.
-        appr_query = appr_query.join(Address, PendingHistory.address_id == Address.id).filter(Address.zone_id == zone_id)
-        rej_query = rej_query.join(Address, PendingHistory.address_id == Address.id).filter(Address.zone_id == zone_id)
-    approved_count = (appr_query.scalar() or 0)
-    rejected_count = (rej_query.scalar() or 0)
-
-    # Распределение активных заявок по статусам
+    # Распределение активных заявок по статусам; их сумма — количество ожидающих
     pending_status_query = db.session.query(PendingMarker.status, func.count(PendingMarker.id))
     if zone_id is not None:
         pending_status_query = pending_status_query.filter(PendingMarker.zone_id == zone_id)
     pending_by_status_rows = pending_status_query.group_by(PendingMarker.status).all()
     pending_by_status: Dict[str, int] = {}
+    pending_count = 0
     for status, cnt in pending_by_status_rows:
         key = status or 'Без статуса'
         pending_by_status[key] = int(cnt or 0)
+        pending_count += int(cnt or 0)
 
-    # --- Метрика «добавлено за N дней» ---
-    since = datetime.now(timezone.utc) - timedelta(days=days_clamped)
-    added_query = db.session.query(func.count(Address.id)).filter(Address.created_at >= since)
+    # Исторические статусы заявок (approved / rejected) — одним запросом
+    hist_query = db.session.query(
+        func.count(case((PendingHistory.status == 'approved', 1))),
+        func.count(case((PendingHistory.status == 'rejected', 1))),
+    )
     if zone_id is not None:
-        added_query = added_query.filter(Address.zone_id == zone_id)
-    added_last_n = (added_query.scalar() or 0)
+        # Не все записи PendingHistory содержат address_id; выполняем join только если zone_id фильтр задан.
+        hist_query = hist_query.join(Address, PendingHistory.address_id == Address.id).filter(Address.zone_id == zone_id)
+    approved_count, rejected_count = hist_query.one()
 
     # --- Таймлайн за N дней ---
-    today = datetime.now(timezone.utc).date()
-    timeline_last_n: List[Dict[str, Any]] = []
-    # Определяем количество точек. Если период больше 60 дней, выбираем шаг,
-    # чтобы не перегружать график. Всегда ограничиваем максимум 60 точек.
-    total_points = min(days_clamped, 60)
-    step = 1
-    if days_clamped > 60:
-        step = days_clamped // 60 + 1
-    for i in range(total_points):
-        delta = (total_points - 1 - i) * step
-        day = today - timedelta(days=delta)
-        day_start = datetime.combine(day, datetime.min.time())
-        day_end = day_start + timedelta(days=step)
-        # Считаем адреса и заявки в выбранном интервале
-        addr_day_query = db.session.query(func.count(Address.id)).filter(Address.created_at >= day_start, Address.created_at < day_end)
-        pend_day_query = db.session.query(func.count(PendingMarker.id)).filter(PendingMarker.created_at >= day_start, PendingMarker.created_at < day_end)
-        appr_day_query = db.session.query(func.count(PendingHistory.id)).filter(PendingHistory.status == 'approved', PendingHistory.timestamp >= day_start, PendingHistory.timestamp < day_end)
-        rej_day_query = db.session.query(func.count(PendingHistory.id)).filter(PendingHistory.status == 'rejected', PendingHistory.timestamp >= day_start, PendingHistory.timestamp < day_end)
-        if zone_id is not None:
-            addr_day_query = addr_day_query.filter(Address.zone_id == zone_id)
-            pend_day_query = pend_day_query.filter(PendingMarker.zone_id == zone_id)
-            # История заявок: join с Address для фильтрации по zone_id
-            appr_day_query = appr_day_query.join(Address, PendingHistory.address_id == Address.id).filter(Address.zone_id == zone_id)
-            rej_day_query = rej_day_query.join(Address, PendingHistory.address_id == Address.id).filter(Address.zone_id == zone_id)
-        addresses_day = (addr_day_query.scalar() or 0)
-        pending_created_day = (pend_day_query.scalar() or 0)
-        approved_day = (appr_day_query.scalar() or 0)
-        rejected_day = (rej_day_query.scalar() or 0)
-        timeline_last_n.append(
-            {
-                'date': day.isoformat(),
-                'addresses': int(addresses_day or 0),
-                'pending_created': int(pending_created_day or 0),
-                'approved': int(approved_day or 0),
-                'rejected': int(rejected_day or 0),
-            }
-        )
+    timeline_last_n = _build_timeline(days_clamped, zone_id)
 
     return {
         'total': int(total_addresses or 0),
@@ -301,6 +286,92 @@ def build_summary(days: int = 7, zone_id: Optional[int] = None) -> Dict[str, Any
     }
 
 
+def _as_date(value: Any) -> Optional[date]:
+    """Значение ``date(col)`` из БД -> date (SQLite отдаёт строку 'YYYY-MM-DD')."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _build_timeline(days_clamped: int, zone_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Таймлайн для :func:`build_summary`: по одному GROUP BY date(...) на таблицу.
+
+    Раньше каждая точка графика стоила 4 COUNT-запроса (до 240 на сводку).
+    Теперь БД возвращает счётчики по дням за весь интервал, а в корзины
+    (шаг ``step`` дней) они раскладываются здесь. Границы корзин те же:
+    [полночь дня, полночь дня + step).
+    """
+    today = datetime.now(timezone.utc).date()
+    # Определяем количество точек. Если период больше 60 дней, выбираем шаг,
+    # чтобы не перегружать график. Всегда ограничиваем максимум 60 точек.
+    total_points = min(days_clamped, 60)
+    step = 1
+    if days_clamped > 60:
+        step = days_clamped // 60 + 1
+    first_day = today - timedelta(days=(total_points - 1) * step)
+    range_start = datetime.combine(first_day, datetime.min.time())
+    range_end = datetime.combine(today, datetime.min.time()) + timedelta(days=step)
+
+    buckets: List[Dict[str, Any]] = [
+        {
+            'date': (first_day + timedelta(days=i * step)).isoformat(),
+            'addresses': 0,
+            'pending_created': 0,
+            'approved': 0,
+            'rejected': 0,
+        }
+        for i in range(total_points)
+    ]
+
+    def _add(day_value: Any, field: str, cnt: Any) -> None:
+        day = _as_date(day_value)
+        if day is None:
+            return
+        idx = (day - first_day).days // step
+        if 0 <= idx < total_points:
+            buckets[idx][field] += int(cnt or 0)
+
+    addr_day = func.date(Address.created_at)
+    addr_q = db.session.query(addr_day, func.count(Address.id)).filter(
+        Address.created_at >= range_start, Address.created_at < range_end
+    )
+    pend_day = func.date(PendingMarker.created_at)
+    pend_q = db.session.query(pend_day, func.count(PendingMarker.id)).filter(
+        PendingMarker.created_at >= range_start, PendingMarker.created_at < range_end
+    )
+    hist_day = func.date(PendingHistory.timestamp)
+    hist_q = db.session.query(
+        hist_day,
+        func.count(case((PendingHistory.status == 'approved', 1))),
+        func.count(case((PendingHistory.status == 'rejected', 1))),
+    ).filter(
+        PendingHistory.status.in_(('approved', 'rejected')),
+        PendingHistory.timestamp >= range_start,
+        PendingHistory.timestamp < range_end,
+    )
+    if zone_id is not None:
+        addr_q = addr_q.filter(Address.zone_id == zone_id)
+        pend_q = pend_q.filter(PendingMarker.zone_id == zone_id)
+        # История заявок: join с Address для фильтрации по zone_id
+        hist_q = hist_q.join(Address, PendingHistory.address_id == Address.id).filter(Address.zone_id == zone_id)
+
+    for day_value, cnt in addr_q.group_by(addr_day).all():
+        _add(day_value, 'addresses', cnt)
+    for day_value, cnt in pend_q.group_by(pend_day).all():
+        _add(day_value, 'pending_created', cnt)
+    for day_value, approved, rejected in hist_q.group_by(hist_day).all():
+        _add(day_value, 'approved', approved)
+        _add(day_value, 'rejected', rejected)
+    return buckets
+
+
 def build_audit_log(limit: int = 50) -> Dict[str, Any]:
     """Построить ленту последних действий (аудит).
 
@@ -16,12 +16,13 @@ from datetime import datetime, timezone
 import os
 
 import requests
-from typing import List, Dict, Any, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from sqlalchemy import func
 from compat_flask import current_app
 
 from ..models import db, ChatMessage, ChatDialog
+from . import keyset
 from ..sockets import broadcast_event_sync
 
 
@@ -243,32 +244,80 @@ def list_conversations(status: Optional[str] = None, limit: int = 200, offset: i
     return result
 
 
+def iter_history(
+    user_id: str,
+    *,
+    batch_size: int = 500,
+    max_messages: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Потоково отдать историю переписки (ASC), не загружая её целиком.
+
+    Сообщения читаются keyset-пачками по ``batch_size`` через индекс
+    (user_id, created_at, id): в памяти одновременно не больше одной
+    пачки, а цена пачки не растёт с длиной диалога. ``max_messages``
+    ограничивает общее число сообщений.
+    """
+    user_id = str(user_id)
+    batch_size = max(1, min(int(batch_size), 5000))
+    left = max_messages
+    position = None
+    q = ChatMessage.query.filter_by(user_id=user_id)
+    while left is None or left > 0:
+        size = batch_size if left is None else min(batch_size, left)
+        rows, more = keyset.page(q, ChatMessage, position=position, descending=False, limit=size)
+        for m in rows:
+            yield m.to_dict()
+        if not rows or not more:
+            return
+        position = keyset.position_of(rows[-1])
+        if left is not None:
+            left -= len(rows)
+
+
 def get_history(user_id: str, mark_as_read: bool = True) -> List[Dict[str, Any]]:
     """Вернуть историю сообщений для указанного пользователя.
 
     Сообщения упорядочены по времени. По умолчанию все сообщения
     от пользователя помечаются как прочитанные администратором.
+    Для длинных диалогов используйте :func:`iter_history` или
+    :func:`get_history_page`.
     """
     user_id = str(user_id)
-    msgs = (
-        ChatMessage.query.filter_by(user_id=user_id)
-        .order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
-        .all()
-    )
-
+    msgs = list(iter_history(user_id))
     if mark_as_read:
-        (
-            ChatMessage.query.filter_by(user_id=user_id, sender="user", is_read=False)
-            .update({"is_read": True}, synchronize_session=False)
-        )
-        dialog = _get_or_create_dialog(user_id)
-        dialog.unread_for_admin = 0
-        if dialog.status == "new":
-            dialog.status = "in_progress"
-        db.session.commit()
+        mark_read_by_admin(user_id)
+    return msgs
 
-    return [m.to_dict() for m in msgs]
 
+def get_history_page(
+    user_id: str,
+    *,
+    cursor: Optional[str] = None,
+    limit: int = 200,
+    mark_as_read: bool = False,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Страница истории, листаемая от новых сообщений к старым.
+
+    Без ``cursor`` — последние ``limit`` сообщений, с ``cursor`` — те, что
+    старше позиции курсора. Сообщения страницы — в порядке ASC. Второй
+    элемент — курсор следующей (более старой) страницы или None.
+    ValueError — повреждённый курсор.
+    """
+    user_id = str(user_id)
+    try:
+        limit = max(1, min(2000, int(limit)))
+    except Exception:
+        limit = 200
+    position = keyset.decode_cursor(cursor) if cursor else None
+    rows, more = keyset.page(
+        ChatMessage.query.filter_by(user_id=user_id), ChatMessage,
+        position=position, descending=True, limit=limit,
+    )
+    next_cursor = keyset.cursor_of(rows[-1]) if more else None
+    msgs = [m.to_dict() for m in reversed(rows)]
+    if mark_as_read:
+        mark_read_by_admin(user_id)
+    return msgs, next_cursor
 
 
 def get_history_paged(
@@ -350,8 +399,6 @@ def get_history_before(
 
     Возвращает сообщения в порядке ASC (от старых к новым).
     """
-    from sqlalchemy import and_, or_
-
     try:
         limit = max(1, min(2000, int(limit)))
     except Exception:
@@ -361,30 +408,14 @@ def get_history_before(
     if not ref:
         return []
 
-    q = ChatMessage.query.filter(ChatMessage.user_id == user_id).filter(
-        or_(
-            ChatMessage.created_at < ref.created_at,
-            and_(ChatMessage.created_at == ref.created_at, ChatMessage.id < ref.id),
-        )
-    )
-
-    rows = (
-        q.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
-        .limit(limit)
-        .all()
+    rows, _more = keyset.page(
+        ChatMessage.query.filter(ChatMessage.user_id == user_id), ChatMessage,
+        position=keyset.position_of(ref), descending=True, limit=limit,
     )
     msgs = list(reversed(rows))
 
     if mark_as_read:
-        (
-            ChatMessage.query.filter_by(user_id=user_id, sender="user", is_read=False)
-            .update({"is_read": True}, synchronize_session=False)
-        )
-        dialog = _get_or_create_dialog(user_id)
-        dialog.unread_for_admin = 0
-        if dialog.status == "new":
-            dialog.status = "in_progress"
-        db.session.commit()
+        mark_read_by_admin(user_id)
 
     return [m.to_dict() for m in msgs]
 
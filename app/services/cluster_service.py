@@ -0,0 +1,273 @@
+"""Кластеризация точек слоёв карты на сервере (/api/geo/clusters).
+
+Раньше слои отдавали все точки (адреса — целиком, объекты и инциденты —
+до нескольких тысяч), а кластеризовал их Leaflet.markercluster в браузере.
+Здесь для каждого слоя в памяти процесса держится «пирамида» сеток:
+
+- точки переводятся в нормированный Web Mercator (x, y ∈ [0, 1));
+- на уровне ``z`` (0..PRECOMPUTED_ZOOM) ячейка — квадрат CLUSTER_PX
+  пикселей экрана на этом зуме: ``2^-(z + CELL_SHIFT)``; ячейки уровней
+  вложены как в квадродереве (4 ячейки z+1 в одной ячейке z);
+- ячейка хранит агрегаты ``[count, Σx, Σy, Σid]``: центр кластера —
+  среднее, а у ячейки из одной точки Σid и есть её id.
+
+Добавление/удаление точки меняет по одной ячейке на уровень, поэтому
+пирамида обновляется по commit построчно (app.services.live_index).
+На зумах больше PRECOMPUTED_ZOOM видимая область мала: точки берутся
+из ячеек последнего уровня (там хранятся id) и группируются на лету.
+
+Слой делится на части по zone_id, чтобы ограничение по зонам
+администратора не требовало отдельных индексов: агрегаты ячеек разных
+зон просто складываются.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..extensions import db
+from ..models import Address, Object, PendingMarker
+from . import live_index
+
+CLUSTER_PX = 64
+CELL_SHIFT = int(math.log2(256 // CLUSTER_PX))  # ячейка уровня z = 2^-(z + CELL_SHIFT)
+PRECOMPUTED_ZOOM = 12
+MAX_ZOOM = 22
+MAX_LAT = 85.05112878
+DEFAULT_MAX_AGE_SEC = 60.0
+
+LAYERS = {
+    'addresses': Address,
+    'pending': PendingMarker,
+    'objects': Object,
+}
+
+Cell = List[float]  # [count, sum_x, sum_y, sum_id]
+ZoneKey = Optional[int]
+
+
+def project(lat: float, lon: float) -> Tuple[float, float]:
+    """(lat, lon) -> нормированные координаты Web Mercator."""
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    s = math.sin(math.radians(lat))
+    x = (lon + 180.0) / 360.0
+    y = 0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+def unproject(x: float, y: float) -> Tuple[float, float]:
+    lon = x * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, lon
+
+
+def _key(x: float, y: float, z: int) -> Tuple[int, int]:
+    n = 1 << (z + CELL_SHIFT)
+    return int(x * n), int(y * n)
+
+
+def _in_range(grid: Dict[Tuple[int, int], Any], lo: Tuple[int, int], hi: Tuple[int, int]) -> Iterable[Tuple[Tuple[int, int], Any]]:
+    """Непустые ячейки grid в прямоугольнике lo..hi: перебор диапазона или словаря — что короче."""
+    if (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) <= len(grid):
+        for cx in range(lo[0], hi[0] + 1):
+            for cy in range(lo[1], hi[1] + 1):
+                value = grid.get((cx, cy))
+                if value is not None:
+                    yield (cx, cy), value
+    else:
+        for k, value in grid.items():
+            if lo[0] <= k[0] <= hi[0] and lo[1] <= k[1] <= hi[1]:
+                yield k, value
+
+
+class _Pyramid:
+    """Сетки уровней 0..PRECOMPUTED_ZOOM для точек одной зоны."""
+
+    def __init__(self) -> None:
+        self.levels: List[Dict[Tuple[int, int], Cell]] = [{} for _ in range(PRECOMPUTED_ZOOM + 1)]
+        self.members: Dict[Tuple[int, int], Set[int]] = {}
+
+    def update(self, row_id: int, x: float, y: float, sign: int) -> None:
+        for z, level in enumerate(self.levels):
+            key = _key(x, y, z)
+            cell = level.get(key)
+            if cell is None:
+                cell = level[key] = [0, 0.0, 0.0, 0]
+            cell[0] += sign
+            cell[1] += sign * x
+            cell[2] += sign * y
+            cell[3] += sign * row_id
+            if cell[0] <= 0:
+                del level[key]
+        key = _key(x, y, PRECOMPUTED_ZOOM)
+        if sign > 0:
+            self.members.setdefault(key, set()).add(row_id)
+        else:
+            ids = self.members.get(key)
+            if ids is not None:
+                ids.discard(row_id)
+                if not ids:
+                    del self.members[key]
+
+
+class ClusterIndex:
+    """Пирамиды слоя по зонам + координаты точек (для ячеек последнего уровня)."""
+
+    def __init__(self) -> None:
+        self.zones: Dict[ZoneKey, _Pyramid] = {}
+        self.points: Dict[int, Tuple[float, float, ZoneKey]] = {}
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    # протокол live_index
+
+    @classmethod
+    def load(cls, model: Any) -> 'ClusterIndex':
+        zone_col = getattr(model, 'zone_id', None)
+        cols = [model.id, model.lat, model.lon] + ([zone_col] if zone_col is not None else [])
+        rows = db.session.query(*cols).filter(model.lat.isnot(None), model.lon.isnot(None))
+        return cls.from_rows((r[0], r[1], r[2], r[3] if len(r) > 3 else None) for r in rows)
+
+    @staticmethod
+    def snapshot(obj: Any) -> Tuple[Any, Any, ZoneKey]:
+        return obj.lat, obj.lon, getattr(obj, 'zone_id', None)
+
+    def apply(self, row_id: int, row: Optional[Tuple[Any, Any, ZoneKey]]) -> None:
+        old = self.points.pop(row_id, None)
+        if old is not None:
+            self.zones[old[2]].update(row_id, old[0], old[1], -1)
+        if row is None:
+            return
+        lat, lon, zone = row
+        try:
+            x, y = project(float(lat), float(lon))
+        except (TypeError, ValueError):
+            return
+        self.points[row_id] = (x, y, zone)
+        self.zones.setdefault(zone, _Pyramid()).update(row_id, x, y, 1)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, Any, Any, ZoneKey]]) -> 'ClusterIndex':
+        index = cls()
+        for row_id, lat, lon, zone in rows:
+            index.apply(int(row_id), (lat, lon, zone))
+        return index
+
+    # запросы
+
+    def _pyramids(self, zones: Optional[Set[ZoneKey]]) -> List[_Pyramid]:
+        if zones is None:
+            return list(self.zones.values())
+        return [p for z, p in self.zones.items() if z in zones]
+
+    def _cells(self, pyramids: List[_Pyramid], z: int, x0: float, y0: float, x1: float, y1: float) -> Dict[Tuple[int, int], Cell]:
+        """Суммарные ячейки уровня z (<= PRECOMPUTED_ZOOM), пересекающие область."""
+        lo, hi = _key(x0, y0, z), _key(x1, y1, z)
+        out: Dict[Tuple[int, int], Cell] = {}
+        for p in pyramids:
+            for k, cell in _in_range(p.levels[z], lo, hi):
+                acc = out.get(k)
+                if acc is None:
+                    out[k] = list(cell)
+                else:
+                    for i in range(4):
+                        acc[i] += cell[i]
+        return out
+
+    def _expansion_zoom(self, pyramids: List[_Pyramid], z: int, key: Tuple[int, int]) -> int:
+        """Зум, на котором кластер распадается (спуск, пока непустой потомок один)."""
+        while z < PRECOMPUTED_ZOOM:
+            children = {
+                (2 * key[0] + dx, 2 * key[1] + dy)
+                for p in pyramids
+                for dx in (0, 1)
+                for dy in (0, 1)
+                if (2 * key[0] + dx, 2 * key[1] + dy) in p.levels[z + 1]
+            }
+            z += 1
+            if len(children) != 1:
+                return z
+            key = children.pop()
+        return z + 1
+
+    def _adhoc_cells(self, pyramids: List[_Pyramid], z: int, x0: float, y0: float, x1: float, y1: float) -> Dict[Tuple[int, int], Cell]:
+        """Ячейки зума z > PRECOMPUTED_ZOOM: точки из ячеек последнего уровня."""
+        out: Dict[Tuple[int, int], Cell] = {}
+        lo, hi = _key(x0, y0, PRECOMPUTED_ZOOM), _key(x1, y1, PRECOMPUTED_ZOOM)
+        for p in pyramids:
+            for _, ids in _in_range(p.members, lo, hi):
+                for row_id in ids:
+                    x, y, _ = self.points[row_id]
+                    if not (x0 <= x <= x1 and y0 <= y <= y1):
+                        continue
+                    key = _key(x, y, z)
+                    acc = out.setdefault(key, [0, 0.0, 0.0, 0])
+                    acc[0] += 1
+                    acc[1] += x
+                    acc[2] += y
+                    acc[3] += row_id
+        return out
+
+    def clusters(
+        self,
+        bbox: Tuple[float, float, float, float],
+        z: int,
+        zones: Optional[Set[ZoneKey]] = None,
+    ) -> Dict[str, Any]:
+        """Кластеры и одиночные точки в bbox (west, south, east, north) на зуме z."""
+        west, south, east, north = bbox
+        x0, y0 = project(north, west)
+        x1, y1 = project(south, east)
+        pyramids = self._pyramids(zones)
+        if z <= PRECOMPUTED_ZOOM:
+            cells = self._cells(pyramids, z, x0, y0, x1, y1)
+        else:
+            cells = self._adhoc_cells(pyramids, z, x0, y0, x1, y1)
+
+        clusters: List[Dict[str, Any]] = []
+        points: List[Dict[str, Any]] = []
+        total = 0
+        for key, (count, sx, sy, sid) in sorted(cells.items()):
+            count = int(round(count))
+            total += count
+            lat, lon = unproject(sx / count, sy / count)
+            if count == 1:
+                points.append({'id': int(round(sid)), 'lat': round(lat, 6), 'lon': round(lon, 6)})
+            else:
+                expand = self._expansion_zoom(pyramids, z, key) if z < PRECOMPUTED_ZOOM else z + 1
+                clusters.append({
+                    'lat': round(lat, 5),
+                    'lon': round(lon, 5),
+                    'count': count,
+                    'expansion_zoom': min(expand, MAX_ZOOM),
+                })
+        return {'z': z, 'total': total, 'clusters': clusters, 'points': points}
+
+
+def _index_name(layer: str) -> str:
+    return f'clusters.{layer}'
+
+
+for _layer, _model in LAYERS.items():
+    live_index.register(_index_name(_layer), _model, ClusterIndex)
+
+
+def get_clusters(
+    layer: str,
+    bbox: Tuple[float, float, float, float],
+    z: int,
+    *,
+    zones: Optional[Set[ZoneKey]] = None,
+    max_age: float = DEFAULT_MAX_AGE_SEC,
+) -> Dict[str, Any]:
+    """Кластеры слоя ``layer`` (ключ LAYERS); ``zones`` — доступные zone_id (None — все)."""
+    with live_index.use(_index_name(layer), max_age) as index:
+        result = index.clusters(bbox, z, zones)
+    result['layer'] = layer
+    return result
+
+
+def index_stats() -> Dict[str, Dict[str, Any]]:
+    return {layer: live_index.stats(_index_name(layer)) for layer in LAYERS}
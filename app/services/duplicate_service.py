@@ -0,0 +1,232 @@
+"""Поиск дубликатов точек (адресы и pending-заявки) для бота.
+
+Дубликат — запись ближе ``threshold_m`` к новой точке или с тем же
+нормализованным названием (:func:`normalize_name`: нижний регистр,
+схлопнутые пробелы). Сначала проверяются адреса, затем заявки; среди
+подходящих возвращается запись с меньшим id.
+
+Раньше каждый вызов выбирал обе таблицы целиком и считал haversine в
+Python. Теперь:
+
+- PostgreSQL — один запрос на таблицу: ``ST_DWithin`` по ``geom::geography``
+  и равенство нормализованного имени; оба условия закрыты индексами
+  (GiST по выражению и btree, миграция 0025);
+- остальные СУБД (SQLite) — :class:`GridIndex` в памяти процесса: сетка
+  ячеек по ``CELL_DEG`` градусов и словарь имён. Индекс поддерживается
+  по commit (app.services.live_index), полная пересборка — не реже чем раз
+  в DUPLICATE_INDEX_MAX_AGE_SEC.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from compat_flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from ..extensions import db
+from ..helpers import haversine_m
+from ..models import Address, PendingMarker
+from . import live_index
+
+CELL_DEG = 0.01  # ≈ 1.1 км по широте
+M_PER_DEG = 111320.0
+DEFAULT_MAX_AGE_SEC = 60.0
+
+# (тип дубликата, модель); порядок — порядок проверки
+KINDS = (('address', Address), ('pending', PendingMarker))
+
+# Выражение нормализации имени в SQL — то же, что в индексе миграции 0025
+PG_NAME_SQL = "lower(btrim(regexp_replace(name, '\\s+', ' ', 'g')))"
+PG_POINT_SQL = (
+    'geom IS NOT NULL AND ST_DWithin(geom::geography, '
+    'ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)::geography, :radius)'
+)
+
+
+def normalize_name(name: Any) -> str:
+    """Нормализованное название: нижний регистр, без крайних и двойных пробелов."""
+    return ' '.join(str(name or '').lower().split())
+
+
+# ---------------------------------------------------------------------------
+# Сеточный индекс
+# ---------------------------------------------------------------------------
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    return math.floor(lat / CELL_DEG), math.floor(lon / CELL_DEG)
+
+
+class GridIndex:
+    """Точки и имена одной таблицы: поиск ближайшего id в радиусе и по имени."""
+
+    def __init__(self) -> None:
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float]]] = {}
+        self._rows: Dict[int, Tuple[Optional[float], Optional[float], str]] = {}
+        self._names: Dict[str, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, row_id: int, lat: Any, lon: Any, name: Any) -> None:
+        self.remove(row_id)
+        nm = normalize_name(name)
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            lat = lon = None
+        if lat is not None:
+            self._cells.setdefault(_cell(lat, lon), {})[row_id] = (lat, lon)
+        if nm:
+            self._names.setdefault(nm, set()).add(row_id)
+        self._rows[row_id] = (lat, lon, nm)
+
+    def remove(self, row_id: int) -> None:
+        row = self._rows.pop(row_id, None)
+        if row is None:
+            return
+        lat, lon, nm = row
+        if lat is not None:
+            cell = self._cells.get(_cell(lat, lon))
+            if cell is not None:
+                cell.pop(row_id, None)
+                if not cell:
+                    del self._cells[_cell(lat, lon)]
+        if nm:
+            ids = self._names.get(nm)
+            if ids is not None:
+                ids.discard(row_id)
+                if not ids:
+                    del self._names[nm]
+
+    def within(self, lat: float, lon: float, radius_m: float) -> Optional[int]:
+        """Наименьший id среди точек не дальше radius_m."""
+        dlat = radius_m / M_PER_DEG
+        dlon = radius_m / (M_PER_DEG * max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6))
+        y0, x0 = _cell(lat - dlat, lon - dlon)
+        y1, x1 = _cell(lat + dlat, lon + dlon)
+        best: Optional[int] = None
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                for row_id, (plat, plon) in self._cells.get((cy, cx), {}).items():
+                    if (best is None or row_id < best) and haversine_m(lat, lon, plat, plon) <= radius_m:
+                        best = row_id
+        return best
+
+    def by_name(self, name: Any) -> Optional[int]:
+        ids = self._names.get(normalize_name(name))
+        return min(ids) if ids else None
+
+    def find(self, name: Any, lat: Optional[float], lon: Optional[float], radius_m: float) -> Optional[int]:
+        hits = [self.by_name(name)]
+        if lat is not None and lon is not None:
+            hits.append(self.within(float(lat), float(lon), radius_m))
+        hits = [h for h in hits if h is not None]
+        return min(hits) if hits else None
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, Optional[float], Optional[float], Any]]) -> 'GridIndex':
+        index = cls()
+        for row_id, lat, lon, name in rows:
+            index.add(int(row_id), lat, lon, name)
+        return index
+
+    # протокол live_index
+
+    @classmethod
+    def load(cls, model: Any) -> 'GridIndex':
+        return cls.from_rows(db.session.query(model.id, model.lat, model.lon, model.name))
+
+    @staticmethod
+    def snapshot(obj: Any) -> Tuple[Any, Any, Any]:
+        return obj.lat, obj.lon, obj.name
+
+    def apply(self, row_id: int, row: Optional[Tuple[Any, Any, Any]]) -> None:
+        if row is None:
+            self.remove(row_id)
+        else:
+            self.add(row_id, *row)
+
+
+def _index_name(kind: str) -> str:
+    return f'duplicates.{kind}'
+
+
+for _kind, _model in KINDS:
+    live_index.register(_index_name(_kind), _model, GridIndex)
+
+
+def index_stats() -> Dict[str, Dict[str, Any]]:
+    """Состояние индексов текущей базы: строк в индексе и число полных сборок."""
+    return {kind: live_index.stats(_index_name(kind)) for kind, _ in KINDS}
+
+
+# ---------------------------------------------------------------------------
+# Поиск
+# ---------------------------------------------------------------------------
+
+
+def _find_pg(model: Any, name: str, lat: Optional[float], lon: Optional[float], radius_m: float) -> Optional[int]:
+    conds = []
+    if lat is not None:
+        conds.append(f'({PG_POINT_SQL})')
+    if name:
+        conds.append(f'{PG_NAME_SQL} = :name')
+    sql = text(f'SELECT min(id) FROM {model.__tablename__} WHERE ' + ' OR '.join(conds))
+    return db.session.execute(sql, {'lat': lat, 'lon': lon, 'radius': radius_m, 'name': name}).scalar()
+
+
+def find_duplicate(
+    name: Any,
+    lat: Optional[float],
+    lon: Optional[float],
+    threshold_m: float = 100,
+) -> Optional[Dict[str, Any]]:
+    """Найти дубликат среди адресов и заявок: ``{'type': 'address'|'pending', 'id': int}`` или None."""
+    nm = normalize_name(name)
+    if lat is not None and lon is not None:
+        lat, lon = float(lat), float(lon)
+    else:
+        lat = lon = None
+    if not nm and lat is None:
+        return None
+    use_pg = db.session.get_bind().dialect.name == 'postgresql'
+    max_age = float(current_app.config.get('DUPLICATE_INDEX_MAX_AGE_SEC', DEFAULT_MAX_AGE_SEC))
+    for kind, model in KINDS:
+        try:
+            if use_pg:
+                found = _find_pg(model, nm, lat, lon, threshold_m)
+            else:
+                with live_index.use(_index_name(kind), max_age) as index:
+                    found = index.find(nm, lat, lon, threshold_m)
+        except (OperationalError, ProgrammingError):
+            # старая схема без нужных колонок/расширений — как раньше, таблицу пропускаем
+            db.session.rollback()
+            continue
+        if found is not None:
+            return {'type': kind, 'id': int(found)}
+    return None
+
+
+def find_duplicate_in_items(
+    name: Any,
+    lat: Optional[float],
+    lon: Optional[float],
+    items: List[Dict[str, Any]],
+    pending: List[Dict[str, Any]],
+    threshold_m: float = 100,
+) -> Optional[Dict[str, Any]]:
+    """То же для списков словарей (JSON-хранилище): индекс строится на вызов."""
+    for kind, rows in (('address', items), ('pending', pending)):
+        index = GridIndex.from_rows(
+            (it['id'], it.get('lat'), it.get('lon'), it.get('name') or it.get('address'))
+            for it in rows
+            if it.get('id') is not None
+        )
+        found = index.find(name, lat, lon, threshold_m)
+        if found is not None:
+            return {'type': kind, 'id': int(found)}
+    return None
@@ -0,0 +1,288 @@
+"""In-memory индекс офлайн‑геокодера.
+
+Раньше каждый запрос к /api/geocode читал весь OFFLINE_GEOCODE_FILE и
+линейно искал ``q in name.lower()``. Здесь записи файла один раз
+разбираются в индекс (пересборка — при смене mtime/размера файла, см.
+:mod:`app.services.geocode_service`):
+
+- нормализация: NFKC, нижний регистр, ё→е, диакритика снимается, кириллица
+  (рус./бел.) транслитерируется в латиницу — «Немига», «nemiga» и
+  «НЕМИГА» дают один токен;
+- словарь токенов отсортирован, id токена = позиция, поэтому все токены с
+  префиксом — непрерывный диапазон id (bisect);
+- posting-листы — отсортированные массивы NumPy, AND токенов запроса —
+  ``np.intersect1d``; если кандидатов много, в Python ранжируются только
+  MAX_CANDIDATES с самыми короткими подписями;
+- триграммы по словарю: вхождение внутри слова («where» в «somewhere») и
+  нечёткое совпадение с опечаткой, если точного/префиксного нет.
+
+Все токены запроса должны совпасть (AND). Ранг: точное совпадение токена >
+префикс > вхождение > нечёткое; бонус за совпадение начала названия;
+при равенстве выигрывает более короткое название.
+"""
+
+from __future__ import annotations
+
+import bisect
+import heapq
+import re
+import sys
+import time
+import unicodedata
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SCORE_EXACT = 3.0
+SCORE_PREFIX = 2.0
+SCORE_INFIX = 1.5
+SCORE_FUZZY = 1.0  # умножается на сходство триграмм
+FUZZY_MIN_SIM = 0.3
+MAX_CANDIDATES = 256
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p",
+    "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch",
+    "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    # белорусские/украинские
+    "і": "i", "ї": "i", "ў": "u", "є": "e", "ґ": "g",
+}
+_TRANSLIT_TABLE = str.maketrans(_TRANSLIT)
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def normalize(text: Any) -> str:
+    """Текст -> нижний регистр, латиница, без диакритики."""
+    s = unicodedata.normalize("NFKC", str(text or "")).lower().replace("ё", "е")
+    s = s.translate(_TRANSLIT_TABLE)
+    if s.isascii():
+        return s
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(ch for ch in s if not unicodedata.combining(ch))
+
+
+def tokenize(text: Any) -> List[str]:
+    return _WORD_RE.findall(normalize(text))
+
+
+def _trigrams(token: str) -> set:
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+_TEXT_FIELDS = ("name", "display_name", "address")
+
+
+def _label(item: Dict[str, Any]) -> str:
+    return str(item.get("name") or item.get("display_name") or item.get("address") or "")
+
+
+class _TokenMatch:
+    """Какие id словаря подходят под токен запроса и с каким весом."""
+
+    __slots__ = ("lo", "hi", "exact", "extra")
+
+    def __init__(self, lo: int, hi: int, exact: Optional[int], extra: Dict[int, float]) -> None:
+        self.lo = lo
+        self.hi = hi
+        self.exact = exact
+        self.extra = extra
+
+    def score(self, token_ids: Sequence[int]) -> float:
+        best = 0.0
+        for tid in token_ids:
+            if tid == self.exact:
+                return SCORE_EXACT
+            if self.lo <= tid < self.hi:
+                best = SCORE_PREFIX
+            elif best < SCORE_PREFIX:
+                best = max(best, self.extra.get(tid, 0.0))
+        return best
+
+    def ids(self) -> Iterable[int]:
+        if self.exact is not None:
+            yield self.exact
+        for tid in range(self.lo, self.hi):
+            if tid != self.exact:
+                yield tid
+        yield from sorted(self.extra, key=self.extra.get, reverse=True)
+
+
+class GeocodeIndex:
+    """Индекс записей офлайн‑геокодера (dict'ы с name/display_name/address и lat/lon)."""
+
+    def __init__(self, entries: Sequence[Dict[str, Any]]) -> None:
+        t0 = time.perf_counter()
+        self.entries: List[Dict[str, Any]] = [e for e in entries if isinstance(e, dict) and _label(e)]
+        per_entry: List[List[str]] = []
+        self.labels: List[str] = []
+        vocab = set()
+        for item in self.entries:
+            fields = [tokenize(item.get(f)) for f in _TEXT_FIELDS]
+            # подпись — первое непустое поле (как _label), в нормализованном виде
+            self.labels.append(" ".join(next(f for f in fields if f) if any(fields) else []))
+            toks = [t for f in fields for t in f]
+            per_entry.append(toks)
+            vocab.update(toks)
+
+        self.tokens: List[str] = sorted(vocab)
+        tid = {t: i for i, t in enumerate(self.tokens)}
+        self.entry_tokens: List[Tuple[int, ...]] = [tuple(sorted({tid[t] for t in toks})) for toks in per_entry]
+
+        # posting-листы по id записи (для np.intersect1d); rank — место записи
+        # при сортировке по длине подписи (короче — выше)
+        postings: List[List[int]] = [[] for _ in self.tokens]
+        for i, toks in enumerate(self.entry_tokens):
+            for t in toks:
+                postings[t].append(i)
+        self.postings: List[np.ndarray] = [np.array(p, dtype=np.int32) for p in postings]
+        order = sorted(range(len(self.entries)), key=lambda i: (len(self.labels[i]), i))
+        self.rank = np.empty(len(self.entries), dtype=np.int32)
+        self.rank[order] = np.arange(len(order), dtype=np.int32)
+
+        trigram_ids: Dict[str, array] = defaultdict(lambda: array("I"))
+        for i, t in enumerate(self.tokens):
+            for g in _trigrams(t):
+                trigram_ids[g].append(i)
+        self.trigrams: Dict[str, array] = dict(trigram_ids)
+
+        self.build_ms = round((time.perf_counter() - t0) * 1000, 1)
+        self.built_at = time.time()
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # --- сопоставление токена запроса со словарём ---
+
+    def _match(self, qtok: str) -> _TokenMatch:
+        lo = bisect.bisect_left(self.tokens, qtok)
+        hi = bisect.bisect_left(self.tokens, qtok + "\uffff")
+        exact = lo if lo < len(self.tokens) and self.tokens[lo] == qtok else None
+        extra: Dict[int, float] = {}
+        if hi > lo or len(qtok) < 3:
+            return _TokenMatch(lo, hi, exact, extra)
+
+        # вхождение внутри слова: токены, содержащие все триграммы запроса
+        inner = [qtok[i:i + 3] for i in range(len(qtok) - 2)]
+        lists = sorted((self.trigrams.get(g) for g in inner), key=lambda a: len(a) if a is not None else -1)
+        if lists and lists[0] is not None:
+            cand = set(lists[0])
+            for a in lists[1:]:
+                cand.intersection_update(a)
+                if not cand:
+                    break
+            for t in cand:
+                if qtok in self.tokens[t]:
+                    extra[t] = SCORE_INFIX
+        if extra or len(qtok) < 4:
+            return _TokenMatch(lo, lo, None, extra)
+
+        # опечатка: сходство наборов триграмм (Жаккар)
+        qgrams = _trigrams(qtok)
+        common: Dict[int, int] = defaultdict(int)
+        for g in qgrams:
+            for t in self.trigrams.get(g, ()):
+                common[t] += 1
+        for t, c in common.items():
+            sim = c / (len(qgrams) + len(self.tokens[t]) - c)  # |триграмм| слова с паддингом = len
+            if sim >= FUZZY_MIN_SIM:
+                extra[t] = SCORE_FUZZY * sim
+        return _TokenMatch(lo, lo, None, extra)
+
+    def _entries_for(self, m: _TokenMatch) -> np.ndarray:
+        """Отсортированные id записей, где встречается подходящий токен."""
+        lists = [self.postings[t] for t in m.ids()]
+        if len(lists) == 1:
+            return lists[0]
+        return np.unique(np.concatenate(lists))
+
+    # --- поиск ---
+
+    def search(self, q: str, limit: int = 1) -> List[Dict[str, Any]]:
+        """Лучшие записи по запросу (в формате ответа /api/geocode)."""
+        t0 = time.perf_counter()
+        try:
+            return self._search(q, max(1, int(limit or 1)))
+        finally:
+            self.lookups += 1
+            self.lookup_seconds += time.perf_counter() - t0
+
+    def _search(self, q: str, limit: int) -> List[Dict[str, Any]]:
+        qtoks = list(dict.fromkeys(tokenize(q)))
+        if not qtoks or not self.entries:
+            return []
+        matches = [self._match(t) for t in qtoks]
+        if any(m.hi == m.lo and m.exact is None and not m.extra for m in matches):
+            return []
+
+        # AND: пересечение posting-листов, начиная с самого короткого
+        sets = sorted((self._entries_for(m) for m in matches), key=len)
+        cand = sets[0]
+        for other in sets[1:]:
+            cand = np.intersect1d(cand, other, assume_unique=True)
+            if not len(cand):
+                return []
+        if len(cand) > MAX_CANDIDATES:
+            # ранжируем в Python только самые короткие подписи
+            cand = cand[np.argpartition(self.rank[cand], MAX_CANDIDATES)[:MAX_CANDIDATES]]
+
+        qnorm = " ".join(qtoks)
+        scored: List[Tuple[float, int, int]] = []
+        for i in cand.tolist():
+            toks = self.entry_tokens[i]
+            total = 0.0
+            for m in matches:
+                total += m.score(toks)
+            label = self.labels[i]
+            if label.startswith(qnorm):
+                total += 1.0
+            elif qnorm in label:
+                total += 0.5
+            scored.append((total, -len(label), -i))
+
+        out: List[Dict[str, Any]] = []
+        for _score, _neg_len, neg_i in heapq.nlargest(limit, scored):
+            item = self.entries[-neg_i]
+            out.append({
+                "display_name": item.get("display_name") or item.get("name") or item.get("address"),
+                "lat": item.get("lat"),
+                "lon": item.get("lon"),
+            })
+        return out
+
+    # --- диагностика ---
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Оценка памяти индекса (sys.getsizeof по структурам, без интернирования)."""
+        gs = sys.getsizeof
+        tokens = gs(self.tokens) + sum(gs(t) for t in self.tokens)
+        labels = gs(self.labels) + sum(gs(s) for s in self.labels)
+        entry_tokens = gs(self.entry_tokens) + sum(gs(t) for t in self.entry_tokens)
+        postings = gs(self.postings) + sum(gs(p) for p in self.postings) + gs(self.rank)
+        trigrams = gs(self.trigrams) + sum(gs(k) + gs(v) for k, v in self.trigrams.items())
+        index_total = tokens + labels + entry_tokens + postings + trigrams
+        return {
+            "tokens": tokens,
+            "labels": labels,
+            "entry_tokens": entry_tokens,
+            "postings": postings,
+            "trigrams": trigrams,
+            "index_total": index_total,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.entries),
+            "tokens": len(self.tokens),
+            "trigrams": len(self.trigrams),
+            "build_ms": self.build_ms,
+            "built_at": self.built_at,
+            "lookups": self.lookups,
+            "avg_lookup_us": round(self.lookup_seconds / self.lookups * 1e6, 1) if self.lookups else None,
+            "memory_bytes": self.memory_bytes(),
+        }
@@ -2,81 +2,114 @@
 
 Содержит функцию :func:`geocode`, которая инкапсулирует логику
 поиска в офлайн‑базе и обращения к сервису Nominatim.
+
+Офлайн‑поиск идёт по in-memory индексу (:mod:`app.services.geocode_index`),
+который строится один раз и перестраивается при смене mtime/размера файла.
+Результаты кэшируются (:mod:`app.cache`, кэш ``geocode``) на
+GEOCODE_CACHE_SECONDS; ответы Nominatim дополнительно хранятся в БД
+(:mod:`app.services.nominatim_service`). Маршруты, переписывающие файл, вызывают
+:func:`invalidate_geocode_cache`. Ошибка Nominatim доходит до вызывающего
+исключением :class:`~app.services.nominatim_service.NominatimUnavailable` —
+в кэш попадают только настоящие ответы.
 """
 
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, List, Optional
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
 from compat_flask import current_app
 
+from ..cache import cached, invalidate
+from . import nominatim_service
+from .geocode_index import GeocodeIndex
 
-def _load_offline_entries() -> List[Dict[str, Any]]:
-    path = current_app.config.get('OFFLINE_GEOCODE_FILE')
-    if not path:
-        return []
+
+CACHE_NAME = 'geocode'
+
+# индекс офлайн‑файла и отметка (path, mtime_ns, size), по которой он построен
+_offline: Tuple[Optional[Tuple[str, int, int]], Optional[GeocodeIndex]] = (None, None)
+_offline_lock = threading.Lock()
+
+
+def _file_stamp(path: str) -> Optional[Tuple[str, int, int]]:
     try:
-        with open(path, 'r', encoding='utf-8') as fh:
-            data = json.load(fh)
-            if isinstance(data, list):
-                return data
-    except Exception:
-        return []
-    return []
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (str(path), st.st_mtime_ns, st.st_size)
+
 
+def get_offline_index() -> Optional[GeocodeIndex]:
+    """Индекс OFFLINE_GEOCODE_FILE; перестраивается, когда меняется файл.
 
-def _search_offline(entries: List[Dict[str, Any]], q: str, limit: int) -> List[Dict[str, Any]]:
-    q_norm = q.lower()
-    results: List[Dict[str, Any]] = []
-    for item in entries:
+    Пока один поток строит индекс, остальные ждут его на lock'е, а не
+    разбирают файл параллельно.
+    """
+    global _offline
+    path = current_app.config.get('OFFLINE_GEOCODE_FILE')
+    if not path:
+        return None
+    stamp = _file_stamp(path)
+    if stamp is None:
+        return None
+    if _offline[0] == stamp:
+        return _offline[1]
+    with _offline_lock:
+        if _offline[0] == stamp:
+            return _offline[1]
+        entries: List[Dict[str, Any]] = []
         try:
-            name = (item.get('name') or item.get('display_name') or '').lower()
-            if not name:
-                continue
-            if q_norm in name:
-                results.append(
-                    {
-                        'display_name': item.get('display_name') or item.get('name'),
-                        'lat': item.get('lat'),
-                        'lon': item.get('lon'),
-                    }
-                )
-                if len(results) >= limit:
-                    break
+            with open(path, 'r', encoding='utf-8') as fh:
+                data = json.load(fh)
+                if isinstance(data, list):
+                    entries = data
         except Exception:
-            continue
-    return results
+            entries = []
+        index = GeocodeIndex(entries)
+        _offline = (stamp, index)
+        current_app.logger.info('offline geocode index built: %s entries, %s ms', len(index), index.build_ms)
+    return index
 
 
-def _search_online(q: str, limit: int, lang: str = 'ru') -> List[Dict[str, Any]]:
-    try:
-        params = {'q': q, 'format': 'json', 'limit': limit, 'accept-language': lang}
-        r = requests.get(
-            'https://nominatim.openstreetmap.org/search',
-            params=params,
-            headers={'User-Agent': 'map-v12-geocode'},
-            timeout=10,
-        )
-        if not r.ok:
-            return []
-        data = r.json()
-        out: List[Dict[str, Any]] = []
-        if isinstance(data, list):
-            for item in data:
-                out.append(
-                    {
-                        'display_name': item.get('display_name'),
-                        'lat': item.get('lat'),
-                        'lon': item.get('lon'),
-                    }
-                )
-                if len(out) >= limit:
-                    break
-        return out
-    except Exception:
+def offline_index_stats() -> Dict[str, Any]:
+    """Состояние индекса для диагностики (без пересборки)."""
+    stamp, index = _offline
+    path = current_app.config.get('OFFLINE_GEOCODE_FILE')
+    out: Dict[str, Any] = {
+        'path': path,
+        'loaded': index is not None,
+        'stale': index is not None and (not path or _file_stamp(path) != stamp),
+    }
+    if index is not None:
+        out.update(index.stats())
+    return out
+
+
+def invalidate_geocode_cache() -> None:
+    """Сбросить индекс и кэш результатов (после изменения офлайн‑файла)."""
+    global _offline
+    _offline = (None, None)
+    invalidate(CACHE_NAME)
+
+
+def search_offline(q: str, limit: int = 1) -> List[Dict[str, Any]]:
+    index = get_offline_index()
+    if index is None:
         return []
+    return index.search(q, limit)
+
+
+def _search_online(q: str, limit: int, lang: str = 'ru') -> List[Dict[str, Any]]:
+    # постоянный кэш (таблица geocode_cache) + Nominatim с ограничением частоты
+    return nominatim_service.search(q, limit, lang)
+
+
+def reverse_geocode(lat: float, lon: float, lang: str = 'ru') -> List[Dict[str, Any]]:
+    """Адрес по координатам (Nominatim /reverse через постоянный кэш)."""
+    return nominatim_service.reverse(lat, lon, lang)
 
 
 def geocode(q: str, limit: int = 1, lang: str = 'ru') -> List[Dict[str, Any]]:
@@ -84,10 +117,18 @@ def geocode(q: str, limit: int = 1, lang: str = 'ru') -> List[Dict[str, Any]]:
     q = (q or '').strip()
     if not q:
         return []
+    try:
+        ttl = int(current_app.config.get('GEOCODE_CACHE_SECONDS', 600) or 0)
+    except (TypeError, ValueError):
+        ttl = 0
+    path = current_app.config.get('OFFLINE_GEOCODE_FILE') or ''
+    key = json.dumps([path, q.lower(), int(limit), lang], ensure_ascii=False)
+    return cached(CACHE_NAME, key, lambda: _geocode(q, limit, lang), ttl)
+
 
+def _geocode(q: str, limit: int, lang: str) -> List[Dict[str, Any]]:
     # Сначала офлайн
-    offline_entries = _load_offline_entries()
-    results = _search_offline(offline_entries, q, limit)
+    results = search_offline(q, limit)
     if results:
         return results
 
@@ -0,0 +1,72 @@
+"""Keyset-пагинация по (created_at, id) с непрозрачными курсорами.
+
+Страница «старше/новее позиции» выбирается условием
+``(created_at, id) < (:created_at, :id)`` (row value) при равенстве
+ключа канала/диалога: по составному индексу ``(<ключ>, created_at, id)``
+это переход по индексу к позиции и чтение ``limit`` строк — время страницы
+не зависит ни от глубины, ни от размера канала (в отличие от OFFSET и от
+поиска опорного сообщения по id с последующим фильтром по времени).
+``id`` в ключе делает порядок строгим: сообщения с одинаковым
+``created_at`` не теряются и не повторяются на границе страниц.
+
+Курсор — base64url от JSON ``[created_at, id]``; клиент его не разбирает.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+
+Position = Tuple[datetime, Any]
+
+
+def encode_cursor(created_at: datetime, row_id: Any) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Position:
+    """Позиция из курсора; ValueError — курсор повреждён."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw.decode('utf-8'))
+        return datetime.fromisoformat(created_at), row_id
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as exc:
+        raise ValueError('invalid cursor') from exc
+
+
+def cursor_of(row: Any) -> str:
+    return encode_cursor(row.created_at, row.id)
+
+
+def position_of(row: Any) -> Position:
+    return row.created_at, row.id
+
+
+def page(
+    query: Any,
+    model: Any,
+    *,
+    position: Optional[Position] = None,
+    descending: bool = True,
+    limit: int = 50,
+) -> Tuple[List[Any], bool]:
+    """Строки ``query`` после ``position`` в порядке (created_at, id).
+
+    ``descending`` — от новых к старым (история), иначе от старых к новым
+    (синхронизация). Возвращает ``(rows, has_more)``.
+    """
+    key = tuple_(model.created_at, model.id)
+    if position is not None:
+        query = query.filter(key < tuple_(*position) if descending else key > tuple_(*position))
+    if descending:
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.created_at.asc(), model.id.asc())
+    rows = query.limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
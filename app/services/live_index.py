@@ -0,0 +1,142 @@
+"""Индексы строк моделей в памяти процесса, поддерживаемые по commit.
+
+Индекс (поиск дубликатов, кластеры точек на карте) строится из таблицы
+один раз, а дальше обновляется построчно: события маппера SQLAlchemy
+(after_insert/update/delete) копят изменения в ``session.info``, после
+commit они применяются к индексу, при rollback — отбрасываются. Bulk
+``query(...).update()/delete()`` строки не перечисляет — такой индекс
+просто пересобирается при следующем обращении. Записи других процессов
+подхватываются полной пересборкой не реже чем раз в ``max_age`` секунд.
+
+Класс индекса регистрируется через :func:`register` и реализует:
+
+- ``load(model)`` (classmethod) — построить индекс по всей таблице;
+- ``snapshot(obj)`` (staticmethod) — строка индекса из ORM-объекта;
+- ``apply(row_id, row)`` — добавить/заменить строку (``row=None`` — удалить);
+- ``__len__``.
+
+Индексы разных баз (например, тестов) не смешиваются: ключ — URL базы.
+Чтение и применение изменений идут под одним lock'ом: :func:`use`.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from ..extensions import db
+
+# name -> (model, класс индекса)
+_specs: Dict[str, Tuple[Any, Any]] = {}
+_holders: Dict[Tuple[str, str], '_Holder'] = {}
+_holders_lock = threading.Lock()
+_session_listeners = False
+
+
+class _Holder:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.index: Any = None
+        self.built_at = 0.0
+        self.builds = 0
+        self.lock = threading.RLock()
+
+    def apply(self, changes: Dict[int, Any]) -> None:
+        with self.lock:
+            if self.index is None:
+                return
+            for row_id, row in changes.items():
+                self.index.apply(row_id, row)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.index = None
+
+
+def _holder(bind: Any, name: str) -> _Holder:
+    key = (str(bind.url), name)
+    holder = _holders.get(key)
+    if holder is None:
+        with _holders_lock:
+            holder = _holders.setdefault(key, _Holder(name))
+    return holder
+
+
+def register(name: str, model: Any, index_cls: Any) -> None:
+    """Поддерживать индекс ``index_cls`` по строкам ``model`` под именем ``name``."""
+    if name in _specs:
+        return
+    _specs[name] = (model, index_cls)
+    _install_session_listeners()
+
+    def _saved(mapper, connection, target):  # noqa: ANN001
+        _record(object_session(target), name, target, index_cls.snapshot(target))
+
+    def _deleted(mapper, connection, target):  # noqa: ANN001
+        _record(object_session(target), name, target, None)
+
+    event.listen(model, 'after_insert', _saved)
+    event.listen(model, 'after_update', _saved)
+    event.listen(model, 'after_delete', _deleted)
+
+
+def _record(session: Optional[Session], name: str, target: Any, row: Any) -> None:
+    if session is None or target.id is None:
+        return
+    session.info.setdefault('_live_index_changes', {}).setdefault(name, {})[int(target.id)] = row
+
+
+def _install_session_listeners() -> None:
+    global _session_listeners
+    if _session_listeners:
+        return
+    _session_listeners = True
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _bulk(state):  # noqa: ANN001
+        if (state.is_update or state.is_delete) and state.bind_mapper is not None:
+            cls = state.bind_mapper.class_
+            for name, (model, _) in _specs.items():
+                if issubclass(cls, model):
+                    state.session.info.setdefault('_live_index_reset', set()).add(name)
+
+    @event.listens_for(Session, 'after_commit')
+    def _after_commit(session):  # noqa: ANN001
+        changes = session.info.pop('_live_index_changes', {})
+        resets = session.info.pop('_live_index_reset', ())
+        if not changes and not resets:
+            return
+        bind = session.get_bind()
+        for name, rows in changes.items():
+            _holder(bind, name).apply(rows)
+        for name in resets:
+            _holder(bind, name).reset()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _after_rollback(session):  # noqa: ANN001
+        session.info.pop('_live_index_changes', None)
+        session.info.pop('_live_index_reset', None)
+
+
+@contextmanager
+def use(name: str, max_age: float) -> Iterator[Any]:
+    """Актуальный индекс ``name`` текущей базы (под lock'ом на время блока)."""
+    model, index_cls = _specs[name]
+    holder = _holder(db.session.get_bind(), name)
+    with holder.lock:
+        if holder.index is None or time.monotonic() - holder.built_at >= max_age:
+            holder.index = index_cls.load(model)
+            holder.built_at = time.monotonic()
+            holder.builds += 1
+        yield holder.index
+
+
+def stats(name: str) -> Dict[str, Any]:
+    """Строк в индексе (None — ещё не построен) и число полных сборок."""
+    holder = _holder(db.session.get_bind(), name)
+    return {'rows': len(holder.index) if holder.index is not None else None, 'builds': holder.builds}
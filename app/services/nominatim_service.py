@@ -0,0 +1,420 @@
+"""Nominatim: ограничение частоты запросов и постоянный кэш ответов.
+
+Раньше каждый промах геокодера (и каждый адрес при пересборке офлайн‑базы)
+шёл в Nominatim синхронно, с таймаутом 10 с, и те же запросы повторялись
+при каждой пересборке. Здесь:
+
+- :class:`RateLimiter` — не чаще NOMINATIM_RPS запросов в секунду на процесс
+  (общий для всех потоков), 429/503 с Retry-After сдвигают следующий слот;
+  интерактивные запросы ждут слот не дольше NOMINATIM_MAX_WAIT секунд
+  (иначе :class:`NominatimBusy`), пакетные — сколько нужно;
+- :class:`NominatimClient` — HTTP-клиент ``/search`` и ``/reverse``;
+  ``None`` — ошибка upstream (не кэшируется), ``[]`` — ничего не найдено;
+- :func:`search` / :func:`reverse` при ошибке upstream бросают
+  :class:`NominatimUnavailable`, а не ``[]``: пустой ответ закэшировали бы
+  и постоянный кэш, и кэш ответов геокодера (app.cache);
+- таблица ``geocode_cache`` (:class:`app.models.GeocodeCacheEntry`) —
+  постоянный кэш по (kind, lang, нормализованный запрос) с TTL
+  GEOCODE_PERSIST_TTL_DAYS и негативными записями на GEOCODE_NEGATIVE_TTL_HOURS;
+- :func:`fetch_many` — пакетное геокодирование для пересборки: кэш читается
+  одним запросом, промахи идут в NOMINATIM_CONCURRENCY потоков через общий
+  limiter, результаты сохраняются по мере получения — прерванную пересборку
+  достаточно запустить заново.
+
+Счётчики (observability.metrics): ``geocode_persist_hits_total``,
+``geocode_persist_misses_total``, ``nominatim_requests_total``,
+``nominatim_errors_total``, ``nominatim_busy_total``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+from compat_flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models import GeocodeCacheEntry
+from ..observability.metrics import inc_counter
+
+
+SEARCH = 'search'
+REVERSE = 'reverse'
+
+DEFAULT_URL = 'https://nominatim.openstreetmap.org'
+# search всегда запрашиваем с запасом, чтобы limit=1..5 брали одну запись кэша
+FETCH_LIMIT = 5
+STORE_BATCH = 20
+MAX_KEY_LEN = 255
+LOOKUP_CHUNK = 500
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _cfg(name: str, default: Any, cast=float) -> Any:
+    try:
+        value = current_app.config.get(name)
+        return default if value is None else cast(value)
+    except Exception:
+        return default
+
+
+def normalize_query(q: Any) -> str:
+    """Ключ запроса: NFKC, нижний регистр, схлопнутые пробелы."""
+    key = ' '.join(unicodedata.normalize('NFKC', str(q or '')).lower().split())
+    if len(key) > MAX_KEY_LEN:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        key = f'{key[:MAX_KEY_LEN - 41]}#{digest}'
+    return key
+
+
+def reverse_key(lat: float, lon: float) -> str:
+    # 5 знаков ≈ 1 м: соседние клики по карте попадают в одну запись
+    return f'{float(lat):.5f},{float(lon):.5f}'
+
+
+class NominatimUnavailable(RuntimeError):
+    """Upstream не ответил (сеть, 5xx, мусор вместо JSON) — результат не кэшируется."""
+
+
+class NominatimBusy(NominatimUnavailable):
+    """Свободный слот limiter'а дальше max_wait: не ждём, отвечаем «повторите позже»."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f'nominatim rate limit, retry after {retry_after:.1f}s')
+        self.retry_after = retry_after
+
+
+# --- ограничение частоты ---
+
+
+class RateLimiter:
+    """Равномерные слоты: не чаще rps запросов в секунду на все потоки."""
+
+    def __init__(self, rps: float) -> None:
+        self.interval = 1.0 / rps if rps and rps > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: Optional[float] = None) -> bool:
+        """Дождаться своего слота; False — ждать дольше max_wait (слот не занят)."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            if max_wait is not None and slot - now > max_wait:
+                return False
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+        return True
+
+    def delay(self) -> float:
+        """Сколько секунд до ближайшего свободного слота."""
+        with self._lock:
+            return max(0.0, self._next - time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        """Upstream попросил подождать (429/503) — сдвинуть следующий слот."""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + max(0.0, seconds))
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(base_url: str, rps: float) -> RateLimiter:
+    """Один limiter на upstream в процессе (геокодер и пересборка делят лимит)."""
+    with _limiters_lock:
+        limiter = _limiters.get(base_url)
+        if limiter is None or limiter.interval != (1.0 / rps if rps > 0 else 0.0):
+            limiter = _limiters[base_url] = RateLimiter(rps)
+        return limiter
+
+
+# --- HTTP ---
+
+
+def _item(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {'display_name': data.get('display_name'), 'lat': data.get('lat'), 'lon': data.get('lon')}
+
+
+class NominatimClient:
+    def __init__(
+        self,
+        base_url: str = DEFAULT_URL,
+        *,
+        rps: float = 1.0,
+        timeout: float = 10.0,
+        user_agent: str = 'map-v12-geocode',
+        retries: int = 1,
+        max_wait: Optional[float] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.limiter = get_limiter(self.base_url, rps)
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.retries = retries
+        # None — ждать слот сколько нужно (пересборка офлайн-базы)
+        self.max_wait = max_wait
+
+    @classmethod
+    def from_config(cls, *, interactive: bool = False) -> 'NominatimClient':
+        """Клиент по конфигу; interactive — ожидание слота не дольше NOMINATIM_MAX_WAIT."""
+        return cls(
+            _cfg('NOMINATIM_URL', DEFAULT_URL, str) or DEFAULT_URL,
+            rps=_cfg('NOMINATIM_RPS', 1.0),
+            timeout=_cfg('NOMINATIM_TIMEOUT', 10.0),
+            user_agent=_cfg('NOMINATIM_USER_AGENT', 'map-v12-geocode', str),
+            max_wait=_cfg('NOMINATIM_MAX_WAIT', 2.0) if interactive else None,
+        )
+
+    def _get(self, path: str, params: Dict[str, Any]) -> Any:
+        """JSON ответа; None — ошибка upstream, NominatimBusy — слот дальше max_wait."""
+        for attempt in range(self.retries + 1):
+            if not self.limiter.acquire(self.max_wait):
+                inc_counter('nominatim_busy_total')
+                raise NominatimBusy(self.limiter.delay())
+            inc_counter('nominatim_requests_total')
+            try:
+                r = requests.get(
+                    f'{self.base_url}/{path}',
+                    params=params,
+                    headers={'User-Agent': self.user_agent},
+                    timeout=self.timeout,
+                )
+            except Exception:
+                inc_counter('nominatim_errors_total')
+                return None
+            if not r.ok:
+                if r.status_code in (429, 503) and attempt < self.retries:
+                    try:
+                        retry_after = float(r.headers.get('Retry-After') or 5)
+                    except ValueError:
+                        retry_after = 5.0
+                    self.limiter.pause(min(retry_after, 60.0))
+                    continue
+                inc_counter('nominatim_errors_total')
+                return None
+            try:
+                return r.json()
+            except Exception:
+                inc_counter('nominatim_errors_total')
+                return None
+        inc_counter('nominatim_errors_total')
+        return None
+
+    def search(self, q: str, limit: int, lang: str) -> Optional[List[Dict[str, Any]]]:
+        data = self._get('search', {'q': q, 'format': 'json', 'limit': limit, 'accept-language': lang})
+        if not isinstance(data, list):
+            return None
+        return [_item(d) for d in data[:limit] if isinstance(d, dict)]
+
+    def reverse(self, lat: float, lon: float, lang: str) -> Optional[List[Dict[str, Any]]]:
+        data = self._get('reverse', {'lat': lat, 'lon': lon, 'format': 'json', 'accept-language': lang})
+        if not isinstance(data, dict):
+            return None
+        if data.get('error'):
+            return []  # «Unable to geocode» — валидный пустой ответ
+        return [_item(data)]
+
+
+# --- постоянный кэш ---
+
+
+def _expires(results: Sequence[Any]) -> datetime:
+    if results:
+        return _utcnow() + timedelta(days=_cfg('GEOCODE_PERSIST_TTL_DAYS', 30.0))
+    return _utcnow() + timedelta(hours=_cfg('GEOCODE_NEGATIVE_TTL_HOURS', 24.0))
+
+
+def cache_lookup(kind: str, lang: str, keys: Iterable[str]) -> Dict[str, GeocodeCacheEntry]:
+    """Непросроченные записи кэша по ключам."""
+    keys = list(dict.fromkeys(keys))
+    now = _utcnow()
+    out: Dict[str, GeocodeCacheEntry] = {}
+    for i in range(0, len(keys), LOOKUP_CHUNK):
+        rows = GeocodeCacheEntry.query.filter(
+            GeocodeCacheEntry.kind == kind,
+            GeocodeCacheEntry.lang == lang,
+            GeocodeCacheEntry.query_key.in_(keys[i:i + LOOKUP_CHUNK]),
+            GeocodeCacheEntry.expires_at > now,
+        ).all()
+        out.update((r.query_key, r) for r in rows)
+    return out
+
+
+def cache_store(kind: str, lang: str, items: Sequence[Tuple[str, List[Dict[str, Any]], int]]) -> None:
+    """Upsert (key, results, fetched_limit); параллельная вставка того же ключа не ошибка."""
+    if not items:
+        return
+    for attempt in range(2):
+        existing = {
+            r.query_key: r
+            for r in GeocodeCacheEntry.query.filter(
+                GeocodeCacheEntry.kind == kind,
+                GeocodeCacheEntry.lang == lang,
+                GeocodeCacheEntry.query_key.in_([k for k, _, _ in items]),
+            ).all()
+        }
+        for key, results, fetched_limit in items:
+            row = existing.get(key)
+            if row is None:
+                row = GeocodeCacheEntry(kind=kind, lang=lang, query_key=key)
+                db.session.add(row)
+            row.results_json = json.dumps(results, ensure_ascii=False)
+            row.fetched_limit = fetched_limit
+            row.fetched_at = _utcnow()
+            row.expires_at = _expires(results)
+        try:
+            db.session.commit()
+            return
+        except IntegrityError:
+            # ключ вставил другой воркер — повторяем как update
+            db.session.rollback()
+            if attempt:
+                raise
+
+
+def _covers(row: GeocodeCacheEntry, limit: int) -> bool:
+    results = row.results()
+    return not results or len(results) >= limit or row.fetched_limit >= limit
+
+
+def search(q: str, limit: int = 1, lang: str = 'ru', client: Optional[NominatimClient] = None) -> List[Dict[str, Any]]:
+    """Прямое геокодирование через постоянный кэш и Nominatim.
+
+    NominatimUnavailable — upstream не ответил (или NominatimBusy — занят
+    limiter); такой результат не должен кэшироваться вызывающим.
+    """
+    key = normalize_query(q)
+    if not key:
+        return []
+    try:
+        row = cache_lookup(SEARCH, lang, [key]).get(key)
+    except Exception:
+        db.session.rollback()
+        row = None
+    if row is not None and _covers(row, limit):
+        inc_counter('geocode_persist_hits_total')
+        return row.results()[:limit]
+    inc_counter('geocode_persist_misses_total')
+    fetch_limit = max(limit, FETCH_LIMIT)
+    results = (client or NominatimClient.from_config(interactive=True)).search(q.strip(), fetch_limit, lang)
+    if results is None:
+        raise NominatimUnavailable('nominatim search failed')
+    _store_quietly(SEARCH, lang, [(key, results, fetch_limit)])
+    return results[:limit]
+
+
+def reverse(lat: float, lon: float, lang: str = 'ru', client: Optional[NominatimClient] = None) -> List[Dict[str, Any]]:
+    """Обратное геокодирование через постоянный кэш и Nominatim (ошибки — как у :func:`search`)."""
+    key = reverse_key(lat, lon)
+    try:
+        row = cache_lookup(REVERSE, lang, [key]).get(key)
+    except Exception:
+        db.session.rollback()
+        row = None
+    if row is not None:
+        inc_counter('geocode_persist_hits_total')
+        return row.results()
+    inc_counter('geocode_persist_misses_total')
+    results = (client or NominatimClient.from_config(interactive=True)).reverse(float(lat), float(lon), lang)
+    if results is None:
+        raise NominatimUnavailable('nominatim reverse failed')
+    _store_quietly(REVERSE, lang, [(key, results, 1)])
+    return results
+
+
+def _store_quietly(kind: str, lang: str, items: Sequence[Tuple[str, List[Dict[str, Any]], int]]) -> None:
+    try:
+        cache_store(kind, lang, items)
+    except Exception:
+        db.session.rollback()
+        current_app.logger.warning('geocode_cache store failed', exc_info=True)
+
+
+# --- пакетное геокодирование ---
+
+
+def fetch_many(
+    queries: Iterable[str],
+    lang: str = 'ru',
+    *,
+    limit: int = 1,
+    concurrency: Optional[int] = None,
+    client: Optional[NominatimClient] = None,
+) -> Iterator[Tuple[str, List[Dict[str, Any]], bool]]:
+    """Геокодировать запросы; yield (query, results, from_cache) по мере готовности.
+
+    Вызывать в app context (потоки пула только ходят в HTTP, БД — в
+    вызывающем потоке). Одинаковые после нормализации запросы геокодируются
+    один раз, но yield'ятся для каждого исходного. Ошибки upstream дают
+    пустой результат и не сохраняются — при повторном запуске они будут
+    запрошены снова. Закрытие генератора (клиент отвалился) сохраняет уже
+    полученное.
+    """
+    by_key: Dict[str, List[str]] = {}
+    for q in queries:
+        key = normalize_query(q)
+        if key:
+            by_key.setdefault(key, []).append(q)
+
+    fetch_limit = max(limit, FETCH_LIMIT)
+    found = cache_lookup(SEARCH, lang, by_key)
+    missing: List[str] = []
+    for key, originals in by_key.items():
+        row = found.get(key)
+        if row is not None and _covers(row, limit):
+            inc_counter('geocode_persist_hits_total')
+            for q in originals:
+                yield q, row.results()[:limit], True
+        else:
+            missing.append(key)
+    if not missing:
+        return
+
+    client = client or NominatimClient.from_config()
+    workers = max(1, int(concurrency or _cfg('NOMINATIM_CONCURRENCY', 2, int)))
+    pending: List[Tuple[str, List[Dict[str, Any]], int]] = []
+    todo = iter(missing)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='nominatim')
+    inflight: Dict[Any, str] = {}
+    try:
+        while True:
+            # в очереди не больше 2×workers задач: закрытие генератора не ждёт весь список
+            while len(inflight) < workers * 2:
+                key = next(todo, None)
+                if key is None:
+                    break
+                inflight[pool.submit(client.search, by_key[key][0].strip(), fetch_limit, lang)] = key
+            if not inflight:
+                break
+            ready, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+            for fut in ready:
+                key = inflight.pop(fut)
+                inc_counter('geocode_persist_misses_total')
+                try:
+                    results = fut.result()
+                except Exception:
+                    results = None
+                if results is not None:
+                    pending.append((key, results, fetch_limit))
+                    if len(pending) >= STORE_BATCH:
+                        _store_quietly(SEARCH, lang, pending)
+                        pending = []
+                for q in by_key[key]:
+                    yield q, (results or [])[:limit], False
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        _store_quietly(SEARCH, lang, pending)
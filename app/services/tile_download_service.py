@@ -0,0 +1,442 @@
+"""Фоновая загрузка офлайн‑тайлов.
+
+Раньше /api/offline/map/stream качал тайлы по одному прямо в SSE-генераторе:
+web-воркер был занят всё время загрузки, а при закрытии вкладки работа
+терялась. Теперь загрузка — задание (:class:`app.models.TileDownloadJob`),
+которое выполняется в фоновом потоке:
+
+- один ``requests.Session`` с пулом соединений на TILE_DOWNLOAD_CONCURRENCY
+  параллельных запросов;
+- до TILE_DOWNLOAD_RETRIES повторов на тайл с экспоненциальной паузой
+  (и Retry-After для 429/503); тайлы, не скачанные после повторов,
+  сохраняются в задании и пробуются снова при resume;
+- тайл пишется через временный файл, поэтому после падения не остаётся
+  «обрезанных» png, а существующие файлы пропускаются;
+- прогресс, счётчики и ``cursor`` (сколько первых тайлов обработано)
+  сохраняются раз в FLUSH_SEC; задание, чей воркер перестал обновлять
+  heartbeat (STALE_SEC), продолжается с cursor в другом потоке/процессе.
+
+SSE-эндпоинт только читает запись задания (:func:`iter_progress`), поэтому
+за одним заданием могут следить несколько администраторов, а повторный
+запуск того же набора подключается к уже идущему заданию.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+from compat_flask import current_app
+from requests.adapters import HTTPAdapter
+from sqlalchemy import and_, or_
+
+from ..extensions import db
+from ..models import TileDownloadJob
+
+
+DEFAULT_URL = 'https://tile.openstreetmap.org/{z}/{x}/{y}.png'
+
+ACTIVE = ('queued', 'running')
+# partial — готово, но часть неудачных тайлов не поместилась в failed_json
+# (больше MAX_FAILED_KEEP): повтор — полный проход с начала
+TERMINAL = ('done', 'partial', 'failed', 'cancelled')
+
+DOWNLOADED, SKIPPED, FAILED = 'downloaded', 'skipped', 'failed'
+
+FLUSH_SEC = 1.0
+STALE_SEC = 60.0
+BACKOFF_SEC = 0.5
+BACKOFF_MAX_SEC = 30.0
+REQUEST_TIMEOUT = 15
+MAX_FAILED_KEEP = 1000
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _cfg_int(name: str, default: int) -> int:
+    try:
+        return int(current_app.config.get(name) or default)
+    except (TypeError, ValueError):
+        return default
+
+
+# --- диапазоны тайлов ---
+
+
+def deg2num(lat_deg: float, lon_deg: float, zoom: int) -> Tuple[float, float]:
+    """Географические координаты -> дробный номер тайла (x, y) по формуле OSM."""
+    lat_rad = math.radians(lat_deg)
+    n = 2.0 ** zoom
+    xtile = (lon_deg + 180.0) / 360.0 * n
+    ytile = (1.0 - math.log(math.tan(lat_rad) + (1 / math.cos(lat_rad))) / math.pi) / 2.0 * n
+    return xtile, ytile
+
+
+def tile_ranges(bounds: Sequence[float], zmin: int, zmax: int) -> List[Tuple[int, int, int, int, int]]:
+    """[(z, x0, x1, y0, y1)] для bounds = (lat_min, lat_max, lon_min, lon_max)."""
+    lat_min, lat_max, lon_min, lon_max = bounds
+    ranges = []
+    for z in range(zmin, zmax + 1):
+        try:
+            x_min_f, y_max_f = deg2num(lat_max, lon_min, z)
+            x_max_f, y_min_f = deg2num(lat_min, lon_max, z)
+        except Exception:
+            continue
+        limit = 2 ** z
+        x0, x1 = (max(0, min(int(math.floor(v)), limit - 1)) for v in sorted((x_min_f, x_max_f)))
+        y0, y1 = (max(0, min(int(math.floor(v)), limit - 1)) for v in sorted((y_min_f, y_max_f)))
+        if x1 >= x0 and y1 >= y0:
+            ranges.append((z, x0, x1, y0, y1))
+    return ranges
+
+
+class _TileOrder:
+    """Сквозная нумерация тайлов диапазонов: индекс <-> (z, x, y)."""
+
+    def __init__(self, ranges: Sequence[Sequence[int]]) -> None:
+        self.ranges = [tuple(int(v) for v in r) for r in ranges]
+        self.starts: List[int] = []
+        total = 0
+        for _z, x0, x1, y0, y1 in self.ranges:
+            self.starts.append(total)
+            total += (x1 - x0 + 1) * (y1 - y0 + 1)
+        self.total = total
+
+    def tile(self, i: int) -> Tuple[int, int, int]:
+        k = bisect.bisect_right(self.starts, i) - 1
+        z, x0, _x1, y0, y1 = self.ranges[k]
+        dx, dy = divmod(i - self.starts[k], y1 - y0 + 1)
+        return z, x0 + dx, y0 + dy
+
+
+# --- загрузка одного тайла ---
+
+
+def _http_session(concurrency: int, user_agent: str) -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, concurrency))
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    s.headers['User-Agent'] = user_agent
+    return s
+
+
+def tile_path(target_dir: str, z: int, x: int, y: int) -> str:
+    return os.path.join(target_dir, str(z), str(x), f'{y}.png')
+
+
+def fetch_tile(session: requests.Session, url_tpl: str, target_dir: str, z: int, x: int, y: int, retries: int) -> str:
+    """Скачать тайл, если его ещё нет; DOWNLOADED / SKIPPED / FAILED."""
+    path = tile_path(target_dir, z, x, y)
+    if os.path.isfile(path):
+        return SKIPPED
+    url = url_tpl.format(z=z, x=x, y=y)
+    for attempt in range(retries + 1):
+        delay = min(BACKOFF_MAX_SEC, BACKOFF_SEC * 2 ** attempt) + random.uniform(0, BACKOFF_SEC)
+        try:
+            r = session.get(url, timeout=REQUEST_TIMEOUT)
+            if r.status_code == 200 and r.content:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f'{path}.{threading.get_ident()}.part'
+                with open(tmp, 'wb') as fh:
+                    fh.write(r.content)
+                os.replace(tmp, path)
+                return DOWNLOADED
+            if r.status_code in (400, 403, 404):
+                return FAILED  # повтор не поможет
+            if r.status_code in (429, 503):
+                try:
+                    delay = max(delay, min(BACKOFF_MAX_SEC, float(r.headers.get('Retry-After') or 0)))
+                except ValueError:
+                    pass
+        except (requests.RequestException, OSError):
+            pass
+        if attempt < retries:
+            time.sleep(delay)
+    return FAILED
+
+
+# --- задания ---
+
+
+def get_job(job_id: str) -> Optional[TileDownloadJob]:
+    return db.session.get(TileDownloadJob, str(job_id))
+
+
+def list_jobs(limit: int = 20) -> List[TileDownloadJob]:
+    return TileDownloadJob.query.order_by(TileDownloadJob.created_at.desc()).limit(limit).all()
+
+
+def _is_stale(job: TileDownloadJob) -> bool:
+    beat = job.heartbeat_at or job.started_at
+    return job.status == 'running' and (beat is None or beat < _utcnow() - timedelta(seconds=STALE_SEC))
+
+
+def active_job(set_name: str) -> Optional[TileDownloadJob]:
+    """Задание в очереди или в работе для набора (пишет в его каталог)."""
+    return (
+        TileDownloadJob.query.filter(TileDownloadJob.set_name == set_name, TileDownloadJob.status.in_(ACTIVE))
+        .order_by(TileDownloadJob.created_at.desc())
+        .first()
+    )
+
+
+def create_job(
+    *,
+    city: str,
+    bounds: Sequence[float],
+    zmin: int,
+    zmax: int,
+    set_name: str,
+    target_dir: str,
+    created_by: Optional[str] = None,
+) -> TileDownloadJob:
+    """Новое задание или уже активное задание для того же набора тайлов."""
+    active = active_job(set_name)
+    if active is not None:
+        return active
+    ranges = tile_ranges(bounds, zmin, zmax)
+    job = TileDownloadJob(
+        id=uuid.uuid4().hex,
+        status='queued',
+        set_name=set_name,
+        target_dir=target_dir,
+        params_json=json.dumps({
+            'city': city,
+            'zmin': zmin,
+            'zmax': zmax,
+            'bounds': list(bounds),
+            'ranges': ranges,
+            'url': current_app.config.get('TILE_DOWNLOAD_URL') or DEFAULT_URL,
+        }),
+        total=_TileOrder(ranges).total,
+        created_by=created_by,
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def start_job(job_id: str) -> None:
+    """Выполнить задание в фоновом потоке этого процесса."""
+    app = current_app._get_current_object()
+
+    def _run() -> None:
+        with app.app_context():
+            try:
+                run_job(job_id)
+            finally:
+                db.session.remove()
+
+    threading.Thread(target=_run, daemon=True, name=f'tiles-{job_id[:8]}').start()
+
+
+def ensure_running(job: TileDownloadJob) -> None:
+    """Запустить задание, если оно ждёт или его воркер пропал."""
+    if job.status == 'queued' or _is_stale(job):
+        start_job(job.id)
+
+
+def cancel_job(job_id: str) -> Optional[TileDownloadJob]:
+    job = get_job(job_id)
+    if job is not None and job.status in ACTIVE:
+        job.status = 'cancelled'
+        job.finished_at = _utcnow()
+        db.session.commit()
+    return job
+
+
+def resume_job(job_id: str) -> Optional[TileDownloadJob]:
+    """Продолжить прерванное задание / повторить неудавшиеся тайлы."""
+    job = get_job(job_id)
+    if job is None:
+        return None
+    if job.status == 'partial':
+        # список неудачных тайлов неполон — проходим всё заново, готовые будут skipped
+        job.cursor = job.done = job.downloaded = job.skipped = job.failed = 0
+        job.failed_json = None
+    if job.status in TERMINAL and (job.cursor < job.total or job.failed_json not in (None, '[]')):
+        job.status = 'queued'
+        job.error = None
+        job.finished_at = None
+        db.session.commit()
+    ensure_running(job)
+    return job
+
+
+def _claim(job_id: str, worker: str) -> bool:
+    now = _utcnow()
+    n = TileDownloadJob.query.filter(
+        TileDownloadJob.id == job_id,
+        or_(
+            TileDownloadJob.status == 'queued',
+            and_(
+                TileDownloadJob.status == 'running',
+                or_(TileDownloadJob.heartbeat_at.is_(None),
+                       TileDownloadJob.heartbeat_at < now - timedelta(seconds=STALE_SEC)),
+            ),
+        ),
+    ).update({'status': 'running', 'worker': worker, 'heartbeat_at': now}, synchronize_session=False)
+    db.session.commit()
+    return n == 1
+
+
+def run_job(job_id: str) -> Optional[TileDownloadJob]:
+    """Выполнить задание в текущем потоке (нужен app context).
+
+    Возвращает задание или None, если его уже выполняет другой воркер.
+    """
+    worker = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    if not _claim(job_id, worker):
+        return None
+    job = get_job(job_id)
+    try:
+        _download(job)
+    except Exception as exc:  # noqa: BLE001
+        db.session.rollback()
+        job = get_job(job_id)
+        job.status = 'failed'
+        job.error = str(exc)[:500]
+        job.finished_at = _utcnow()
+        db.session.commit()
+        current_app.logger.exception('tile download job %s failed', job_id)
+    return job
+
+
+def _download(job: TileDownloadJob) -> None:
+    params = job.params()
+    order = _TileOrder(params.get('ranges') or [])
+    url_tpl = params.get('url') or DEFAULT_URL
+    target_dir = job.target_dir
+    concurrency = max(1, _cfg_int('TILE_DOWNLOAD_CONCURRENCY', 4))
+    retries = max(0, _cfg_int('TILE_DOWNLOAD_RETRIES', 3))
+    session = _http_session(concurrency, current_app.config.get('TILE_DOWNLOAD_USER_AGENT') or 'map-v12-offline')
+
+    retry_tiles = []
+    for key in job.failed_tiles():
+        try:
+            z, x, y = (int(v) for v in str(key).split('/'))
+            retry_tiles.append((z, x, y))
+        except ValueError:
+            continue
+    cursor = min(job.cursor or 0, order.total)
+    # тайлы после cursor при перезапуске проходят заново (готовые — как skipped)
+    done = cursor
+    downloaded, skipped = job.downloaded or 0, job.skipped or 0
+    # failed считает все неудачи; failed_tiles — те, что можно повторить.
+    # Повторяемый тайл остаётся в списке (и в failed_json), пока не скачается:
+    # падение воркера посреди повтора не теряет его.
+    failed = job.failed or 0
+    failed_tiles: Dict[str, None] = dict.fromkeys(f'{z}/{x}/{y}' for z, x, y in retry_tiles)
+    finished_after_cursor: set = set()
+
+    if job.started_at is None:
+        job.started_at = _utcnow()
+    job.done, job.total = done, order.total
+    db.session.commit()
+
+    work: Iterator[Tuple[Optional[int], Tuple[int, int, int]]] = chain(
+        ((None, t) for t in retry_tiles),
+        ((i, order.tile(i)) for i in range(cursor, order.total)),
+    )
+    inflight: Dict[Any, Tuple[Optional[int], Tuple[int, int, int]]] = {}
+    stopping = False
+    last_flush = time.monotonic()
+
+    def flush() -> str:
+        job.cursor, job.done = cursor, done
+        job.downloaded, job.skipped, job.failed = downloaded, skipped, failed
+        job.failed_json = json.dumps(list(failed_tiles))
+        job.heartbeat_at = _utcnow()
+        db.session.commit()
+        return job.status  # после commit перечитывается — видно отмену
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='tiles') as pool:
+        while True:
+            while not stopping and len(inflight) < concurrency * 4:
+                item = next(work, None)
+                if item is None:
+                    break
+                z, x, y = item[1]
+                inflight[pool.submit(fetch_tile, session, url_tpl, target_dir, z, x, y, retries)] = item
+            if not inflight:
+                break
+            ready, _ = wait(list(inflight), timeout=FLUSH_SEC, return_when=FIRST_COMPLETED)
+            for fut in ready:
+                idx, (z, x, y) = inflight.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception:  # noqa: BLE001
+                    result = FAILED
+                key = f'{z}/{x}/{y}'
+                if result == DOWNLOADED:
+                    downloaded += 1
+                elif result == SKIPPED:
+                    skipped += 1
+                elif idx is not None:
+                    failed += 1
+                    # не поместившиеся в список учтены в failed -> статус partial
+                    if len(failed_tiles) < MAX_FAILED_KEEP:
+                        failed_tiles[key] = None
+                if idx is None and result != FAILED:
+                    failed_tiles.pop(key, None)
+                    failed = max(0, failed - 1)
+                if idx is not None:
+                    done += 1
+                    finished_after_cursor.add(idx)
+                    while cursor in finished_after_cursor:
+                        finished_after_cursor.discard(cursor)
+                        cursor += 1
+            if time.monotonic() - last_flush >= FLUSH_SEC:
+                last_flush = time.monotonic()
+                if flush() != 'running' and not stopping:
+                    # отменено: новые тайлы не берём, начатые дожидаемся
+                    stopping = True
+                    for fut in list(inflight):
+                        if fut.cancel():
+                            inflight.pop(fut)
+
+    status = flush()
+    if status == 'running':
+        job.status = 'partial' if failed > len(failed_tiles) else 'done'
+        job.finished_at = _utcnow()
+        db.session.commit()
+    session.close()
+
+
+def iter_progress(job_id: str, poll_sec: float = 1.0) -> Iterator[Dict[str, Any]]:
+    """Состояние задания при каждом изменении, до завершения (нужен app context).
+
+    Если воркер задания пропал (нет heartbeat STALE_SEC), задание
+    перезапускается в этом процессе с сохранённого cursor.
+    """
+    last = None
+    while True:
+        db.session.expire_all()
+        job = get_job(job_id)
+        if job is None:
+            return
+        state = job.to_dict()
+        key = (state['status'], state['done'], state['failed'])
+        if key != last:
+            last = key
+            yield state
+        if job.status in TERMINAL:
+            return
+        if _is_stale(job):
+            start_job(job.id)
+        time.sleep(poll_sec)
@@ -0,0 +1,510 @@
+"""Хранилища наборов офлайн‑тайлов.
+
+Исторически набор — каталог ``z/x/y.png``: миллионы файлов, статистика
+набора — обход всего дерева (os.walk + getsize), копирование и удаление
+трогают каждый inode. Здесь два бэкенда с общим интерфейсом:
+
+- :class:`DirTileStore` — прежний каталог (туда пишет загрузчик тайлов);
+- :class:`MBTilesStore` — один файл MBTiles (SQLite, схема MBTiles 1.3,
+  строки в TMS-нумерации). Чтение — через отдельное read-only соединение
+  на поток с ``PRAGMA mmap_size``; количество тайлов, размер и уровни
+  лежат в таблице metadata, поэтому статистика — O(1).
+
+:func:`pack_directory` упаковывает каталог в MBTiles (через временный файл
+и ``os.replace``, так что читатели видят либо старый файл, либо готовый
+новый). ETag тайла строится без чтения данных: из mtime/размера файла
+MBTiles (или файла тайла) и координат.
+
+:func:`tile_response` — общая отдача тайла для /tiles/...: 304 по ETag,
+Range, sendfile для каталогов и LRU горячих низких уровней
+(:class:`TileCache`) для MBTiles.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from compat_flask import Response, current_app, request, send_file
+
+from ..observability.metrics import inc_counter
+
+MBTILES_EXT = '.mbtiles'
+PACKING_SUFFIX = '.part'
+MMAP_SIZE = 256 * 1024 * 1024
+PACK_BATCH = 2000
+# Cache-Control: см. cache_control()
+ACTIVE_MAX_AGE = 60
+DIR_MAX_AGE = 3600
+PACKED_MAX_AGE = 365 * 24 * 3600
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_CACHE_MAX_ZOOM = 12
+
+
+def _file_stamp(st: os.stat_result) -> str:
+    return f'{st.st_mtime_ns:x}-{st.st_size:x}'
+
+
+# ---------------------------------------------------------------------------
+# Каталог z/x/y.png
+# ---------------------------------------------------------------------------
+
+
+def summarise_tiles(dir_path: str) -> Dict[str, Any]:
+    """Собрать статистику по тайлам в каталоге.
+
+    Возвращает словарь с ключами levels (список объектов z/tiles),
+    total_tiles (общее количество тайлов) и size_bytes (общий размер в байтах).
+    """
+    levels: List[Dict[str, Any]] = []
+    total_tiles = 0
+    total_size = 0
+    try:
+        if os.path.isdir(dir_path):
+            for name in os.listdir(dir_path):
+                z_dir = os.path.join(dir_path, name)
+                if not os.path.isdir(z_dir):
+                    continue
+                try:
+                    z_int = int(name)
+                except Exception:
+                    continue
+                tile_count = 0
+                level_size = 0
+                for root, dirs, files in os.walk(z_dir):
+                    for f in files:
+                        if f.lower().endswith('.png'):
+                            tile_count += 1
+                            try:
+                                size = os.path.getsize(os.path.join(root, f))
+                                level_size += size
+                            except Exception:
+                                pass
+                if tile_count > 0:
+                    levels.append({'z': z_int, 'tiles': tile_count})
+                    total_tiles += tile_count
+                    total_size += level_size
+            levels.sort(key=lambda d: d['z'])
+    except Exception:
+        pass
+    return {
+        'levels': levels,
+        'total_tiles': total_tiles,
+        'size_bytes': total_size,
+    }
+
+
+class DirTileStore:
+    kind = 'dir'
+
+    def __init__(self, path: str) -> None:
+        # send_file трактует относительные пути от корня приложения
+        self.path = os.path.abspath(path)
+
+    def tile_path(self, z: int, x: int, y: int) -> str:
+        return os.path.join(self.path, str(z), str(x), f'{y}.png')
+
+    def etag(self, z: int, x: int, y: int) -> Optional[str]:
+        try:
+            st = os.stat(self.tile_path(z, x, y))
+        except OSError:
+            return None
+        return f'{_file_stamp(st)}-{z}-{x}-{y}'
+
+    def get_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        try:
+            with open(self.tile_path(z, x, y), 'rb') as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {'format': self.kind, **summarise_tiles(self.path)}
+
+
+# ---------------------------------------------------------------------------
+# MBTiles
+# ---------------------------------------------------------------------------
+
+
+class MBTilesStore:
+    kind = 'mbtiles'
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.stamp = _file_stamp(os.stat(path))
+        self._local = threading.local()
+        # все соединения потоков — чтобы close() закрыл и чужие
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._meta: Optional[Dict[str, str]] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def etag(self, z: int, x: int, y: int) -> Optional[str]:
+        return f'{self.stamp}-{z}-{x}-{y}'
+
+    def get_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        if z < 0 or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            return None
+        args = (z, x, (1 << z) - 1 - y)
+        sql = 'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?'
+        try:
+            row = self._conn().execute(sql, args).fetchone()
+        except sqlite3.ProgrammingError:
+            # соединение закрыли при замене файла (close()) — открыть заново
+            row = self._conn().execute(sql, args).fetchone()
+        return bytes(row[0]) if row else None
+
+    def metadata(self) -> Dict[str, str]:
+        if self._meta is None:
+            self._meta = {k: v for k, v in self._conn().execute('SELECT name, value FROM metadata')}
+        return self._meta
+
+    def stats(self) -> Dict[str, Any]:
+        meta = self.metadata()
+        try:
+            levels = json.loads(meta.get('levels') or '[]')
+            total = int(meta['tile_count'])
+            size = int(meta['size_bytes'])
+        except (KeyError, ValueError):
+            # MBTiles, собранный не нами, — считаем один раз
+            rows = self._conn().execute(
+                'SELECT zoom_level, COUNT(*), SUM(LENGTH(tile_data)) FROM tiles GROUP BY zoom_level ORDER BY zoom_level'
+            ).fetchall()
+            levels = [{'z': z, 'tiles': n} for z, n, _ in rows]
+            total = sum(n for _, n, _ in rows)
+            size = sum(s or 0 for _, _, s in rows)
+        return {
+            'format': self.kind,
+            'levels': levels,
+            'total_tiles': total,
+            'size_bytes': size,
+            'file_bytes': os.path.getsize(self.path),
+            'version': self.stamp,
+            'name': meta.get('name'),
+            'bounds': meta.get('bounds'),
+        }
+
+    def close(self) -> None:
+        """Закрыть соединения всех потоков (иначе старый файл держат открытым до их смерти)."""
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+            self._local = threading.local()
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+TileStore = Union[DirTileStore, MBTilesStore]
+
+_stores: Dict[str, Tuple[str, MBTilesStore]] = {}
+_stores_lock = threading.Lock()
+
+
+def open_mbtiles(path: str) -> Optional[MBTilesStore]:
+    """Открытый MBTiles (кэш по пути; после перепаковки файла — заново).
+
+    Соединения прежнего хранилища закрываются: они держат заменённый файл.
+    """
+    try:
+        stamp = _file_stamp(os.stat(path))
+    except OSError:
+        return None
+    cached = _stores.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    old = None
+    with _stores_lock:
+        cached = _stores.get(path)
+        if cached is None or cached[0] != stamp:
+            old = cached[1] if cached is not None else None
+            cached = (stamp, MBTilesStore(path))
+            _stores[path] = cached
+    if old is not None:
+        old.close()
+    return cached[1]
+
+
+def open_set(sets_dir: str, name: str) -> Optional[TileStore]:
+    """Набор по имени: упакованный ``<name>.mbtiles``, иначе каталог ``<name>/``."""
+    packed = open_mbtiles(os.path.join(sets_dir, name + MBTILES_EXT))
+    if packed is not None:
+        return packed
+    path = os.path.join(sets_dir, name)
+    return DirTileStore(path) if os.path.isdir(path) else None
+
+
+# ---------------------------------------------------------------------------
+# Упаковка каталога
+# ---------------------------------------------------------------------------
+
+
+def _tile_to_lonlat(z: int, x: int, y: int) -> Tuple[float, float]:
+    n = 2.0 ** z
+    lon = x / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    return lon, lat
+
+
+def _iter_dir_tiles(src_dir: str):
+    for z_name in os.listdir(src_dir):
+        if not z_name.isdigit():
+            continue
+        z = int(z_name)
+        z_dir = os.path.join(src_dir, z_name)
+        for x_name in os.listdir(z_dir) if os.path.isdir(z_dir) else ():
+            if not x_name.isdigit():
+                continue
+            x_dir = os.path.join(z_dir, x_name)
+            for entry in os.scandir(x_dir) if os.path.isdir(x_dir) else ():
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() == '.png' and stem.isdigit() and entry.is_file():
+                    yield z, int(x_name), int(stem), entry.path
+
+
+def pack_directory(
+    src_dir: str,
+    dest_path: str,
+    *,
+    name: Optional[str] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, Any]:
+    """Упаковать каталог ``z/x/y.png`` в MBTiles ``dest_path``; вернуть статистику."""
+    t0 = time.perf_counter()
+    tmp_path = dest_path + PACKING_SUFFIX
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(
+            """
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            PRAGMA page_size = 4096;
+            CREATE TABLE metadata (name TEXT, value TEXT);
+            CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+            """
+        )
+        levels: Dict[int, int] = {}
+        extent: Dict[int, List[int]] = {}
+        total = size = 0
+        batch: List[Tuple[int, int, int, bytes]] = []
+        for z, x, y, path in _iter_dir_tiles(src_dir):
+            with open(path, 'rb') as fh:
+                data = fh.read()
+            batch.append((z, x, (1 << z) - 1 - y, data))
+            levels[z] = levels.get(z, 0) + 1
+            ext = extent.setdefault(z, [x, x, y, y])
+            ext[0], ext[1], ext[2], ext[3] = min(ext[0], x), max(ext[1], x), min(ext[2], y), max(ext[3], y)
+            total += 1
+            size += len(data)
+            if len(batch) >= PACK_BATCH:
+                conn.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)', batch)
+                batch = []
+                if progress:
+                    progress(total)
+        if batch:
+            conn.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)', batch)
+        # индекс после вставки — быстрее, чем поддерживать его на каждой строке
+        conn.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+
+        meta = {
+            'name': name or os.path.basename(os.path.normpath(src_dir)),
+            'format': 'png',
+            'type': 'baselayer',
+            'version': '1.3',
+            'tile_count': str(total),
+            'size_bytes': str(size),
+            'levels': json.dumps([{'z': z, 'tiles': levels[z]} for z in sorted(levels)]),
+        }
+        if levels:
+            meta['minzoom'], meta['maxzoom'] = str(min(levels)), str(max(levels))
+            zmax = max(levels)
+            x0, x1, y0, y1 = extent[zmax]
+            west, north = _tile_to_lonlat(zmax, x0, y0)
+            east, south = _tile_to_lonlat(zmax, x1 + 1, y1 + 1)
+            meta['bounds'] = f'{west:.6f},{south:.6f},{east:.6f},{north:.6f}'
+        conn.executemany('INSERT INTO metadata VALUES (?, ?)', list(meta.items()))
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, dest_path)
+    return {
+        'total_tiles': total,
+        'size_bytes': size,
+        'file_bytes': os.path.getsize(dest_path),
+        'levels': json.loads(meta['levels']),
+        'seconds': round(time.perf_counter() - t0, 2),
+    }
+
+
+def pack_set_in_background(src_dir: str, dest_path: str, *, name: str, remove_dir: bool = False) -> None:
+    """Упаковать набор в фоновом потоке (каталог удаляется только после успеха)."""
+    app = current_app._get_current_object()
+
+    def _run() -> None:
+        try:
+            stats = pack_directory(src_dir, dest_path, name=name)
+            if remove_dir:
+                shutil.rmtree(src_dir, ignore_errors=True)
+            app.logger.info('tile set %s packed: %s', name, stats)
+        except Exception:
+            app.logger.exception('tile set %s: packing failed', name)
+            try:
+                os.remove(dest_path + PACKING_SUFFIX)
+            except OSError:
+                pass
+
+    threading.Thread(target=_run, name=f'pack-{name}', daemon=True).start()
+
+
+# ---------------------------------------------------------------------------
+# Отдача тайла
+# ---------------------------------------------------------------------------
+
+
+class TileCache:
+    """LRU тайлов упакованных наборов с бюджетом в байтах.
+
+    Кэшируются только уровни ``z <= max_zoom``: их немного, а запрашивают
+    их все клиенты при каждом открытии карты. Ключ включает ETag, поэтому
+    после перепаковки набора старые записи просто вытесняются.
+    """
+
+    def __init__(self, max_bytes: int, max_zoom: int) -> None:
+        self.max_bytes = max_bytes
+        self.max_zoom = max_zoom
+        self.bytes = 0
+        self._items: 'OrderedDict[Tuple[str, str], bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+        inc_counter('tiles_cache_hits_total' if data is not None else 'tiles_cache_misses_total')
+        return data
+
+    def put(self, key: Tuple[str, str], data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._items[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {'tiles': len(self._items), 'bytes': self.bytes, 'max_bytes': self.max_bytes, 'max_zoom': self.max_zoom}
+
+
+_tile_cache: Optional[TileCache] = None
+
+
+def get_tile_cache() -> Optional[TileCache]:
+    """Кэш процесса по TILE_CACHE_MAX_BYTES / TILE_CACHE_MAX_ZOOM (0 байт — выключен)."""
+    global _tile_cache
+    max_bytes = int(current_app.config.get('TILE_CACHE_MAX_BYTES', DEFAULT_CACHE_BYTES))
+    max_zoom = int(current_app.config.get('TILE_CACHE_MAX_ZOOM', DEFAULT_CACHE_MAX_ZOOM))
+    if max_bytes <= 0:
+        return None
+    cache = _tile_cache
+    if cache is None or (cache.max_bytes, cache.max_zoom) != (max_bytes, max_zoom):
+        with _stores_lock:
+            cache = _tile_cache
+            if cache is None or (cache.max_bytes, cache.max_zoom) != (max_bytes, max_zoom):
+                cache = _tile_cache = TileCache(max_bytes, max_zoom)
+    return cache
+
+
+def _read_packed(store: MBTilesStore, z: int, x: int, y: int, etag: str) -> Optional[bytes]:
+    cache = get_tile_cache()
+    if cache is None or z > cache.max_zoom:
+        return store.get_tile(z, x, y)
+    key = (store.path, etag)
+    data = cache.get(key)
+    if data is None:
+        data = store.get_tile(z, x, y)
+        if data is not None:
+            cache.put(key, data)
+    return data
+
+
+def cache_control(store: TileStore, *, pinned: bool, version: Optional[str] = None) -> str:
+    """Cache-Control тайла.
+
+    ``pinned`` — URL называет набор явно. Упакованный набор неизменяем, но
+    под тем же именем его можно упаковать заново (новый файл и новый
+    ``version`` в /map/sets), поэтому immutable — только если клиент добавил
+    к URL ``?v=`` и он совпадает с версией файла. Без версии (или со
+    старой), для каталога, который может дописываться загрузчиком, и для
+    URL активного набора, который после переключения отдаёт другой набор, —
+    короткий max-age и ETag-ревалидация.
+    """
+    if not pinned:
+        return f'public, max-age={ACTIVE_MAX_AGE}'
+    if store.kind == MBTilesStore.kind:
+        if version and version == store.stamp:
+            return f'public, max-age={PACKED_MAX_AGE}, immutable'
+        return f'public, max-age={ACTIVE_MAX_AGE}'
+    return f'public, max-age={DIR_MAX_AGE}'
+
+
+def tile_response(store: TileStore, z: int, x: int, y: int, *, pinned: bool = True) -> Response:
+    """HTTP-ответ с тайлом: ETag/If-None-Match (304 без чтения данных) и Range.
+
+    Версия набора для Cache-Control берётся из ``?v=`` запроса.
+
+    Тайлы каталога отдаются через ``send_file`` (файловый объект уходит в
+    ``wsgi.file_wrapper`` — под gunicorn это sendfile без копирования в
+    Python), тайлы MBTiles — из SQLite через LRU горячих уровней.
+    """
+    etag = store.etag(z, x, y)
+    if etag is None:
+        return Response(status=404)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+    elif isinstance(store, DirTileStore):
+        try:
+            resp = send_file(store.tile_path(z, x, y), mimetype='image/png', etag=etag, conditional=True)
+        except OSError:
+            return Response(status=404)
+    else:
+        data = _read_packed(store, z, x, y, etag)
+        if data is None:
+            return Response(status=404)
+        resp = Response(data, mimetype='image/png')
+        resp.set_etag(etag)
+        # If-Range сверяется с уже выставленным ETag
+        resp.make_conditional(request, accept_ranges=True, complete_length=len(data))
+    resp.headers['Cache-Control'] = cache_control(store, pinned=pinned, version=request.args.get('v'))
+    return resp
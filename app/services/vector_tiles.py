@@ -0,0 +1,634 @@
+"""Векторные тайлы (Mapbox Vector Tile) для оперативных слоёв карты.
+
+Вместо GeoJSON-массивов (``/api/incidents/geo``, ``/api/objects/geo``,
+адреса, зоны с геометрией-строкой) карта берёт слой тайлами
+``/api/geo/tiles/<layer>/<z>/<x>/<y>.mvt``: в тайле только объекты его
+области, полигоны зон обрезаны по границе тайла и огрублены до сетки
+EXTENT — большая зона приходит по частям по мере панорамирования.
+
+Кодирование:
+
+- PostgreSQL/PostGIS — точечные слои одним запросом ``ST_AsMVT`` /
+  ``ST_AsMVTGeom`` (:data:`PG_POINT_SQL`); если функции недоступны
+  (PostGIS < 3), используется кодировщик ниже;
+- остальные случаи (SQLite, зоны — их геометрия хранится JSON-текстом
+  в формате Leaflet ``{"latlngs": [...]}`` или GeoJSON) — чистый Python:
+  :func:`encode_tile` пишет protobuf по спецификации MVT 2.1.
+
+Готовые тайлы кэшируются в памяти процесса (LRU с бюджетом в байтах на
+слой). Кэш — индекс app.services.live_index: он помнит границы каждой
+строки слоя, и commit, изменивший строку, вытесняет только тайлы,
+пересекающие её старое и новое положение. Записи других процессов
+подхватываются пересборкой раз в VECTOR_TILE_MAX_AGE_SEC.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from compat_flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from ..extensions import db
+from ..models import Address, Incident, Object, Zone
+from ..observability.metrics import inc_counter
+from . import live_index
+from .cluster_service import MAX_ZOOM, project, unproject
+
+EXTENT = 4096
+BUFFER = 64
+MIME_TYPE = 'application/vnd.mapbox-vector-tile'
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+DEFAULT_MAX_AGE_SEC = 60.0
+
+Bounds = Tuple[float, float, float, float]  # west, south, east, north
+Ring = List[Tuple[float, float]]  # (lon, lat)
+
+
+class _LayerSpec:
+    """Описание слоя: модель, свойства фич и колонка зоны для фильтра доступа."""
+
+    def __init__(self, model: Any, properties: Sequence[str], zone_attr: Optional[str] = None) -> None:
+        self.model = model
+        self.properties = tuple(properties)
+        self.zone_attr = zone_attr
+        self.polygons = model is Zone
+
+
+LAYERS: Dict[str, _LayerSpec] = {
+    'incidents': _LayerSpec(Incident, ('status', 'priority', 'object_id', 'address')),
+    'objects': _LayerSpec(Object, ('name', 'tags')),
+    'addresses': _LayerSpec(Address, ('name', 'status', 'category'), zone_attr='zone_id'),
+    'zones': _LayerSpec(Zone, ('description', 'color', 'icon'), zone_attr='id'),
+}
+
+
+# ---------------------------------------------------------------------------
+# Protobuf / MVT
+# ---------------------------------------------------------------------------
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field: int, wire: int) -> bytes:
+    return _varint((field << 3) | wire)
+
+
+def _len_field(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed(field: int, values: Iterable[int]) -> bytes:
+    return _len_field(field, b''.join(_varint(v) for v in values))
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _command(cmd: int, count: int) -> int:
+    return (cmd & 0x7) | (count << 3)
+
+
+def _value(value: Any) -> bytes:
+    """Сообщение Value: строка, bool, целое (sint) или double."""
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        return _key(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack('<d', value)
+    return _len_field(1, str(value).encode('utf-8'))
+
+
+def _point_geometry(points: Sequence[Tuple[int, int]]) -> List[int]:
+    out = [_command(1, len(points))]
+    cx = cy = 0
+    for x, y in points:
+        out += [_zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+    return out
+
+
+def _polygon_geometry(rings: Sequence[Sequence[Tuple[int, int]]]) -> List[int]:
+    """Кольца без замыкающей точки; ориентация уже приведена (внешнее — площадь > 0)."""
+    out: List[int] = []
+    cx = cy = 0
+    for ring in rings:
+        x, y = ring[0]
+        out += [_command(1, 1), _zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        out.append(_command(2, len(ring) - 1))
+        for x, y in ring[1:]:
+            out += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+        out.append(_command(7, 1))
+    return out
+
+
+def encode_layer(name: str, features: Iterable[Dict[str, Any]], extent: int = EXTENT) -> bytes:
+    """Слой MVT из фич ``{'id', 'type': 1|3, 'geometry': [...], 'properties': {...}}``.
+
+    ``geometry`` — уже в координатах тайла: точки ``[(x, y)]`` для type=1,
+    кольца ``[[(x, y), ...], ...]`` для type=3.
+    """
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, Any], int] = {}
+    body = bytearray()
+    for feature in features:
+        tags: List[int] = []
+        for k, v in feature.get('properties', {}).items():
+            if v is None:
+                continue
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault((type(v), v), len(values)))
+        if feature['type'] == 1:
+            geometry = _point_geometry(feature['geometry'])
+        else:
+            geometry = _polygon_geometry(feature['geometry'])
+        msg = b''
+        if feature.get('id') is not None:
+            msg += _key(1, 0) + _varint(int(feature['id']))
+        if tags:
+            msg += _packed(2, tags)
+        msg += _key(3, 0) + _varint(feature['type']) + _packed(4, geometry)
+        body += _len_field(2, msg)
+
+    out = _key(15, 0) + _varint(2) + _len_field(1, name.encode('utf-8')) + bytes(body)
+    out += b''.join(_len_field(3, k.encode('utf-8')) for k in keys)
+    out += b''.join(_len_field(4, _value(v)) for (_, v) in values)
+    return out + _key(5, 0) + _varint(extent)
+
+
+def encode_tile(layers: Dict[str, Iterable[Dict[str, Any]]]) -> bytes:
+    return b''.join(_len_field(3, encode_layer(name, feats)) for name, feats in layers.items())
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    shift = value = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _fields(buf: bytes) -> Iterable[Tuple[int, Any]]:
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            size, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + size], pos + size
+        yield field, value
+
+
+def _unpacked(buf: bytes) -> List[int]:
+    out, pos = [], 0
+    while pos < len(buf):
+        value, pos = _read_varint(buf, pos)
+        out.append(value)
+    return out
+
+
+def _decode_value(buf: bytes) -> Any:
+    for field, value in _fields(buf):
+        if field == 1:
+            return value.decode('utf-8')
+        if field == 2:
+            return struct.unpack('<f', value)[0]
+        if field == 3:
+            return struct.unpack('<d', value)[0]
+        if field in (4, 5):
+            return value
+        if field == 6:
+            return (value >> 1) ^ -(value & 1)
+        if field == 7:
+            return bool(value)
+    return None
+
+
+def _decode_geometry(cmds: List[int]) -> List[List[Tuple[int, int]]]:
+    """Команды геометрии -> список частей (точки/кольца) в абсолютных координатах."""
+    parts: List[List[Tuple[int, int]]] = []
+    x = y = i = 0
+    while i < len(cmds):
+        cmd, count = cmds[i] & 7, cmds[i] >> 3
+        i += 1
+        if cmd == 7:
+            continue
+        for _ in range(count):
+            dx, dy = cmds[i], cmds[i + 1]
+            i += 2
+            x += (dx >> 1) ^ -(dx & 1)
+            y += (dy >> 1) ^ -(dy & 1)
+            if cmd == 1:
+                parts.append([])
+            parts[-1].append((x, y))
+    return parts
+
+
+def decode_tile(data: bytes) -> Dict[str, Dict[str, Any]]:
+    """Разбор тайла (для тестов и отладки): ``{layer: {'extent', 'features': [...]}}``.
+
+    Фича: ``{'id', 'type', 'properties', 'geometry'}``; geometry — список
+    частей (для точек — одна часть со всеми точками multipoint).
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    for field, layer_buf in _fields(data):
+        if field != 3:
+            continue
+        name, extent, keys, values, raw = '', EXTENT, [], [], []
+        for f, v in _fields(layer_buf):
+            if f == 1:
+                name = v.decode('utf-8')
+            elif f == 2:
+                raw.append(v)
+            elif f == 3:
+                keys.append(v.decode('utf-8'))
+            elif f == 4:
+                values.append(_decode_value(v))
+            elif f == 5:
+                extent = v
+        features = []
+        for buf in raw:
+            feature: Dict[str, Any] = {'id': None, 'type': 0, 'properties': {}, 'geometry': []}
+            for f, v in _fields(buf):
+                if f == 1:
+                    feature['id'] = v
+                elif f == 2:
+                    tags = _unpacked(v)
+                    feature['properties'] = {keys[tags[i]]: values[tags[i + 1]] for i in range(0, len(tags), 2)}
+                elif f == 3:
+                    feature['type'] = v
+                elif f == 4:
+                    feature['geometry'] = _decode_geometry(_unpacked(v))
+            features.append(feature)
+        out[name] = {'extent': extent, 'features': features}
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Геометрия
+# ---------------------------------------------------------------------------
+
+
+def tile_bounds(z: int, x: int, y: int, buffer: int = 0) -> Bounds:
+    """Границы тайла (west, south, east, north) в градусах, с буфером в единицах EXTENT."""
+    n = 1 << z
+    pad = buffer / EXTENT
+    west = (x - pad) / n * 360.0 - 180.0
+    east = (x + 1 + pad) / n * 360.0 - 180.0
+    north = unproject(0.0, max((y - pad) / n, 0.0))[0]
+    south = unproject(0.0, min((y + 1 + pad) / n, 1.0))[0]
+    return west, south, east, north
+
+
+def _intersects(a: Bounds, b: Bounds) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _to_tile(z: int, x: int, y: int) -> Any:
+    scale = (1 << z) * EXTENT
+
+    def convert(lon: float, lat: float) -> Tuple[float, float]:
+        px, py = project(lat, lon)
+        return px * scale - x * EXTENT, py * scale - y * EXTENT
+
+    return convert
+
+
+def _clip_ring(ring: List[Tuple[float, float]], lo: float, hi: float) -> List[Tuple[float, float]]:
+    """Sutherland–Hodgman: кольцо, обрезанное квадратом [lo, hi]²."""
+    for axis, bound, keep_le in ((0, lo, False), (0, hi, True), (1, lo, False), (1, hi, True)):
+        if not ring:
+            break
+        inside = (lambda p: p[axis] <= bound) if keep_le else (lambda p: p[axis] >= bound)
+        out: List[Tuple[float, float]] = []
+        prev = ring[-1]
+        for cur in ring:
+            if inside(cur):
+                if not inside(prev):
+                    out.append(_cross(prev, cur, axis, bound))
+                out.append(cur)
+            elif inside(prev):
+                out.append(_cross(prev, cur, axis, bound))
+            prev = cur
+        ring = out
+    return ring
+
+
+def _cross(a: Tuple[float, float], b: Tuple[float, float], axis: int, bound: float) -> Tuple[float, float]:
+    t = (bound - a[axis]) / (b[axis] - a[axis])
+    p = (a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1]))
+    return (bound, p[1]) if axis == 0 else (p[0], bound)
+
+
+def _area2(ring: Sequence[Tuple[int, int]]) -> int:
+    return sum(ring[i - 1][0] * ring[i][1] - ring[i][0] * ring[i - 1][1] for i in range(len(ring)))
+
+
+def _tile_ring(ring: Ring, convert: Any, exterior: bool) -> Optional[List[Tuple[int, int]]]:
+    pts = _clip_ring([convert(lon, lat) for lon, lat in ring], -BUFFER, EXTENT + BUFFER)
+    out: List[Tuple[int, int]] = []
+    for px, py in pts:
+        p = (int(round(px)), int(round(py)))
+        if not out or out[-1] != p:
+            out.append(p)
+    if len(out) > 1 and out[0] == out[-1]:
+        out.pop()
+    if len(out) < 3:
+        return None
+    area = _area2(out)
+    if area == 0:
+        return None
+    if (area > 0) != exterior:
+        out.reverse()
+    return out
+
+
+def parse_zone_geometry(raw: Any) -> List[List[Ring]]:
+    """Полигоны зоны (списки колец (lon, lat)) из JSON-текста geometry.
+
+    Поддерживаются форматы фронтенда ``{"latlngs": [{lat, lng}, ...]}``
+    (в т.ч. вложенные массивы Leaflet) и GeoJSON Polygon/MultiPolygon/Feature.
+    """
+    try:
+        geom = json.loads(raw) if isinstance(raw, str) else raw
+    except ValueError:
+        return []
+    if not isinstance(geom, dict):
+        return []
+    if geom.get('type') == 'Feature':
+        geom = geom.get('geometry') or {}
+    try:
+        if isinstance(geom.get('latlngs'), list):
+            latlngs = geom['latlngs']
+            if latlngs and isinstance(latlngs[0], dict):
+                latlngs = [latlngs]
+            rings = [[(float(p['lng']), float(p['lat'])) for p in ring] for ring in latlngs if ring]
+            return [rings] if rings else []
+        coords = geom.get('coordinates') or []
+        if geom.get('type') == 'Polygon':
+            coords = [coords]
+        elif geom.get('type') != 'MultiPolygon':
+            return []
+        return [[[(float(c[0]), float(c[1])) for c in ring] for ring in poly] for poly in coords if poly]
+    except (KeyError, TypeError, ValueError, IndexError):
+        return []
+
+
+def _geometry_bounds(polygons: List[List[Ring]]) -> Optional[Bounds]:
+    pts = [p for poly in polygons for p in poly[0]]
+    if not pts:
+        return None
+    lons = [p[0] for p in pts]
+    lats = [p[1] for p in pts]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+# ---------------------------------------------------------------------------
+# Кэш тайлов слоя (индекс live_index)
+# ---------------------------------------------------------------------------
+
+
+def _row_bounds(obj: Any) -> Optional[Bounds]:
+    if isinstance(obj, Zone):
+        return _geometry_bounds(parse_zone_geometry(obj.geometry))
+    try:
+        lat, lon = float(obj.lat), float(obj.lon)
+    except (TypeError, ValueError):
+        return None
+    return lon, lat, lon, lat
+
+
+class TileCache:
+    """Готовые тайлы слоя и границы его строк.
+
+    ``apply`` (commit строки) вытесняет тайлы, пересекающие старые и новые
+    границы строки, и увеличивает ``generation``: тайл, отрисованный до
+    изменения, в кэш уже не попадёт (см. :func:`get_tile`).
+    """
+
+    def __init__(self) -> None:
+        self.bounds: Dict[int, Optional[Bounds]] = {}
+        self.tiles: 'OrderedDict[Tuple[Any, ...], bytes]' = OrderedDict()
+        self.tile_bounds: Dict[Tuple[Any, ...], Bounds] = {}
+        self.bytes = 0
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    # протокол live_index
+
+    @classmethod
+    def load(cls, model: Any) -> 'TileCache':
+        cache = cls()
+        if model is Zone:
+            for row_id, geometry in db.session.query(Zone.id, Zone.geometry):
+                cache.bounds[row_id] = _geometry_bounds(parse_zone_geometry(geometry))
+        else:
+            for row_id, lat, lon in db.session.query(model.id, model.lat, model.lon):
+                cache.bounds[row_id] = (lon, lat, lon, lat) if lat is not None and lon is not None else None
+        return cache
+
+    @staticmethod
+    def snapshot(obj: Any) -> Optional[Bounds]:
+        return _row_bounds(obj)
+
+    def apply(self, row_id: int, row: Optional[Bounds]) -> None:
+        old = self.bounds.pop(row_id, None)
+        if row is not None:
+            self.bounds[row_id] = row
+        self.generation += 1
+        changed = [b for b in (old, row) if b is not None]
+        if not changed:
+            return
+        for key in [k for k, tb in self.tile_bounds.items() if any(_intersects(tb, b) for b in changed)]:
+            self._drop(key)
+
+    # кэш
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[bytes]:
+        data = self.tiles.get(key)
+        if data is not None:
+            self.tiles.move_to_end(key)
+        return data
+
+    def put(self, key: Tuple[Any, ...], data: bytes, max_bytes: int) -> None:
+        if len(data) > max_bytes:
+            return
+        self._drop(key)
+        self.tiles[key] = data
+        self.tile_bounds[key] = tile_bounds(key[0], key[1], key[2], BUFFER)
+        self.bytes += len(data)
+        while self.bytes > max_bytes:
+            self._drop(next(iter(self.tiles)))
+
+    def _drop(self, key: Tuple[Any, ...]) -> None:
+        data = self.tiles.pop(key, None)
+        if data is not None:
+            self.bytes -= len(data)
+            self.tile_bounds.pop(key, None)
+
+
+def _index_name(layer: str) -> str:
+    return f'tiles.{layer}'
+
+
+for _layer, _spec in LAYERS.items():
+    live_index.register(_index_name(_layer), _spec.model, TileCache)
+
+
+# ---------------------------------------------------------------------------
+# Отрисовка
+# ---------------------------------------------------------------------------
+
+# Точечный слой в PostGIS: :table, :props подставляются из LAYERS (не из запроса)
+PG_POINT_SQL = """
+WITH mvtgeom AS (
+    SELECT id, {props},
+           ST_AsMVTGeom(
+               ST_Transform(ST_SetSRID(ST_MakePoint(lon, lat), 4326), 3857),
+               ST_TileEnvelope(:z, :x, :y), {extent}, {buffer}, true
+           ) AS geom
+    FROM {table}
+    WHERE lat BETWEEN :south AND :north AND lon BETWEEN :west AND :east {zone_filter}
+)
+SELECT ST_AsMVT(mvtgeom.*, :layer, {extent}, 'geom', 'id') FROM mvtgeom WHERE geom IS NOT NULL
+"""
+
+
+def _render_pg(layer: str, spec: _LayerSpec, z: int, x: int, y: int, zones: Optional[Set[int]]) -> bytes:
+    west, south, east, north = tile_bounds(z, x, y, BUFFER)
+    zone_filter = f'AND {spec.zone_attr} = ANY(:zones)' if zones is not None else ''
+    sql = PG_POINT_SQL.format(
+        props=', '.join(spec.properties), table=spec.model.__tablename__,
+        extent=EXTENT, buffer=BUFFER, zone_filter=zone_filter,
+    )
+    params = {'z': z, 'x': x, 'y': y, 'west': west, 'south': south, 'east': east, 'north': north,
+              'layer': layer, 'zones': sorted(zones or ())}
+    return bytes(db.session.execute(text(sql), params).scalar() or b'')
+
+
+def _properties(spec: _LayerSpec, row: Any) -> Dict[str, Any]:
+    return {name: getattr(row, name) for name in spec.properties}
+
+
+def _render_python(layer: str, spec: _LayerSpec, z: int, x: int, y: int, zones: Optional[Set[int]]) -> bytes:
+    model = spec.model
+    bounds = tile_bounds(z, x, y, BUFFER)
+    convert = _to_tile(z, x, y)
+    query = model.query
+    if zones is not None:
+        query = query.filter(getattr(model, spec.zone_attr).in_(zones))
+    features: List[Dict[str, Any]] = []
+
+    if spec.polygons:
+        for row in query.order_by(model.id):
+            polygons = parse_zone_geometry(row.geometry)
+            box = _geometry_bounds(polygons)
+            if box is None or not _intersects(box, bounds):
+                continue
+            rings = []
+            for poly in polygons:
+                for i, ring in enumerate(poly):
+                    tile_ring = _tile_ring(ring, convert, exterior=(i == 0))
+                    if tile_ring is None and i == 0:
+                        break
+                    if tile_ring is not None:
+                        rings.append(tile_ring)
+            if rings:
+                features.append({'id': row.id, 'type': 3, 'geometry': rings, 'properties': _properties(spec, row)})
+    else:
+        west, south, east, north = bounds
+        query = query.filter(
+            model.lat.between(south, north), model.lon.between(west, east),
+        ).order_by(model.id)
+        for row in query:
+            px, py = convert(row.lon, row.lat)
+            features.append({
+                'id': row.id, 'type': 1, 'geometry': [(int(round(px)), int(round(py)))],
+                'properties': _properties(spec, row),
+            })
+
+    return encode_tile({layer: features}) if features else b''
+
+
+def render_tile(layer: str, z: int, x: int, y: int, zones: Optional[Set[int]] = None) -> bytes:
+    """Тайл слоя без кэша: ST_AsMVT на PostGIS для точек, иначе кодировщик на Python."""
+    spec = LAYERS[layer]
+    if not spec.polygons and db.session.get_bind().dialect.name == 'postgresql':
+        try:
+            return _render_pg(layer, spec, z, x, y, zones)
+        except (OperationalError, ProgrammingError):
+            # PostGIS без ST_AsMVT/ST_TileEnvelope — кодируем сами
+            db.session.rollback()
+    return _render_python(layer, spec, z, x, y, zones)
+
+
+def get_tile(layer: str, z: int, x: int, y: int, zones: Optional[Set[int]] = None) -> bytes:
+    """Тайл слоя ``layer`` (ключ LAYERS) из кэша или свежеотрисованный.
+
+    ``zones`` — доступные пользователю zone_id (None — все, пустое
+    множество — ничего); разные наборы зон кэшируются отдельно. Пустой результат — ``b''`` (пустой тайл).
+    """
+    if not (0 <= z <= MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise ValueError('tile out of range')
+    if zones is not None and not zones:
+        # у пользователя нет ни одной зоны — слой с зонами ему пуст
+        return b''
+    max_age = float(current_app.config.get('VECTOR_TILE_MAX_AGE_SEC', DEFAULT_MAX_AGE_SEC))
+    max_bytes = int(current_app.config.get('VECTOR_TILE_CACHE_MAX_BYTES', DEFAULT_CACHE_BYTES))
+    key = (z, x, y, tuple(sorted(zones, key=str)) if zones is not None else None)
+    name = _index_name(layer)
+
+    with live_index.use(name, max_age) as cache:
+        data = cache.get(key)
+        generation = cache.generation
+    if data is not None:
+        inc_counter('vector_tiles_cache_hits_total')
+        return data
+    inc_counter('vector_tiles_cache_misses_total')
+
+    # отрисовка — вне lock'а индекса, чтобы не задерживать commit'ы и чтение кэша
+    data = render_tile(layer, z, x, y, zones)
+    if max_bytes > 0:
+        with live_index.use(name, max_age) as current:
+            if current is cache and current.generation == generation:
+                current.put(key, data, max_bytes)
+    return data
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """По слоям: строк в индексе, сборок, тайлов и байт в кэше (индекс строится при необходимости)."""
+    out = {}
+    for layer in LAYERS:
+        name = _index_name(layer)
+        with live_index.use(name, float('inf')) as cache:
+            out[layer] = dict(live_index.stats(name), tiles=len(cache.tiles), bytes=cache.bytes)
+    return out
@@ -32,11 +32,22 @@ from urllib.parse import urlparse, parse_qs
 
 import websockets
 
+from .realtime.coalesce import PositionCoalescer, deliver_positions, tick_seconds
+from .realtime.fanout import ClientQueue, fanout, queue_settings, summarize
+from .realtime.routing import SubscriptionIndex, apply_control, parse_control
 from .realtime.tokens import verify_token
 
 # Список подключённых клиентов (websockets.WebSocketServerProtocol)
 connected_clients: Set[websockets.WebSocketServerProtocol] = set()
 
+# Исходящие очереди клиентов: отправку делает writer-задача соединения,
+# рассылка только кладёт строку в очередь (медленный клиент не тормозит остальных).
+_client_queues: Dict[Any, ClientQueue] = {}
+# Подписки клиентов на топики/bbox (см. realtime/routing.py)
+_router = SubscriptionIndex()
+# Склейка позиций в кадры positions (создаётся в start_socket_server)
+_coalescer: Optional[PositionCoalescer] = None
+
 # Цикл событий, который используется сервером websockets
 ws_loop: asyncio.AbstractEventLoop | None = None
 
@@ -69,6 +80,36 @@ def _origin_allowed(origin: Optional[str]) -> bool:
     return host in _ws_allowed_hostnames
 
 
+def _on_client_closed(cq: ClientQueue) -> None:
+    # ошибка отправки или политика disconnect
+    connected_clients.discard(cq.ws)
+    if _client_queues.get(cq.ws) is cq:
+        del _client_queues[cq.ws]
+    _router.remove(cq)
+
+
+def _send_to(ws, message: str) -> None:
+    """Поставить сообщение в очередь конкретного клиента (без ожидания отправки)."""
+    cq = _client_queues.get(ws)
+    if cq is not None:
+        cq.offer(message)
+
+
+def get_stats() -> Dict[str, Any]:
+    """Очереди отправки standalone WS-сервера (формат как у realtime.hub)."""
+    size, policy = queue_settings()
+    stats: Dict[str, Any] = {
+        "ws_clients": len(connected_clients),
+        "queue_size": size,
+        "overflow_policy": policy,
+    }
+    stats.update(summarize(list(_client_queues.values())))
+    stats["routing"] = _router.stats()
+    if _coalescer is not None:
+        stats["positions"] = _coalescer.stats()
+    return stats
+
+
 async def _handler(websocket, path: str | None = None):
     """Обработчик подключений. Сохраняет websocket в наборе
     подключенных клиентов и ожидает входящих сообщений. При
@@ -115,6 +156,12 @@ async def _handler(websocket, path: str | None = None):
     websocket.user_id = user_id
     websocket.sid = str(id(websocket))  # Уникальный ID текущего подключения в памяти
 
+    size, policy = queue_settings()
+    client_queue = ClientQueue(
+        websocket, websocket.send, maxsize=size, policy=policy, on_close=_on_client_closed
+    ).start()
+    _client_queues[websocket] = client_queue
+    _router.add(client_queue)
     connected_clients.add(websocket)
     try:
         async for message_raw in websocket:
@@ -124,6 +171,13 @@ async def _handler(websocket, path: str | None = None):
                 event = msg.get("event")
                 data = msg.get("data", {})
 
+                # --- Подписки на топики / viewport ---
+                control = parse_control(msg)
+                if control is not None:
+                    sub = apply_control(_router, client_queue, *control)
+                    client_queue.offer(json.dumps({"event": "subscribed", "data": sub}, ensure_ascii=False))
+                    continue
+
                 # --- 📡 WebRTC Signaling (Сигнальный сервер) ---
 
                 if event == "webrtc_offer":
@@ -140,7 +194,7 @@ async def _handler(websocket, path: str | None = None):
                     # Ищем устройство дежурного и пересылаем ему Offer
                     for ws in list(connected_clients):
                         if getattr(ws, "user_id", "") == target_user_id:
-                            await ws.send(out_msg)
+                            _send_to(ws, out_msg)
 
                 elif event == "webrtc_answer":
                     # Телефон отвечает админу
@@ -153,7 +207,7 @@ async def _handler(websocket, path: str | None = None):
                     # Отправляем ответ инициатору (админу) по его SID
                     for ws in list(connected_clients):
                         if getattr(ws, "sid", "") == caller_sid:
-                            await ws.send(out_msg)
+                            _send_to(ws, out_msg)
 
                 elif event == "webrtc_ice_candidate":
                     # Обмен путями обхода NAT (ICE Candidates)
@@ -169,7 +223,7 @@ async def _handler(websocket, path: str | None = None):
                     for ws in list(connected_clients):
                         if (target_sid and getattr(ws, "sid", "") == target_sid) or \
                            (target_user_id and getattr(ws, "user_id", "") == target_user_id):
-                            await ws.send(out_msg)
+                            _send_to(ws, out_msg)
 
             except json.JSONDecodeError:
                 pass  # Игнорируем не-JSON сообщения
@@ -179,26 +233,29 @@ async def _handler(websocket, path: str | None = None):
 
     finally:
         connected_clients.discard(websocket)
+        cq = _client_queues.pop(websocket, None)
+        if cq is not None:
+            _router.remove(cq)
+            await cq.aclose()
 
 
 async def _broadcast(event: str, data: Dict[str, Any]) -> None:
     """Рассылка события всем подключенным клиентам.
 
-    Формирует JSON‑строку с полями `event` и `data` и отправляет её
-    каждому websocket. Клиенты, у которых отправка не удалась,
-    автоматически удаляются из набора подключённых.
+    Формирует JSON‑строку с полями `event` и `data` один раз и кладёт её
+    в очередь каждого подписанного на событие клиента (топики/bbox); отправляют writer-задачи соединений.
+    Клиенты, у которых отправка не удалась (или переполнилась очередь при
+    политике ``disconnect``), удаляются из набора подключённых.
+    События местоположения уходят не сразу, а через склейку (кадр
+    ``positions`` раз в тик, см. realtime/coalesce.py).
     """
-    if not connected_clients:
+    if _coalescer is not None and _coalescer.offer(event, data):
+        return
+    targets = _router.route(event, data)
+    if not targets:
         return
     message = json.dumps({'event': event, 'data': data}, ensure_ascii=False)
-    to_remove: Set[websockets.WebSocketServerProtocol] = set()
-    for ws in list(connected_clients):
-        try:
-            await ws.send(message)
-        except Exception:
-            to_remove.add(ws)
-    for ws in to_remove:
-        connected_clients.discard(ws)
+    fanout(list(targets), event, data, message)
 
 
 def broadcast_event_sync(event: str, data: Dict[str, Any]) -> None:
@@ -272,8 +329,10 @@ def start_socket_server(
 
     # Определяем корутину для запуска сервера внутри события петли
     async def _start():
+        global _coalescer
         # Запускаем WS сервер
         await websockets.serve(_handler, host, port)
+        _coalescer = PositionCoalescer(lambda items: deliver_positions(_router, items), tick=tick_seconds()).start()
 
         # Redis Pub/Sub (опционально): подписываемся и ретранслируем события клиентам.
         try:
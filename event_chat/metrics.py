@@ -9,9 +9,11 @@
 from __future__ import annotations
 
 from collections import defaultdict
-from typing import Dict
+from typing import Callable, Dict
 
 _counters: Dict[str, int] = defaultdict(int)
+# gauge -> функция, возвращающая текущее значение
+_gauges: Dict[str, Callable[[], float]] = {}
 
 def inc(metric: str, value: int = 1) -> None:
     """Увеличить значение счётчика.
@@ -22,14 +24,30 @@ def inc(metric: str, value: int = 1) -> None:
     """
     _counters[metric] += value
 
+def gauge(metric: str, fn: Callable[[], float]) -> None:
+    """Зарегистрировать gauge: значение вычисляется ``fn`` в момент экспорта."""
+    _gauges[metric] = fn
+
 def snapshot() -> Dict[str, int]:
     """Получить копию текущих значений всех счётчиков."""
     return dict(_counters)
 
+def gauges_snapshot() -> Dict[str, float]:
+    """Текущие значения gauge (ошибка одного не мешает остальным)."""
+    out: Dict[str, float] = {}
+    for name, fn in _gauges.items():
+        try:
+            out[name] = fn()
+        except Exception:
+            continue
+    return out
+
 def render_prometheus() -> str:
     """Сформировать текст в формате Prometheus с именами chat2_*"""
     lines = []
     for name, val in sorted(_counters.items()):
         pname = name.replace("-", "_")
         lines.append(f"{pname} {val}")
+    for name, val in sorted(gauges_snapshot().items()):
+        lines.append(f"{name} {val}")
     return "\n".join(lines)
\ No newline at end of file
@@ -9,6 +9,8 @@
   информацию об авторе, тексте, типе и времени создания.
 - :class:`ChannelMember` — привязка пользователя (админ или устройство)
   к каналу с отметкой, до какого сообщения он дочитал.
+- :class:`PushToken` и :class:`PushOutbox` — push‑токены участников и
+  очередь push‑уведомлений, которую разбирает фоновый воркер.
 
 В настоящий момент модели задают минимальный набор полей для
 отправки и получения текстовых сообщений. В дальнейшем можно
@@ -42,6 +44,9 @@ class Channel(db.Model):
     marker_id: Optional[int] = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
     last_message_at = db.Column(db.DateTime, nullable=True)
+    # Последнее сообщение (денормализовано для списка каналов, см. event_chat.unread)
+    last_message_id: Optional[str] = db.Column(db.String(36), nullable=True)
+    last_message_preview: Optional[str] = db.Column(db.String(256), nullable=True)
 
     messages = db.relationship("Message", backref="channel", lazy="dynamic")
     members = db.relationship("ChannelMember", backref="channel", lazy="dynamic")
@@ -86,7 +91,7 @@ class Message(db.Model):
     deleted_at = db.Column(db.DateTime, nullable=True)
 
     __table_args__ = (
-        db.Index("ix_chat2_messages_channel_created", "channel_id", "created_at"),
+        db.Index("ix_chat2_messages_channel_created_id", "channel_id", "created_at", "id"),
     )
 
     def to_dict(self) -> dict:
@@ -168,3 +173,38 @@ class PushToken(db.Model):
             "token": self.token,
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
+
+
+class PushOutbox(db.Model):
+    """Очередь push‑уведомлений chat2 (см. event_chat.push_outbox).
+
+    Запись создаётся в той же транзакции, что и сообщение; получателей
+    (участники канала кроме отправителя) и их токены определяет воркер.
+    ``tokens_json`` — токены для повтора после временной ошибки FCM
+    (None — все токены канала). ``status``: ``queued`` → ``sending``
+    (захвачено воркером ``claimed_by`` до ``locked_until``) → запись
+    удаляется; после CHAT2_PUSH_MAX_ATTEMPTS попыток — ``failed``.
+    """
+
+    __tablename__ = "chat2_push_outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    channel_id: str = db.Column(db.String(36), nullable=False)
+    message_id: Optional[str] = db.Column(db.String(36), nullable=True)
+    sender_type: Optional[str] = db.Column(db.String(16), nullable=True)
+    sender_id: Optional[str] = db.Column(db.String(64), nullable=True)
+    title: str = db.Column(db.String(256), nullable=False, default="")
+    body: str = db.Column(db.Text, nullable=False, default="")
+    data_json: Optional[str] = db.Column(db.Text, nullable=True)
+    tokens_json: Optional[str] = db.Column(db.Text, nullable=True)
+    status: str = db.Column(db.String(16), nullable=False, default="queued")
+    attempts: int = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    claimed_by: Optional[str] = db.Column(db.String(32), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error: Optional[str] = db.Column(db.String(256), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.Index("ix_chat2_push_outbox_status_next", "status", "next_attempt_at"),
+        db.Index("ix_chat2_push_outbox_claimed_by", "claimed_by"),
+    )
@@ -3,11 +3,18 @@
 Для работы необходим ключ ``FCM_SERVER_KEY`` в конфигурации Flask.
 Если ключ не задан или ``CHAT2_PUSH_ENABLED`` не включён, функция
 ``send_push`` silently returns without doing anything.
+
+Уведомления о сообщениях чата отправляются не отсюда, а фоновым
+воркером очереди (:mod:`event_chat.push_outbox`) через
+:func:`send_push_async`: общий пул соединений ``httpx.AsyncClient``,
+до FCM_MAX_TOKENS токенов в запросе, разбор результата по каждому токену.
+``send_push`` (синхронно) остаётся для ``/push/test``.
 """
 
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
 import json
 import logging
 
@@ -15,6 +22,102 @@ import requests
 from compat_flask import current_app
 
 FCM_URL = "https://fcm.googleapis.com/fcm/send"
+# registration_ids в одном запросе legacy HTTP API
+FCM_MAX_TOKENS = 1000
+# ошибки по токену: токен больше не действителен — удалить
+INVALID_TOKEN_ERRORS = frozenset({"NotRegistered", "InvalidRegistration", "MismatchSenderId"})
+# временные ошибки по токену — повторить позже
+RETRY_TOKEN_ERRORS = frozenset({"Unavailable", "InternalServerError", "DeviceMessageRateExceeded"})
+
+
+@dataclass
+class PushResult:
+    """Итог отправки: доставлено, недействительные токены, токены для повтора."""
+
+    sent: int = 0
+    invalid: List[str] = field(default_factory=list)
+    retry: List[str] = field(default_factory=list)
+    failed: int = 0
+    error: Optional[str] = None
+
+    def merge(self, other: "PushResult") -> None:
+        self.sent += other.sent
+        self.invalid.extend(other.invalid)
+        self.retry.extend(other.retry)
+        self.failed += other.failed
+        self.error = other.error or self.error
+
+
+def _payload(title: str, body: str, tokens: Sequence[str], data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "registration_ids": list(tokens),
+        "notification": {
+            "title": title,
+            "body": body,
+        },
+    }
+    if data:
+        payload["data"] = data
+    return payload
+
+
+def parse_fcm_response(tokens: Sequence[str], res: Dict[str, Any]) -> PushResult:
+    """Разобрать ответ FCM: ``results`` идут в порядке ``registration_ids``."""
+    out = PushResult(sent=int(res.get("success") or 0))
+    results = res.get("results") or []
+    for token, item in zip(tokens, results):
+        error = (item or {}).get("error")
+        if not error:
+            continue
+        if error in INVALID_TOKEN_ERRORS:
+            out.invalid.append(token)
+        elif error in RETRY_TOKEN_ERRORS:
+            out.retry.append(token)
+        else:
+            out.failed += 1
+    return out
+
+
+def _status_result(tokens: Sequence[str], status: int, text: str) -> PushResult:
+    # 429 и 5xx — FCM недоступен, весь пакет повторяется; прочие 4xx — ошибка конфигурации
+    if status == 429 or status >= 500:
+        return PushResult(retry=list(tokens), error=f"HTTP {status}")
+    return PushResult(failed=len(tokens), error=f"HTTP {status}: {text[:200]}")
+
+
+async def send_push_async(
+    client: Any,
+    title: str,
+    body: str,
+    tokens: Sequence[str],
+    data: Optional[Dict[str, Any]] = None,
+    *,
+    url: str = FCM_URL,
+    server_key: str,
+) -> PushResult:
+    """Отправить уведомление на ``tokens`` через ``client`` (``httpx.AsyncClient``)."""
+    out = PushResult()
+    headers = {
+        "Authorization": f"key={server_key}",
+        "Content-Type": "application/json",
+    }
+    for i in range(0, len(tokens), FCM_MAX_TOKENS):
+        chunk = list(tokens[i:i + FCM_MAX_TOKENS])
+        try:
+            resp = await client.post(url, headers=headers, content=json.dumps(_payload(title, body, chunk, data)))
+        except Exception as exc:
+            # таймаут/обрыв соединения: повторить весь пакет
+            out.merge(PushResult(retry=chunk, error=repr(exc)[:200]))
+            continue
+        if resp.status_code != 200:
+            out.merge(_status_result(chunk, resp.status_code, resp.text))
+            continue
+        try:
+            out.merge(parse_fcm_response(chunk, resp.json()))
+        except Exception:
+            out.merge(PushResult(failed=len(chunk), error="bad FCM response"))
+    return out
+
 
 def send_push(title: str, body: str, tokens: List[str], data: Optional[Dict[str, str]] = None) -> Dict[str, int]:
     """Отправить push‑уведомление на список токенов.
@@ -41,26 +144,19 @@ def send_push(title: str, body: str, tokens: List[str], data: Optional[Dict[str,
         "Authorization": f"key={server_key}",
         "Content-Type": "application/json",
     }
-    payload: Dict[str, any] = {
-        "registration_ids": tokens,
-        "notification": {
-            "title": title,
-            "body": body,
-        },
-    }
-    if data:
-        payload["data"] = data
-    try:
-        resp = requests.post(FCM_URL, headers=headers, data=json.dumps(payload), timeout=5)
-        if resp.ok:
-            try:
-                res = resp.json()
-                sent = int(res.get("success") or 0)
-            except Exception:
-                sent = 0
-            return {"sent": sent}
-        else:
-            current_app.logger.debug("FCM push failed: %s %s", resp.status_code, resp.text)
-    except Exception as exc:
-        logging.getLogger(__name__).debug("FCM push error: %s", exc)
-    return {"sent": 0}
\ No newline at end of file
+    url = app.config.get("FCM_URL") or FCM_URL
+    sent = 0
+    for i in range(0, len(tokens), FCM_MAX_TOKENS):
+        chunk = tokens[i:i + FCM_MAX_TOKENS]
+        try:
+            resp = requests.post(url, headers=headers, data=json.dumps(_payload(title, body, chunk, data)), timeout=5)
+            if resp.ok:
+                try:
+                    sent += int(resp.json().get("success") or 0)
+                except Exception:
+                    pass
+            else:
+                current_app.logger.debug("FCM push failed: %s %s", resp.status_code, resp.text)
+        except Exception as exc:
+            logging.getLogger(__name__).debug("FCM push error: %s", exc)
+    return {"sent": sent}
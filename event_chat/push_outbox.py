@@ -0,0 +1,318 @@
+"""Очередь push‑уведомлений chat2 и фоновый воркер.
+
+Раньше send / upload_media / send_template прямо в HTTP-запросе искали
+токены участников (запрос на каждого) и синхронно ходили в FCM
+(``requests.post(..., timeout=5)``): медленный FCM добавлял до 5 секунд к
+каждому сообщению. Теперь:
+
+- запрос только добавляет :class:`PushOutbox` в ту же транзакцию, что и
+  сообщение (:func:`enqueue_push`), и будит воркер (:func:`wake_push_worker`);
+- воркер (:func:`dispatch_pending`) захватывает пачку до
+  CHAT2_PUSH_BATCH_SIZE записей (UPDATE с повторной проверкой статуса —
+  безопасно при нескольких процессах), находит токены всех каналов пачки
+  одним запросом (участники JOIN токены, ``channel_id IN (...)``) и
+  отправляет уведомления параллельно (CHAT2_PUSH_CONCURRENCY) через общий
+  пул соединений ``httpx.AsyncClient``;
+- недействительные токены (NotRegistered, InvalidRegistration) удаляются
+  одним DELETE; временные ошибки (таймаут, 5xx, 429, Unavailable)
+  повторяются только для затронутых токенов с экспоненциальной паузой,
+  после CHAT2_PUSH_MAX_ATTEMPTS попыток запись остаётся ``failed``.
+
+Воркер — daemon-поток процесса (запускается при первой постановке в
+очередь, CHAT2_PUSH_INPROCESS_WORKER) и/или задача Celery
+``app.tasks.push_outbox.dispatch_chat2_push`` по расписанию: захват
+записей исключает двойную отправку.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from compat_flask import current_app
+from sqlalchemy import and_, or_
+
+from ..extensions import db
+from .metrics import inc
+from .models import ChannelMember, PushOutbox, PushToken
+from .push import FCM_URL, PushResult, send_push_async
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 20
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_TIMEOUT_SEC = 5.0
+BACKOFF_SEC = 2.0
+BACKOFF_MAX_SEC = 300.0
+LEASE_SEC = 120.0
+POLL_SEC = 5.0
+
+_wake = threading.Event()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _cfg_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(current_app.config.get(name, default) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+def enqueue_push(
+    channel_id: str,
+    message_id: Optional[str],
+    title: str,
+    body: str,
+    *,
+    sender: Optional[Tuple[str, str]] = None,
+    data: Optional[Dict[str, Any]] = None,
+) -> Optional[PushOutbox]:
+    """Поставить уведомление участникам канала (кроме ``sender``) в очередь.
+
+    Запись добавляется в текущую сессию и сохраняется commit'ом вызывающего
+    кода — вместе с сообщением. После commit нужен :func:`wake_push_worker`.
+    """
+    if not current_app.config.get("CHAT2_PUSH_ENABLED"):
+        return None
+    row = PushOutbox(
+        channel_id=channel_id,
+        message_id=message_id,
+        sender_type=sender[0] if sender else None,
+        sender_id=sender[1] if sender else None,
+        title=(title or "")[:256],
+        body=body or "",
+        data_json=json.dumps(data, ensure_ascii=False) if data else None,
+        status="queued",
+        attempts=0,
+        next_attempt_at=_utcnow(),
+    )
+    db.session.add(row)
+    inc("chat2_push_enqueued_total")
+    return row
+
+
+def wake_push_worker() -> None:
+    """Разбудить воркер этого процесса (и запустить его, если ещё не запущен)."""
+    app = current_app._get_current_object()
+    if not app.config.get("CHAT2_PUSH_ENABLED"):
+        return
+    if app.config.get("CHAT2_PUSH_INPROCESS_WORKER", True):
+        start_push_worker(app)
+    _wake.set()
+
+
+# ---------------------------------------------------------------------------
+# Разбор очереди
+# ---------------------------------------------------------------------------
+
+
+def _due(now: datetime) -> Any:
+    return or_(
+        and_(PushOutbox.status == "queued", PushOutbox.next_attempt_at <= now),
+        # воркер, захвативший запись, пропал
+        and_(PushOutbox.status == "sending", PushOutbox.locked_until < now),
+    )
+
+
+def _claim(batch_size: int) -> List[PushOutbox]:
+    now = _utcnow()
+    ids = [
+        r[0]
+        for r in db.session.query(PushOutbox.id).filter(_due(now)).order_by(PushOutbox.id).limit(batch_size)
+    ]
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    PushOutbox.query.filter(PushOutbox.id.in_(ids), _due(now)).update(
+        {
+            PushOutbox.status: "sending",
+            PushOutbox.claimed_by: claim,
+            PushOutbox.locked_until: now + timedelta(seconds=LEASE_SEC),
+        },
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return PushOutbox.query.filter_by(claimed_by=claim).order_by(PushOutbox.id).all()
+
+
+def _resolve_tokens(rows: Sequence[PushOutbox]) -> List[List[str]]:
+    """Токены получателей каждой записи: один запрос на все каналы пачки."""
+    channel_ids = {r.channel_id for r in rows if r.tokens_json is None}
+    by_channel: Dict[str, List[Tuple[str, str, str]]] = {}
+    if channel_ids:
+        q = (
+            db.session.query(ChannelMember.channel_id, PushToken.member_type, PushToken.member_id, PushToken.token)
+            .join(PushToken, and_(
+                PushToken.member_type == ChannelMember.member_type,
+                PushToken.member_id == ChannelMember.member_id,
+            ))
+            .filter(ChannelMember.channel_id.in_(channel_ids))
+        )
+        for channel_id, member_type, member_id, token in q:
+            by_channel.setdefault(channel_id, []).append((member_type, member_id, token))
+    out: List[List[str]] = []
+    for row in rows:
+        if row.tokens_json is not None:
+            tokens = json.loads(row.tokens_json)
+        else:
+            tokens = [
+                token
+                for member_type, member_id, token in by_channel.get(row.channel_id, ())
+                if token and (member_type, member_id) != (row.sender_type, row.sender_id)
+            ]
+        out.append(list(dict.fromkeys(tokens)))
+    return out
+
+
+async def _send_all(
+    client: Any,
+    jobs: Sequence[Tuple[PushOutbox, List[str]]],
+    *,
+    url: str,
+    server_key: str,
+    concurrency: int,
+) -> List[PushResult]:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(row: PushOutbox, tokens: List[str]) -> PushResult:
+        if not tokens:
+            return PushResult()
+        data = json.loads(row.data_json) if row.data_json else None
+        async with sem:
+            return await send_push_async(client, row.title, row.body, tokens, data, url=url, server_key=server_key)
+
+    return list(await asyncio.gather(*(_one(row, tokens) for row, tokens in jobs)))
+
+
+def make_client(concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT_SEC) -> httpx.AsyncClient:
+    """Пул соединений к FCM на ``concurrency`` одновременных запросов."""
+    return httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
+
+
+def _finish(rows: Sequence[PushOutbox], results: Sequence[PushResult], stats: Dict[str, int]) -> None:
+    now = _utcnow()
+    max_attempts = _cfg_int("CHAT2_PUSH_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+    invalid: set = set()
+    for row, res in zip(rows, results):
+        invalid.update(res.invalid)
+        stats["sent"] += res.sent
+        row.claimed_by = None
+        row.locked_until = None
+        if res.retry:
+            row.attempts = int(row.attempts or 0) + 1
+            row.last_error = (res.error or "retryable token errors")[:256]
+            if row.attempts >= max_attempts:
+                row.status = "failed"
+                stats["failed"] += 1
+            else:
+                row.status = "queued"
+                row.tokens_json = json.dumps(res.retry)
+                row.next_attempt_at = now + timedelta(seconds=min(BACKOFF_MAX_SEC, BACKOFF_SEC * 2 ** (row.attempts - 1)))
+                stats["retried"] += 1
+        elif res.error and not res.sent:
+            row.status = "failed"
+            row.last_error = res.error[:256]
+            stats["failed"] += 1
+        else:
+            db.session.delete(row)
+            stats["done"] += 1
+    if invalid:
+        stats["pruned"] = PushToken.query.filter(PushToken.token.in_(sorted(invalid))).delete(synchronize_session=False)
+    db.session.commit()
+    for key, metric in (("sent", "chat2_push_sent_total"), ("retried", "chat2_push_retried_total"),
+                        ("failed", "chat2_push_failed_total"), ("pruned", "chat2_push_tokens_pruned_total")):
+        if stats[key]:
+            inc(metric, stats[key])
+
+
+def dispatch_pending(
+    client: Optional[httpx.AsyncClient] = None,
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+) -> Dict[str, int]:
+    """Отправить одну пачку записей, время которых пришло.
+
+    ``client``/``loop`` — пул соединений и event loop воркера; без них
+    создаются на один вызов. Возвращает счётчики; ``claimed == 0`` —
+    очередь пуста.
+    """
+    stats = {"claimed": 0, "sent": 0, "done": 0, "retried": 0, "failed": 0, "pruned": 0}
+    rows = _claim(_cfg_int("CHAT2_PUSH_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    if not rows:
+        return stats
+    stats["claimed"] = len(rows)
+    server_key = current_app.config.get("FCM_SERVER_KEY")
+    if not server_key:
+        _finish(rows, [PushResult(failed=1, error="FCM_SERVER_KEY is not configured")] * len(rows), stats)
+        return stats
+    concurrency = _cfg_int("CHAT2_PUSH_CONCURRENCY", DEFAULT_CONCURRENCY)
+    jobs = list(zip(rows, _resolve_tokens(rows)))
+    kwargs = dict(url=current_app.config.get("FCM_URL") or FCM_URL, server_key=server_key, concurrency=concurrency)
+
+    async def _with_own_client() -> List[PushResult]:
+        timeout = float(current_app.config.get("CHAT2_PUSH_TIMEOUT_SEC", DEFAULT_TIMEOUT_SEC))
+        async with make_client(concurrency, timeout) as own:
+            return await _send_all(own, jobs, **kwargs)
+
+    if client is None:
+        results = asyncio.run(_with_own_client())
+    else:
+        results = (loop or asyncio.get_event_loop()).run_until_complete(_send_all(client, jobs, **kwargs))
+    _finish(rows, results, stats)
+    return stats
+
+
+def drain(client: Optional[httpx.AsyncClient] = None, loop: Optional[asyncio.AbstractEventLoop] = None) -> Dict[str, int]:
+    """Разбирать очередь, пока есть записи, время которых пришло."""
+    total: Dict[str, int] = {}
+    while True:
+        stats = dispatch_pending(client, loop)
+        for key, value in stats.items():
+            total[key] = total.get(key, 0) + value
+        if not stats["claimed"]:
+            return total
+
+
+def start_push_worker(app: Any) -> None:
+    """Запустить daemon-поток разбора очереди в этом процессе (один на процесс)."""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+
+        def _run() -> None:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            client: Optional[httpx.AsyncClient] = None
+            while True:
+                _wake.wait(POLL_SEC)
+                _wake.clear()
+                with app.app_context():
+                    try:
+                        if client is None:
+                            client = make_client(
+                                _cfg_int("CHAT2_PUSH_CONCURRENCY", DEFAULT_CONCURRENCY),
+                                float(app.config.get("CHAT2_PUSH_TIMEOUT_SEC", DEFAULT_TIMEOUT_SEC)),
+                            )
+                        drain(client, loop)
+                    except Exception:
+                        db.session.rollback()
+                        app.logger.exception("chat2 push worker failed")
+                    finally:
+                        db.session.remove()
+
+        _worker = threading.Thread(target=_run, daemon=True, name="chat2-push")
+        _worker.start()
@@ -1,41 +1,153 @@
-"""Простая in-memory система ограничения скорости.
+"""Ограничение частоты действий chat2 (отправка сообщений, загрузка медиа).
 
-Ограничивает количество вызовов определённого действия в заданное окно
-времени. Используется для защиты чата от спама и чрезмерной нагрузки.
+Раньше счётчики жили в словаре процесса, который никогда не чистился, а
+при нескольких воркерах фактический лимит был N_workers × limit. Теперь
+проверка идёт через :mod:`app.security.rate_limit`: общий Redis
+(``REDIS_URL``), одно обращение на проверку, скользящее окно. Без Redis —
+счётчики процесса, устаревшие окна вытесняются time wheel, число ключей
+ограничено.
 
-Замечание: эти счётчики хранятся в памяти процесса, поэтому при
-многопроцессном развёртывании ограничения действуют только внутри
-конкретного процесса. Для production можно заменить на Redis или иной
-внешний стор.
+Одна проверка применяет несколько лимитов сразу (всё или ничего —
+отказ по одному лимиту не расходует остальные):
+
+- отправитель — ``CHAT2_SEND_RATE_*`` (загрузки — ``CHAT2_UPLOAD_RATE_*``);
+- канал — ``CHAT2_CHANNEL_RATE_*``;
+- весь chat2 — ``CHAT2_GLOBAL_RATE_*``.
+
+Лимит 0 выключает соответствующее правило.
+
+Метрики (:mod:`event_chat.metrics`): ``chat2_rate_limited_<scope>_total`` —
+отказы по сработавшему правилу, ``chat2_throttled_senders_total`` —
+отправители, впервые упёршиеся в лимит (до конца блокировки повторно не
+считаются), gauge ``chat2_throttled_senders`` — ограничены сейчас.
+Самые активные из них — :func:`throttled_senders`.
 """
 
 from __future__ import annotations
 
+import threading
 import time
-from typing import Dict, Tuple
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from compat_flask import current_app
+
+from ..security.rate_limit import RateRule, check_rate_limits
+from .metrics import gauge, inc
+
+MAX_THROTTLED = 1000
+
+# ключ отправителя -> [заблокирован до, отказов]; порядок — последний отказ
+_throttled: "OrderedDict[str, List[float]]" = OrderedDict()
+_throttled_lock = threading.Lock()
+
+# правило -> (ключ лимита, ключ окна, лимит по умолчанию)
+_SENDER_KNOBS = {
+    "send": ("CHAT2_SEND_RATE_LIMIT", "CHAT2_SEND_RATE_WINDOW_SEC", 20),
+    "upload": ("CHAT2_UPLOAD_RATE_LIMIT", "CHAT2_UPLOAD_RATE_WINDOW_SEC", 5),
+}
+
+
+def _rule(bucket: str, ident: str, limit_key: str, window_key: str, default: int) -> Optional[RateRule]:
+    limit = int(current_app.config.get(limit_key, default) or 0)
+    window = max(1, int(round(float(current_app.config.get(window_key, 60.0) or 60.0))))
+    if limit <= 0:
+        return None
+    return RateRule(bucket, ident, limit, window)
+
+
+def _sender_key(sender_type: str, sender_id: str) -> str:
+    return f"{sender_type}:{sender_id}"
+
+
+def _record_throttled(sender: str, retry_after: float) -> None:
+    now = time.time()
+    with _throttled_lock:
+        entry = _throttled.pop(sender, None)
+        if entry is None or entry[0] <= now:
+            inc("chat2_throttled_senders_total")
+            entry = [0.0, 0]
+        entry[0] = max(entry[0], now + retry_after)
+        entry[1] += 1
+        _throttled[sender] = entry
+        while len(_throttled) > MAX_THROTTLED:
+            _throttled.popitem(last=False)
+
+
+def check_send(
+    sender_type: str,
+    sender_id: str,
+    channel_id: Optional[str] = None,
+    action: str = "send",
+) -> Tuple[bool, int]:
+    """Можно ли отправителю выполнить ``action`` (``send``/``upload``) в канале.
+
+    Returns:
+        ``(ok, retry_after)`` — при отказе ``retry_after`` — через сколько
+        секунд повтор может пройти.
+    """
+    sender = _sender_key(sender_type, sender_id)
+    limit_key, window_key, default = _SENDER_KNOBS.get(action, _SENDER_KNOBS["send"])
+    scopes: Dict[RateRule, str] = {}
+    for scope, rule in (
+        ("sender", _rule(f"chat2_{action}", sender, limit_key, window_key, default)),
+        ("channel", _rule("chat2_channel", str(channel_id), "CHAT2_CHANNEL_RATE_LIMIT",
+                          "CHAT2_CHANNEL_RATE_WINDOW_SEC", 120) if channel_id else None),
+        ("global", _rule("chat2_global", "all", "CHAT2_GLOBAL_RATE_LIMIT", "CHAT2_GLOBAL_RATE_WINDOW_SEC", 0)),
+    ):
+        if rule is not None:
+            scopes[rule] = scope
+    if not scopes:
+        return True, 0
+    ok, info, rejected = check_rate_limits(list(scopes))
+    if ok:
+        return True, 0
+    scope = scopes.get(rejected, "sender")
+    inc(f"chat2_rate_limited_{scope}_total")
+    retry_after = max(1, int(info.reset_in))
+    if scope == "sender":
+        _record_throttled(sender, retry_after)
+    return False, retry_after
 
-_records: Dict[Tuple[str, str, str], Dict[str, float]] = {}
 
 def check_rate(key: Tuple[str, str, str], window_seconds: float, limit: int) -> bool:
-    """Проверить, допускается ли ещё один вызов для данного ключа.
+    """Совместимость со старым API: только лимит отправителя.
 
     Args:
-        key: Кортеж, идентифицирующий отправителя и тип действия.
+        key: ``(sender_type, sender_id, action)``.
         window_seconds: Длительность окна в секундах.
         limit: Максимальное количество вызовов в этом окне.
 
     Returns:
         True, если действие разрешено (счётчик увеличен), иначе False.
     """
+    sender_type, sender_id, action = key
+    rule = RateRule(f"chat2_{action}", _sender_key(sender_type, sender_id), int(limit),
+                    max(1, int(round(window_seconds))))
+    ok, info, _ = check_rate_limits([rule])
+    if not ok:
+        inc("chat2_rate_limited_sender_total")
+        _record_throttled(rule.ident, max(1, int(info.reset_in)))
+    return ok
+
+
+def throttled_count() -> int:
+    """Сколько отправителей ограничено сейчас."""
+    now = time.time()
+    with _throttled_lock:
+        return sum(1 for until, _ in _throttled.values() if until > now)
+
+
+def throttled_senders(top: int = 20) -> List[Dict[str, Any]]:
+    """Ограниченные сейчас отправители, больше всего отказов — первыми."""
     now = time.time()
-    rec = _records.get(key)
-    if not rec or now - rec["last_reset"] >= window_seconds:
-        # Начинаем новое окно
-        _records[key] = {"last_reset": now, "count": 1}
-        return True
-    if rec["count"] >= limit:
-        # Достигнут лимит
-        return False
-    # Увеличиваем счётчик
-    rec["count"] += 1
-    return True
\ No newline at end of file
+    with _throttled_lock:
+        active = [(sender, until, n) for sender, (until, n) in _throttled.items() if until > now]
+    active.sort(key=lambda x: -x[2])
+    return [
+        {"sender": sender, "rejected": int(n), "retry_after": int(until - now + 0.999)}
+        for sender, until, n in active[:top]
+    ]
+
+
+gauge("chat2_throttled_senders", throttled_count)
@@ -23,9 +23,12 @@ import uuid
 import json
 
 # Импортируем rate-limiter, метрики и push
-from .ratelimit import check_rate
+from .ratelimit import check_send
 from .metrics import inc
 from .push import send_push
+from .push_outbox import enqueue_push, wake_push_worker
+from .unread import forget_previews_before, last_message_previews, touch_channel, unread_counts
+from ..services.keyset import cursor_of, decode_cursor, encode_cursor, page as keyset_page, position_of
 
 
 def _get_current_user() -> tuple[str, str]:
@@ -49,31 +52,13 @@ def _get_current_user() -> tuple[str, str]:
     abort(403)
 
 
+def _rate_limited(retry_after: int):
+    """Ответ 429 при превышении лимита chat2 (с Retry-After)."""
+    inc("chat2_messages_failed_rate_limit_total")
+    resp = jsonify({"error": "rate limit exceeded", "retry_after": int(retry_after)})
+    resp.headers["Retry-After"] = str(int(retry_after))
+    return resp, 429
 
-def _unread_count_for_member(channel_id: str, member_type: str, member_id: str, *, exclude_self: bool = True) -> int:
-    """Подсчитать непрочитанные сообщения для участника канала.
-
-    В MVP считаем непрочитанными сообщения, созданные после last_read_message_id/last_read_at.
-    По умолчанию исключаем собственные сообщения участника.
-    """
-    q = Message.query.filter(Message.channel_id == channel_id)
-    if exclude_self:
-        q = q.filter(~((Message.sender_type == member_type) & (Message.sender_id == member_id)))
-
-    cm = ChannelMember.query.filter_by(channel_id=channel_id, member_type=member_type, member_id=member_id).first()
-    if cm and cm.last_read_message_id:
-        ref = Message.query.filter_by(id=cm.last_read_message_id, channel_id=channel_id).first()
-        if ref and ref.created_at:
-            q = q.filter(Message.created_at > ref.created_at)
-        elif cm.last_read_at:
-            q = q.filter(Message.created_at > cm.last_read_at)
-    elif cm and cm.last_read_at:
-        q = q.filter(Message.created_at > cm.last_read_at)
-
-    try:
-        return int(q.count())
-    except Exception:
-        return 0
 
 
 # Предопределённые шаблоны быстрых сообщений
@@ -150,12 +135,10 @@ def api_chat_send():
         return jsonify({"error": "channel not found"}), 404
     sender_type, sender_id = _get_current_user()
 
-    # Применяем ограничение частоты отправки
-    window_sec = float(current_app.config.get("CHAT2_SEND_RATE_WINDOW_SEC", 60.0))
-    limit = int(current_app.config.get("CHAT2_SEND_RATE_LIMIT", 20))
-    if not check_rate((sender_type, sender_id, "send"), window_sec, limit):
-        inc("chat2_messages_failed_rate_limit_total")
-        return jsonify({"error": "rate limit exceeded"}), 429
+    # Применяем ограничение частоты отправки (отправитель, канал, весь chat2)
+    ok, retry_after = check_send(sender_type, sender_id, channel.id, "send")
+    if not ok:
+        return _rate_limited(retry_after)
 
     # Idempotency (store-and-forward friendly): if client retries the same
     # message with the same client_msg_id, we return the previously created
@@ -183,9 +166,17 @@ def api_chat_send():
         created_at=datetime.now(timezone.utc),
     )
     db.session.add(msg)
-    channel.last_message_at = msg.created_at
+    touch_channel(channel, msg)
+    enqueue_push(
+        channel.id,
+        msg.id,
+        current_app.config.get("CHAT2_PUSH_TITLE", "Новое сообщение"),
+        text or "",
+        sender=(sender_type, sender_id),
+        data={"channel_id": channel_id, "message_id": msg.id, "kind": kind},
+    )
     db.session.commit()
-    # Рассылаем событие в realtime-хаб. Клиенты сами фильтруют по channel_id.
+    # Рассылаем событие в realtime-хаб: уходит подписчикам топика chat2:<channel_id>.
     try:
         broadcast_sync("chat2_message", msg.to_dict())
     except Exception:
@@ -193,31 +184,50 @@ def api_chat_send():
 
     # Обновляем метрики
     inc("chat2_messages_sent_total")
-    # Рассылаем push-уведомления участникам канала, кроме отправителя
+    # Push-уведомления участникам канала (кроме отправителя) отправляет фоновый воркер
+    wake_push_worker()
+    return jsonify(msg.to_dict()), 201
+
+
+# Верхняя граница ``limit`` для /history и /sync
+HISTORY_MAX_LIMIT = 500
+
+
+def _page_limit(default: int) -> int:
     try:
-        if current_app.config.get("CHAT2_PUSH_ENABLED"):
-            member_pairs = [(m.member_type, m.member_id) for m in channel.members]
-            tokens: List[str] = []
-            for mtype, mid in member_pairs:
-                if mtype == sender_type and mid == sender_id:
-                    continue
-                pts = PushToken.query.filter_by(member_type=mtype, member_id=mid).all()
-                tokens.extend([pt.token for pt in pts if pt.token])
-            tokens = list(dict.fromkeys(tokens))
-            if tokens:
-                title = current_app.config.get("CHAT2_PUSH_TITLE", "Новое сообщение")
-                body = text or ""
-                data = {
-                    "channel_id": channel_id,
-                    "message_id": msg.id,
-                    "kind": kind,
-                }
-                res = send_push(title, body, tokens, data=data)
-                if res.get("sent"):
-                    inc("chat2_push_sent_total", res["sent"])
+        limit = int(request.args.get("limit") or default)
     except Exception:
-        current_app.logger.debug("Failed to send push", exc_info=True)
-    return jsonify(msg.to_dict()), 201
+        limit = default
+    return max(1, min(limit, HISTORY_MAX_LIMIT))
+
+
+def _page_position(channel_id: str, legacy_param: str):
+    """Позиция keyset-страницы: из ``cursor`` или (по-старому) из ID сообщения.
+
+    Возвращает ``(position, error_response)``; ``position`` — None, если
+    листать с начала. Старый ``before_id``/``after_id`` стоит один поиск по
+    первичному ключу; курсор не стоит ничего.
+    """
+    cursor = (request.args.get("cursor") or "").strip()
+    if cursor:
+        try:
+            return decode_cursor(cursor), None
+        except ValueError:
+            return None, (jsonify({"error": "invalid cursor"}), 400)
+    ref_id = request.args.get(legacy_param)
+    if ref_id:
+        ref = Message.query.filter_by(id=ref_id, channel_id=channel_id).first()
+        if ref:
+            return position_of(ref), None
+    return None, None
+
+
+def _page_response(msgs: List[Message], next_cursor: Optional[str]):
+    # ответ остаётся массивом (его ждёт chat2.js), курсор — в заголовке
+    resp = jsonify([m.to_dict() for m in msgs])
+    if next_cursor:
+        resp.headers["X-Next-Cursor"] = next_cursor
+    return resp
 
 
 @bp.get("/history")
@@ -226,28 +236,28 @@ def api_chat_history():
 
     Query‑параметры:
       - ``channel_id`` (обязателен);
-      - ``limit`` (int) — сколько сообщений вернуть (по умолчанию 50);
-      - ``before_id`` — ID сообщения; возвращаем записи, созданные
-        строго до него.
+      - ``limit`` (int) — сколько сообщений вернуть (по умолчанию 50,
+        не больше ``HISTORY_MAX_LIMIT``);
+      - ``cursor`` — курсор из заголовка ``X-Next-Cursor`` предыдущей
+        страницы;
+      - ``before_id`` — ID сообщения (устаревший вариант ``cursor``);
+        возвращаем записи строго до него.
 
     Возвращает массив сообщений в обратном хронологическом порядке (последние – первые).
+    Если есть более старые сообщения, курсор следующей страницы — в ``X-Next-Cursor``.
     """
     channel_id: str = str(request.args.get("channel_id") or "").strip()
     if not channel_id:
         return jsonify({"error": "channel_id is required"}), 400
-    try:
-        limit = int(request.args.get("limit") or 50)
-    except Exception:
-        limit = 50
-    before_id = request.args.get("before_id")
-    q = Message.query.filter_by(channel_id=channel_id)
-    if before_id:
-        ref = Message.query.filter_by(id=before_id, channel_id=channel_id).first()
-        if ref:
-            q = q.filter(Message.created_at < ref.created_at)
-    q = q.order_by(Message.created_at.desc()).limit(limit)
-    msgs = [m.to_dict() for m in q]
-    return jsonify(msgs)
+    limit = _page_limit(50)
+    position, error = _page_position(channel_id, "before_id")
+    if error:
+        return error
+    msgs, more = keyset_page(
+        Message.query.filter_by(channel_id=channel_id), Message,
+        position=position, descending=True, limit=limit,
+    )
+    return _page_response(msgs, cursor_of(msgs[-1]) if more else None)
 
 
 @bp.get("/sync")
@@ -256,28 +266,32 @@ def api_chat_sync():
 
     Query‑параметры:
       - ``channel_id`` (обязателен);
-      - ``after_id`` — ID последнего сообщения, которое видит клиент;
+      - ``cursor`` — ``X-Next-Cursor`` предыдущего ответа /sync;
+      - ``after_id`` — ID последнего сообщения, которое видит клиент
+        (устаревший вариант ``cursor``);
       - ``limit`` (int) — сколько сообщений вернуть (по умолчанию 200).
 
-    Возвращает список сообщений, созданных после указанного ID, отсортированный
-    по возрастанию времени (старые -> новые).
+    Возвращает список сообщений, созданных после указанной позиции, отсортированный
+    по возрастанию времени (старые -> новые). ``X-Next-Cursor`` — позиция
+    последнего отданного сообщения (или переданный курсор, если новых нет);
+    с ним следующий /sync продолжит без пропусков и повторов.
     """
     channel_id: str = str(request.args.get("channel_id") or "").strip()
     if not channel_id:
         return jsonify({"error": "channel_id is required"}), 400
-    try:
-        limit = int(request.args.get("limit") or 200)
-    except Exception:
-        limit = 200
-    after_id = request.args.get("after_id")
-    q = Message.query.filter_by(channel_id=channel_id)
-    if after_id:
-        ref = Message.query.filter_by(id=after_id, channel_id=channel_id).first()
-        if ref:
-            q = q.filter(Message.created_at > ref.created_at)
-    q = q.order_by(Message.created_at.asc()).limit(limit)
-    msgs = [m.to_dict() for m in q]
-    return jsonify(msgs)
+    limit = _page_limit(200)
+    position, error = _page_position(channel_id, "after_id")
+    if error:
+        return error
+    msgs, _more = keyset_page(
+        Message.query.filter_by(channel_id=channel_id), Message,
+        position=position, descending=False, limit=limit,
+    )
+    if msgs:
+        next_cursor = cursor_of(msgs[-1])
+    else:
+        next_cursor = encode_cursor(*position) if position else None
+    return _page_response(msgs, next_cursor)
 
 
 @bp.post("/read")
@@ -415,11 +429,9 @@ def api_chat_upload_media():
         except Exception:
             current_app.logger.debug("Failed to check idempotency for chat2 upload", exc_info=True)
     # Rate limit for uploads
-    upload_window = float(current_app.config.get("CHAT2_UPLOAD_RATE_WINDOW_SEC", 60.0))
-    upload_limit = int(current_app.config.get("CHAT2_UPLOAD_RATE_LIMIT", 5))
-    if not check_rate((sender_type, sender_id, "upload"), upload_window, upload_limit):
-        inc("chat2_messages_failed_rate_limit_total")
-        return jsonify({"error": "rate limit exceeded"}), 429
+    ok, retry_after = check_send(sender_type, sender_id, channel_id, "upload")
+    if not ok:
+        return _rate_limited(retry_after)
     # Prepare upload directory
     upload_root = current_app.config.get("UPLOAD_FOLDER") or "uploads"
     subdir = os.path.join(upload_root, "chat2")
@@ -451,7 +463,15 @@ def api_chat_upload_media():
         created_at=datetime.now(timezone.utc),
     )
     db.session.add(msg)
-    channel.last_message_at = msg.created_at
+    touch_channel(channel, msg)
+    enqueue_push(
+        channel.id,
+        msg.id,
+        current_app.config.get("CHAT2_PUSH_TITLE", "Новое медиа"),
+        caption or "(медиа)",
+        sender=(sender_type, sender_id),
+        data={"channel_id": channel_id, "message_id": msg.id, "kind": "media"},
+    )
     db.session.commit()
     # Broadcast via WS
     try:
@@ -461,30 +481,8 @@ def api_chat_upload_media():
     # Metrics
     inc("chat2_messages_sent_total")
     inc("chat2_media_uploaded_total")
-    # Push notifications
-    try:
-        if current_app.config.get("CHAT2_PUSH_ENABLED"):
-            member_pairs = [(m.member_type, m.member_id) for m in channel.members]
-            tokens: List[str] = []
-            for mtype, mid in member_pairs:
-                if mtype == sender_type and mid == sender_id:
-                    continue
-                pts = PushToken.query.filter_by(member_type=mtype, member_id=mid).all()
-                tokens.extend([pt.token for pt in pts if pt.token])
-            tokens = list(dict.fromkeys(tokens))
-            if tokens:
-                title = current_app.config.get("CHAT2_PUSH_TITLE", "Новое медиа")
-                body = caption or "(медиа)"
-                data = {
-                    "channel_id": channel_id,
-                    "message_id": msg.id,
-                    "kind": "media",
-                }
-                res = send_push(title, body, tokens, data=data)
-                if res.get("sent"):
-                    inc("chat2_push_sent_total", res["sent"])
-    except Exception:
-        current_app.logger.debug("Failed to send media push", exc_info=True)
+    # Push notifications (background worker)
+    wake_push_worker()
     return jsonify(msg.to_dict()), 201
 
 
@@ -542,11 +540,9 @@ def api_chat_send_template():
         return jsonify({"error": "channel not found"}), 404
     sender_type, sender_id = _get_current_user()
     # Rate limit
-    window_sec = float(current_app.config.get("CHAT2_SEND_RATE_WINDOW_SEC", 60.0))
-    limit = int(current_app.config.get("CHAT2_SEND_RATE_LIMIT", 20))
-    if not check_rate((sender_type, sender_id, "send"), window_sec, limit):
-        inc("chat2_messages_failed_rate_limit_total")
-        return jsonify({"error": "rate limit exceeded"}), 429
+    ok, retry_after = check_send(sender_type, sender_id, channel.id, "send")
+    if not ok:
+        return _rate_limited(retry_after)
     # Find template
     tmpl = next((t for t in TEMPLATES if str(t.get("id")) == template_id), None)
     if not tmpl:
@@ -563,7 +559,15 @@ def api_chat_send_template():
         created_at=datetime.now(timezone.utc),
     )
     db.session.add(msg)
-    channel.last_message_at = msg.created_at
+    touch_channel(channel, msg)
+    enqueue_push(
+        channel.id,
+        msg.id,
+        current_app.config.get("CHAT2_PUSH_TITLE", "Новый шаблон"),
+        text or "",
+        sender=(sender_type, sender_id),
+        data={"channel_id": channel_id, "message_id": msg.id, "kind": "template", "template_id": template_id},
+    )
     db.session.commit()
     # Broadcast
     try:
@@ -572,31 +576,8 @@ def api_chat_send_template():
         current_app.logger.debug("Failed to broadcast template message", exc_info=True)
     # Metrics
     inc("chat2_messages_sent_total")
-    # Push
-    try:
-        if current_app.config.get("CHAT2_PUSH_ENABLED"):
-            member_pairs = [(m.member_type, m.member_id) for m in channel.members]
-            tokens: List[str] = []
-            for mtype, mid in member_pairs:
-                if mtype == sender_type and mid == sender_id:
-                    continue
-                pts = PushToken.query.filter_by(member_type=mtype, member_id=mid).all()
-                tokens.extend([pt.token for pt in pts if pt.token])
-            tokens = list(dict.fromkeys(tokens))
-            if tokens:
-                title = current_app.config.get("CHAT2_PUSH_TITLE", "Новый шаблон")
-                body = text or ""
-                data = {
-                    "channel_id": channel_id,
-                    "message_id": msg.id,
-                    "kind": "template",
-                    "template_id": template_id,
-                }
-                res = send_push(title, body, tokens, data=data)
-                if res.get("sent"):
-                    inc("chat2_push_sent_total", res["sent"])
-    except Exception:
-        current_app.logger.debug("Failed to send template push", exc_info=True)
+    # Push (background worker)
+    wake_push_worker()
     return jsonify(msg.to_dict()), 201
 
 
@@ -657,25 +638,21 @@ def api_chat_channels():
         limit = int(request.args.get("limit") or 50)
     except Exception:
         limit = 50
-    qs = Channel.query.order_by(Channel.last_message_at.desc().nullslast()).limit(limit)
+    channels = Channel.query.order_by(Channel.last_message_at.desc().nullslast()).limit(limit).all()
+    # Непрочитанные для текущего пользователя (исключая его же сообщения) — один запрос на все каналы
+    sender_type, sender_id = _get_current_user()
+    unread = unread_counts([ch.id for ch in channels], sender_type, sender_id, exclude_self=True)
+    previews = last_message_previews(channels)
     res: List[Dict[str, Any]] = []
-    for ch in qs:
-        last_msg = Message.query.filter_by(channel_id=ch.id).order_by(Message.created_at.desc()).first()
-        if last_msg:
-            preview = last_msg.text or (last_msg.kind or "")
-        else:
-            preview = None
-        # Подсчёт непрочитанных для текущего пользователя (исключая его же сообщения)
-        sender_type, sender_id = _get_current_user()
-        unread = _unread_count_for_member(ch.id, sender_type, sender_id, exclude_self=True)
+    for ch in channels:
         res.append({
             "id": ch.id,
             "type": ch.type,
             "shift_id": ch.shift_id,
             "marker_id": ch.marker_id,
             "last_message_at": ch.last_message_at.isoformat() if ch.last_message_at else None,
-            "preview": preview,
-            "unread": unread,
+            "preview": previews.get(ch.id),
+            "unread": unread.get(ch.id, 0),
         })
     return jsonify(res)
 
@@ -717,12 +694,10 @@ def api_chat_unread_for_incidents():
     channels = Channel.query.filter(Channel.type == "incident", Channel.marker_id.in_(ids)).all()
     by_marker: Dict[int, Channel] = {int(ch.marker_id): ch for ch in channels if ch.marker_id is not None}
 
+    counts = unread_counts([ch.id for ch in by_marker.values()], sender_type, sender_id, exclude_self=True)
     for iid in ids:
         ch = by_marker.get(int(iid))
-        if not ch:
-            out[str(iid)] = 0
-            continue
-        out[str(iid)] = _unread_count_for_member(ch.id, sender_type, sender_id, exclude_self=True)
+        out[str(iid)] = counts.get(ch.id, 0) if ch else 0
 
     return jsonify(out), 200
 
@@ -761,12 +736,10 @@ def api_chat_unread_for_shifts():
     channels = Channel.query.filter(Channel.type == "shift", Channel.shift_id.in_(ids)).all()
     by_shift: Dict[int, Channel] = {int(ch.shift_id): ch for ch in channels if ch.shift_id is not None}
 
+    counts = unread_counts([ch.id for ch in by_shift.values()], sender_type, sender_id, exclude_self=True)
     for sid in ids:
         ch = by_shift.get(int(sid))
-        if not ch:
-            out[str(sid)] = 0
-            continue
-        out[str(sid)] = _unread_count_for_member(ch.id, sender_type, sender_id, exclude_self=True)
+        out[str(sid)] = counts.get(ch.id, 0) if ch else 0
 
     return jsonify(out), 200
 
@@ -921,6 +894,7 @@ def api_chat_admin_purge():
             except Exception:
                 pass
         db.session.delete(msg)
+    forget_previews_before(cutoff)
     db.session.commit()
     return jsonify({"deleted_messages": count, "deleted_files": deleted_files}), 200
 
@@ -929,5 +903,9 @@ def api_chat_admin_purge():
 def api_chat_metrics():
     """Метрики chat2 в формате JSON."""
     require_admin("viewer")
-    from .metrics import snapshot as chat_snapshot
-    return jsonify(chat_snapshot())
+    from .metrics import gauges_snapshot, snapshot as chat_snapshot
+    from .ratelimit import throttled_senders
+    data: Dict[str, Any] = chat_snapshot()
+    data.update(gauges_snapshot())
+    data["throttled_top"] = throttled_senders()
+    return jsonify(data)
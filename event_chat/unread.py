@@ -0,0 +1,122 @@
+"""Непрочитанные и последнее сообщение каналов chat2.
+
+Раньше список каналов делал на каждый канал четыре запроса (последнее
+сообщение, ChannelMember, опорное сообщение отметки прочтения, COUNT),
+столько же — unread_for_incidents / unread_for_shifts. Теперь:
+
+- последнее сообщение денормализовано в Channel (``last_message_id``,
+  ``last_message_preview``), его обновляет :func:`touch_channel` при
+  каждой отправке;
+- непрочитанные всех нужных каналов считает один сгруппированный запрос
+  :func:`unread_counts`: LEFT JOIN на отметку прочтения участника и её
+  опорное сообщение, подсчёт — по индексу (channel_id, created_at).
+
+Список любого числа каналов — фиксированное число запросов.
+"""
+
+from __future__ import annotations
+
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import aliased
+
+from ..extensions import db
+from .models import Channel, ChannelMember, Message
+
+PREVIEW_LEN = 200
+# параметров в одном IN (SQLite старых версий — не больше 999 на запрос)
+IN_CHUNK = 500
+
+
+def message_preview(msg: Message) -> str:
+    """Превью сообщения для списка каналов: текст или тип (``media``, ``template``…)."""
+    return (msg.text or msg.kind or "")[:PREVIEW_LEN]
+
+
+def touch_channel(channel: Channel, msg: Message) -> None:
+    """Запомнить ``msg`` последним сообщением канала (до commit отправки)."""
+    if msg.id is None:
+        msg.id = str(uuid.uuid4())
+    channel.last_message_at = msg.created_at
+    channel.last_message_id = msg.id
+    channel.last_message_preview = message_preview(msg)
+
+
+def forget_previews_before(cutoff) -> None:  # noqa: ANN001
+    """Сбросить превью каналов, чьё последнее сообщение удаляется по сроку хранения."""
+    Channel.query.filter(Channel.last_message_at < cutoff).update(
+        {Channel.last_message_id: None, Channel.last_message_preview: None},
+        synchronize_session=False,
+    )
+
+
+def _chunks(ids: List[str]) -> Iterable[List[str]]:
+    for i in range(0, len(ids), IN_CHUNK):
+        yield ids[i:i + IN_CHUNK]
+
+
+def unread_counts(
+    channel_ids: Iterable[str],
+    member_type: str,
+    member_id: str,
+    *,
+    exclude_self: bool = True,
+) -> Dict[str, int]:
+    """Непрочитанные участника по каналам: ``{channel_id: n}`` (0 — для всех запрошенных).
+
+    Непрочитанные — сообщения после опорного сообщения отметки прочтения
+    (``last_read_message_id``), иначе после ``last_read_at``; без отметки —
+    все. По умолчанию свои сообщения участника не считаются.
+    """
+    ids = list(dict.fromkeys(str(c) for c in channel_ids))
+    out: Dict[str, int] = {cid: 0 for cid in ids}
+    cm = aliased(ChannelMember)
+    ref = aliased(Message)
+    cutoff = func.coalesce(ref.created_at, cm.last_read_at)
+    for chunk in _chunks(ids):
+        q = (
+            db.session.query(Message.channel_id, func.count(Message.id))
+            .outerjoin(cm, and_(
+                cm.channel_id == Message.channel_id,
+                cm.member_type == member_type,
+                cm.member_id == member_id,
+            ))
+            .outerjoin(ref, and_(ref.id == cm.last_read_message_id, ref.channel_id == Message.channel_id))
+            .filter(Message.channel_id.in_(chunk))
+            .filter(or_(cutoff.is_(None), Message.created_at > cutoff))
+        )
+        if exclude_self:
+            q = q.filter(~and_(Message.sender_type == member_type, Message.sender_id == member_id))
+        for channel_id, n in q.group_by(Message.channel_id):
+            out[channel_id] = int(n)
+    return out
+
+
+def last_message_previews(channels: Iterable[Channel]) -> Dict[str, Optional[str]]:
+    """Превью последних сообщений каналов.
+
+    Берётся из Channel; каналы со старыми сообщениями без денормализованного
+    превью (до миграции 0026) дочитываются одним запросом на все.
+    """
+    out: Dict[str, Optional[str]] = {}
+    missing: List[str] = []
+    for ch in channels:
+        out[ch.id] = ch.last_message_preview
+        if ch.last_message_id is None and ch.last_message_at is not None:
+            missing.append(ch.id)
+    for chunk in _chunks(missing):
+        latest = (
+            db.session.query(Message.channel_id, func.max(Message.created_at).label("created_at"))
+            .filter(Message.channel_id.in_(chunk))
+            .group_by(Message.channel_id)
+            .subquery()
+        )
+        rows = db.session.query(Message).join(
+            latest,
+            and_(Message.channel_id == latest.c.channel_id, Message.created_at == latest.c.created_at),
+        )
+        for msg in rows:
+            out[msg.channel_id] = message_preview(msg)
+    return out
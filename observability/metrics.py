@@ -19,6 +19,8 @@ from compat_flask import Response, g, request, current_app
 _req_total: Dict[Tuple[str, str, str], int] = defaultdict(int)
 _req_dur_sum: Dict[Tuple[str, str], float] = defaultdict(float)
 _req_dur_cnt: Dict[Tuple[str, str], int] = defaultdict(int)
+# Прочие счётчики подсистем (realtime, кэши и т.п.): имя -> значение
+_counters: Dict[str, int] = defaultdict(int)
 
 @dataclass(frozen=True)
 class MetricsSnapshot:
@@ -51,6 +53,13 @@ def after_request(resp: Response) -> Response:
         pass
     return resp
 
+def inc_counter(name: str, value: int = 1) -> None:
+    """Increment a named counter (exported as ``<name> <value>``)."""
+    _counters[name] += value
+
+def counters_snapshot() -> Dict[str, int]:
+    return dict(_counters)
+
 def snapshot() -> MetricsSnapshot:
     return MetricsSnapshot(dict(_req_total), dict(_req_dur_sum), dict(_req_dur_cnt))
 
@@ -71,6 +80,9 @@ def render_prometheus_text() -> str:
     lines.append("# TYPE http_request_duration_seconds_count counter")
     for (method, endpoint), val in sorted(s.dur_cnt.items()):
         lines.append(f'http_request_duration_seconds_count{{method="{method}",endpoint="{endpoint}"}} {val}')
+    for name, val in sorted(counters_snapshot().items()):
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {val}")
     lines.append("")
     # Включаем chat2 метрики
     try:
@@ -82,6 +94,10 @@ def render_prometheus_text() -> str:
             # Объявляем каждую метрику как счётчик (counter)
             lines.append(f"# TYPE {pname} counter")
             lines.append(f"{pname} {val}")
+        from ..event_chat.metrics import gauges_snapshot as chat_gauges
+        for name, val in sorted(chat_gauges().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {val}")
     except Exception:
         # Метрики не должны прерывать вывод
         pass
@@ -8,5 +8,6 @@
 from compat_flask import Blueprint
 
 bp = Blueprint('offline', __name__)
+tiles_bp = Blueprint('tiles', __name__, url_prefix='/tiles')
 
-from . import routes  # noqa: F401
+from . import routes, tiles  # noqa: F401
@@ -9,20 +9,23 @@
 from __future__ import annotations
 
 import json
-import math
 import os
 import shutil
 import re
+import tempfile
 import time
+from contextlib import closing
 from typing import Any, Dict, List, Optional
 
-import requests
 from compat_flask import Response, current_app, jsonify, request, session
 
 from ..helpers import require_admin
 from ..audit.logger import log_admin_action
 from ..models import Address
 from ..extensions import db
+from ..services import nominatim_service, tile_download_service, tile_store
+from ..services.tile_store import summarise_tiles
+from ..services.geocode_service import invalidate_geocode_cache
 
 from . import bp
 
@@ -185,64 +188,6 @@ def set_active_tiles_set(name: str) -> None:
 # Вспомогательные функции
 # ---------------------------------------------------------------------------
 
-def deg2num(lat_deg: float, lon_deg: float, zoom: int) -> tuple:
-    """Преобразовать географические координаты в номер тайла (x, y).
-
-    Используется для вычисления диапазона тайлов, которые нужно
-    скачать, ограничивая область интереса. Формула взята из
-    спецификации OSM.
-    """
-    lat_rad = math.radians(lat_deg)
-    n = 2.0 ** zoom
-    xtile = (lon_deg + 180.0) / 360.0 * n
-    ytile = (1.0 - math.log(math.tan(lat_rad) + (1 / math.cos(lat_rad))) / math.pi) / 2.0 * n
-    return xtile, ytile
-
-
-def summarise_tiles(dir_path: str) -> Dict[str, Any]:
-    """Собрать статистику по тайлам в каталоге.
-
-    Возвращает словарь с ключами levels (список объектов z/tiles),
-    total_tiles (общее количество тайлов) и size_bytes (общий размер в байтах).
-    """
-    levels: List[Dict[str, Any]] = []
-    total_tiles = 0
-    total_size = 0
-    try:
-        if os.path.isdir(dir_path):
-            for name in os.listdir(dir_path):
-                z_dir = os.path.join(dir_path, name)
-                if not os.path.isdir(z_dir):
-                    continue
-                try:
-                    z_int = int(name)
-                except Exception:
-                    continue
-                tile_count = 0
-                level_size = 0
-                for root, dirs, files in os.walk(z_dir):
-                    for f in files:
-                        if f.lower().endswith('.png'):
-                            tile_count += 1
-                            try:
-                                size = os.path.getsize(os.path.join(root, f))
-                                level_size += size
-                            except Exception:
-                                pass
-                if tile_count > 0:
-                    levels.append({'z': z_int, 'tiles': tile_count})
-                    total_tiles += tile_count
-                    total_size += level_size
-            levels.sort(key=lambda d: d['z'])
-    except Exception:
-        pass
-    return {
-        'levels': levels,
-        'total_tiles': total_tiles,
-        'size_bytes': total_size,
-    }
-
-
 # ---------------------------------------------------------------------------
 # Эндпоинты офлайн‑карт
 # ---------------------------------------------------------------------------
@@ -256,6 +201,10 @@ def offline_map_stream() -> Response:
     с данными прогресса и завершения.  Тайлы сохраняются в каталог
     по умолчанию или в указанный набор.  Область ограничивается
     выбранным городом из CITY_BOUNDS.
+
+    Сама загрузка — фоновое задание (app.services.tile_download_service);
+    если для набора уже идёт задание, поток подключается к нему.
+    ``?job=<id>`` — следить за конкретным заданием.
     """
     require_admin()
     ok, wait = _rate_limit('rl_offline_map_stream', seconds=3)
@@ -305,61 +254,84 @@ def offline_map_stream() -> Response:
         target_dir = _safe_tiles_set_dir(sets_dir, safe)
         if not target_dir:
             return jsonify({'error': 'invalid set path'}), 400
-    # функция генерации SSE
+        if os.path.exists(target_dir + tile_store.MBTILES_EXT + tile_store.PACKING_SUFFIX):
+            # упаковка с remove_dir удалила бы скачанное
+            return jsonify({'error': 'set is being packed'}), 409
+    job_id = (request.args.get('job') or '').strip()
+    if job_id:
+        job = tile_download_service.get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'job not found'}), 404
+    else:
+        job = tile_download_service.create_job(
+            city=city, bounds=bounds, zmin=zmin_int, zmax=zmax_int,
+            set_name=set_name, target_dir=target_dir,
+            created_by=session.get('admin_username') or session.get('username'),
+        )
+        log_admin_action('offline.map_download', {'job': job.id, 'set': set_name, 'city': city})
+    tile_download_service.ensure_running(job)
+    job_id = job.id
+    app = current_app._get_current_object()
+
+    # SSE только читает состояние задания: загрузка идёт в фоне и
+    # продолжается, даже если клиент закрыл вкладку
     def generate():
-        total = 0
-        ranges: List[tuple] = []
-        # вычисляем количество тайлов и диапазоны
-        for z in range(zmin_int, zmax_int + 1):
-            try:
-                x_min_f, y_max_f = deg2num(lat_max, lon_min, z)
-                x_max_f, y_min_f = deg2num(lat_min, lon_max, z)
-            except Exception:
-                continue
-            x0 = int(math.floor(min(x_min_f, x_max_f)))
-            x1 = int(math.floor(max(x_min_f, x_max_f)))
-            y0 = int(math.floor(min(y_min_f, y_max_f)))
-            y1 = int(math.floor(max(y_min_f, y_max_f)))
-            # ограничиваем диапазон индексов
-            limit = 2 ** z
-            x0 = max(0, min(x0, limit - 1))
-            x1 = max(0, min(x1, limit - 1))
-            y0 = max(0, min(y0, limit - 1))
-            y1 = max(0, min(y1, limit - 1))
-            if x1 < x0 or y1 < y0:
-                continue
-            total += (x1 - x0 + 1) * (y1 - y0 + 1)
-            ranges.append((z, x0, x1, y0, y1))
-        done = 0
-        for (z, x0, x1, y0, y1) in ranges:
-            for x in range(x0, x1 + 1):
-                for y in range(y0, y1 + 1):
-                    done += 1
-                    # путь к файлу
-                    dir_z = os.path.join(target_dir, str(z), str(x))
-                    file_path = os.path.join(dir_z, f"{y}.png")
-                    # если файл уже существует — пропускаем загрузку
-                    if not os.path.isfile(file_path):
-                        try:
-                            # создаём каталоги
-                            os.makedirs(dir_z, exist_ok=True)
-                            url = f"https://tile.openstreetmap.org/{z}/{x}/{y}.png"
-                            r = requests.get(url, timeout=15)
-                            if r.ok:
-                                with open(file_path, 'wb') as fh:
-                                    fh.write(r.content)
-                        except Exception:
-                            # ошибки при загрузке игнорируем
-                            pass
-                    # отправляем прогресс
-                    pct = int(done * 100 / total) if total else 100
-                    payload = {'type': 'progress', 'pct': pct, 'done': done, 'total': total}
-                    yield f"data: {json.dumps(payload)}\n\n"
-        # завершение
-        yield 'data: {"type":"done"}\n\n'
+        state: Dict[str, Any] = {}
+        with app.app_context():
+            for state in tile_download_service.iter_progress(job_id):
+                payload = {
+                    'type': 'progress',
+                    'job_id': job_id,
+                    'status': state['status'],
+                    'pct': state['pct'],
+                    'done': state['done'],
+                    'total': state['total'],
+                    'failed': state['failed'],
+                }
+                yield f"data: {json.dumps(payload)}\n\n"
+        payload = {'type': 'done', 'job_id': job_id, 'status': state.get('status'), 'failed': state.get('failed', 0)}
+        yield f"data: {json.dumps(payload)}\n\n"
     return Response(generate(), mimetype='text/event-stream')
 
 
+@bp.get('/map/jobs')
+def offline_map_jobs() -> Response:
+    """Последние задания загрузки тайлов."""
+    require_admin('viewer')
+    return jsonify({'items': [j.to_dict() for j in tile_download_service.list_jobs()]})
+
+
+@bp.get('/map/jobs/<job_id>')
+def offline_map_job(job_id: str) -> Response:
+    require_admin('viewer')
+    job = tile_download_service.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@bp.post('/map/jobs/<job_id>:cancel')
+def offline_map_job_cancel(job_id: str) -> Response:
+    """Остановить загрузку (уже скачанные тайлы остаются, можно продолжить)."""
+    require_admin()
+    job = tile_download_service.cancel_job(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    log_admin_action('offline.map_download_cancel', {'job': job_id})
+    return jsonify(job.to_dict())
+
+
+@bp.post('/map/jobs/<job_id>:resume')
+def offline_map_job_resume(job_id: str) -> Response:
+    """Продолжить прерванное задание с сохранённой позиции и повторить неудавшиеся тайлы."""
+    require_admin()
+    job = tile_download_service.resume_job(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    log_admin_action('offline.map_download_resume', {'job': job_id})
+    return jsonify(job.to_dict())
+
+
 @bp.post('/map:delete')
 def offline_map_delete() -> Response:
     """Удалить все загруженные тайлы карты (download)."""
@@ -405,20 +377,28 @@ def offline_map_sets() -> Response:
     sets: List[Dict[str, Any]] = []
     # набор по умолчанию
     default_summary = summarise_tiles(current_app.config.get('DOWNLOAD_TILES_DIR'))
-    sets.append({'name': 'download', **default_summary})
-    # named sets
+    sets.append({'name': 'download', 'format': tile_store.DirTileStore.kind, **default_summary})
+    # named sets: каталоги и упакованные <name>.mbtiles
     sets_dir = current_app.config.get('TILES_SETS_DIR')
     if sets_dir and os.path.isdir(sets_dir):
         try:
-            for name in os.listdir(sets_dir):
+            entries = set(os.listdir(sets_dir))
+            names = set()
+            for name in entries:
+                if name.endswith(tile_store.MBTILES_EXT):
+                    name = name[:-len(tile_store.MBTILES_EXT)]
                 safe = _safe_set_name(name)
-                if safe is None or safe == '':
+                if safe:
+                    names.add(safe)
+            for name in sorted(names):
+                if not _safe_tiles_set_dir(sets_dir, name):
                     continue
-                set_dir = _safe_tiles_set_dir(sets_dir, safe) or ''
-                if not set_dir or not os.path.isdir(set_dir):
+                store = tile_store.open_set(sets_dir, name)
+                if store is None:
                     continue
-                summary = summarise_tiles(set_dir)
-                sets.append({'name': name, **summary})
+                item = {'name': name, **store.stats()}
+                item['packing'] = name + tile_store.MBTILES_EXT + tile_store.PACKING_SUFFIX in entries
+                sets.append(item)
         except Exception:
             pass
     active = get_active_tiles_set() or 'download'
@@ -460,7 +440,7 @@ def offline_map_activate() -> Response:
     dir_path = _safe_tiles_set_dir(sets_dir, safe)
     if not dir_path:
         return jsonify({'error': 'invalid set path'}), 400
-    if not os.path.isdir(dir_path):
+    if tile_store.open_set(sets_dir, safe) is None:
         return jsonify({'error': 'set not found'}), 404
 
     set_active_tiles_set(safe)
@@ -497,6 +477,8 @@ def offline_map_delete_set(set_name: str) -> Response:
     try:
         if os.path.isdir(dir_path):
             shutil.rmtree(dir_path)
+        if os.path.isfile(dir_path + tile_store.MBTILES_EXT):
+            os.remove(dir_path + tile_store.MBTILES_EXT)
     except Exception:
         # не раскрываем детали файловой системы
         return jsonify({'error': 'failed to delete set'}), 500
@@ -509,6 +491,50 @@ def offline_map_delete_set(set_name: str) -> Response:
     return jsonify({'status': 'ok'})
 
 
+@bp.post('/map/sets/<set_name>:pack')
+def offline_map_pack_set(set_name: str) -> Response:
+    """Упаковать каталог набора в один файл MBTiles (в фоне).
+
+    После упаковки набор читается из ``<name>.mbtiles``; с флагом
+    ``remove_dir`` исходный каталог удаляется. Пока идёт упаковка,
+    в /map/sets у набора стоит ``packing``. Пока в набор качает задание
+    загрузки, упаковка запрещена (409): файл не содержал бы часть тайлов,
+    а ``remove_dir`` удалил бы их прямо во время загрузки. Требует
+    административных прав.
+    """
+    require_admin()
+    ok, wait = _rate_limit('rl_offline_map_pack_set', seconds=2)
+    if not ok:
+        return jsonify({'error': 'too many requests', 'retry_after': wait}), 429
+
+    safe = _safe_set_name(set_name)
+    if safe is None or safe == '':
+        return jsonify({'error': 'invalid set name'}), 400
+
+    sets_dir = current_app.config.get('TILES_SETS_DIR')
+    if not sets_dir:
+        return jsonify({'error': 'tiles sets dir is not configured'}), 500
+
+    dir_path = _safe_tiles_set_dir(sets_dir, safe)
+    if not dir_path:
+        return jsonify({'error': 'invalid set path'}), 400
+    if not os.path.isdir(dir_path):
+        return jsonify({'error': 'set not found'}), 404
+    dest_path = dir_path + tile_store.MBTILES_EXT
+    if os.path.exists(dest_path + tile_store.PACKING_SUFFIX):
+        return jsonify({'error': 'already packing'}), 409
+    job = tile_download_service.active_job(safe)
+    if job is not None:
+        return jsonify({'error': 'download in progress', 'job': job.id}), 409
+
+    data = request.get_json(silent=True) or {}
+    remove_dir = bool(data.get('remove_dir'))
+    tile_store.pack_set_in_background(dir_path, dest_path, name=safe, remove_dir=remove_dir)
+    log_admin_action('offline.map_pack_set', {'set': safe, 'remove_dir': remove_dir})
+    return jsonify({'status': 'packing', 'set': safe}), 202
+
+
+
 
 
 # ---------------------------------------------------------------------------
@@ -593,6 +619,7 @@ def offline_geocode_delete_entry(idx: int) -> Response:
                     with open(path, 'w', encoding='utf-8') as fh:
                         json.dump(data, fh, ensure_ascii=False, indent=2)
                     remaining = len(data)
+                    invalidate_geocode_cache()
                 except Exception:
                     pass
         except Exception:
@@ -613,6 +640,7 @@ def offline_geocode_delete() -> Response:
             os.remove(path)
     except Exception:
         pass
+    invalidate_geocode_cache()
     log_admin_action('offline.geocode_delete')
     return ('', 204)
 
@@ -623,14 +651,17 @@ def offline_geocode_stream() -> Response:
 
     Проходит по всем сохранённым адресам, пытаясь определить
     координаты. Если они есть, берёт существующие значения,
-    иначе делает запрос к Nominatim.  Результаты записывает в
+    иначе геокодирует через :func:`nominatim_service.fetch_many`:
+    постоянный кэш ответов, затем Nominatim в несколько потоков с
+    общим ограничением частоты. Результаты записывает в
     файл OFFLINE_GEOCODE_FILE.  Клиенту отправляются события
-    прогресса, затем завершения.
-    
+    прогресса (``cached`` — сколько адресов взято из кэша), затем
+    завершения. Каждый ответ Nominatim сохраняется сразу, поэтому
+    прерванную пересборку можно просто запустить снова.
+
     Важно: т.к. генератор выполняется вне контекста запроса,
-    необходимые параметры (список адресов и путь к файлу)
-    извлекаются заранее, до создания генератора. Это избегает
-    ошибок "Working outside of application context".
+    список адресов и путь к файлу извлекаются заранее, а кэш
+    читается внутри app_context() самого приложения.
     """
     require_admin()
     ok, wait = _rate_limit('rl_offline_geocode_stream', seconds=3)
@@ -643,44 +674,56 @@ def offline_geocode_stream() -> Response:
     items = [addr.to_dict() for addr in Address.query.all()]
     total = len(items)
     offline_path: Optional[str] = current_app.config.get('OFFLINE_GEOCODE_FILE')
+    app = current_app._get_current_object()
 
     def generate():
-        done = 0
-        offline_entries: List[Dict[str, Any]] = []
+        rows = []
+        missing: List[str] = []
         for it in items:
             name = (it.get('name') or it.get('address') or '').strip()
             lat = it.get('lat')
             lon = it.get('lon')
+            rows.append([name, lat, lon])
             # если координаты отсутствуют, пытаемся геокодировать
             if (lat is None or lon is None) and name:
+                missing.append(name)
+
+        done = total - len(missing)
+        cached_n = 0
+        found: Dict[str, Any] = {}
+        if done:
+            yield _progress_event(done, total, cached_n)
+        with app.app_context():
+            with closing(nominatim_service.fetch_many(missing, lang='ru')) as results:
+                for query, res, from_cache in results:
+                    if res:
+                        try:
+                            found[query] = (float(res[0]['lat']), float(res[0]['lon']))
+                        except (KeyError, TypeError, ValueError):
+                            pass
+                    done += 1
+                    cached_n += bool(from_cache)
+                    yield _progress_event(done, total, cached_n)
+
+            offline_entries: List[Dict[str, Any]] = []
+            for name, lat, lon in rows:
+                if (lat is None or lon is None) and name in found:
+                    lat, lon = found[name]
+                if lat is not None and lon is not None:
+                    offline_entries.append({'display_name': name, 'lat': lat, 'lon': lon})
+            # сохраняем файл офлайн‑геокода (если путь задан)
+            if offline_path:
                 try:
-                    params = {'q': name, 'format': 'json', 'limit': 1, 'accept-language': 'ru'}
-                    r = requests.get(
-                        'https://nominatim.openstreetmap.org/search',
-                        params=params,
-                        headers={'User-Agent': 'map-v12-offline'},
-                        timeout=10,
-                    )
-                    if r.ok:
-                        data = r.json()
-                        if isinstance(data, list) and data:
-                            lat = float(data[0].get('lat', lat))
-                            lon = float(data[0].get('lon', lon))
+                    _atomic_write_json(offline_path, offline_entries)
+                    invalidate_geocode_cache()
                 except Exception:
                     pass
-            if lat is not None and lon is not None:
-                offline_entries.append({'display_name': name, 'lat': lat, 'lon': lon})
-            done += 1
-            pct = int(done * 100 / total) if total else 100
-            step_msg = f'{done}/{total}'
-            payload = {'type': 'progress', 'pct': pct, 'step': step_msg}
-            yield f"data: {json.dumps(payload)}\n\n"
-        # сохраняем файл офлайн‑геокода (если путь задан)
-        if offline_path:
-            try:
-                _atomic_write_json(offline_path, offline_entries)
-            except Exception:
-                pass
         yield 'data: {"type":"done"}\n\n'
 
     return Response(generate(), mimetype='text/event-stream')
+
+
+def _progress_event(done: int, total: int, cached: int) -> str:
+    pct = int(done * 100 / total) if total else 100
+    payload = {'type': 'progress', 'pct': pct, 'step': f'{done}/{total}', 'cached': cached}
+    return f"data: {json.dumps(payload)}\n\n"
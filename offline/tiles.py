@@ -0,0 +1,48 @@
+"""
+Отдача офлайн‑тайлов: ``/tiles/<z>/<x>/<y>.png`` — активный набор
+(его использует основной интерфейс карты), ``/tiles/<set>/<z>/<x>/<y>.png``
+— конкретный набор. Наборы — каталоги ``z/x/y.png`` или упакованные
+``<set>.mbtiles`` (см. app.services.tile_store).
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from compat_flask import Response, current_app, jsonify
+
+from ..services import tile_store
+from . import tiles_bp as bp
+from .routes import _safe_set_name, _safe_tiles_set_dir, get_active_tiles_set
+
+
+def _open_tiles_set(safe: str) -> Optional[tile_store.TileStore]:
+    """Хранилище набора по нормализованному имени ('' — набор download)."""
+    if safe == '':
+        path = current_app.config.get('DOWNLOAD_TILES_DIR')
+        return tile_store.DirTileStore(path) if path else None
+    sets_dir = current_app.config.get('TILES_SETS_DIR')
+    if not sets_dir or not _safe_tiles_set_dir(sets_dir, safe):
+        return None
+    return tile_store.open_set(sets_dir, safe)
+
+
+@bp.get('/<int:z>/<int:x>/<int:y>.png')
+def active_tile(z: int, x: int, y: int) -> Response:
+    """Тайл активного набора (после переключения набора URL тот же — только ревалидация)."""
+    store = _open_tiles_set(get_active_tiles_set())
+    if store is None:
+        return Response(status=404)
+    return tile_store.tile_response(store, z, x, y, pinned=False)
+
+
+@bp.get('/<set_name>/<int:z>/<int:x>/<int:y>.png')
+def set_tile(set_name: str, z: int, x: int, y: int) -> Response:
+    """Тайл указанного набора; упакованный набор с ``?v=<version>`` — immutable."""
+    safe = _safe_set_name(set_name)
+    if safe is None:
+        return jsonify({'error': 'invalid set name'}), 400
+    store = _open_tiles_set(safe)
+    if store is None:
+        return jsonify({'error': 'set not found'}), 404
+    return tile_store.tile_response(store, z, x, y)
@@ -33,87 +33,96 @@ export default function useWebSocket({
   useEffect(() => {
     const socket = wsFactory ? wsFactory(url) : new WebSocket(url);
 
-    socket.onmessage = (event) => {
-      try {
-        const message = JSON.parse(event.data || '{}');
-        const eventName = message?.event;
-        const data = message?.data;
-
-        if (!eventName) return;
-
-        // НАКОПЛЕНИЕ ПАКЕТОВ ТЕЛЕМЕТРИИ
-        if (eventName === 'AGENT_LOCATION_UPDATE') {
-          const items = Array.isArray(data) ? data : [data];
-          locationBuffer.current.push(...items);
-
-          if (!frameId.current) {
-            frameId.current = requestAnimationFrame(() => {
-              if (locationBuffer.current.length > 0) {
-                batchUpdateAgentLocations(locationBuffer.current);
-                locationBuffer.current = [];
-              }
-              frameId.current = null;
-            });
-          }
-          return;
-        }
+    const dispatch = (message) => {
+      const eventName = message?.event;
+      const data = message?.data;
 
-        if (eventName === 'telemetry_update' || eventName === 'duty_location_update') {
-          updateAgent(data);
-          return;
-        }
+      if (!eventName) return;
 
-        if (eventName === 'SYS_TELEMETRY') {
-          setTelemetry(data);
-          return;
-        }
+      // Пакет склеенных за тик позиций: разворачиваем в исходные события
+      if (eventName === 'positions') {
+        (Array.isArray(data?.items) ? data.items : []).forEach((item) => dispatch(item));
+        return;
+      }
 
-        if (eventName === 'THREAT_INTEL_ALERT') {
-          addThreatAlert(data);
-          return;
-        }
+      // НАКОПЛЕНИЕ ПАКЕТОВ ТЕЛЕМЕТРИИ
+      if (eventName === 'AGENT_LOCATION_UPDATE') {
+        const items = Array.isArray(data) ? data : [data];
+        locationBuffer.current.push(...items);
 
-        if (eventName === 'pending_created' || eventName === 'NEW_PENDING_MARKER') {
-          const pendingPayload = data ?? message?.marker ?? message;
-          asArray(pendingPayload).forEach((item) => upsertPendingMarker(item));
-          return;
+        if (!frameId.current) {
+          frameId.current = requestAnimationFrame(() => {
+            if (locationBuffer.current.length > 0) {
+              batchUpdateAgentLocations(locationBuffer.current);
+              locationBuffer.current = [];
+            }
+            frameId.current = null;
+          });
         }
+        return;
+      }
 
-        if (
-          eventName === 'pending_approved'
-          || eventName === 'pending_rejected'
-          || eventName === 'MARKER_APPROVED'
-          || eventName === 'MARKER_REJECTED'
-        ) {
-          const pendingId = getPendingId(data) ?? getPendingId(message);
-          if (pendingId !== undefined && pendingId !== null) removePendingMarker(pendingId);
-
-          if (eventName === 'MARKER_APPROVED') {
-            const approvedObject = data?.new_object ?? message?.new_object;
-            if (approvedObject) addIncident(approvedObject);
-          }
-          return;
-        }
+      if (eventName === 'telemetry_update' || eventName === 'duty_location_update') {
+        updateAgent(data);
+        return;
+      }
 
-        if (eventName === 'new_incident' || eventName === 'new_address' || eventName === 'incident_created' || eventName === 'NEW_INCIDENT') {
-          asArray(data).forEach((item) => addIncident(item));
-          return;
-        }
+      if (eventName === 'SYS_TELEMETRY') {
+        setTelemetry(data);
+        return;
+      }
 
-        if (data?.event === 'CHAT_MESSAGE') {
-          useChatStore.getState().addMessage(data?.incident_id, data?.message);
-          return;
+      if (eventName === 'THREAT_INTEL_ALERT') {
+        addThreatAlert(data);
+        return;
+      }
+
+      if (eventName === 'pending_created' || eventName === 'NEW_PENDING_MARKER') {
+        const pendingPayload = data ?? message?.marker ?? message;
+        asArray(pendingPayload).forEach((item) => upsertPendingMarker(item));
+        return;
+      }
+
+      if (
+        eventName === 'pending_approved'
+        || eventName === 'pending_rejected'
+        || eventName === 'MARKER_APPROVED'
+        || eventName === 'MARKER_REJECTED'
+      ) {
+        const pendingId = getPendingId(data) ?? getPendingId(message);
+        if (pendingId !== undefined && pendingId !== null) removePendingMarker(pendingId);
+
+        if (eventName === 'MARKER_APPROVED') {
+          const approvedObject = data?.new_object ?? message?.new_object;
+          if (approvedObject) addIncident(approvedObject);
         }
+        return;
+      }
 
-        if (eventName === 'chat_message' || eventName === 'CHAT_MESSAGE') {
-          const chatPayload = data || message?.message;
-          if (chatPayload) {
-            addChatMessage(chatPayload);
-            if (eventName === 'CHAT_MESSAGE') {
-              addIncidentChatMessage(message?.incident_id, chatPayload);
-            }
+      if (eventName === 'new_incident' || eventName === 'new_address' || eventName === 'incident_created' || eventName === 'NEW_INCIDENT') {
+        asArray(data).forEach((item) => addIncident(item));
+        return;
+      }
+
+      if (data?.event === 'CHAT_MESSAGE') {
+        useChatStore.getState().addMessage(data?.incident_id, data?.message);
+        return;
+      }
+
+      if (eventName === 'chat_message' || eventName === 'CHAT_MESSAGE') {
+        const chatPayload = data || message?.message;
+        if (chatPayload) {
+          addChatMessage(chatPayload);
+          if (eventName === 'CHAT_MESSAGE') {
+            addIncidentChatMessage(message?.incident_id, chatPayload);
           }
         }
+      }
+    };
+
+    socket.onmessage = (event) => {
+      try {
+        dispatch(JSON.parse(event.data || '{}'));
       } catch (_error) {
         // ignore malformed websocket frames
       }
@@ -3,6 +3,21 @@
 Python здесь выступает:
 - Publisher'ом UI-событий в Redis (канал map_updates)
 - Consumer'ом telemetry_save_queue для батч-сохранения координат в БД
+
+Очередь сохранения телеметрии работает в одном из режимов
+(TELEMETRY_QUEUE_MODE):
+
+- ``pubsub`` (по умолчанию) — канал Pub/Sub ``telemetry_save_queue``; точки,
+  опубликованные во время рестарта consumer'а, теряются, consumer один;
+- ``stream`` — Redis Stream ``telemetry_save_stream`` + consumer group:
+  XADD делает только telemetry_node (Rust), XREADGROUP/XACK — здесь.
+  Несколько процессов делят нагрузку, неподтверждённые записи упавшего
+  consumer'а забираются XAUTOCLAIM. telemetry_node отвечает 503, когда
+  длина стрима превышает TELEMETRY_STREAM_BACKPRESSURE_LEN.
+
+Формат записи стрима: поле ``payload`` с тем же JSON, что и в Pub/Sub
+(``{"event": ..., "data": {...}}`` или плоский объект), разбирается
+`_normalize_telemetry_payload`.
 """
 
 from __future__ import annotations
@@ -12,9 +27,13 @@ import json
 import logging
 import os
 import random
+import socket
+import time
 from datetime import datetime, timezone
 from typing import Any, Awaitable, Callable, Dict, Optional
 
+from ..tracker.point_fields import point_columns
+
 try:
     import redis.asyncio as redis_async
     from redis import Redis
@@ -26,6 +45,8 @@ except Exception:  # pragma: no cover
 DEFAULT_CHANNEL = "map_updates"
 DEFAULT_TELEMETRY_QUEUE = "telemetry_save_queue"
 MATRIX_NOISE_CHANNEL = "realtime_events"
+DEFAULT_TELEMETRY_STREAM = "telemetry_save_stream"
+DEFAULT_TELEMETRY_GROUP = "telemetry_writers"
 
 logger = logging.getLogger(__name__)
 
@@ -55,25 +76,65 @@ def get_channel() -> str:
     return (os.getenv("REALTIME_REDIS_CHANNEL") or DEFAULT_CHANNEL).strip() or DEFAULT_CHANNEL
 
 
-def _parse_ts(raw: Any) -> datetime:
-    if raw is None:
-        return datetime.now(timezone.utc)
+def _config(name: str, default: Any) -> Any:
+    try:
+        from compat_flask import current_app
+
+        val = current_app.config.get(name)
+        if val not in (None, ""):
+            return val
+    except Exception:
+        pass
+    return os.getenv(name) or default
+
+
+def get_telemetry_queue_mode() -> str:
+    mode = str(_config("TELEMETRY_QUEUE_MODE", "pubsub")).strip().lower()
+    return mode if mode in ("pubsub", "stream") else "pubsub"
+
+
+def telemetry_stream_settings() -> Dict[str, Any]:
+    """Параметры стрима телеметрии из конфига Flask или окружения."""
+    stream = str(_config("TELEMETRY_STREAM_KEY", DEFAULT_TELEMETRY_STREAM))
+    return {
+        "stream": stream,
+        "group": str(_config("TELEMETRY_STREAM_GROUP", DEFAULT_TELEMETRY_GROUP)),
+        "claim_idle_ms": int(_config("TELEMETRY_STREAM_CLAIM_IDLE_MS", 60_000)),
+        "max_deliveries": int(_config("TELEMETRY_STREAM_MAX_DELIVERIES", 5)),
+        "dead_stream": str(_config("TELEMETRY_STREAM_DEAD_KEY", f"{stream}:dead")),
+    }
+
+
+def _parse_ts(raw: Any, default: Optional[datetime] = None) -> datetime:
+    """Время точки из payload; без него (или нечитаемое) — ``default`` или сейчас."""
+    fallback = default or datetime.now(timezone.utc)
+    if raw is None or isinstance(raw, bool):
+        return fallback
     if isinstance(raw, (int, float)):
-        return datetime.fromtimestamp(float(raw), tz=timezone.utc)
+        value = float(raw)
+        # epoch в миллисекундах (Android: System.currentTimeMillis())
+        if value > 1e11:
+            value /= 1000.0
+        try:
+            return datetime.fromtimestamp(value, tz=timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            return fallback
     if isinstance(raw, str):
         text = raw.strip()
         if not text:
-            return datetime.now(timezone.utc)
+            return fallback
         if text.endswith("Z"):
             text = text[:-1] + "+00:00"
         try:
             return datetime.fromisoformat(text)
         except Exception:
-            return datetime.now(timezone.utc)
-    return datetime.now(timezone.utc)
+            return fallback
+    return fallback
 
 
-def _normalize_telemetry_payload(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def _normalize_telemetry_payload(
+    payload: Dict[str, Any], default_ts: Optional[datetime] = None
+) -> Optional[Dict[str, Any]]:
     body = payload.get("data") if isinstance(payload.get("data"), dict) else payload
 
     user_id = body.get("user_id")
@@ -89,8 +150,9 @@ def _normalize_telemetry_payload(payload: Dict[str, Any]) -> Optional[Dict[str,
             "lon": float(lon),
             "accuracy_m": float(body.get("accuracy_m")) if body.get("accuracy_m") is not None else None,
             "kind": str(body.get("kind") or "live")[:16],
-            "ts": _parse_ts(body.get("ts")),
+            "ts": _parse_ts(body.get("ts"), default_ts),
             "raw_json": json.dumps(body, ensure_ascii=False),
+            **point_columns(body),
         }
     except Exception:
         return None
@@ -233,25 +295,62 @@ async def matrix_telemetry_stream(
 
 
 def flush_telemetry_batch(points: list[Dict[str, Any]]) -> int:
-    """Bulk insert telemetry points into DB in one transaction."""
+    """Bulk insert telemetry points into DB in one transaction.
+
+    Точки пишутся через `tracker.bulk_insert.insert_points` (COPY на Postgres).
+
+    В той же транзакции обновляется tracker_last_position (последняя точка
+    на пользователя), чтобы читатели не сканировали tracking_points.
+    """
     if not points:
         return 0
 
     from ..extensions import db
-    from ..models import TrackingPoint
+    from ..tracker.bulk_insert import insert_points
+    from ..tracker.last_position import upsert_last_positions
 
-    db.session.bulk_insert_mappings(TrackingPoint, points)
+    # COPY на Postgres, executemany на SQLite (tracker/bulk_insert.py)
+    insert_points(points)
+    upsert_last_positions(points)
     db.session.commit()
     return len(points)
 
 
+def _telemetry_app_context():
+    try:
+        from compat_flask import current_app
+
+        return current_app.app_context()
+    except Exception:
+        from app import create_app
+
+        return create_app().app_context()
+
+
+def _make_batcher(batch_size: Optional[int], flush_interval_sec: Optional[float]):
+    from ..tracker.bulk_insert import AdaptiveBatcher
+
+    if batch_size is None and flush_interval_sec is None:
+        return AdaptiveBatcher.from_config()
+    # явные параметры — фиксированный режим (как раньше)
+    size = int(batch_size or 100)
+    interval = float(flush_interval_sec if flush_interval_sec is not None else 0.5)
+    return AdaptiveBatcher(min_batch=size, max_batch=size, min_interval=interval, max_interval=interval)
+
+
 async def consume_telemetry_save_queue(
     *,
     channel: str = DEFAULT_TELEMETRY_QUEUE,
-    batch_size: int = 100,
-    flush_interval_sec: float = 0.5,
+    batch_size: Optional[int] = None,
+    flush_interval_sec: Optional[float] = None,
 ) -> None:
-    """Consume telemetry queue and flush points to DB in batches."""
+    """Consume telemetry queue and flush points to DB in batches.
+
+    Размер пачки и интервал сброса по умолчанию адаптивные
+    (TELEMETRY_BATCH_MIN/MAX, TELEMETRY_FLUSH_MIN_MS/MAX_MS); явные
+    batch_size/flush_interval_sec фиксируют их.
+    В режиме TELEMETRY_QUEUE_MODE=stream делегирует в `consume_telemetry_stream`.
+    """
     if redis_async is None:
         return
 
@@ -259,23 +358,34 @@ async def consume_telemetry_save_queue(
     if not redis_url:
         return
 
-    try:
-        from compat_flask import current_app
-
-        app_ctx_manager = current_app.app_context()
-    except Exception:
-        from app import create_app
-
-        app_ctx_manager = create_app().app_context()
+    if get_telemetry_queue_mode() == "stream":
+        with _telemetry_app_context():
+            cfg = telemetry_stream_settings()
+            redis_conn = redis_async.from_url(redis_url, decode_responses=True)
+            try:
+                await consume_telemetry_stream(
+                    redis_conn,
+                    stream=cfg["stream"],
+                    group=cfg["group"],
+                    batcher=_make_batcher(batch_size, flush_interval_sec),
+                    claim_idle_ms=cfg["claim_idle_ms"],
+                    max_deliveries=cfg["max_deliveries"],
+                    dead_stream=cfg["dead_stream"],
+                )
+            finally:
+                try:
+                    await redis_conn.close()
+                except Exception:
+                    pass
+        return
 
-    with app_ctx_manager:
+    with _telemetry_app_context():
         redis_conn = redis_async.from_url(redis_url, decode_responses=True)
         pubsub = redis_conn.pubsub()
         await pubsub.subscribe(channel)
 
         batch: list[Dict[str, Any]] = []
-        loop = asyncio.get_running_loop()
-        last_flush = loop.time()
+        batcher = _make_batcher(batch_size, flush_interval_sec)
 
         try:
             while True:
@@ -292,13 +402,14 @@ async def consume_telemetry_save_queue(
                         except Exception:
                             pass
 
-                now = loop.time()
-                if batch and (len(batch) >= batch_size or (now - last_flush) >= flush_interval_sec):
+                if batcher.should_flush(len(batch)):
+                    n = len(batch)
+                    t0 = time.monotonic()
                     try:
                         flush_telemetry_batch(batch)
                     finally:
                         batch.clear()
-                        last_flush = now
+                        batcher.record(n, time.monotonic() - t0)
         finally:
             if batch:
                 try:
@@ -317,3 +428,190 @@ async def consume_telemetry_save_queue(
                 await redis_conn.close()
             except Exception:
                 pass
+
+
+def default_consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _entry_time(entry_id: str) -> Optional[datetime]:
+    """Время XADD из ID записи стрима (``<ms>-<seq>``)."""
+    try:
+        ms = int(str(entry_id).split("-", 1)[0])
+        return datetime.fromtimestamp(ms / 1000.0, tz=timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def _entries_to_points(entries: list) -> tuple[list[str], list[Dict[str, Any]]]:
+    """Записи стрима -> точки. Время точки — ``ts`` устройства, без него —
+    время постановки в стрим (из ID записи), а не время чтения consumer'ом."""
+    ids: list[str] = []
+    points: list[Dict[str, Any]] = []
+    for entry_id, fields in entries or []:
+        ids.append(entry_id)
+        raw = (fields or {}).get("payload")
+        if not raw:
+            continue
+        try:
+            payload = json.loads(raw)
+        except Exception:
+            continue
+        if isinstance(payload, dict):
+            norm = _normalize_telemetry_payload(payload, _entry_time(entry_id))
+            if norm is not None:
+                points.append(norm)
+    return ids, points
+
+
+async def _save_stream_entries(redis_conn: Any, stream: str, group: str, entries: list) -> bool:
+    """Сохранить записи стрима одной транзакцией и подтвердить (XACK).
+
+    Если запись в БД упала — не подтверждаем: записи останутся в PEL и будут
+    перечитаны (XAUTOCLAIM) этим или другим consumer'ом; после
+    TELEMETRY_STREAM_MAX_DELIVERIES доставок их убирает `_dead_letter_exhausted`.
+    Битые записи (не JSON / без user_id/lat/lon) подтверждаются сразу, чтобы не зациклиться.
+    """
+    ids, points = _entries_to_points(entries)
+    if not ids:
+        return True
+    if points:
+        try:
+            flush_telemetry_batch(points)
+        except Exception:
+            logger.exception("telemetry stream: flush of %d points failed, leaving %d entries pending", len(points), len(ids))
+            try:
+                from ..extensions import db
+
+                db.session.rollback()
+            except Exception:
+                pass
+            return False
+    await redis_conn.xack(stream, group, *ids)
+    return True
+
+
+async def _dead_letter_exhausted(
+    redis_conn: Any,
+    stream: str,
+    group: str,
+    entries: list,
+    *,
+    max_deliveries: int,
+    dead_stream: str,
+) -> list:
+    """Перенести в dead-letter стрим записи, доставленные больше max_deliveries раз.
+
+    Такие записи (пачка, которая стабильно не сохраняется) иначе
+    перечитывались бы XAUTOCLAIM бесконечно. Запись копируется в
+    ``dead_stream`` (payload + исходный ID + число доставок) и подтверждается.
+    Возвращает оставшиеся записи.
+    """
+    if not entries or max_deliveries <= 0:
+        return entries
+    alive = []
+    for entry_id, fields in entries:
+        try:
+            info = await redis_conn.xpending_range(stream, group, min=entry_id, max=entry_id, count=1)
+            delivered = int(info[0]["times_delivered"]) if info else 0
+        except Exception:
+            logger.debug("telemetry stream: XPENDING %s failed", entry_id, exc_info=True)
+            delivered = 0
+        if delivered <= max_deliveries:
+            alive.append((entry_id, fields))
+            continue
+        try:
+            await redis_conn.xadd(dead_stream, {
+                "payload": (fields or {}).get("payload") or "",
+                "source_id": entry_id,
+                "deliveries": delivered,
+            })
+            await redis_conn.xack(stream, group, entry_id)
+            logger.warning(
+                "telemetry stream: entry %s moved to %s after %d deliveries", entry_id, dead_stream, delivered
+            )
+        except Exception:
+            logger.warning("telemetry stream: dead-lettering %s failed", entry_id, exc_info=True)
+    return alive
+
+
+async def consume_telemetry_stream(
+    redis_conn: Any,
+    *,
+    stream: str = DEFAULT_TELEMETRY_STREAM,
+    group: str = DEFAULT_TELEMETRY_GROUP,
+    consumer: Optional[str] = None,
+    batch_size: int = 100,
+    batcher: Any = None,
+    block_ms: int = 1000,
+    claim_idle_ms: int = 60_000,
+    reclaim_every_sec: float = 15.0,
+    max_deliveries: int = 5,
+    dead_stream: Optional[str] = None,
+    stop: Optional[asyncio.Event] = None,
+) -> None:
+    """Consumer group reader for the telemetry stream (XREADGROUP + XACK).
+
+    Каждый процесс читает своей частью группы (consumer = host-pid), так что
+    несколько процессов делят запись. При старте дочитываются собственные
+    неподтверждённые записи, периодически XAUTOCLAIM забирает записи упавших
+    consumer'ов, простаивающие дольше claim_idle_ms (курсор XAUTOCLAIM
+    сохраняется между вызовами, так что PEL обходится целиком). Записи,
+    доставленные больше ``max_deliveries`` раз, уходят в ``dead_stream``
+    (по умолчанию ``<stream>:dead``) и подтверждаются. С ``batcher``
+    (tracker.bulk_insert.AdaptiveBatcher) COUNT чтения подстраивается под поток.
+    Нужен app context (flush_telemetry_batch пишет через db.session).
+    """
+    consumer = consumer or default_consumer_name()
+    dead_stream = dead_stream or f"{stream}:dead"
+
+    async def _retry(entries: list) -> bool:
+        entries = await _dead_letter_exhausted(
+            redis_conn, stream, group, entries, max_deliveries=max_deliveries, dead_stream=dead_stream
+        )
+        return await _save_stream_entries(redis_conn, stream, group, entries)
+
+    try:
+        await redis_conn.xgroup_create(stream, group, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+    # 1) свои pending после рестарта
+    while True:
+        resp = await redis_conn.xreadgroup(group, consumer, {stream: "0"}, count=batch_size)
+        entries = resp[0][1] if resp else []
+        if not entries:
+            break
+        if not await _retry(entries):
+            break  # БД недоступна — записи останутся pending, заберёт reclaim
+
+    loop = asyncio.get_running_loop()
+    next_reclaim = loop.time()
+    reclaim_cursor = "0-0"
+    while stop is None or not stop.is_set():
+        # 2) зависшие записи (упавших consumer'ов и свои несохранённые)
+        if loop.time() >= next_reclaim:
+            next_reclaim = loop.time() + reclaim_every_sec
+            try:
+                res = await redis_conn.xautoclaim(
+                    stream, group, consumer, min_idle_time=claim_idle_ms, start_id=reclaim_cursor, count=batch_size
+                )
+                # следующий вызов продолжает с курсора; "0-0" — PEL пройден, начать сначала
+                reclaim_cursor = str(res[0]) if res and res[0] else "0-0"
+                claimed = res[1] if res and len(res) > 1 else []
+                if claimed:
+                    logger.info("telemetry stream: reclaimed %d idle entries", len(claimed))
+                    await _retry(claimed)
+            except Exception:
+                logger.debug("telemetry stream: XAUTOCLAIM failed", exc_info=True)
+
+        # 3) новые записи
+        count = batcher.batch_size if batcher is not None else batch_size
+        resp = await redis_conn.xreadgroup(group, consumer, {stream: ">"}, count=count, block=block_ms)
+        entries = resp[0][1] if resp else []
+        if entries:
+            t0 = time.monotonic()
+            await _save_stream_entries(redis_conn, stream, group, entries)
+            if batcher is not None:
+                batcher.record(len(entries), time.monotonic() - t0)
@@ -0,0 +1,180 @@
+"""Склейка событий местоположения перед рассылкой в WS.
+
+Устройство на 1 Гц GNSS + Wi-Fi оценки даёт несколько перемещений маркера
+в секунду, и каждое раньше уходило в каждый браузер отдельным сообщением.
+Здесь события местоположения (`LOCATION_EVENTS`) не рассылаются сразу:
+за тик (REALTIME_COALESCE_TICK_MS, 250–1000 мс) хранится только последняя
+позиция на пользователя/устройство, а по тику уходит один пакетный кадр
+
+    {"event": "positions", "data": {"items": [{"event": "tracking_point", "data": {...}}, ...]}}
+
+Клиенты (static/js/realtime.js, react useWebSocket) разворачивают кадр
+обратно в исходные события, так что подписчики `tracking_point` и т.п. не
+меняются.
+
+Метрики (observability.metrics): ``realtime_position_events_in_total``,
+``realtime_position_events_coalesced_total``, ``realtime_position_frames_out_total``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .fanout import LAST_VALUE_EVENTS, config_value
+
+
+log = logging.getLogger(__name__)
+
+POSITIONS_EVENT = "positions"
+
+LOCATION_EVENTS = LAST_VALUE_EVENTS
+
+# ключ сущности: первый непустой из полей
+_ENTITY_FIELDS = ("device_id", "user_id", "agent_id")
+
+DEFAULT_TICK_MS = 250
+MIN_TICK_MS = 250
+MAX_TICK_MS = 1000
+
+Item = Tuple[str, Dict[str, Any]]
+
+
+def _inc(name: str, value: int = 1) -> None:
+    try:
+        from ..observability.metrics import inc_counter
+
+        inc_counter(name, value)
+    except Exception:
+        pass
+
+
+def tick_seconds() -> float:
+    """Длительность тика из конфига; 0 — склейка выключена."""
+    try:
+        ms = int(config_value("REALTIME_COALESCE_TICK_MS", DEFAULT_TICK_MS))
+    except (TypeError, ValueError):
+        ms = DEFAULT_TICK_MS
+    if ms <= 0:
+        return 0.0
+    return min(MAX_TICK_MS, max(MIN_TICK_MS, ms)) / 1000.0
+
+
+def entity_key(event: str, data: Any) -> Optional[str]:
+    """Ключ буфера: событие + сущность, как fanout.coalesce_key.
+
+    Разные события одной сущности (``tracking_point`` и ``telemetry_update``
+    одного пользователя) не перетирают друг друга.
+    """
+    if not isinstance(data, dict):
+        return None
+    for field in _ENTITY_FIELDS:
+        val = data.get(field)
+        if val not in (None, ""):
+            return f"{event}:{field}:{val}"
+    return None
+
+
+class PositionCoalescer:
+    """Буфер «последняя позиция на сущность» + тик-задача, отдающая пакет.
+
+    ``emit(items)`` вызывается раз за тик со списком (event, data) —
+    в порядке первого появления сущности в тике.
+    """
+
+    def __init__(self, emit: Callable[[List[Item]], Any], *, tick: float) -> None:
+        self.tick = float(tick)
+        self._emit = emit
+        self._pending: Dict[str, Item] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.events_in = 0
+        self.events_coalesced = 0
+        self.frames_out = 0
+        self.items_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.tick > 0
+
+    def offer(self, event: str, data: Any) -> bool:
+        """Забрать событие в буфер. False — событие не позиционное, шлём как есть."""
+        if not self.enabled or event not in LOCATION_EVENTS:
+            return False
+        key = entity_key(event, data)
+        if key is None:
+            return False
+        self.events_in += 1
+        _inc("realtime_position_events_in_total")
+        if key in self._pending:
+            self.events_coalesced += 1
+            _inc("realtime_position_events_coalesced_total")
+        # dict сохраняет позицию ключа при перезаписи — порядок первого появления
+        self._pending[key] = (event, data)
+        return True
+
+    def drain(self) -> List[Item]:
+        if not self._pending:
+            return []
+        items = list(self._pending.values())
+        self._pending.clear()
+        return items
+
+    async def flush(self) -> int:
+        items = self.drain()
+        if not items:
+            return 0
+        self.frames_out += 1
+        self.items_out += len(items)
+        _inc("realtime_position_frames_out_total")
+        res = self._emit(items)
+        if inspect.isawaitable(res):
+            await res
+        return len(items)
+
+    def start(self) -> "PositionCoalescer":
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.debug("positions flush failed", exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tick_ms": int(self.tick * 1000),
+            "pending": len(self._pending),
+            "events_in": self.events_in,
+            "events_coalesced": self.events_coalesced,
+            "frames_out": self.frames_out,
+            "items_out": self.items_out,
+        }
+
+
+def positions_frame(items: List[Item]) -> Dict[str, Any]:
+    return {"items": [{"event": e, "data": d} for e, d in items]}
+
+
+def deliver_positions(index: Any, items: List[Item]) -> int:
+    """Разослать кадр positions через индекс подписок (realtime.routing).
+
+    Клиенты с одинаковым набором позиций получают одну и ту же строку —
+    JSON собирается один раз на группу. Возвращает число отправленных кадров.
+    """
+    sent = 0
+    for idx, clients in index.route_batch(items).items():
+        frame = positions_frame([items[i] for i in idx])
+        msg = json.dumps({"event": POSITIONS_EVENT, "data": frame}, ensure_ascii=False)
+        for cq in clients:
+            if cq.offer(msg):
+                sent += 1
+    return sent
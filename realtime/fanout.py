@@ -0,0 +1,278 @@
+"""Неблокирующая рассылка: у каждого WS-клиента своя очередь и writer-задача.
+
+Раньше `_broadcast` делал ``await ws.send(...)`` по клиентам по очереди, и
+один медленный клиент (мобильный на плохой сети) задерживал `map_updates`
+для всех диспетчеров. Теперь событие сериализуется один раз, строка кладётся
+в ограниченную очередь каждого клиента (без await), а отправку делает
+отдельная задача на соединение.
+
+Политика при переполнении очереди (REALTIME_OVERFLOW_POLICY):
+
+- ``drop_oldest`` — выкинуть самое старое сообщение;
+- ``coalesce``    — заменить ещё не отправленное сообщение о той же сущности
+  (то же событие + user_id/device_id/id) новым, иначе как drop_oldest.
+  Склеиваются только события «важно последнее значение»
+  (`LAST_VALUE_EVENTS` — местоположение); сообщения чата, тревоги и прочие
+  события-факты не заменяют друг друга, даже если у них общий user_id;
+- ``disconnect``  — закрыть соединение (клиент переподключится и получит
+  свежее состояние через REST).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+log = logging.getLogger(__name__)
+
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_COALESCE = "coalesce"
+POLICY_DISCONNECT = "disconnect"
+POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_DISCONNECT)
+
+DEFAULT_QUEUE_SIZE = 256
+
+# 1013 = "Try Again Later": клиент не успевает читать поток
+CLOSE_CODE_SLOW_CONSUMER = 1013
+
+# поля, по которым событие относится к сущности (для coalesce)
+_ENTITY_FIELDS = ("user_id", "device_id", "id")
+
+# события, где новое значение отменяет старое (позиция маркера); их же
+# склеивает по тику realtime.coalesce
+LAST_VALUE_EVENTS = frozenset({
+    "tracking_point",
+    "AGENT_LOCATION_UPDATE",
+    "telemetry_update",
+    "duty_location_update",
+})
+
+CoalesceKey = Optional[Tuple[str, str]]
+
+
+def config_value(name: str, default: Any) -> Any:
+    try:
+        from compat_flask import current_app
+
+        val = current_app.config.get(name)
+        if val not in (None, ""):
+            return val
+    except Exception:
+        pass
+    return os.getenv(name) or default
+
+
+def queue_settings() -> Tuple[int, str]:
+    """(размер очереди, политика) из конфига Flask или окружения."""
+    try:
+        size = int(config_value("REALTIME_CLIENT_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+    except (TypeError, ValueError):
+        size = DEFAULT_QUEUE_SIZE
+    policy = str(config_value("REALTIME_OVERFLOW_POLICY", POLICY_DROP_OLDEST)).strip().lower()
+    if policy not in POLICIES:
+        policy = POLICY_DROP_OLDEST
+    return max(1, size), policy
+
+
+def coalesce_key(event: str, data: Any) -> CoalesceKey:
+    """Ключ сущности события: (event, id) или None, если склеивать нечего.
+
+    None и для событий не из LAST_VALUE_EVENTS: каждое из них доставляется
+    само по себе.
+    """
+    if event not in LAST_VALUE_EVENTS or not isinstance(data, dict):
+        return None
+    for field in _ENTITY_FIELDS:
+        val = data.get(field)
+        if val not in (None, ""):
+            return (str(event), f"{field}:{val}")
+    return None
+
+
+class ClientQueue:
+    """Исходящая очередь одного соединения + writer-задача.
+
+    ``send`` — корутина отправки строки (``ws.send_text`` для starlette,
+    ``ws.send`` для websockets). ``on_close`` вызывается один раз, когда
+    клиент отключён (ошибка отправки или политика ``disconnect``).
+    """
+
+    def __init__(
+        self,
+        ws: Any,
+        send: Callable[[str], Awaitable[Any]],
+        *,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        policy: str = POLICY_DROP_OLDEST,
+        on_close: Optional[Callable[["ClientQueue"], Any]] = None,
+    ) -> None:
+        self.ws = ws
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy if policy in POLICIES else POLICY_DROP_OLDEST
+        self._send = send
+        self._on_close = on_close
+        # элементы: [msg, key, enqueued_at] — список, чтобы coalesce менял на месте
+        self._queue: Deque[List[Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.close_reason: Optional[str] = None
+
+        self.connected_at = time.time()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    # --- producer side (вызывается из event-loop, без await) ---
+
+    def offer(self, msg: str, key: CoalesceKey = None) -> bool:
+        """Поставить сообщение в очередь. False — клиент закрыт/отключается."""
+        if self.closed:
+            return False
+        q = self._queue
+        if len(q) >= self.maxsize:
+            if self.policy == POLICY_DISCONNECT:
+                self.dropped += 1
+                self._start_close("slow_consumer")
+                return False
+            if self.policy == POLICY_COALESCE and key is not None:
+                for item in reversed(q):
+                    if item[1] == key:
+                        # позицию в очереди сохраняем, время — от старого сообщения,
+                        # чтобы lag честно показывал, сколько клиент отстаёт
+                        item[0] = msg
+                        self.coalesced += 1
+                        return True
+            q.popleft()
+            self.dropped += 1
+        q.append([msg, key, time.monotonic()])
+        if len(q) > self.max_depth:
+            self.max_depth = len(q)
+        self._wakeup.set()
+        return True
+
+    # --- writer ---
+
+    def start(self) -> "ClientQueue":
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._writer())
+        return self
+
+    async def _writer(self) -> None:
+        q = self._queue
+        while not self.closed:
+            if not q:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            msg, _key, enqueued_at = q.popleft()
+            try:
+                await self._send(msg)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._mark_closed("send_error")
+                return
+            lag = (time.monotonic() - enqueued_at) * 1000.0
+            self.sent += 1
+            self.last_lag_ms = lag
+            if lag > self.max_lag_ms:
+                self.max_lag_ms = lag
+        if self.close_reason == "slow_consumer":
+            try:
+                await self.ws.close(code=CLOSE_CODE_SLOW_CONSUMER, reason="slow consumer")
+            except Exception:
+                pass
+
+    def _start_close(self, reason: str) -> None:
+        self._mark_closed(reason)
+        self._queue.clear()
+        # writer проснётся, увидит closed и закроет сокет
+        self._wakeup.set()
+
+    def _mark_closed(self, reason: str) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason
+        if self._on_close is not None:
+            try:
+                self._on_close(self)
+            except Exception:
+                log.debug("on_close callback failed", exc_info=True)
+
+    async def aclose(self) -> None:
+        """Остановить writer (клиент отключился сам)."""
+        self.closed = True
+        self._queue.clear()
+        task = self._task
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+
+    # --- диагностика ---
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def lag_ms(self) -> float:
+        """Возраст самого старого неотправленного сообщения (мс)."""
+        q = self._queue
+        if not q:
+            return 0.0
+        try:
+            return (time.monotonic() - q[0][2]) * 1000.0
+        except IndexError:
+            return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "client": str(getattr(self.ws, "sid", None) or id(self.ws)),
+            "user_id": getattr(self.ws, "user_id", None),
+            "queued": self.depth,
+            "max_queued": self.max_depth,
+            "lag_ms": round(self.lag_ms(), 1),
+            "last_lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "connected_sec": int(time.time() - self.connected_at),
+        }
+
+
+def fanout(queues: List[ClientQueue], event: str, data: Dict[str, Any], msg: str) -> int:
+    """Разложить уже сериализованное сообщение по очередям. Возвращает число принявших."""
+    key = coalesce_key(event, data)
+    accepted = 0
+    for cq in queues:
+        if cq.offer(msg, key):
+            accepted += 1
+    return accepted
+
+
+def summarize(queues: List[ClientQueue]) -> Dict[str, Any]:
+    """Суммарные счётчики + по-клиентная разбивка для get_stats()."""
+    clients = [cq.stats() for cq in queues]
+    return {
+        "totals": {
+            "queued": sum(c["queued"] for c in clients),
+            "sent": sum(c["sent"] for c in clients),
+            "dropped": sum(c["dropped"] for c in clients),
+            "coalesced": sum(c["coalesced"] for c in clients),
+            "max_lag_ms": max((c["lag_ms"] for c in clients), default=0.0),
+        },
+        "clients": clients,
+    }
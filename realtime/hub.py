@@ -5,63 +5,158 @@
 
 Flask-обработчики (WSGI слой) остаются синхронными, поэтому для рассылки
 событий из них используем `asyncio.run_coroutine_threadsafe` в loop ASGI.
+
+Рассылка не ждёт клиентов: событие сериализуется один раз и кладётся в
+ограниченную очередь каждого соединения, отправляет её writer-задача
+клиента (см. `fanout.py`). Получатели выбираются через индекс подписок
+(топики / bbox, см. `routing.py`): ASGI-эндпоинт ``/ws`` после accept и
+проверки токена отдаёт соединение в `serve`, чей цикл приёма передаёт
+сообщения клиента в `handle_message`. События местоположения склеиваются
+по тику в пакетные кадры ``positions`` (см. `coalesce.py`).
 """
 
 from __future__ import annotations
 
 import asyncio
 import json
-from typing import Any, Dict, Set
+import sys
+from typing import Any, Dict
+
+from .coalesce import PositionCoalescer, deliver_positions, tick_seconds
+from .fanout import ClientQueue, fanout, queue_settings, summarize
+from .routing import SubscriptionIndex, apply_control, parse_control
 
 
 # Важно: тип не импортируем жёстко, чтобы не требовать starlette при WSGI-запуске.
 AsgiWebSocket = Any
 
 
-_clients: Set[AsgiWebSocket] = set()
+_clients: Dict[AsgiWebSocket, ClientQueue] = {}
 _asgi_loop: asyncio.AbstractEventLoop | None = None
+_router = SubscriptionIndex()
+_coalescer: PositionCoalescer | None = None
 
 # Диагностика: простой счётчик подключений.
 # Это удобнее, чем читать len(_clients) из WSGI-потока.
 _client_count: int = 0
 
 
+def _emit_positions(items) -> None:
+    deliver_positions(_router, items)
+
+
 async def register(ws: AsgiWebSocket) -> None:
-    global _asgi_loop, _client_count
+    global _asgi_loop, _client_count, _coalescer
     if _asgi_loop is None:
         _asgi_loop = asyncio.get_running_loop()
-    _clients.add(ws)
+    if _coalescer is None:
+        _coalescer = PositionCoalescer(_emit_positions, tick=tick_seconds())
+    _coalescer.start()
+    size, policy = queue_settings()
+    cq = ClientQueue(ws, ws.send_text, maxsize=size, policy=policy, on_close=_on_client_closed).start()
+    _clients[ws] = cq
+    _router.add(cq)
+    _client_count = len(_clients)
+
+
+def _on_client_closed(cq: ClientQueue) -> None:
+    # ошибка отправки или политика disconnect — убираем из рассылки сразу
+    global _client_count
+    if _clients.get(cq.ws) is cq:
+        del _clients[cq.ws]
+    _router.remove(cq)
     _client_count = len(_clients)
 
 
 async def unregister(ws: AsgiWebSocket) -> None:
     global _client_count
-    _clients.discard(ws)
+    cq = _clients.pop(ws, None)
     _client_count = len(_clients)
+    if cq is not None:
+        _router.remove(cq)
+        await cq.aclose()
+
+
+async def handle_message(ws: AsgiWebSocket, raw: Any) -> bool:
+    """Обработать управляющее сообщение клиента (subscribe/unsubscribe).
+
+    Возвращает True, если сообщение было управляющим. В ответ клиенту
+    уходит событие ``subscribed`` с текущей подпиской.
+    """
+    cq = _clients.get(ws)
+    if cq is None:
+        return False
+    try:
+        msg = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+    except (TypeError, ValueError):
+        return False
+    control = parse_control(msg)
+    if control is None:
+        return False
+    sub = apply_control(_router, cq, *control)
+    cq.offer(json.dumps({"event": "subscribed", "data": sub}, ensure_ascii=False))
+    return True
+
+
+async def serve(ws: AsgiWebSocket) -> None:
+    """Обслужить принятое ASGI WebSocket-соединение до отключения клиента.
+
+    Регистрирует клиента в рассылке, читает входящие сообщения
+    (subscribe/unsubscribe — в `handle_message`, остальное, например
+    текстовый ``ping``, игнорируется) и снимает регистрацию при выходе.
+    """
+    await register(ws)
+    try:
+        while True:
+            try:
+                raw = await ws.receive_text()
+            except Exception:
+                # WebSocketDisconnect (starlette) или обрыв соединения
+                break
+            await handle_message(ws, raw)
+    finally:
+        await unregister(ws)
 
 
 def get_stats() -> Dict[str, Any]:
-    """Снимок состояния realtime-хаба (для админ-диагностики)."""
-    return {
+    """Снимок состояния realtime-хаба (для админ-диагностики).
+
+    Помимо числа клиентов — очереди отправки: totals и по каждому клиенту
+    глубина очереди, lag (возраст самого старого неотправленного сообщения),
+    счётчики sent/dropped/coalesced. Если в процессе поднят standalone
+    WS-сервер (app.sockets), его клиенты — в ключе ``standalone``.
+    """
+    size, policy = queue_settings()
+    stats: Dict[str, Any] = {
         "ws_clients": int(_client_count),
         "asgi_loop": bool(_asgi_loop is not None),
+        "queue_size": size,
+        "overflow_policy": policy,
     }
+    stats.update(summarize(list(_clients.values())))
+    stats["routing"] = _router.stats()
+    if _coalescer is not None:
+        stats["positions"] = _coalescer.stats()
+    # без импорта: standalone-сервер тянет websockets, в ASGI-режиме он не нужен
+    sockets = sys.modules.get(__name__.rsplit(".", 2)[0] + ".sockets")
+    if sockets is not None and getattr(sockets, "ws_loop", None) is not None:
+        try:
+            stats["standalone"] = sockets.get_stats()
+        except Exception:
+            pass
+    return stats
 
 
 async def _broadcast(event: str, data: Dict[str, Any]) -> None:
     if not _clients:
         return
+    if _coalescer is not None and _coalescer.offer(event, data):
+        return
+    targets = _router.route(event, data)
+    if not targets:
+        return
     msg = json.dumps({"event": event, "data": data}, ensure_ascii=False)
-    dead = set()
-    for ws in list(_clients):
-        try:
-            # starlette.WebSocket: send_text
-            await ws.send_text(msg)
-        except Exception:
-            dead.add(ws)
-    for ws in dead:
-        _clients.discard(ws)
-
+    fanout(list(targets), event, data, msg)
 
 
 async def broadcast(event: str, data: Dict[str, Any]) -> None:
@@ -0,0 +1,301 @@
+"""Подписки WS-клиентов на топики и bbox + индекс маршрутизации событий.
+
+Без подписок каждый браузер получал все события страны: все сообщения
+chat2, все точки трекера, все обновления инцидентов. Теперь клиент может
+прислать
+
+    {"event": "subscribe", "data": {"topics": ["tracker", "chat2:5"],
+                                    "bbox": [min_lon, min_lat, max_lon, max_lat]}}
+    {"event": "unsubscribe", "data": {"topics": ["chat2:5"]}}
+
+и хаб отправит ему только интересующие события.
+
+Правила:
+
+- топики события выводятся из имени и данных (`event_topics`):
+  ``chat2:<channel_id>``, ``incident:<id>`` (+ ``incidents``), ``tracker``;
+  события без топика (pending, адреса, алерты, SOS) — общие, идут всем,
+  без фильтра по bbox: тревога вне viewport диспетчера не должна теряться;
+- клиент, ещё не приславший subscribe, получает всё (старые клиенты не
+  ломаются);
+- bbox ограничивает гео-события: точка вне viewport клиенту не уходит;
+  subscribe только с bbox (без topics) = «все топики внутри viewport».
+
+Индекс: topic -> клиенты и сетка ячеек (GRID_DEG градусов) -> клиенты с
+bbox, чтобы маршрутизация события стоила O(подписчиков топика), а не
+O(всех соединений).
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+ALL_TOPICS = "*"
+
+# размер ячейки сетки bbox-индекса (градусы) и предел ячеек на один bbox:
+# больше — считаем, что клиент смотрит «на всю страну», bbox не ограничивает
+GRID_DEG = 0.5
+MAX_BBOX_CELLS = 4096
+
+MAX_TOPICS_PER_CLIENT = 256
+
+_TRACKER_EVENTS = {"checkin", "positions"}
+# sos_* сюда не входят: тревоги идут всем, независимо от bbox
+_TRACKER_PREFIXES = ("tracking_", "tracker_", "shift_", "break_")
+
+BBox = Tuple[float, float, float, float]
+Point = Tuple[float, float]
+
+
+def _as_float(v: Any) -> Optional[float]:
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if math.isfinite(f) else None
+
+
+def event_point(data: Any) -> Optional[Point]:
+    """(lon, lat) события, если оно гео-привязано."""
+    if not isinstance(data, dict):
+        return None
+    lat, lon = _as_float(data.get("lat")), _as_float(data.get("lon"))
+    if lat is None or lon is None:
+        return None
+    return (lon, lat)
+
+
+def event_topics(event: str, data: Any) -> List[str]:
+    """Топики события. Пустой список — событие общее (уходит всем)."""
+    if not isinstance(data, dict):
+        data = {}
+    if event.startswith("chat2_"):
+        cid = data.get("channel_id")
+        return [f"chat2:{cid}"] if cid not in (None, "") else []
+    if event.startswith("incident_"):
+        iid = data.get("id") or data.get("incident_id")
+        return ["incidents", f"incident:{iid}"] if iid not in (None, "") else ["incidents"]
+    if event in _TRACKER_EVENTS or event.startswith(_TRACKER_PREFIXES):
+        return ["tracker"]
+    return []
+
+
+def parse_bbox(raw: Any) -> Optional[BBox]:
+    """[min_lon, min_lat, max_lon, max_lat] (список или "a,b,c,d") -> кортеж или None."""
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    if not isinstance(raw, (list, tuple)) or len(raw) != 4:
+        return None
+    vals = [_as_float(v) for v in raw]
+    if any(v is None for v in vals):
+        return None
+    min_lon, min_lat, max_lon, max_lat = vals  # type: ignore[misc]
+    min_lat, max_lat = max(-90.0, min_lat), min(90.0, max_lat)
+    min_lon, max_lon = max(-180.0, min_lon), min(180.0, max_lon)
+    if min_lon > max_lon or min_lat > max_lat:
+        return None
+    return (min_lon, min_lat, max_lon, max_lat)
+
+
+def _cell(lon: float, lat: float) -> Tuple[int, int]:
+    return (int(math.floor(lon / GRID_DEG)), int(math.floor(lat / GRID_DEG)))
+
+
+def _bbox_cells(bbox: BBox) -> Optional[List[Tuple[int, int]]]:
+    x0, y0 = _cell(bbox[0], bbox[1])
+    x1, y1 = _cell(bbox[2], bbox[3])
+    if (x1 - x0 + 1) * (y1 - y0 + 1) > MAX_BBOX_CELLS:
+        return None
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def _contains(bbox: BBox, pt: Point) -> bool:
+    return bbox[0] <= pt[0] <= bbox[2] and bbox[1] <= pt[1] <= bbox[3]
+
+
+class SubscriptionIndex:
+    """Индекс подписок. Клиент — любой hashable (в хабе это ClientQueue).
+
+    Все методы вызываются из event-loop сервера (без блокировок);
+    `stats()` безопасно читать из другого потока.
+    """
+
+    def __init__(self) -> None:
+        self._clients: Set[Hashable] = set()
+        self._legacy: Set[Hashable] = set()
+        self._topics: Dict[Hashable, Set[str]] = {}
+        self._by_topic: Dict[str, Set[Hashable]] = {}
+        self._bbox: Dict[Hashable, BBox] = {}
+        self._bbox_cells: Dict[Hashable, List[Tuple[int, int]]] = {}
+        self._grid: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self.routed = 0
+        self.deliveries = 0
+        self.skipped = 0
+
+    # --- membership ---
+
+    def add(self, client: Hashable) -> None:
+        self._clients.add(client)
+        self._legacy.add(client)
+
+    def remove(self, client: Hashable) -> None:
+        self._clients.discard(client)
+        self._legacy.discard(client)
+        for topic in self._topics.pop(client, ()):
+            self._unindex_topic(client, topic)
+        self._clear_bbox(client)
+
+    def reset(self, client: Hashable) -> None:
+        """Снять все подписки: клиент снова получает все события."""
+        if client in self._clients:
+            self.remove(client)
+            self.add(client)
+
+    def subscribe(self, client: Hashable, topics: Iterable[Any] = (), bbox: Any = None, *, set_bbox: bool = False) -> Dict[str, Any]:
+        """Добавить топики; если set_bbox — заменить bbox (None снимает)."""
+        if client not in self._clients:
+            return {}
+        self._legacy.discard(client)
+        current = self._topics.setdefault(client, set())
+        for t in topics or ():
+            t = str(t).strip()
+            if not t or t in current or len(current) >= MAX_TOPICS_PER_CLIENT:
+                continue
+            current.add(t)
+            self._by_topic.setdefault(t, set()).add(client)
+        if set_bbox:
+            self._clear_bbox(client)
+            parsed = parse_bbox(bbox)
+            if parsed is not None:
+                self._set_bbox(client, parsed)
+        return self.subscription(client)
+
+    def unsubscribe(self, client: Hashable, topics: Iterable[Any] = ()) -> Dict[str, Any]:
+        current = self._topics.get(client)
+        if current:
+            for t in topics or ():
+                t = str(t).strip()
+                if t in current:
+                    current.discard(t)
+                    self._unindex_topic(client, t)
+        return self.subscription(client)
+
+    def subscription(self, client: Hashable) -> Dict[str, Any]:
+        bbox = self._bbox.get(client)
+        return {
+            "topics": sorted(self._topics.get(client, ())),
+            "bbox": list(bbox) if bbox else None,
+            "all": client in self._legacy,
+        }
+
+    # --- routing ---
+
+    def route(self, event: str, data: Any) -> Set[Hashable]:
+        """Клиенты, которым нужно отправить событие."""
+        self.routed += 1
+        topics = event_topics(event, data)
+        if not topics:
+            targets = set(self._clients)
+        else:
+            targets = set(self._legacy)
+            for t in topics:
+                subs = self._by_topic.get(t)
+                if subs:
+                    targets |= subs
+            wildcard = self._by_topic.get(ALL_TOPICS)
+            if wildcard:
+                targets |= wildcard
+            pt = event_point(data)
+            if pt is not None and self._bbox:
+                inside = {c for c in self._grid.get(_cell(*pt), ()) if _contains(self._bbox[c], pt)}
+                targets = {c for c in targets if c not in self._bbox or c in inside}
+        self.deliveries += len(targets)
+        self.skipped += len(self._clients) - len(targets)
+        return targets
+
+    def route_batch(self, items: List[Tuple[str, Any]]) -> Dict[Tuple[int, ...], List[Hashable]]:
+        """Маршрутизация пакета событий (кадр positions).
+
+        Возвращает {индексы событий: клиенты}: клиенты с одинаковым набором
+        событий (обычно все без bbox) получают один и тот же кадр, поэтому
+        сериализовать его нужно один раз на группу, а не на клиента.
+        """
+        per_client: Dict[Hashable, List[int]] = {}
+        for i, (event, data) in enumerate(items):
+            for c in self.route(event, data):
+                per_client.setdefault(c, []).append(i)
+        groups: Dict[Tuple[int, ...], List[Hashable]] = {}
+        for c, idx in per_client.items():
+            groups.setdefault(tuple(idx), []).append(c)
+        return groups
+
+    # --- internals ---
+
+    def _unindex_topic(self, client: Hashable, topic: str) -> None:
+        subs = self._by_topic.get(topic)
+        if subs is not None:
+            subs.discard(client)
+            if not subs:
+                del self._by_topic[topic]
+
+    def _set_bbox(self, client: Hashable, bbox: BBox) -> None:
+        cells = _bbox_cells(bbox)
+        if cells is None:
+            return  # слишком крупный viewport — без ограничения
+        self._bbox[client] = bbox
+        self._bbox_cells[client] = cells
+        for cell in cells:
+            self._grid.setdefault(cell, set()).add(client)
+        if not self._topics.get(client):
+            self.subscribe(client, [ALL_TOPICS])
+
+    def _clear_bbox(self, client: Hashable) -> None:
+        self._bbox.pop(client, None)
+        for cell in self._bbox_cells.pop(client, ()):
+            subs = self._grid.get(cell)
+            if subs is not None:
+                subs.discard(client)
+                if not subs:
+                    del self._grid[cell]
+
+    # --- диагностика ---
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients_all_events": len(self._legacy),
+            "topics": len(self._by_topic),
+            "bbox_clients": len(self._bbox),
+            "events_routed": self.routed,
+            "deliveries": self.deliveries,
+            "deliveries_skipped": self.skipped,
+        }
+
+
+def parse_control(msg: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Разобрать управляющее сообщение клиента (subscribe/unsubscribe)."""
+    if not isinstance(msg, dict):
+        return None
+    event = msg.get("event")
+    if event not in ("subscribe", "unsubscribe"):
+        return None
+    data = msg.get("data")
+    return event, data if isinstance(data, dict) else {}
+
+
+def apply_control(index: SubscriptionIndex, client: Hashable, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Применить subscribe/unsubscribe и вернуть текущую подписку клиента."""
+    topics = data.get("topics") or []
+    if isinstance(topics, str):
+        topics = [topics]
+    if event == "unsubscribe":
+        if data.get("all"):
+            index.reset(client)
+            return index.subscription(client)
+        if "bbox" in data:
+            # снять viewport (и неявную подписку «все топики внутри bbox»)
+            index.subscribe(client, (), None, set_bbox=True)
+            topics = list(topics) + [ALL_TOPICS]
+        return index.unsubscribe(client, topics)
+    return index.subscribe(client, topics, data.get("bbox"), set_bbox="bbox" in data)
@@ -3,37 +3,120 @@
 Usage:
     ok, info = check_rate_limit(bucket="login", ident=remote_ip, limit=10, window_seconds=60)
     if not ok: return jsonify(error="rate_limited", **info), 429
+
+Several limits at once (all-or-nothing, e.g. per sender + per channel + global):
+    ok, info, rule = check_rate_limits([RateRule("chat2_send", sender, 20, 60), ...])
+
+Semantics: sliding window counter. Each (bucket, ident) keeps the count of
+the current and the previous fixed window; the estimate is
+``prev * (share of the previous window still inside the sliding window) + cur``.
+Memory is O(1) per key and there is no burst of 2x limit at window edges.
+Rejected requests are not counted.
+
+Redis: one process-wide connection pool per URL and one round trip per
+check (a Lua script, EVALSHA), whatever the number of rules. The two keys
+of a rule share a hash tag, so single-rule checks also work on Redis
+Cluster; multi-rule checks need all their keys on one node. A rejection is
+remembered in the process until the next request can fit, so a flooding
+client does not reach Redis at all. When Redis is unreachable we fall back
+to the in-process counter and do not retry for REDIS_RETRY_SEC.
+
+In-process state is bounded: expired windows are dropped by a time wheel
+(one slot per second, O(1) amortized per check) and each store is capped
+at MAX_MEM_KEYS entries (oldest first).
+
+Local batching (RATE_LIMIT_LOCAL_BATCH=N): a check reserves up to N units
+from Redis at once and the next requests of this process are served from
+the reservation without a Redis call. Reserved units count as used, so the
+cluster-wide limit is never exceeded; the cost is that an idle reservation
+can reject other processes a bit earlier. Batching only applies to
+single-rule checks with ``limit >= 10 * N`` — small limits (login) stay exact.
 """
 
 from __future__ import annotations
 
+import math
+import threading
 import time
 from dataclasses import dataclass
-from typing import Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from compat_flask import current_app
 
+from ..observability.metrics import inc_counter
+
 try:
     import redis
 except Exception:  # pragma: no cover
     redis = None  # type: ignore
 
-_mem: Dict[str, Tuple[int, float]] = {}  # key -> (count, expires_at)
-_cleanup_counter = 0
-_CLEANUP_EVERY = 100
+REDIS_RETRY_SEC = 5.0
+DEFAULT_POOL_SIZE = 50
+SOCKET_TIMEOUT = 0.25
+MAX_MEM_KEYS = 100_000
 
+# KEYS: (current window, previous window) per rule.
+# ARGV: units wanted, minimum units, then per rule: limit, weight of the previous window, ttl_ms.
+# Grants min(wanted, available over all rules) to every rule if that is at least
+# the minimum (a partial grant is a batch reservation), otherwise nothing.
+# Returns {granted, cur1, prev1, cur2, prev2, ...}.
+SLIDING_WINDOW_LUA = """
+local wanted = tonumber(ARGV[1])
+local minimum = tonumber(ARGV[2])
+local counts = {}
+local granted = wanted
+for i = 1, #KEYS / 2 do
+  local cur = tonumber(redis.call('GET', KEYS[2 * i - 1]) or '0')
+  local prev = tonumber(redis.call('GET', KEYS[2 * i]) or '0')
+  counts[2 * i - 1] = cur
+  counts[2 * i] = prev
+  local available = math.floor(tonumber(ARGV[3 * i]) - prev * tonumber(ARGV[3 * i + 1]) - cur)
+  if available < granted then
+    granted = available
+  end
+end
+if granted < minimum then
+  return {0, unpack(counts)}
+end
+for i = 1, #KEYS / 2 do
+  local cur = redis.call('INCRBY', KEYS[2 * i - 1], granted)
+  if cur == granted then
+    redis.call('PEXPIRE', KEYS[2 * i - 1], ARGV[3 * i + 2])
+  end
+  counts[2 * i - 1] = cur
+end
+return {granted, unpack(counts)}
+"""
+
+Key = Tuple[str, str]  # (bucket, ident)
+
+_mem: Dict[Key, list] = {}  # -> [window_start, cur, prev]
+_leases: Dict[Key, list] = {}  # -> [window_start, units_left]
+_blocked: Dict[Key, list] = {}  # -> [window_start, blocked_until]
+_windows: Dict[str, int] = {}  # bucket -> window_seconds
+_wheel: Dict[int, List[Key]] = {}  # second -> keys that may expire then
+_wheel_pos: Optional[int] = None
+_mem_lock = threading.Lock()
+
+_pools: Dict[str, Any] = {}
+_scripts: Dict[int, Any] = {}
+_pools_lock = threading.Lock()
+_redis_down_until = 0.0
+
+
+@dataclass(frozen=True)
+class RateRule:
+    """One limit: at most ``limit`` units per ``window_seconds`` for (bucket, ident)."""
+
+    bucket: str
+    ident: str
+    limit: int
+    window_seconds: int
+
+    @property
+    def key(self) -> Key:
+        return self.bucket, str(self.ident)
 
-def _purge_expired() -> None:
-    """Remove expired entries from in-memory store to prevent leaks."""
-    global _cleanup_counter
-    _cleanup_counter += 1
-    if _cleanup_counter < _CLEANUP_EVERY:
-        return
-    _cleanup_counter = 0
-    now = time.time()
-    stale = [k for k, (_, exp) in _mem.items() if exp <= now]
-    for k in stale:
-        _mem.pop(k, None)
 
 @dataclass
 class LimitInfo:
@@ -62,44 +145,248 @@ class LimitInfo:
             'X-RateLimit-Reset': str(int(self.reset_in)),
         }
 
+
+# ---------------------------------------------------------------------------
+# In-process state
+# ---------------------------------------------------------------------------
+
+
+def _schedule(key: Key, expires_at: float) -> None:
+    """Remember to look at ``key`` once ``expires_at`` has passed (under _mem_lock)."""
+    _wheel.setdefault(int(expires_at) + 1, []).append(key)
+
+
+def _purge_expired(now: float) -> None:
+    """Drop expired windows, leases and blocks due by ``now`` (under _mem_lock)."""
+    global _wheel_pos
+    now_slot = int(now)
+    if _wheel_pos is None or _wheel_pos > now_slot + 1:
+        _wheel_pos = now_slot
+    if now_slot - _wheel_pos > len(_wheel):
+        slots = sorted(s for s in _wheel if s <= now_slot)
+    else:
+        slots = range(_wheel_pos, now_slot + 1)
+    for slot in slots:
+        for key in _wheel.pop(slot, ()):
+            window = _windows.get(key[0], 60)
+            state = _mem.get(key)
+            if state is not None and state[0] + 2 * window <= now:
+                del _mem[key]
+            lease = _leases.get(key)
+            if lease is not None and lease[0] + window <= now:
+                del _leases[key]
+            blocked = _blocked.get(key)
+            if blocked is not None and blocked[1] <= now:
+                del _blocked[key]
+    _wheel_pos = now_slot + 1
+    for store in (_mem, _leases, _blocked):
+        # every key is live (e.g. a scan with random idents): forget the oldest
+        while len(store) > MAX_MEM_KEYS:
+            store.pop(next(iter(store)))
+
+
+def _mem_state(key: Key, window_start: int, window_seconds: int) -> list:
+    """[window_start, cur, prev] of ``key`` rolled to the current window (under _mem_lock)."""
+    state = _mem.get(key)
+    if state is None or state[0] < window_start:
+        prev = state[1] if state is not None and state[0] == window_start - window_seconds else 0
+        state = _mem[key] = [window_start, 0, prev]
+        _schedule(key, window_start + 2 * window_seconds)
+    return state
+
+
+# ---------------------------------------------------------------------------
+# Redis
+# ---------------------------------------------------------------------------
+
+
 def _redis_client():
+    """Process-wide pooled client for REDIS_URL (None: no Redis or it failed recently)."""
     url = (current_app.config.get("REDIS_URL") or "").strip()
-    if not url or redis is None:
+    if not url or redis is None or time.monotonic() < _redis_down_until:
         return None
+    client = _pools.get(url)
+    if client is None:
+        with _pools_lock:
+            client = _pools.get(url)
+            if client is None:
+                try:
+                    pool = redis.ConnectionPool.from_url(
+                        url,
+                        decode_responses=True,
+                        max_connections=int(current_app.config.get("RATE_LIMIT_REDIS_POOL_SIZE", DEFAULT_POOL_SIZE)),
+                        socket_timeout=SOCKET_TIMEOUT,
+                        socket_connect_timeout=SOCKET_TIMEOUT,
+                    )
+                    client = _pools[url] = redis.Redis(connection_pool=pool)
+                except Exception:
+                    return None
+    return client
+
+
+def _redis_failed() -> None:
+    # Redis is down: use the in-process counter instead of paying the timeout on every request
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SEC
+    inc_counter("rate_limit_redis_errors_total")
+
+
+def _script(client) -> Any:
+    script = _scripts.get(id(client))
+    if script is None:
+        script = _scripts[id(client)] = client.register_script(SLIDING_WINDOW_LUA)
+    return script
+
+
+def _keys(bucket: str, ident: str, window_start: int, window_seconds: int) -> Tuple[str, str]:
+    tag = f"rl:{{{bucket}:{ident}}}"
+    return f"{tag}:{window_start}", f"{tag}:{window_start - window_seconds}"
+
+
+# ---------------------------------------------------------------------------
+# Checks
+# ---------------------------------------------------------------------------
+
+
+def _retry_after(limit: int, cur: int, prev: int, elapsed: float, window_seconds: int) -> float:
+    """Seconds until one more request fits the sliding window.
+
+    Other processes can only add to the counters, so a rejection stays
+    valid at least this long — the Redis path caches it (``_blocked``).
+    """
+    room = limit - 1 - cur
+    if room < 0:
+        # the current window alone is full: wait until it becomes the previous one and decays
+        need = (cur - (limit - 1)) / cur if cur else 1.0
+        return window_seconds - elapsed + need * window_seconds
+    if prev <= 0:
+        return 0.0
+    return max(0.0, (1.0 - room / prev) * window_seconds - elapsed)
+
+
+def _local_batch(limit: int) -> int:
     try:
-        return redis.Redis.from_url(url, decode_responses=True)
-    except Exception:
-        return None
+        batch = int(current_app.config.get("RATE_LIMIT_LOCAL_BATCH", 0) or 0)
+    except (TypeError, ValueError):
+        batch = 0
+    return batch if batch > 1 and limit >= 10 * batch else 1
+
+
+class _Window:
+    """Position of ``now`` in the fixed windows of one rule."""
 
-def check_rate_limit(bucket: str, ident: str, limit: int, window_seconds: int) -> Tuple[bool, LimitInfo]:
-    now = int(time.time())
-    window_start = (now // window_seconds) * window_seconds
-    key = f"rl:{bucket}:{window_start}:{ident}"
-    reset_in = (window_start + window_seconds) - now
-    if reset_in < 0:
-        reset_in = 0
+    __slots__ = ("start", "elapsed", "weight")
 
+    def __init__(self, now: float, window_seconds: int) -> None:
+        self.start = int(now // window_seconds) * window_seconds
+        self.elapsed = now - self.start
+        self.weight = 1.0 - self.elapsed / window_seconds
+
+
+def _info(rule: RateRule, win: _Window, cur: int, prev: int) -> LimitInfo:
+    remaining = max(0, int(math.floor(rule.limit - prev * win.weight - cur)))
+    if remaining:
+        reset_in = int(math.ceil(rule.window_seconds - win.elapsed))
+    else:
+        reset_in = int(math.ceil(_retry_after(rule.limit, cur, prev, win.elapsed, rule.window_seconds)))
+    return LimitInfo(limit=rule.limit, window_seconds=rule.window_seconds, remaining=remaining, reset_in=reset_in)
+
+
+def check_rate_limits(
+    rules: Sequence[RateRule],
+    cost: int = 1,
+) -> Tuple[bool, LimitInfo, Optional[RateRule]]:
+    """Spend ``cost`` units on every rule, or on none if any rule would be exceeded.
+
+    Returns ``(ok, info, rejected_rule)``: on rejection ``info`` describes the
+    rule that rejected (``reset_in`` — when a retry can succeed), otherwise
+    the rule with the fewest units left.
+    """
+    rules = list(rules)
+    now = time.time()
+    windows = [_Window(now, r.window_seconds) for r in rules]
+    for r in rules:
+        _windows[r.bucket] = r.window_seconds
+
+    for rule in rules:
+        blocked = _blocked.get(rule.key)
+        if blocked is not None and now < blocked[1]:
+            inc_counter("rate_limit_rejected_total")
+            return False, LimitInfo(limit=rule.limit, window_seconds=rule.window_seconds,
+                                    remaining=0, reset_in=int(math.ceil(blocked[1] - now))), rule
+
+    batch = _local_batch(rules[0].limit) if len(rules) == 1 and cost == 1 else 1
+    if batch > 1:
+        rule, win = rules[0], windows[0]
+        with _mem_lock:
+            lease = _leases.get(rule.key)
+            if lease is not None and lease[0] == win.start and lease[1] > 0:
+                lease[1] -= 1
+                inc_counter("rate_limit_local_hits_total")
+                info = LimitInfo(limit=rule.limit, window_seconds=rule.window_seconds,
+                                 remaining=lease[1], reset_in=int(math.ceil(rule.window_seconds - win.elapsed)))
+                return True, info, None
+
+    counts: Optional[List[Tuple[int, int]]] = None
+    remote = False
     r = _redis_client()
     if r is not None:
+        keys: List[str] = []
+        args: List[Any] = [batch * cost, cost]
+        for rule, win in zip(rules, windows):
+            keys += _keys(rule.bucket, str(rule.ident), win.start, rule.window_seconds)
+            args += [rule.limit, repr(win.weight), int(rule.window_seconds * 2000) + 1000]
         try:
-            # Atomic-ish: INCR + set expiry on first hit
-            val = r.incr(key)
-            if val == 1:
-                r.expire(key, window_seconds + 5)
-            remaining = max(0, limit - int(val))
-            ok = int(val) <= limit
-            return ok, LimitInfo(limit=limit, window_seconds=window_seconds, remaining=remaining, reset_in=reset_in)
+            reply = [int(v) for v in _script(r)(keys=keys, args=args)]
         except Exception:
-            # fall back to memory
-            pass
-
-    # In-memory fallback
-    _purge_expired()
-    cnt, exp = _mem.get(key, (0, now + window_seconds))
-    if exp <= now:
-        cnt, exp = 0, now + window_seconds
-    cnt += 1
-    _mem[key] = (cnt, exp)
-    remaining = max(0, limit - cnt)
-    ok = cnt <= limit
-    return ok, LimitInfo(limit=limit, window_seconds=window_seconds, remaining=remaining, reset_in=int(exp - now))
+            _redis_failed()
+        else:
+            granted, remote = reply[0], True
+            counts = [(reply[1 + 2 * i], reply[2 + 2 * i]) for i in range(len(rules))]
+
+    with _mem_lock:
+        _purge_expired(now)
+        if counts is None:
+            # In-memory fallback: the same sliding windows per process
+            states = [_mem_state(rule.key, win.start, rule.window_seconds) for rule, win in zip(rules, windows)]
+            fits = all(math.floor(rule.limit - s[2] * win.weight - s[1]) >= cost
+                       for rule, win, s in zip(rules, windows, states))
+            granted = cost if fits else 0
+            for s in states:
+                s[1] += granted
+            counts = [(s[1], s[2]) for s in states]
+
+    infos = [_info(rule, win, cur, prev) for rule, win, (cur, prev) in zip(rules, windows, counts)]
+    if granted < cost:
+        inc_counter("rate_limit_rejected_total")
+        i = next(
+            (i for i, (rule, win, (cur, prev)) in enumerate(zip(rules, windows, counts))
+             if math.floor(rule.limit - prev * win.weight - cur) < cost),
+            0,
+        )
+        rule, win, (cur, prev) = rules[i], windows[i], counts[i]
+        if remote and cost == 1:
+            until = now + _retry_after(rule.limit, cur, prev, win.elapsed, rule.window_seconds)
+            with _mem_lock:
+                _blocked[rule.key] = [win.start, until]
+                _schedule(rule.key, until)
+        return False, infos[i], rule
+
+    if granted > cost:
+        rule, win = rules[0], windows[0]
+        with _mem_lock:
+            _leases[rule.key] = [win.start, granted - cost]
+            _schedule(rule.key, win.start + rule.window_seconds)
+        infos[0].remaining += granted - cost
+    return True, min(infos, key=lambda info: info.remaining), None
+
+
+def check_rate_limit(
+    bucket: str,
+    ident: str,
+    limit: int,
+    window_seconds: int,
+    cost: int = 1,
+) -> Tuple[bool, LimitInfo]:
+    ok, info, _ = check_rate_limits([RateRule(bucket, str(ident), limit, window_seconds)], cost)
+    return ok, info
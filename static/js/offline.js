@@ -220,7 +220,7 @@
       }
       if (d.type === 'done') {
         setProgress(bar, 100);
-        if (status) status.textContent = 'Готово';
+        if (status) status.textContent = d.status === 'partial' ? `Готово, не скачано тайлов: ${d.failed}` : 'Готово';
         es.close();
         try { setTileSource('local'); } catch (_) {}
         try { loadOfflineSets(); } catch (_) {}
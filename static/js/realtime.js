@@ -6,9 +6,15 @@
   - Подключается к WS (same-port / отдельный порт) с фолбэками
   - Автопереподключение с backoff
   - Раздаёт события подписчикам: Realtime.on('event', fn)
+  - Серверные подписки: Realtime.subscribe(['tracker', 'chat2:5'], bbox)
+    — сервер шлёт только события этих топиков/внутри viewport
+    (bbox = [minLon, minLat, maxLon, maxLat]); без вызова приходит всё.
 
   Формат входящего сообщения:
     {"event":"name","data":{...}}
+  Позиции трекера приходят пакетом раз в тик:
+    {"event":"positions","data":{"items":[{"event":"tracking_point","data":{...}}, ...]}}
+  и раздаются подписчикам как отдельные события.
 */
 (function(){
   const listeners = new Map();   // event -> Set(fn)
@@ -19,6 +25,10 @@
   let closedByUser = false;
   let pingTimer = null;
   const PING_MS = 25000;
+  // серверная подписка (повторяется после переподключения)
+  const subTopics = new Set();
+  let subBbox;            // undefined = не задан, null = снят
+  let subscribed = false;
 
   function _emit(event, data){
     try{
@@ -130,6 +140,7 @@
       connecting = false;
       backoffMs = 1000;
       _emit('__open__', { url: urls[idx] });
+      if(subscribed) _sendSubscription();
 
       // keepalive: Cloudflare/proxies may drop totally-idle WS.
       try{
@@ -146,6 +157,12 @@
       try{
         const msg = JSON.parse(ev && ev.data ? ev.data : '{}');
         if(!msg || !msg.event) return;
+        if(msg.event === 'positions' && msg.data && Array.isArray(msg.data.items)){
+          // пакет склеенных позиций за тик: раздаём как исходные события
+          for(const it of msg.data.items){
+            if(it && it.event) _emit(String(it.event), it.data || {});
+          }
+        }
         _emit(String(msg.event), msg.data || {});
       }catch(e){}
     });
@@ -192,6 +209,36 @@
     _cleanupSocket();
   }
 
+  function _sendSubscription(){
+    try{
+      if(!ws || ws.readyState !== 1) return;
+      const data = { topics: Array.from(subTopics) };
+      if(subBbox !== undefined) data.bbox = subBbox;
+      ws.send(JSON.stringify({ event: 'subscribe', data: data }));
+    }catch(e){}
+  }
+
+  function subscribe(topics, bbox){
+    subscribed = true;
+    for(const t of (topics || [])){
+      if(t) subTopics.add(String(t));
+    }
+    if(bbox !== undefined) subBbox = bbox;
+    _sendSubscription();
+  }
+
+  function unsubscribe(topics){
+    const list = [];
+    for(const t of (topics || [])){
+      if(subTopics.delete(String(t))) list.push(String(t));
+    }
+    try{
+      if(ws && ws.readyState === 1 && list.length){
+        ws.send(JSON.stringify({ event: 'unsubscribe', data: { topics: list } }));
+      }
+    }catch(e){}
+  }
+
   function isConnected(){
     return !!(ws && ws.readyState === 1);
   }
@@ -246,6 +293,8 @@
     disconnect,
     on,
     onAny,
+    subscribe,
+    unsubscribe,
     isConnected,
     refreshCounters,
     debounce
@@ -20,6 +20,7 @@ from app.tasks import diagnostics_tasks as diagnostics_tasks  # noqa: F401
 from app.tasks import ai_mutation_tasks as ai_mutation_tasks  # noqa: F401
 from app.tasks import mutation_testing as mutation_testing_tasks  # noqa: F401
 from app.tasks import operational_tasks as operational_tasks  # noqa: F401
+from app.tasks import push_outbox as push_outbox_tasks  # noqa: F401
 
 
 @celery_app.task(bind=True)
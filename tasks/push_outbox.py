@@ -0,0 +1,13 @@
+"""Разбор очереди push-уведомлений chat2 в worker-контейнере."""
+
+from __future__ import annotations
+
+from celery import shared_task
+
+from app.event_chat.push_outbox import drain
+
+
+@shared_task(name="app.tasks.push_outbox.dispatch_chat2_push")
+def dispatch_chat2_push() -> dict:
+    """Отправить все записи chat2_push_outbox, время которых пришло."""
+    return drain()
@@ -10,7 +10,9 @@ use quinn::{Endpoint, ServerConfig};
 use redis::AsyncCommands as RedisAsyncCommands;
 use serde::{Deserialize, Serialize};
 use serde_json::Value;
+use std::sync::atomic::{AtomicU64, Ordering};
 use std::sync::Arc;
+use std::time::{SystemTime, UNIX_EPOCH};
 use thiserror::Error;
 use tokio::sync::mpsc;
 use tower_governor::{governor::GovernorConfigBuilder, GovernorLayer};
@@ -19,6 +21,9 @@ use tracing::{error, info, warn};
 
 type TelemetryChannel = mpsc::Sender<Value>;
 
+/// How often the backpressure check re-reads the stream length (XLEN).
+const STREAM_LEN_CHECK_MS: u64 = 1_000;
+
 #[derive(Deserialize, Serialize, Debug)]
 struct TelemetryPayload {
     user_id: String,
@@ -26,6 +31,10 @@ struct TelemetryPayload {
     lon: f64,
     accuracy_m: Option<f64>,
     unit_label: Option<String>,
+    /// Device fix time (ISO-8601 string or epoch seconds/ms), passed through
+    /// unchanged so the stream consumer stores the device time, not its own.
+    #[serde(default, skip_serializing_if = "Option::is_none")]
+    ts: Option<Value>,
 }
 
 #[derive(Serialize)]
@@ -34,18 +43,91 @@ struct WsMessage {
     data: TelemetryPayload,
 }
 
+/// Durable save queue (TELEMETRY_QUEUE_MODE=stream): XADD into a Redis Stream
+/// read by the Python consumer group (realtime/broker.py::consume_telemetry_stream).
+#[derive(Clone, Debug)]
+struct TelemetryStream {
+    key: String,
+    maxlen: u64,
+    backpressure_len: u64,
+    len_cache: Arc<StreamLen>,
+}
+
+/// Last XLEN result shared by all requests, plus the XADDs made since.
+#[derive(Debug, Default)]
+struct StreamLen {
+    len: AtomicU64,
+    checked_at_ms: AtomicU64,
+}
+
+fn now_ms() -> u64 {
+    SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .map(|d| d.as_millis() as u64)
+        .unwrap_or(0)
+}
+
+impl TelemetryStream {
+    fn from_env() -> Option<Self> {
+        let mode = std::env::var("TELEMETRY_QUEUE_MODE").unwrap_or_default();
+        if mode.trim().to_lowercase() != "stream" {
+            return None;
+        }
+        let num = |name: &str, default: u64| {
+            std::env::var(name)
+                .ok()
+                .and_then(|v| v.trim().parse::<u64>().ok())
+                .unwrap_or(default)
+        };
+        Some(Self {
+            key: std::env::var("TELEMETRY_STREAM_KEY")
+                .ok()
+                .filter(|v| !v.trim().is_empty())
+                .unwrap_or_else(|| "telemetry_save_stream".to_string()),
+            maxlen: num("TELEMETRY_STREAM_MAXLEN", 1_000_000),
+            backpressure_len: num("TELEMETRY_STREAM_BACKPRESSURE_LEN", 500_000),
+            len_cache: Arc::new(StreamLen::default()),
+        })
+    }
+
+    /// Stream length for the backpressure check without an XLEN per request:
+    /// one request per STREAM_LEN_CHECK_MS refreshes it, the rest use the cache.
+    async fn approx_len(&self, con: &mut deadpool_redis::Connection) -> Result<u64, NodeError> {
+        let now = now_ms();
+        let checked = self.len_cache.checked_at_ms.load(Ordering::Relaxed);
+        if now.saturating_sub(checked) >= STREAM_LEN_CHECK_MS
+            && self
+                .len_cache
+                .checked_at_ms
+                .compare_exchange(checked, now, Ordering::AcqRel, Ordering::Relaxed)
+                .is_ok()
+        {
+            let len: u64 = deadpool_redis::redis::cmd("XLEN")
+                .arg(&self.key)
+                .query_async(con)
+                .await
+                .map_err(|e| NodeError::RedisError(format!("XLEN {} failed: {e}", self.key)))?;
+            self.len_cache.len.store(len, Ordering::Relaxed);
+        }
+        Ok(self.len_cache.len.load(Ordering::Relaxed))
+    }
+}
+
 #[derive(Clone)]
 struct AppState {
     redis_pool: Pool,
     redis_client: redis::Client,
     node_token: Option<String>,
     telemetry_tx: TelemetryChannel,
+    telemetry_stream: Option<TelemetryStream>,
 }
 
 #[derive(Debug, Error)]
 enum NodeError {
     #[error("Redis error: {0}")]
     RedisError(String),
+    #[error("Backpressure: {0}")]
+    Backpressure(String),
     #[error("Unauthorized")]
     Unauthorized,
     #[error("Invalid payload: {0}")]
@@ -58,6 +140,7 @@ impl IntoResponse for NodeError {
     fn into_response(self) -> Response {
         let (status, code, message) = match self {
             Self::RedisError(msg) => (StatusCode::INTERNAL_SERVER_ERROR, "redis_error", msg),
+            Self::Backpressure(msg) => (StatusCode::SERVICE_UNAVAILABLE, "backpressure", msg),
             Self::Unauthorized => (
                 StatusCode::UNAUTHORIZED,
                 "unauthorized",
@@ -154,13 +237,34 @@ async fn handle_telemetry(
         warn!("[RUST_GATEWAY] queue send failed: {e}");
     }
 
-    // Legacy channel for backward compatibility.
     let mut pooled_con = state
         .redis_pool
         .get()
         .await
         .map_err(|e| NodeError::RedisError(format!("pool get failed: {e}")))?;
 
+    // Durable save queue: reject (503) while consumers are behind, so the
+    // device keeps the point in its offline buffer and retries later.
+    if let Some(stream) = state.telemetry_stream.as_ref() {
+        let len = stream.approx_len(&mut pooled_con).await?;
+        if len >= stream.backpressure_len {
+            return Err(NodeError::Backpressure(format!("{} length {len}", stream.key)));
+        }
+        let _entry_id: String = deadpool_redis::redis::cmd("XADD")
+            .arg(&stream.key)
+            .arg("MAXLEN")
+            .arg("~")
+            .arg(stream.maxlen)
+            .arg("*")
+            .arg("payload")
+            .arg(&msg_str)
+            .query_async(&mut pooled_con)
+            .await
+            .map_err(|e| NodeError::RedisError(format!("XADD {} failed: {e}", stream.key)))?;
+        stream.len_cache.len.fetch_add(1, Ordering::Relaxed);
+    }
+
+    // Legacy channel for backward compatibility.
     let publish_legacy: Result<usize, _> = pooled_con.publish("map_updates", &msg_str).await;
     publish_legacy.map_err(|e| NodeError::RedisError(format!("publish to map_updates failed: {e}")))?;
 
@@ -247,11 +351,20 @@ async fn main() -> Result<(), NodeError> {
         .create_pool(Some(Runtime::Tokio1))
         .map_err(|e| NodeError::Internal(format!("redis pool init failed: {e}")))?;
 
+    let telemetry_stream = TelemetryStream::from_env();
+    if let Some(stream) = telemetry_stream.as_ref() {
+        info!(
+            "[RUST_GATEWAY] Telemetry save queue: stream {} (maxlen ~{}, backpressure at {})",
+            stream.key, stream.maxlen, stream.backpressure_len
+        );
+    }
+
     let state = Arc::new(AppState {
         redis_pool: pool,
         redis_client,
         node_token,
         telemetry_tx: tx,
+        telemetry_stream,
     });
 
     let governor_conf = Box::new(
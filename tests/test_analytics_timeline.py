@@ -0,0 +1,106 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, func
+
+from app.extensions import db
+from app.models import Address, PendingHistory, PendingMarker, Zone
+from app.services.analytics_service import build_summary
+
+
+def _legacy_timeline(days, zone_id=None):
+    # прежняя реализация: 4 COUNT на каждую точку таймлайна
+    today = datetime.now(timezone.utc).date()
+    total_points = min(days, 60)
+    step = days // 60 + 1 if days > 60 else 1
+    out = []
+    for i in range(total_points):
+        day = today - timedelta(days=(total_points - 1 - i) * step)
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=step)
+        a = db.session.query(func.count(Address.id)).filter(Address.created_at >= start, Address.created_at < end)
+        p = db.session.query(func.count(PendingMarker.id)).filter(PendingMarker.created_at >= start, PendingMarker.created_at < end)
+        h = {
+            s: db.session.query(func.count(PendingHistory.id)).filter(
+                PendingHistory.status == s, PendingHistory.timestamp >= start, PendingHistory.timestamp < end
+            )
+            for s in ("approved", "rejected")
+        }
+        if zone_id is not None:
+            a = a.filter(Address.zone_id == zone_id)
+            p = p.filter(PendingMarker.zone_id == zone_id)
+            h = {s: q.join(Address, PendingHistory.address_id == Address.id).filter(Address.zone_id == zone_id) for s, q in h.items()}
+        out.append({
+            "date": day.isoformat(),
+            "addresses": a.scalar(),
+            "pending_created": p.scalar(),
+            "approved": h["approved"].scalar(),
+            "rejected": h["rejected"].scalar(),
+        })
+    return out
+
+
+def _seed(now):
+    rnd = random.Random(11)
+    zones = [Zone(description=f"Z{i}", color="#f00", geometry="{}") for i in range(2)]
+    db.session.add_all(zones)
+    db.session.flush()
+    addrs = []
+    for i in range(300):
+        a = Address(
+            name=f"A{i}", category=rnd.choice(["cat1", "cat2", None]), status=rnd.choice(["open", "closed"]),
+            zone_id=rnd.choice([zones[0].id, zones[1].id, None]),
+            created_at=now - timedelta(days=rnd.uniform(0, 400)),
+        )
+        addrs.append(a)
+    db.session.add_all(addrs)
+    db.session.flush()
+    for i in range(200):
+        db.session.add(PendingMarker(
+            name=f"P{i}", status=rnd.choice(["new", "review"]), zone_id=rnd.choice([zones[0].id, None]),
+            created_at=now - timedelta(days=rnd.uniform(0, 400), hours=rnd.uniform(0, 23)),
+        ))
+        db.session.add(PendingHistory(
+            pending_id=i, status=rnd.choice(["approved", "rejected", "cancelled"]),
+            address_id=rnd.choice(addrs).id if i % 3 else None,
+            timestamp=now - timedelta(days=rnd.uniform(0, 400)),
+        ))
+    # на границе суток — в корзину «сегодня», а не во вчерашнюю
+    midnight = datetime.combine(now.date(), datetime.min.time())
+    db.session.add(Address(name="edge", zone_id=zones[0].id, created_at=midnight))
+    db.session.commit()
+    return zones
+
+
+def test_summary_timeline_matches_per_bucket_counts_with_few_queries(app):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with app.app_context():
+        zones = _seed(now)
+        for days in (7, 60, 90, 365):
+            for zone_id in (None, zones[0].id):
+                counter = {"n": 0}
+
+                def _inc(*_a, **_kw):
+                    counter["n"] += 1
+
+                event.listen(db.engine, "before_cursor_execute", _inc)
+                try:
+                    summary = build_summary(days, zone_id)
+                finally:
+                    event.remove(db.engine, "before_cursor_execute", _inc)
+
+                assert summary["timeline_last_n"] == _legacy_timeline(days, zone_id)
+                assert counter["n"] <= 9
+
+                addr = Address.query if zone_id is None else Address.query.filter_by(zone_id=zone_id)
+                assert summary["total"] == addr.count()
+                since = datetime.now(timezone.utc) - timedelta(days=days)
+                assert summary["added_last_n"] == addr.filter(Address.created_at >= since).count()
+                pend = PendingMarker.query if zone_id is None else PendingMarker.query.filter_by(zone_id=zone_id)
+                assert summary["pending"] == pend.count() == sum(summary["pending_by_status"].values())
+
+        full = build_summary(30)
+        assert full["approved"] == PendingHistory.query.filter_by(status="approved").count()
+        assert full["rejected"] == PendingHistory.query.filter_by(status="rejected").count()
+        assert full["by_zone"]["none"] == Address.query.filter(Address.zone_id.is_(None)).count()
+        assert full["by_zone"][str(zones[0].id)] == Address.query.filter_by(zone_id=zones[0].id).count()
@@ -51,7 +51,7 @@ def test_api_geocode_offline_and_online(monkeypatch, client, app, tmp_path):
             {'display_name': 'Online from API', 'lat': '9.99', 'lon': '8.88'}
         ])
 
-    monkeypatch.setattr('app.services.geocode_service.requests.get', fake_get)
+    monkeypatch.setattr('app.services.nominatim_service.requests.get', fake_get)
 
     rv2 = client.get('/api/geocode', query_string={'q': 'online'})
     assert rv2.status_code == 200
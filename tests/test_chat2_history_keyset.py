@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from app.event_chat.models import Channel, Message
+from app.extensions import db
+from app.models import ChatMessage
+from app.services import chat_service, keyset
+
+T0 = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _channel_with_messages(n, same_ts_every=3):
+    ch = Channel(type="shift", shift_id=1)
+    db.session.add(ch)
+    db.session.flush()
+    # группы сообщений с одинаковым created_at: на границе страницы их нельзя терять
+    db.session.add_all([
+        Message(id=f"m{i:04d}", channel_id=ch.id, sender_type="tracker", sender_id="d1",
+                text=str(i), created_at=T0 + timedelta(seconds=i // same_ts_every))
+        for i in range(n)
+    ])
+    db.session.commit()
+    return ch.id
+
+
+def test_history_cursor_pages_cover_channel_exactly_once(app, client):
+    with app.app_context():
+        cid = _channel_with_messages(23)
+
+    seen, cursor, pages = [], None, 0
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        while True:
+            url = f"/api/chat2/history?channel_id={cid}&limit=5" + (f"&cursor={cursor}" if cursor else "")
+            resp = client.get(url, headers={"X-Device-ID": "d1"})
+            assert resp.status_code == 200
+            seen.extend(m["text"] for m in resp.get_json())
+            pages += 1
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+    finally:
+        with app.app_context():
+            event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert seen == [str(i) for i in reversed(range(23))]
+    assert pages == 5
+    # по курсору — без поиска опорного сообщения: один SELECT на страницу
+    assert len([s for s in statements if "chat2_messages" in s]) == pages
+
+    bad = client.get(f"/api/chat2/history?channel_id={cid}&cursor=%%%", headers={"X-Device-ID": "d1"})
+    assert bad.status_code == 400
+
+
+def test_sync_cursor_and_legacy_ids(app, client):
+    with app.app_context():
+        cid = _channel_with_messages(10)
+    h = {"X-Device-ID": "d1"}
+
+    first = client.get(f"/api/chat2/sync?channel_id={cid}&limit=4", headers=h)
+    assert [m["text"] for m in first.get_json()] == ["0", "1", "2", "3"]
+    cursor = first.headers["X-Next-Cursor"]
+    rest = client.get(f"/api/chat2/sync?channel_id={cid}&cursor={cursor}", headers=h)
+    assert [m["text"] for m in rest.get_json()] == [str(i) for i in range(4, 10)]
+    # новых сообщений нет — курсор сохраняется
+    tail_cursor = rest.headers["X-Next-Cursor"]
+    empty = client.get(f"/api/chat2/sync?channel_id={cid}&cursor={tail_cursor}", headers=h)
+    assert empty.get_json() == [] and empty.headers["X-Next-Cursor"] == tail_cursor
+
+    # старые параметры: m0004 и m0005 имеют одинаковый created_at, но не теряются
+    after = client.get(f"/api/chat2/sync?channel_id={cid}&after_id=m0004", headers=h)
+    assert [m["id"] for m in after.get_json()][:2] == ["m0005", "m0006"]
+    before = client.get(f"/api/chat2/history?channel_id={cid}&before_id=m0004", headers=h)
+    assert [m["id"] for m in before.get_json()] == ["m0003", "m0002", "m0001", "m0000"]
+
+
+def test_admin_chat_history_page_and_stream(app):
+    with app.app_context():
+        user_id = "555"
+        ts = datetime(2026, 10, 1, 12, 0)
+        db.session.add_all([
+            ChatMessage(user_id=user_id, text=str(i), sender="user", is_read=False, created_at=ts + timedelta(seconds=i // 2))
+            for i in range(11)
+        ] + [ChatMessage(user_id="other", text="x", sender="user", created_at=ts)])
+        db.session.commit()
+
+        streamed = list(chat_service.iter_history(user_id, batch_size=3))
+        assert [m["text"] for m in streamed] == [str(i) for i in range(11)]
+        assert [m["text"] for m in chat_service.iter_history(user_id, batch_size=3, max_messages=5)] == ["0", "1", "2", "3", "4"]
+        assert chat_service.get_history(user_id, mark_as_read=False) == streamed
+
+        texts, cursor = [], None
+        while True:
+            page, cursor = chat_service.get_history_page(user_id, cursor=cursor, limit=4)
+            texts = [m["text"] for m in page] + texts
+            if cursor is None:
+                break
+        assert texts == [str(i) for i in range(11)]
+
+        first_id = streamed[6]["id"]
+        older = chat_service.get_history_before(user_id, before_id=first_id, limit=3)
+        assert [m["text"] for m in older] == ["3", "4", "5"]
+
+        created_at, row_id = keyset.decode_cursor(keyset.encode_cursor(ts, 42))
+        assert (created_at, row_id) == (ts, 42)
@@ -0,0 +1,153 @@
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import event
+
+from app.event_chat import push_outbox
+from app.event_chat.models import Channel, ChannelMember, PushOutbox, PushToken
+from app.extensions import db
+
+
+class _StubFCM:
+    """Локальный FCM legacy API: ответ по каждому токену задаётся ``errors``."""
+
+    def __init__(self):
+        self.requests = []
+        self.errors = {}
+        self.status = 200
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):  # noqa: N802
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests.append({"auth": self.headers.get("Authorization"), **payload})
+                results = [
+                    {"error": stub.errors[t]} if t in stub.errors else {"message_id": "m"}
+                    for t in payload["registration_ids"]
+                ]
+                body = json.dumps({"success": sum("message_id" in r for r in results), "results": results})
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/fcm/send"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tokens(self):
+        return [t for r in self.requests for t in r["registration_ids"]]
+
+
+@pytest.fixture()
+def fcm(app):
+    stub = _StubFCM()
+    app.config.update(
+        CHAT2_PUSH_ENABLED=True,
+        CHAT2_PUSH_INPROCESS_WORKER=False,
+        FCM_SERVER_KEY="k",
+        FCM_URL=stub.url,
+    )
+    yield stub
+    stub.server.shutdown()
+
+
+def _channel(members):
+    ch = Channel(type="shift", shift_id=1)
+    db.session.add(ch)
+    db.session.flush()
+    for member_type, member_id, tokens in members:
+        db.session.add(ChannelMember(channel_id=ch.id, member_type=member_type, member_id=member_id))
+        for token in tokens:
+            db.session.add(PushToken(member_type=member_type, member_id=member_id, token=token))
+    db.session.commit()
+    return ch
+
+
+def test_send_enqueues_and_worker_batches_tokens(app, client, fcm):
+    with app.app_context():
+        channels = [
+            # токены принадлежат участнику, а не каналу: у boss один токен на все каналы
+            _channel([("tracker", f"d{i}", [f"t{i}a", f"t{i}b"]), ("admin", "boss", ["boss"] if i == 0 else [])])
+            for i in range(3)
+        ]
+        ids = [ch.id for ch in channels]
+
+    for cid in ids:
+        resp = client.post("/api/chat2/send", json={"channel_id": cid, "text": "hi"}, headers={"X-Device-ID": "d0"})
+        assert resp.status_code == 201
+    # в запросе — только запись в очередь
+    assert fcm.requests == []
+
+    with app.app_context():
+        assert PushOutbox.query.count() == 3
+        statements = []
+        listener = lambda *args: statements.append(args[2])  # noqa: E731
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            stats = push_outbox.drain()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        assert stats["claimed"] == 3 and stats["done"] == 3 and stats["sent"] == 7
+        assert PushOutbox.query.count() == 0
+        assert len([s for s in statements if "chat2_push_tokens" in s]) == 1
+
+    # отправитель d0 своё уведомление не получает
+    assert sorted(fcm.tokens()) == sorted(["boss", "t1a", "t1b", "boss", "t2a", "t2b", "boss"])
+    assert {r["auth"] for r in fcm.requests} == {"key=k"}
+    assert fcm.requests[0]["notification"]["body"] == "hi"
+    assert fcm.requests[0]["data"]["channel_id"] in ids
+
+
+def test_invalid_tokens_pruned_and_transient_errors_retried(app, fcm, monkeypatch):
+    with app.app_context():
+        ch = _channel([("tracker", "d1", ["good", "gone", "busy"])])
+        fcm.errors = {"gone": "NotRegistered", "busy": "Unavailable"}
+        push_outbox.enqueue_push(ch.id, None, "t", "b")
+        db.session.commit()
+
+        stats = push_outbox.drain()
+        assert stats["sent"] == 1 and stats["pruned"] == 1 and stats["retried"] == 1
+        assert sorted(t.token for t in PushToken.query) == ["busy", "good"]
+        row = PushOutbox.query.one()
+        assert row.status == "queued" and row.attempts == 1 and json.loads(row.tokens_json) == ["busy"]
+        # пауза перед повтором: сразу запись не берётся
+        assert push_outbox.drain()["claimed"] == 0
+
+        fcm.errors = {}
+        later = datetime.now(timezone.utc) + timedelta(seconds=push_outbox.BACKOFF_SEC + 1)
+        monkeypatch.setattr(push_outbox, "_utcnow", lambda: later)
+        stats = push_outbox.drain()
+        assert stats["sent"] == 1 and stats["done"] == 1
+        assert len(fcm.requests) == 2 and fcm.requests[1]["registration_ids"] == ["busy"]
+        assert PushOutbox.query.count() == 0
+
+
+def test_outbox_gives_up_after_max_attempts(app, fcm, monkeypatch):
+    with app.app_context():
+        app.config["CHAT2_PUSH_MAX_ATTEMPTS"] = 2
+        ch = _channel([("tracker", "d1", ["a"])])
+        push_outbox.enqueue_push(ch.id, None, "t", "b")
+        db.session.commit()
+        fcm.status = 503
+        now = [datetime.now(timezone.utc)]
+        monkeypatch.setattr(push_outbox, "_utcnow", lambda: now[0])
+        assert push_outbox.drain()["retried"] == 1
+        now[0] += timedelta(seconds=push_outbox.BACKOFF_MAX_SEC)
+        assert push_outbox.drain()["failed"] == 1
+        row = PushOutbox.query.one()
+        assert row.status == "failed" and row.last_error == "HTTP 503"
+
+        # без ключа FCM запись сразу помечается failed, запросов нет
+        app.config["FCM_SERVER_KEY"] = ""
+        push_outbox.enqueue_push(ch.id, None, "t", "b")
+        db.session.commit()
+        sent_before = len(fcm.requests)
+        assert push_outbox.drain()["failed"] == 1
+        assert len(fcm.requests) == sent_before
@@ -0,0 +1,79 @@
+import pytest
+
+from app.event_chat import ratelimit as chat_rl
+from app.event_chat.metrics import gauges_snapshot, snapshot
+from app.security import rate_limit as rl
+
+T0 = 1_700_000_040.0  # начало минутного окна
+
+
+@pytest.fixture()
+def clock(app, monkeypatch):
+    now = [T0]
+    monkeypatch.setattr(rl.time, "time", lambda: now[0])
+    for name in ("_mem", "_leases", "_blocked", "_pools", "_scripts", "_wheel"):
+        monkeypatch.setattr(rl, name, {})
+    monkeypatch.setattr(rl, "_wheel_pos", None)
+    monkeypatch.setattr(chat_rl, "_throttled", chat_rl.OrderedDict())
+    app.config.update(
+        REDIS_URL="",
+        CHAT2_SEND_RATE_LIMIT=3,
+        CHAT2_SEND_RATE_WINDOW_SEC=60,
+        CHAT2_CHANNEL_RATE_LIMIT=5,
+        CHAT2_CHANNEL_RATE_WINDOW_SEC=60,
+        CHAT2_GLOBAL_RATE_LIMIT=0,
+    )
+    return now
+
+
+def test_sender_channel_and_global_limits(app, clock):
+    with app.app_context():
+        before = snapshot().get("chat2_rate_limited_channel_total", 0)
+        assert [chat_rl.check_send("tracker", "d1", "c1")[0] for _ in range(4)] == [True] * 3 + [False]
+        # канал c1 общий: d2 упирается в лимит канала (5), а не в свой
+        assert [chat_rl.check_send("tracker", "d2", "c1")[0] for _ in range(3)] == [True, True, False]
+        assert snapshot()["chat2_rate_limited_channel_total"] == before + 1
+        # отказ по каналу не расходует лимит отправителя: в другом канале у d2 ещё 1 сообщение
+        assert [chat_rl.check_send("tracker", "d2", "c2")[0] for _ in range(2)] == [True, False]
+
+        app.config["CHAT2_GLOBAL_RATE_LIMIT"] = 1
+        ok, retry_after = chat_rl.check_send("admin", "root", "c3")
+        assert ok and retry_after == 0
+        ok, retry_after = chat_rl.check_send("admin", "boss", "c4")
+        assert not ok and retry_after >= 1
+
+
+def test_throttled_senders_metrics(app, clock):
+    with app.app_context():
+        before = snapshot().get("chat2_throttled_senders_total", 0)
+        for _ in range(6):
+            chat_rl.check_send("tracker", "spam", None)
+        assert snapshot()["chat2_throttled_senders_total"] == before + 1
+        assert gauges_snapshot()["chat2_throttled_senders"] == 1
+        top = chat_rl.throttled_senders()
+        assert top[0]["sender"] == "tracker:spam" and top[0]["rejected"] == 3 and top[0]["retry_after"] > 0
+
+        # блокировка прошла — повторный флуд считается новым ограниченным отправителем
+        clock[0] = T0 + 180
+        assert gauges_snapshot()["chat2_throttled_senders"] == 0
+        for _ in range(4):
+            chat_rl.check_send("tracker", "spam", None)
+        assert snapshot()["chat2_throttled_senders_total"] == before + 2
+
+
+def test_local_state_is_bounded(app, clock, monkeypatch):
+    monkeypatch.setattr(rl, "MAX_MEM_KEYS", 50)
+    monkeypatch.setattr(chat_rl, "MAX_THROTTLED", 10)
+    with app.app_context():
+        app.config["CHAT2_CHANNEL_RATE_LIMIT"] = 0
+        app.config["CHAT2_SEND_RATE_LIMIT"] = 1
+        for i in range(200):
+            chat_rl.check_send("tracker", f"d{i}", None)
+            chat_rl.check_send("tracker", f"d{i}", None)
+        assert len(rl._mem) <= 50 and len(chat_rl._throttled) <= 10
+
+        # через два окна time wheel убирает старые счётчики
+        clock[0] = T0 + 125
+        chat_rl.check_send("tracker", "fresh", None)
+        assert list(rl._mem) == [("chat2_send", "tracker:fresh")]
+        assert not rl._wheel or min(rl._wheel) > int(T0 + 125)
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+
+from app.event_chat.models import Channel, ChannelMember, Message
+from app.event_chat.unread import forget_previews_before, touch_channel, unread_counts
+from app.extensions import db
+from tests.conftest import login_admin
+
+T0 = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _send(channel, sender, text, minutes, touch=True, kind="text"):
+    msg = Message(channel_id=channel.id, sender_type=sender[0], sender_id=sender[1],
+                  text=text, kind=kind, created_at=T0 + timedelta(minutes=minutes))
+    db.session.add(msg)
+    if touch:
+        touch_channel(channel, msg)
+    return msg
+
+
+def test_unread_counts_single_query_semantics(app):
+    with app.app_context():
+        a, b, c = (Channel(type="shift", shift_id=i) for i in (1, 2, 3))
+        db.session.add_all([a, b, c])
+        db.session.flush()
+        me, dev = ("admin", "boss"), ("tracker", "d1")
+        msgs = [_send(a, dev, f"a{i}", i) for i in range(4)] + [_send(a, me, "mine", 5)]
+        for i in range(3):
+            _send(b, dev, f"b{i}", i)
+        db.session.add(ChannelMember(channel_id=a.id, member_type="admin", member_id="boss",
+                                     last_read_message_id=msgs[1].id))
+        # опорного сообщения нет (удалено) — отсчёт от last_read_at
+        db.session.add(ChannelMember(channel_id=b.id, member_type="admin", member_id="boss",
+                                     last_read_message_id="gone", last_read_at=T0 + timedelta(seconds=30)))
+        db.session.commit()
+
+        counts = unread_counts([a.id, b.id, c.id, "missing"], *me)
+        assert counts == {a.id: 2, b.id: 2, c.id: 0, "missing": 0}
+        assert unread_counts([a.id], *me, exclude_self=False)[a.id] == 3
+        # участник без отметки прочтения: непрочитаны все чужие сообщения
+        assert unread_counts([a.id, b.id], *dev) == {a.id: 1, b.id: 0}
+
+
+def test_unread_counts_propagates_db_errors(app):
+    with app.app_context():
+        ch = Channel(type="shift", shift_id=1)
+        db.session.add(ch)
+        db.session.commit()
+        Message.__table__.drop(db.engine)
+        # ошибка БД не должна превращаться в «0 непрочитанных»
+        with pytest.raises(DBAPIError):
+            unread_counts([ch.id], "admin", "boss")
+        db.session.rollback()
+
+def test_channels_list_fixed_query_count(app, client):
+    with app.app_context():
+        channels = [Channel(type="incident", marker_id=i) for i in range(60)]
+        db.session.add_all(channels)
+        db.session.flush()
+        for i, ch in enumerate(channels):
+            _send(ch, ("tracker", f"d{i}"), f"hello {i}", i)
+        # канал из старой базы: сообщения есть, превью не денормализовано
+        legacy = channels[0]
+        _send(legacy, ("tracker", "old"), "legacy text", 100, touch=False)
+        legacy.last_message_at = T0 + timedelta(minutes=100)
+        legacy.last_message_id = legacy.last_message_preview = None
+        db.session.commit()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])  # noqa: E731
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            login_admin(client)
+            resp = client.get("/api/chat2/channels?limit=60")
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert len(data) == 60
+    assert data[0]["preview"] == "legacy text" and data[0]["unread"] == 2
+    assert data[1]["preview"] == "hello 59" and data[1]["unread"] == 1
+    chat_queries = [s for s in statements if "chat2_" in s]
+    assert len(chat_queries) <= 3
+
+
+def test_previews_forgotten_with_purged_messages(app):
+    with app.app_context():
+        old, fresh = Channel(type="dm"), Channel(type="dm")
+        db.session.add_all([old, fresh])
+        db.session.flush()
+        _send(old, ("tracker", "d"), "x" * 500, 0)
+        _send(fresh, ("tracker", "d"), None, 60 * 24 * 10, kind="media")
+        db.session.commit()
+        assert len(old.last_message_preview) == 200 and fresh.last_message_preview == "media"
+
+        forget_previews_before(T0 + timedelta(days=1))
+        db.session.commit()
+        db.session.expire_all()
+        assert old.last_message_id is None and old.last_message_preview is None
+        assert fresh.last_message_preview == "media"
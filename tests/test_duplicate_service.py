@@ -0,0 +1,102 @@
+import random
+
+from app.extensions import db
+from app.helpers import find_duplicate, haversine_m
+from app.models import Address, PendingMarker
+from app.services import duplicate_service as ds
+
+MINSK = (53.9045, 27.5615)
+
+
+def _brute(name, lat, lon, rows, threshold_m=100):
+    nm = ds.normalize_name(name)
+    hits = [
+        rid for rid, rlat, rlon, rname in rows
+        if (nm and ds.normalize_name(rname) == nm)
+        or (lat is not None and rlat is not None and haversine_m(lat, lon, rlat, rlon) <= threshold_m)
+    ]
+    return min(hits) if hits else None
+
+
+def test_finds_nearby_and_same_name_addresses_before_pending(app):
+    with app.app_context():
+        db.session.add_all([
+            Address(name="ул. Немига, 5", lat=MINSK[0], lon=MINSK[1]),
+            Address(name="Без координат", lat=None, lon=None),
+            PendingMarker(name="Заявка у вокзала", lat=53.8905, lon=27.5500),
+        ])
+        db.session.commit()
+        a1, a2 = [a.id for a in Address.query.order_by(Address.id)]
+        p1 = PendingMarker.query.one().id
+
+        # ~55 м к северу — дубликат, ~150 м — нет
+        assert ds.find_duplicate("Новая", MINSK[0] + 0.0005, MINSK[1]) == {"type": "address", "id": a1}
+        assert ds.find_duplicate("Новая", MINSK[0] + 0.00135, MINSK[1]) is None
+        assert ds.find_duplicate("Новая", MINSK[0] + 0.00135, MINSK[1], threshold_m=200)["id"] == a1
+        # имя сравнивается без учёта регистра и лишних пробелов, в том числе без координат
+        assert ds.find_duplicate("  без   КООРДИНАТ ", None, None) == {"type": "address", "id": a2}
+        assert ds.find_duplicate("заявка у  вокзала", 10.0, 10.0) == {"type": "pending", "id": p1}
+        assert ds.find_duplicate("Заявка у вокзала", 53.89051, 27.55001)["type"] == "pending"
+        assert ds.find_duplicate("", None, None) is None
+
+        # JSON-вариант из helpers — тот же индекс
+        items = [{"id": 7, "name": "Дом", "lat": str(MINSK[0]), "lon": str(MINSK[1])}, {"id": 3, "address": "Склад"}]
+        assert find_duplicate("x", MINSK[0], MINSK[1] + 0.001, items, []) == {"type": "address", "id": 7}
+        assert find_duplicate("СКЛАД", None, None, items, [{"id": 1, "name": "склад"}]) == {"type": "address", "id": 3}
+        assert find_duplicate("склад ", None, None, [], [{"id": 1, "name": "Склад"}]) == {"type": "pending", "id": 1}
+
+
+def test_index_follows_commits_without_rebuild(app):
+    with app.app_context():
+        db.session.add(Address(name="Старый", lat=MINSK[0], lon=MINSK[1]))
+        db.session.commit()
+        assert ds.find_duplicate("x", *MINSK)["type"] == "address"
+        assert ds.index_stats()["address"] == {"rows": 1, "builds": 1}
+
+        far = (MINSK[0] + 0.2, MINSK[1] + 0.2)
+        db.session.add(PendingMarker(name="Новая заявка", lat=far[0], lon=far[1]))
+        db.session.commit()
+        pending_id = ds.find_duplicate("x", *far)["id"]
+
+        # перемещение, удаление и откат
+        addr = Address.query.one()
+        addr.lat, addr.lon = far
+        db.session.commit()
+        assert ds.find_duplicate("x", *MINSK) is None
+        assert ds.find_duplicate("x", *far) == {"type": "address", "id": addr.id}
+
+        db.session.delete(db.session.get(PendingMarker, pending_id))
+        db.session.commit()
+        db.session.add(Address(name="Откатили", lat=MINSK[0], lon=MINSK[1]))
+        db.session.flush()
+        db.session.rollback()
+        assert ds.find_duplicate("откатили", *MINSK) is None
+        assert ds.find_duplicate("новая заявка", None, None) is None
+
+        # bulk update не виден событиям маппера — индекс пересобирается
+        Address.query.update({Address.name: "Переименован"})
+        db.session.commit()
+        assert ds.find_duplicate("переименован", None, None)["id"] == addr.id
+        stats = ds.index_stats()
+        assert stats["address"]["builds"] == 2 and stats["pending"]["builds"] == 1
+
+
+def test_grid_matches_brute_force():
+    rnd = random.Random(5)
+    names = ["Немига", "Сурганова", "Кальварийская", "Притыцкого"]
+    rows = []
+    for rid in range(1, 1501):
+        lat = MINSK[0] + rnd.uniform(-0.05, 0.05)
+        lon = MINSK[1] + rnd.uniform(-0.08, 0.08)
+        rows.append((rid, lat, lon, f"{rnd.choice(names)} {rnd.randint(1, 400)}"))
+    # точки на границах ячеек сетки
+    rows.append((5000, 53.90, 27.56, "граница"))
+    rows.append((5001, 53.8999995, 27.5599995, "граница 2"))
+    index = ds.GridIndex.from_rows(rows)
+
+    queries = [(rnd.choice(names) + f" {rnd.randint(1, 800)}", MINSK[0] + rnd.uniform(-0.05, 0.05),
+                MINSK[1] + rnd.uniform(-0.08, 0.08)) for _ in range(150)]
+    queries += [("q", 53.9000004, 27.5600004), ("q", 53.8995, 27.5599)]
+    for name, lat, lon in queries:
+        for radius in (30, 100, 1500):
+            assert index.find(name, lat, lon, radius) == _brute(name, lat, lon, rows, radius)
@@ -0,0 +1,91 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from app.duty.dashboard import build_dashboard_snapshot
+from app.duty.routes import _kpi_5m_for_session
+from app.extensions import db
+from app.models import BreakRequest, DutyShift, TrackerDevice, TrackerDeviceHealth, TrackingPoint, TrackingSession
+from app.tracker.point_fields import FLAG_JUMP
+
+
+def _seed_shift(i: int, now: datetime) -> None:
+    uid = f"u{i}"
+    db.session.add(DutyShift(user_id=uid, unit_label=f"U{i}", started_at=now - timedelta(hours=1)))
+    sess = TrackingSession(user_id=uid, started_at=now - timedelta(minutes=30), last_lat=53.9, last_lon=27.5, last_at=now)
+    db.session.add(sess)
+    db.session.flush()
+    for k in range(5):
+        db.session.add(TrackingPoint(
+            session_id=sess.id, user_id=uid, ts=now - timedelta(seconds=20 * k),
+            lat=53.9, lon=27.5 + k * 1e-4, accuracy_m=10.0 + k, kind="live",
+            speed_mps=2.0, flags=FLAG_JUMP if k == 0 else 0,
+            raw_json=json.dumps({"flags": ["jump"] if k == 0 else [], "speed_mps": 2.0}),
+        ))
+    db.session.add(TrackerDevice(public_id=f"d{i}", token_hash=f"t{i}", user_id=uid, last_seen_at=now))
+    db.session.add(TrackerDeviceHealth(device_id=f"d{i}", user_id=uid, updated_at=now, battery_pct=70))
+    db.session.add(BreakRequest(user_id=uid, status="requested", requested_at=now))
+
+
+def _count_queries(now: datetime):
+    counter = {"n": 0}
+
+    def _inc(*_a, **_kw):
+        counter["n"] += 1
+
+    event.listen(db.engine, "before_cursor_execute", _inc)
+    try:
+        snap = build_dashboard_snapshot(now)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _inc)
+    return snap, counter["n"]
+
+
+def test_dashboard_snapshot_fields(app):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with app.app_context():
+        _seed_shift(0, now)
+        db.session.commit()
+
+        snap = build_dashboard_snapshot(now)
+        assert len(snap["active_shifts"]) == 1
+        row = snap["active_shifts"][0]
+        assert row["user_id"] == "u0"
+        assert row["tracking_active"] is True
+        assert row["last"]["speed_mps"] == 2.0
+        assert row["break"]["status"] == "requested"
+        assert row["health"]["battery_pct"] == 70
+        assert row["last"]["source"] == "live"
+        assert row["kpi_5m"] == {"points_5m": 5, "acc_avg_5m": 12.0, "jumps_5m": 1}
+        assert snap["sos_active_count"] == 0
+
+
+def test_dashboard_query_count_does_not_grow_with_shifts(app):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with app.app_context():
+        for i in range(3):
+            _seed_shift(i, now)
+        db.session.commit()
+        _snap, q_small = _count_queries(now)
+
+        for i in range(3, 30):
+            _seed_shift(i, now)
+        db.session.commit()
+        snap, q_big = _count_queries(now)
+
+        assert len(snap["active_shifts"]) == 30
+        assert q_big == q_small
+
+
+def test_kpi_5m_aggregates_in_sql(app):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with app.app_context():
+        _seed_shift(0, now)
+        # старая точка не попадает в окно 5 минут
+        db.session.add(TrackingPoint(session_id=1, user_id="u0", ts=now - timedelta(minutes=10), lat=1, lon=1,
+                                     accuracy_m=500.0, kind="live", flags=FLAG_JUMP))
+        db.session.commit()
+
+        assert _kpi_5m_for_session(1, now) == {"points_5m": 5, "acc_avg_5m": 12.0, "jumps_5m": 1}
+        assert _kpi_5m_for_session(999, now) == {"points_5m": 0, "acc_avg_5m": None, "jumps_5m": 0}
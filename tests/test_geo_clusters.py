@@ -0,0 +1,139 @@
+import json
+import random
+
+from app.extensions import db
+from app.models import AdminUser, Address, PendingMarker, Zone
+from app.services import cluster_service as cs
+
+from tests.conftest import login_admin
+
+MINSK = (53.9045, 27.5615)
+BELARUS = (23.1, 51.2, 32.8, 56.2)
+
+
+def _sum(result):
+    return sum(c["count"] for c in result["clusters"]) + len(result["points"])
+
+
+def test_clusters_endpoint_zoom_levels_and_access(app, client):
+    with app.app_context():
+        db.session.add_all([Address(name=f"Дом {i}", lat=MINSK[0] + i * 1e-4, lon=MINSK[1]) for i in range(5)])
+        db.session.add(Address(name="Гомель", lat=52.4345, lon=30.9754))
+        db.session.add(PendingMarker(name="Заявка", lat=MINSK[0], lon=MINSK[1]))
+        db.session.commit()
+
+    rv = client.get("/api/geo/clusters?layer=addresses&bbox=23.1,51.2,32.8,56.2&z=6")
+    assert rv.status_code == 200
+    data = rv.get_json()
+    assert data["layer"] == "addresses" and data["total"] == 6 == _sum(data)
+    (cluster,) = data["clusters"]
+    assert cluster["count"] == 5 and 6 < cluster["expansion_zoom"] <= cs.MAX_ZOOM
+    assert data["points"][0]["lat"] == 52.4345
+
+    # на детальном зуме кластер распадается на точки с id
+    rv = client.get(f"/api/geo/clusters?layer=addresses&bbox=27.56,53.90,27.57,53.91&z={cs.MAX_ZOOM}")
+    data = rv.get_json()
+    assert data["clusters"] == [] and len(data["points"]) == 5
+
+    assert client.get("/api/geo/clusters?layer=zones").status_code == 400
+    assert client.get("/api/geo/clusters?layer=addresses&bbox=1,2,3").status_code == 400
+    # заявки и объекты — только для администраторов
+    assert client.get("/api/geo/clusters?layer=pending").status_code in (401, 403)
+    login_admin(client)
+    rv = client.get("/api/geo/clusters?layer=pending&z=30")
+    assert rv.status_code == 200 and rv.get_json()["total"] == 1 and rv.get_json()["z"] == cs.MAX_ZOOM
+
+
+def test_pyramid_follows_commits_and_zones(app):
+    with app.app_context():
+        db.session.add_all([
+            Address(name="A", lat=MINSK[0], lon=MINSK[1], zone_id=1),
+            Address(name="B", lat=MINSK[0] + 0.001, lon=MINSK[1], zone_id=2),
+            Address(name="C", lat=MINSK[0] + 0.002, lon=MINSK[1]),
+        ])
+        db.session.commit()
+        assert cs.get_clusters("addresses", BELARUS, 5)["total"] == 3
+        assert cs.get_clusters("addresses", BELARUS, 5, zones={1})["total"] == 1
+        assert cs.get_clusters("addresses", BELARUS, 5, zones={2, None})["total"] == 2
+        assert cs.get_clusters("addresses", BELARUS, 5, zones=set())["total"] == 0
+
+        # перемещение и удаление применяются построчно, без пересборки
+        a = Address.query.filter_by(name="A").one()
+        a.lat, a.lon = 52.4345, 30.9754
+        db.session.delete(Address.query.filter_by(name="C").one())
+        db.session.commit()
+        result = cs.get_clusters("addresses", BELARUS, 6)
+        assert result["total"] == 2 and len(result["points"]) == 2
+        assert {p["id"] for p in result["points"]} == {a.id, Address.query.filter_by(name="B").one().id}
+        assert cs.index_stats()["addresses"] == {"rows": 2, "builds": 1}
+
+        db.session.add(Address(name="D", lat=MINSK[0], lon=MINSK[1]))
+        db.session.flush()
+        db.session.rollback()
+        assert cs.get_clusters("addresses", BELARUS, 6)["total"] == 2
+
+        # bulk update — пересборка при следующем запросе
+        Address.query.update({Address.zone_id: 3})
+        db.session.commit()
+        assert cs.get_clusters("addresses", BELARUS, 6, zones={3})["total"] == 2
+        assert cs.index_stats()["addresses"]["builds"] == 2
+
+
+def test_country_view_is_compact_and_matches_brute_force():
+    rnd = random.Random(3)
+    rows = []
+    for rid in range(1, 20001):
+        lat, lon = rnd.uniform(51.3, 56.1), rnd.uniform(23.2, 32.7)
+        if rid % 3 == 0:  # плотные города
+            lat, lon = MINSK[0] + rnd.gauss(0, 0.05), MINSK[1] + rnd.gauss(0, 0.08)
+        rows.append((rid, lat, lon, rid % 4 or None))
+    index = cs.ClusterIndex.from_rows(rows)
+
+    country = index.clusters(BELARUS, 6)
+    assert country["total"] == len(rows) == _sum(country)
+    assert len(json.dumps(country)) < 8 * 1024
+
+    for z, bbox in ((9, (27.3, 53.7, 27.9, 54.1)), (13, (27.50, 53.88, 27.60, 53.93)), (17, (27.555, 53.90, 27.565, 53.91))):
+        zones = {1, None}
+        x0, y0 = cs.project(bbox[3], bbox[0])
+        x1, y1 = cs.project(bbox[1], bbox[2])
+        lo, hi = cs._key(x0, y0, z), cs._key(x1, y1, z)
+        expected = 0
+        for _, lat, lon, zone in rows:
+            x, y = cs.project(lat, lon)
+            k = cs._key(x, y, z)
+            if zone in zones and lo[0] <= k[0] <= hi[0] and lo[1] <= k[1] <= hi[1]:
+                if z <= cs.PRECOMPUTED_ZOOM or (x0 <= x <= x1 and y0 <= y <= y1):
+                    expected += 1
+        result = index.clusters(bbox, z, zones)
+        assert result["total"] == expected == _sum(result) > 0
+
+
+def _login_as(client, username, role="editor", zones=()):
+    db.session.add(AdminUser(username=username, password_hash="x", role=role, zones=list(zones)))
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess["is_admin"] = True
+        sess["admin_username"] = username
+
+
+def test_clusters_respect_admin_zones(app, client):
+    with app.app_context():
+        zone = Zone(description="Центр", color="#f00", geometry="{}")
+        db.session.add(zone)
+        db.session.flush()
+        db.session.add_all([
+            Address(name="В зоне", lat=MINSK[0], lon=MINSK[1], zone_id=zone.id),
+            Address(name="Без зоны", lat=MINSK[0] + 0.01, lon=MINSK[1]),
+        ])
+        db.session.commit()
+        zone_id = zone.id
+        # без привязанных зон адреса недоступны (как в /api/addresses)
+        _login_as(client, "zoneless")
+
+    rv = client.get("/api/geo/clusters?layer=addresses&z=5")
+    assert rv.status_code == 200 and rv.get_json()["total"] == 0
+
+    with app.app_context():
+        _login_as(client, "zoned", zones=[db.session.get(Zone, zone_id)])
+    assert client.get("/api/geo/clusters?layer=addresses&z=5").get_json()["total"] == 1
@@ -0,0 +1,64 @@
+import json
+import os
+
+from app.services import geocode_service
+from app.services.geocode_index import GeocodeIndex, normalize
+
+ENTRIES = [
+    {"display_name": "Минск, улица Немига 12", "lat": 53.90, "lon": 27.55},
+    {"display_name": "Минск, проспект Независимости 4", "lat": 53.89, "lon": 27.54},
+    {"display_name": "Брест, улица Советская 10", "lat": 52.09, "lon": 23.69},
+    {"name": "Немига", "display_name": "Минск, станция метро Немига", "lat": 53.905, "lon": 27.553},
+    {"name": "Гродно, Октябрьская улица 3", "lat": 53.68, "lon": 23.83},
+    {"display_name": "", "lat": 0, "lon": 0},
+]
+
+
+def test_normalize_translit_prefix_infix_fuzzy_and_and():
+    assert normalize("Немига") == normalize("НЕМИГА") == "nemiga"
+    assert normalize("Могилёв") == "mogilev"
+    idx = GeocodeIndex(ENTRIES)
+    assert len(idx) == 5  # запись без названия пропущена
+
+    # точное короткое название — первым, латиница находит кириллицу
+    assert idx.search("немига", 5)[0]["lat"] == 53.905
+    assert [r["lat"] for r in idx.search("nemiga", 5)] == [r["lat"] for r in idx.search("Немига", 5)]
+    # все токены запроса (AND), префикс последнего
+    assert [r["lat"] for r in idx.search("минск незав", 5)] == [53.89]
+    assert idx.search("брест незав", 5) == []
+    # вхождение внутри слова и опечатка
+    assert idx.search("ктябрьск")[0]["lat"] == 53.68
+    assert idx.search("Нимига")[0]["lat"] in (53.90, 53.905)
+    assert idx.search("") == [] and idx.search("zzzz") == []
+
+
+def test_service_rebuilds_index_when_file_changes(app, tmp_path):
+    path = tmp_path / "offline.json"
+    path.write_text(json.dumps(ENTRIES[:2]), encoding="utf-8")
+    with app.app_context():
+        app.config["OFFLINE_GEOCODE_FILE"] = str(path)
+        geocode_service.invalidate_geocode_cache()
+        first = geocode_service.get_offline_index()
+        assert geocode_service.get_offline_index() is first
+        assert geocode_service.search_offline("Советская") == []
+
+        path.write_text(json.dumps(ENTRIES), encoding="utf-8")
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        assert geocode_service.offline_index_stats()["stale"] is True
+        assert geocode_service.search_offline("Советская")[0]["lat"] == 52.09
+        assert geocode_service.get_offline_index() is not first
+
+        os.remove(path)
+        assert geocode_service.search_offline("Советская") == []
+
+
+def test_stats_report_memory_and_lookups():
+    idx = GeocodeIndex(ENTRIES)
+    idx.search("минск", 3)
+    stats = idx.stats()
+    assert stats["entries"] == 5 and stats["lookups"] == 1
+    assert stats["avg_lookup_us"] > 0
+    mem = stats["memory_bytes"]
+    assert mem["index_total"] == sum(v for k, v in mem.items() if k != "index_total") > 0
+    json.dumps(stats)
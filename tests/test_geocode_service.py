@@ -21,7 +21,7 @@ def test_geocode_offline(monkeypatch, app, tmp_path):
     def fake_get(*args, **kwargs):  # pragma: no cover - защита от вызова
         raise AssertionError("requests.get should not be called when offline hit exists")
 
-    monkeypatch.setattr("app.services.geocode_service.requests.get", fake_get)
+    monkeypatch.setattr("app.services.nominatim_service.requests.get", fake_get)
 
     with app.app_context():
         results = geocode("some", limit=1, lang="ru")
@@ -48,7 +48,7 @@ def test_geocode_online_fallback(monkeypatch, app):
             {"display_name": "Online place", "lat": "11.11", "lon": "22.22"},
         ])
 
-    monkeypatch.setattr("app.services.geocode_service.requests.get", fake_get)
+    monkeypatch.setattr("app.services.nominatim_service.requests.get", fake_get)
 
     with app.app_context():
         results = geocode("online", limit=1, lang="ru")
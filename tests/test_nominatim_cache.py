@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app.extensions import db
+from app.models import GeocodeCacheEntry
+from app.services import nominatim_service as ns
+
+
+class _Stub:
+    """Локальный «Nominatim»: /search и /reverse, журнал запросов."""
+
+    def __init__(self):
+        self.hits = []  # (monotonic, path, q)
+        self.delay = 0.0
+        self.busy_once = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                args = {k: v[0] for k, v in parse_qs(url.query).items()}
+                q = args.get("q") or f"{args.get('lat')},{args.get('lon')}"
+                stub.hits.append((time.monotonic(), url.path, q))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if q in stub.busy_once:
+                    stub.busy_once.discard(q)
+                    return self._send(429, {}, {"Retry-After": "0.2"})
+                if q == "boom":
+                    return self._send(500, {})
+                if url.path == "/reverse":
+                    return self._send(200, {"display_name": f"addr {q}", "lat": args["lat"], "lon": args["lon"]})
+                if q.startswith("nothing"):
+                    return self._send(200, [])
+                n = min(int(args.get("limit", 1)), 2)
+                return self._send(200, [{"display_name": f"{q} #{i}", "lat": "53.9", "lon": str(27.5 + i)} for i in range(n)])
+
+            def _send(self, code, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(code)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def count(self, q=None):
+        return sum(1 for _, _, hq in self.hits if q is None or hq == q)
+
+
+@pytest.fixture
+def stub(app):
+    s = _Stub()
+    app.config.update(NOMINATIM_URL=s.url, NOMINATIM_RPS=0, NOMINATIM_TIMEOUT=5)
+    yield s
+    s.server.shutdown()
+
+
+def test_search_and_reverse_cached_in_db_with_negative_entries(app, stub):
+    with app.app_context():
+        first = ns.search("  Минск   Немига ", 1)
+        assert first[0]["display_name"] == "Минск   Немига #0"
+        # тот же нормализованный запрос и больший limit — из той же записи
+        assert ns.search("минск немига", 3) == ns.search("МИНСК НЕМИГА", 2)
+        assert stub.count() == 1
+
+        assert ns.search("nothing here") == [] and ns.search("Nothing  here") == []
+        assert stub.count() == 2
+        row = GeocodeCacheEntry.query.filter_by(query_key="nothing here").one()
+        assert row.results() == [] and row.expires_at < datetime.utcnow() + timedelta(days=2)
+        row.expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        ns.search("nothing here")
+        assert stub.count() == 3
+
+        ns.search("минск немига", 1, lang="en")
+        assert stub.count() == 4
+
+        # ошибки upstream не кэшируются
+        for _ in range(2):
+            with pytest.raises(ns.NominatimUnavailable):
+                ns.search("boom")
+        assert stub.count("boom") == 2
+
+        assert ns.reverse(53.900001, 27.55)[0]["display_name"].startswith("addr")
+        assert ns.reverse(53.9000012, 27.5500004) == ns.reverse(53.900001, 27.55)
+        assert sum(1 for _, path, _ in stub.hits if path == "/reverse") == 1
+
+
+def test_fetch_many_concurrent_rate_limited_and_resumable(app, stub):
+    app.config.update(NOMINATIM_RPS=20, NOMINATIM_CONCURRENCY=4)
+    stub.delay = 0.15
+    queries = [f"street {i}" for i in range(12)] + ["Street 1", "street  2"]
+    with app.app_context():
+        # прерываем пересборку после 5 результатов
+        with closing(ns.fetch_many(queries)) as it:
+            got = [next(it) for _ in range(5)]
+        assert not any(from_cache for _, _, from_cache in got)
+        done_keys = {ns.normalize_query(q) for q, _, _ in got}
+        assert GeocodeCacheEntry.query.filter(GeocodeCacheEntry.query_key.in_(done_keys)).count() == len(done_keys)
+
+        time.sleep(0.5)  # запросы, уже начатые до закрытия, дорабатывают в фоне
+        stub.hits.clear()
+        t0 = time.monotonic()
+        results = list(ns.fetch_many(queries))
+        elapsed = time.monotonic() - t0
+
+    assert sorted(q for q, _, _ in results) == sorted(queries)
+    assert all(res and res[0]["lat"] == "53.9" for _, res, _ in results)
+    assert sum(1 for _, _, from_cache in results if from_cache) >= 5
+    # уже сохранённые не запрашиваются повторно, дубликаты — один раз
+    fetched = [q for _, _, q in stub.hits]
+    assert not done_keys & set(fetched) and len(fetched) == len(set(fetched))
+    # не чаще 20/с, но запросы по 150 мс идут параллельно
+    starts = sorted(t for t, _, _ in stub.hits)
+    assert starts[-1] - starts[0] >= (len(starts) - 1) * 0.05 - 0.02
+    assert elapsed < len(fetched) * stub.delay
+
+
+def test_retry_after_429_delays_next_request(app, stub):
+    stub.busy_once.add("busy")
+    with app.app_context():
+        assert ns.search("busy")[0]["display_name"] == "busy #0"
+    (t1, _, _), (t2, _, _) = stub.hits
+    assert t2 - t1 >= 0.2
+
+
+def test_upstream_error_not_cached_by_geocoder(app, client, stub):
+    from app.cache import get_cache
+    from app.geocode import bp as geocode_bp
+    from app.services.geocode_service import CACHE_NAME
+
+    if "geocode" not in app.blueprints:
+        app.register_blueprint(geocode_bp, url_prefix="/api")
+    app.config.update(OFFLINE_GEOCODE_FILE=None, GEOCODE_CACHE_SECONDS=600)
+    get_cache(CACHE_NAME).invalidate()
+
+    for _ in range(2):
+        resp = client.get("/api/geocode", query_string={"q": "boom"})
+        assert resp.status_code == 502 and resp.headers["Cache-Control"] == "no-store"
+    assert stub.count("boom") == 2
+    assert client.get("/api/geocode/reverse?lat=53.9&lon=27.5").status_code == 200
+
+
+def test_interactive_wait_is_bounded(app, client, stub):
+    from app.geocode import bp as geocode_bp
+
+    if "geocode" not in app.blueprints:
+        app.register_blueprint(geocode_bp, url_prefix="/api")
+    app.config.update(OFFLINE_GEOCODE_FILE=None, NOMINATIM_RPS=0.2, NOMINATIM_MAX_WAIT=0.5)
+    with app.app_context():
+        assert ns.search("first")  # занял слот, следующий — через 5 с
+        t0 = time.monotonic()
+        with pytest.raises(ns.NominatimBusy) as exc:
+            ns.search("second")
+        assert time.monotonic() - t0 < 0.5 and exc.value.retry_after > 4
+        # пересборка (без max_wait) по-прежнему ждёт очереди, а не падает
+        assert ns.NominatimClient.from_config().max_wait is None
+
+    resp = client.get("/api/geocode/reverse?lat=53.91&lon=27.51")
+    assert resp.status_code == 503 and int(resp.headers["Retry-After"]) >= 4
+    assert stub.count("second") == 0
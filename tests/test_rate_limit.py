@@ -0,0 +1,135 @@
+import math
+import types
+
+import pytest
+
+from app.security import rate_limit as rl
+
+T0 = 1_700_000_040.0  # начало минутного окна
+
+
+class _FakeRedis:
+    """Redis с тем же поведением, что у SLIDING_WINDOW_LUA (скрипт исполняется на Python)."""
+
+    def __init__(self):
+        self.data = {}
+        self.calls = 0
+        self.down = False
+
+    def register_script(self, source):
+        assert "INCRBY" in source and "PEXPIRE" in source
+
+        def run(keys, args):
+            self.calls += 1
+            if self.down:
+                raise ConnectionError("redis down")
+            wanted, minimum = int(args[0]), int(args[1])
+            counts = [int(self.data.get(k, 0)) for k in keys]
+            granted = wanted
+            for i in range(len(keys) // 2):
+                limit, weight = int(args[2 + 3 * i]), float(args[3 + 3 * i])
+                granted = min(granted, math.floor(limit - counts[2 * i + 1] * weight - counts[2 * i]))
+            if granted < minimum:
+                return [0] + counts
+            for i in range(0, len(keys), 2):
+                counts[i] += granted
+                self.data[keys[i]] = counts[i]
+            return [granted] + counts
+
+        return run
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    now = [T0]
+    monkeypatch.setattr(rl.time, "time", lambda: now[0])
+    for name in ("_mem", "_leases", "_blocked", "_pools", "_scripts", "_wheel"):
+        monkeypatch.setattr(rl, name, {})
+    monkeypatch.setattr(rl, "_wheel_pos", None)
+    monkeypatch.setattr(rl, "_redis_down_until", 0.0)
+    return now
+
+
+@pytest.fixture()
+def fake_redis(app, monkeypatch):
+    server = _FakeRedis()
+    pools = []
+
+    def from_url(url, **kwargs):
+        pools.append(kwargs)
+        return object()
+
+    module = types.SimpleNamespace(
+        ConnectionPool=types.SimpleNamespace(from_url=from_url),
+        Redis=lambda connection_pool: server,
+    )
+    monkeypatch.setattr(rl, "redis", module)
+    app.config["REDIS_URL"] = "redis://fake:6379/0"
+    server.pools = pools
+    return server
+
+
+def test_memory_sliding_window(app, clock):
+    with app.app_context():
+        app.config["REDIS_URL"] = ""
+        results = [rl.check_rate_limit("login", "1.2.3.4", 5, 60)[0] for _ in range(7)]
+        assert results == [True] * 5 + [False] * 2
+        ok, info = rl.check_rate_limit("login", "1.2.3.4", 5, 60)
+        assert not ok and info.remaining == 0 and info.reset_in == 60 + 12
+        assert rl.check_rate_limit("login", "5.6.7.8", 5, 60)[0]
+
+        # середина следующего окна: предыдущее весит 0.5 -> место ещё для двух
+        clock[0] = T0 + 90
+        assert [rl.check_rate_limit("login", "1.2.3.4", 5, 60)[0] for _ in range(3)] == [True, True, False]
+        # через окно старые счётчики не учитываются
+        clock[0] = T0 + 185
+        ok, info = rl.check_rate_limit("login", "1.2.3.4", 5, 60)
+        assert ok and info.remaining == 4 and info.reset_in == 55
+        assert rl.check_rate_limit("bulk", "x", 10, 60, cost=8)[0]
+        assert not rl.check_rate_limit("bulk", "x", 10, 60, cost=3)[0]
+        assert rl.check_rate_limit("bulk", "x", 10, 60, cost=2)[0]
+
+
+def test_redis_pooled_single_round_trip_and_fallback(app, clock, fake_redis):
+    with app.app_context():
+        assert [rl.check_rate_limit("chat", "u1", 3, 60)[0] for _ in range(4)] == [True, True, True, False]
+        assert fake_redis.calls == 4 and len(fake_redis.pools) == 1
+        assert fake_redis.pools[0]["max_connections"] == rl.DEFAULT_POOL_SIZE
+        # оба ключа окна в одном hash slot (Redis Cluster)
+        assert all(k.startswith("rl:{chat:u1}:") for k in fake_redis.data)
+
+        # Redis упал: проверка уходит в память и не ждёт Redis до REDIS_RETRY_SEC
+        fake_redis.down = True
+        assert rl.check_rate_limit("chat", "u2", 3, 60)[0]
+        assert rl.check_rate_limit("chat", "u2", 3, 60)[0]
+        assert fake_redis.calls == 5
+        fake_redis.down = False
+        rl._redis_down_until = 0.0
+        # отказ запомнен до момента, когда запрос снова поместится в окно
+        assert not rl.check_rate_limit("chat", "u1", 3, 60)[0]
+        assert fake_redis.calls == 5
+        clock[0] = T0 + 60 + 21  # предыдущее окно весит 0.65: 3 * 0.65 <= 3 - 1
+        assert rl.check_rate_limit("chat", "u1", 3, 60)[0]
+        assert fake_redis.calls == 6 and len(fake_redis.pools) == 1
+
+
+def test_local_batching_never_exceeds_cluster_limit(app, clock, fake_redis):
+    with app.app_context():
+        app.config["RATE_LIMIT_LOCAL_BATCH"] = 10
+        allowed = sum(rl.check_rate_limit("live", "bot", 600, 60)[0] for _ in range(100))
+        assert allowed == 100 and fake_redis.calls == 10
+
+        # два «процесса» делят счётчик Redis, у каждого свой резерв
+        leases = {"a": {}, "b": {}}
+        allowed = 100
+        for i in range(1000):
+            rl._leases = leases["ab"[i % 2]]
+            allowed += rl.check_rate_limit("live", "bot", 600, 60)[0]
+        assert allowed == 600
+        assert fake_redis.calls <= 10 + 50 + 2
+
+        # маленькие лимиты (логин) не резервируются — точный подсчёт
+        calls = fake_redis.calls
+        rl.check_rate_limit("login", "ip", 10, 60)
+        rl.check_rate_limit("login", "ip", 10, 60)
+        assert fake_redis.calls == calls + 2
@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+from app.observability.metrics import counters_snapshot
+from app.realtime import hub
+from app.realtime.coalesce import PositionCoalescer, deliver_positions
+from app.realtime.routing import SubscriptionIndex, apply_control
+
+
+def test_keeps_latest_position_per_entity():
+    frames = []
+    co = PositionCoalescer(frames.append, tick=0.25)
+
+    before = counters_snapshot().get("realtime_position_frames_out_total", 0)
+    for i in range(5):
+        assert co.offer("tracking_point", {"user_id": "u1", "lat": 53.9 + i * 0.001, "lon": 27.5})
+    assert co.offer("AGENT_LOCATION_UPDATE", {"agent_id": "a1", "lat": 54.0, "lon": 27.6})
+    assert co.offer("tracking_point", {"user_id": "u2", "lat": 52.1, "lon": 23.7})
+    # не позиционные события идут мимо буфера
+    assert not co.offer("tracking_started", {"user_id": "u1"})
+
+    assert asyncio.run(co.flush()) == 3
+    assert asyncio.run(co.flush()) == 0
+    assert len(frames) == 1
+    (u1, a1, u2) = frames[0]
+    assert u1 == ("tracking_point", {"user_id": "u1", "lat": 53.9 + 4 * 0.001, "lon": 27.5})
+    assert a1[0] == "AGENT_LOCATION_UPDATE" and u2[1]["user_id"] == "u2"
+
+    assert co.stats() == {
+        "tick_ms": 250,
+        "pending": 0,
+        "events_in": 7,
+        "events_coalesced": 4,
+        "frames_out": 1,
+        "items_out": 3,
+    }
+    assert counters_snapshot()["realtime_position_frames_out_total"] == before + 1
+
+
+def test_different_events_of_one_entity_both_survive_tick():
+    frames = []
+    co = PositionCoalescer(frames.append, tick=0.25)
+    co.offer("tracking_point", {"user_id": "u1", "lat": 53.9, "lon": 27.5})
+    co.offer("telemetry_update", {"user_id": "u1", "battery": 80})
+    co.offer("tracking_point", {"user_id": "u1", "lat": 53.91, "lon": 27.5})
+
+    assert asyncio.run(co.flush()) == 2
+    assert frames[0] == [
+        ("tracking_point", {"user_id": "u1", "lat": 53.91, "lon": 27.5}),
+        ("telemetry_update", {"user_id": "u1", "battery": 80}),
+    ]
+
+class _Client:
+    def __init__(self):
+        self.msgs = []
+
+    def offer(self, msg, key=None):
+        self.msgs.append(json.loads(msg))
+        return True
+
+
+def test_batched_frame_respects_subscriptions():
+    idx = SubscriptionIndex()
+    everyone, district = _Client(), _Client()
+    idx.add(everyone)
+    idx.add(district)
+    apply_control(idx, district, "subscribe", {"bbox": [27.4, 53.8, 27.7, 54.0]})
+
+    items = [
+        ("tracking_point", {"user_id": "u1", "lat": 53.9, "lon": 27.55}),
+        ("tracking_point", {"user_id": "u2", "lat": 52.1, "lon": 23.7}),
+    ]
+    assert deliver_positions(idx, items) == 2
+
+    assert [m["event"] for m in everyone.msgs] == ["positions"]
+    assert [it["data"]["user_id"] for it in everyone.msgs[0]["data"]["items"]] == ["u1", "u2"]
+    assert [it["data"]["user_id"] for it in district.msgs[0]["data"]["items"]] == ["u1"]
+
+
+def test_hub_emits_one_positions_frame_per_tick(monkeypatch):
+    class _WS:
+        def __init__(self):
+            self.sent = []
+
+        async def send_text(self, msg):
+            self.sent.append(json.loads(msg))
+
+    async def scenario():
+        ws = _WS()
+        monkeypatch.setattr(hub, "_coalescer", None)
+        monkeypatch.setenv("REALTIME_COALESCE_TICK_MS", "250")
+        await hub.register(ws)
+        try:
+            for i in range(10):
+                await hub.broadcast("tracking_point", {"user_id": "u1", "lat": 53.9, "lon": 27.5 + i * 0.0001})
+            await hub.broadcast("tracking_started", {"user_id": "u1"})
+            await asyncio.sleep(0.3)
+
+            assert [m["event"] for m in ws.sent] == ["tracking_started", "positions"]
+            items = ws.sent[1]["data"]["items"]
+            assert len(items) == 1 and items[0]["data"]["lon"] == 27.5 + 9 * 0.0001
+            assert hub.get_stats()["positions"]["events_in"] == 10
+        finally:
+            await hub.unregister(ws)
+            hub._coalescer._task.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_standalone_server_coalesces_positions(monkeypatch):
+    from app import sockets
+    from app.realtime.fanout import ClientQueue
+
+    sent = []
+
+    async def _send(msg):
+        sent.append(json.loads(msg))
+
+    async def scenario():
+        cq = ClientQueue(object(), _send, maxsize=100, policy="drop_oldest").start()
+        router = SubscriptionIndex()
+        router.add(cq)
+        monkeypatch.setattr(sockets, "_router", router)
+        coalescer = PositionCoalescer(lambda items: deliver_positions(router, items), tick=0.25)
+        monkeypatch.setattr(sockets, "_coalescer", coalescer.start())
+        try:
+            await sockets._broadcast("tracking_point", {"user_id": "u1", "lat": 53.9, "lon": 27.5})
+            await sockets._broadcast("tracking_point", {"user_id": "u1", "lat": 53.9, "lon": 27.6})
+            await asyncio.sleep(0.05)
+            # в очередь клиента ещё ничего не ушло — обе позиции ждут тика
+            assert sent == []
+            await asyncio.sleep(0.3)
+            assert [m["event"] for m in sent] == ["positions"]
+            (item,) = sent[0]["data"]["items"]
+            assert item["data"]["lon"] == 27.6
+            assert coalescer.stats()["events_coalesced"] == 1
+        finally:
+            coalescer._task.cancel()
+            await cq.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+from app.realtime import hub
+from app.realtime.fanout import ClientQueue, coalesce_key, fanout
+
+
+class _FakeWS:
+    def __init__(self, delay: float = 0.0, gate: asyncio.Event | None = None):
+        self.delay = delay
+        self.gate = gate
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, msg: str) -> None:
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(msg))
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        self.closed_with = code
+
+
+def test_slow_client_does_not_block_others():
+    async def scenario():
+        stuck = _FakeWS(gate=asyncio.Event())  # «мобильный на плохой сети» — не читает вообще
+        fast = _FakeWS()
+        await hub.register(stuck)
+        await hub.register(fast)
+        try:
+            for i in range(5):
+                await asyncio.wait_for(hub.broadcast("map_updates", {"id": i}), timeout=0.5)
+            await asyncio.sleep(0.05)
+            assert [m["data"]["id"] for m in fast.sent] == [0, 1, 2, 3, 4]
+            assert stuck.sent == []
+
+            stats = hub.get_stats()
+            assert stats["ws_clients"] == 2
+            by_sent = sorted(stats["clients"], key=lambda c: c["sent"])
+            assert by_sent[0]["queued"] == 4 and by_sent[0]["lag_ms"] > 0
+            assert by_sent[1]["sent"] == 5
+            assert stats["totals"]["sent"] == 5
+        finally:
+            await hub.unregister(stuck)
+            await hub.unregister(fast)
+        assert hub.get_stats()["ws_clients"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_overflow_policies():
+    async def scenario():
+        gate = asyncio.Event()
+
+        ws = _FakeWS(gate=gate)
+        cq = ClientQueue(ws, ws.send_text, maxsize=2, policy="drop_oldest").start()
+        cq.offer(json.dumps({"data": {"i": 0}}))
+        await asyncio.sleep(0)  # writer забрал первое сообщение и ждёт на gate
+        for i in range(1, 5):
+            cq.offer(json.dumps({"data": {"i": i}}))
+        gate.set()
+        await asyncio.sleep(0.05)
+        assert [m["data"]["i"] for m in ws.sent] == [0, 3, 4]
+        assert cq.dropped == 2
+        await cq.aclose()
+
+        gate = asyncio.Event()
+        ws = _FakeWS(gate=gate)
+        cq = ClientQueue(ws, ws.send_text, maxsize=2, policy="coalesce")
+        a, b = ("pos", "user_id:a"), ("pos", "user_id:b")
+        cq.offer('{"data": "a1"}', a)
+        cq.offer('{"data": "b1"}', b)
+        cq.offer('{"data": "a2"}', a)  # заменяет a1 на месте
+        cq.offer('{"data": "b2"}', b)
+        cq.start()
+        gate.set()
+        await asyncio.sleep(0.05)
+        assert [m["data"] for m in ws.sent] == ["a2", "b2"]
+        assert (cq.coalesced, cq.dropped) == (2, 0)
+        await cq.aclose()
+
+        # сообщения чата с тем же user_id не склеиваются: при переполнении
+        # теряется только самое старое, а не заменяются более ранние
+        assert coalesce_key("chat_message", {"user_id": "a"}) is None
+        assert coalesce_key("tracking_point", {"user_id": "a"}) == ("tracking_point", "user_id:a")
+        gate = asyncio.Event()
+        ws = _FakeWS(gate=gate)
+        cq = ClientQueue(ws, ws.send_text, maxsize=2, policy="coalesce")
+        for i in range(3):
+            msg = {"event": "chat_message", "data": {"user_id": "a", "text": str(i)}}
+            fanout([cq], msg["event"], msg["data"], json.dumps(msg))
+        cq.start()
+        gate.set()
+        await asyncio.sleep(0.05)
+        assert [m["data"]["text"] for m in ws.sent] == ["1", "2"]
+        assert (cq.coalesced, cq.dropped) == (0, 1)
+        await cq.aclose()
+
+        closed = []
+        ws = _FakeWS(gate=asyncio.Event())
+        cq = ClientQueue(ws, ws.send_text, maxsize=1, policy="disconnect", on_close=closed.append).start()
+        assert cq.offer("{}")
+        await asyncio.sleep(0)  # первое сообщение «в полёте», второе ждёт в очереди
+        assert cq.offer("{}")
+        assert cq.offer("{}") is False
+        assert closed == [cq] and cq.close_reason == "slow_consumer"
+        await cq.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_send_error_drops_client_from_hub():
+    class _Broken(_FakeWS):
+        async def send_text(self, msg: str) -> None:
+            raise ConnectionError("gone")
+
+    async def scenario():
+        ws = _Broken()
+        await hub.register(ws)
+        await hub.broadcast("map_updates", {"id": 1})
+        await asyncio.sleep(0.01)
+        assert hub.get_stats()["ws_clients"] == 0
+        await hub.unregister(ws)
+
+    asyncio.run(scenario())
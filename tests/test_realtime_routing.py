@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+from app.realtime import hub
+from app.realtime.routing import SubscriptionIndex, apply_control, event_topics
+
+
+def test_event_topics():
+    assert event_topics("chat2_message", {"channel_id": "c1"}) == ["chat2:c1"]
+    assert event_topics("incident_updated", {"id": 7}) == ["incidents", "incident:7"]
+    assert event_topics("tracking_point", {"user_id": "u1"}) == ["tracker"]
+    assert event_topics("sos_created", {"lat": 53.9, "lon": 27.5}) == []
+    assert event_topics("pending_created", {"id": 1}) == []
+
+
+def test_index_routes_by_topic_and_bbox():
+    idx = SubscriptionIndex()
+    legacy, chat, district, tracker_all = "legacy", "chat", "district", "tracker_all"
+    for c in (legacy, chat, district, tracker_all):
+        idx.add(c)
+
+    apply_control(idx, chat, "subscribe", {"topics": ["chat2:c1"]})
+    # viewport вокруг Минска без топиков = все гео-события внутри
+    apply_control(idx, district, "subscribe", {"bbox": [27.4, 53.8, 27.7, 54.0]})
+    apply_control(idx, tracker_all, "subscribe", {"topics": ["tracker"]})
+
+    assert idx.route("chat2_message", {"channel_id": "c1"}) == {legacy, chat, district}
+    assert idx.route("chat2_message", {"channel_id": "c2"}) == {legacy, district}
+
+    in_minsk = {"user_id": "u1", "lat": 53.9, "lon": 27.55}
+    in_brest = {"user_id": "u2", "lat": 52.1, "lon": 23.7}
+    assert idx.route("tracking_point", in_minsk) == {legacy, district, tracker_all}
+    assert idx.route("tracking_point", in_brest) == {legacy, tracker_all}
+
+    # общие события (pending и т.п.) — всем
+    assert idx.route("pending_created", {"id": 1}) == {legacy, chat, district, tracker_all}
+    # SOS вне viewport всё равно доходит до всех, включая district
+    for event in ("sos_created", "sos_acked", "sos_closed"):
+        assert idx.route(event, {"id": 3, **in_brest}) == {legacy, chat, district, tracker_all}
+
+    apply_control(idx, district, "unsubscribe", {"bbox": None})
+    assert idx.route("tracking_point", in_minsk) == {legacy, tracker_all}
+
+    apply_control(idx, chat, "unsubscribe", {"all": True})
+    assert idx.route("chat2_message", {"channel_id": "c2"}) == {legacy, chat}
+
+    idx.remove(legacy)
+    assert idx.route("tracking_point", in_brest) == {chat, tracker_all}
+    assert idx.stats()["deliveries_skipped"] > 0
+
+
+class _FakeWS:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, msg: str) -> None:
+        self.sent.append(json.loads(msg))
+
+
+def test_hub_delivers_only_to_subscribers():
+    async def scenario():
+        a, b = _FakeWS(), _FakeWS()
+        await hub.register(a)
+        await hub.register(b)
+        try:
+            assert await hub.handle_message(a, json.dumps({"event": "subscribe", "data": {"topics": ["incident:5"]}}))
+            assert not await hub.handle_message(a, "ping")
+
+            await hub.broadcast("incident_updated", {"id": 5})
+            await hub.broadcast("incident_updated", {"id": 6})
+            await asyncio.sleep(0.01)
+
+            assert [m["event"] for m in a.sent] == ["subscribed", "incident_updated"]
+            assert a.sent[0]["data"]["topics"] == ["incident:5"]
+            assert a.sent[1]["data"]["id"] == 5
+            assert [m["data"]["id"] for m in b.sent] == [5, 6]
+            assert hub.get_stats()["routing"]["deliveries_skipped"] >= 1
+        finally:
+            await hub.unregister(a)
+            await hub.unregister(b)
+
+    asyncio.run(scenario())
+
+
+class _ConnWS(_FakeWS):
+    """Соединение с входящим потоком: receive_text() до отключения клиента."""
+
+    def __init__(self):
+        super().__init__()
+        self.inbox = asyncio.Queue()
+
+    async def receive_text(self) -> str:
+        msg = await self.inbox.get()
+        if msg is None:
+            raise ConnectionError("disconnect")
+        return msg
+
+
+def test_serve_applies_subscriptions_from_receive_loop():
+    async def scenario():
+        ws = _ConnWS()
+        task = asyncio.create_task(hub.serve(ws))
+        await ws.inbox.put("ping")
+        await ws.inbox.put(json.dumps({"event": "subscribe", "data": {"topics": ["incident:7"]}}))
+        for _ in range(20):
+            if ws.sent:
+                break
+            await asyncio.sleep(0.01)
+        assert hub.get_stats()["ws_clients"] == 1
+
+        await hub.broadcast("incident_updated", {"id": 8})
+        await hub.broadcast("incident_updated", {"id": 7})
+        await asyncio.sleep(0.01)
+        assert [m["event"] for m in ws.sent] == ["subscribed", "incident_updated"]
+        assert ws.sent[1]["data"]["id"] == 7
+
+        await ws.inbox.put(None)
+        await asyncio.wait_for(task, timeout=1)
+        assert hub.get_stats()["ws_clients"] == 0
+
+    asyncio.run(scenario())
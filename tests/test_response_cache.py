@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+
+from app import cache as cache_module
+from app.cache import ResponseCache
+from app.extensions import db
+from app.models import Address, Zone
+from app.observability.metrics import counters_snapshot
+from app.services.analytics_service import get_summary
+from app.services.geocode_service import geocode
+
+
+def test_lru_ttl_and_single_flight(monkeypatch):
+    monkeypatch.setattr(cache_module, "_redis", lambda: None)
+    c = ResponseCache("t_lru", maxsize=2)
+    calls = []
+
+    def compute(v):
+        def _f():
+            calls.append(v)
+            return v
+        return _f
+
+    assert c.get_or_compute("a", compute(1), ttl=60) == 1
+    assert c.get_or_compute("a", compute(2), ttl=60) == 1
+    c.get_or_compute("b", compute(3), ttl=60)
+    c.get_or_compute("c", compute(4), ttl=60)  # вытесняет самый старый — "a"
+    assert c.get("a") is None and c.get("c") == 4
+    c.set("short", 5, ttl=0.01)
+    time.sleep(0.02)
+    assert c.get("short") is None
+    assert c.stats()["hits"] == 1 and c.stats()["misses"] == 3
+    assert counters_snapshot()["cache_t_lru_hits_total"] == 1
+
+    # 8 одновременных промахов по одному ключу — одно вычисление
+    slow_calls = []
+
+    def slow():
+        slow_calls.append(1)
+        time.sleep(0.1)
+        return {"v": 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(c.get_or_compute("k", slow, ttl=60))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(slow_calls) == 1 and results == [{"v": 42}] * 8
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.kv = {}
+
+    def get(self, key):
+        return self.kv.get(key)
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.kv:
+            return None
+        self.kv[key] = value
+        return True
+
+    def ttl(self, key):
+        return 30
+
+    def incr(self, key):
+        self.kv[key] = str(int(self.kv.get(key) or 0) + 1)
+        return int(self.kv[key])
+
+    def delete(self, key):
+        self.kv.pop(key, None)
+
+
+def test_redis_tier_shared_between_processes(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(cache_module, "_redis", lambda: fake)
+    monkeypatch.setattr(cache_module, "GEN_CHECK_SEC", 0.0)
+    worker1, worker2 = ResponseCache("t_shared"), ResponseCache("t_shared")
+
+    assert worker1.get_or_compute("k", lambda: [1, 2], ttl=60) == [1, 2]
+    # второй «воркер» берёт значение из Redis, не вычисляя
+    assert worker2.get_or_compute("k", lambda: 1 / 0, ttl=60) == [1, 2]
+    assert not any(k.endswith(":lock") for k in fake.kv)
+
+    worker1.invalidate()
+    assert worker2.get("k") is None
+    assert worker2.get_or_compute("k", lambda: [3], ttl=60) == [3]
+
+
+def test_invalidate_during_compute_does_not_cache_stale_value(monkeypatch):
+    fake = _FakeRedis()
+    for backend in (None, fake):
+        monkeypatch.setattr(cache_module, "_redis", lambda: backend)
+        monkeypatch.setattr(cache_module, "GEN_CHECK_SEC", 0.0)
+        c = ResponseCache(f"t_race_{backend is not None}")
+
+        def stale():
+            # запись в БД и инвалидация случились, пока считали старые данные
+            c.invalidate()
+            return "stale"
+
+        assert c.get_or_compute("k", stale, ttl=60) == "stale"
+        assert c.get("k") is None
+        assert c.get_or_compute("k", lambda: "fresh", ttl=60) == "fresh"
+        assert c.get("k") == "fresh"
+
+
+def test_model_writes_invalidate_analytics_and_geocode_file_changes(app, monkeypatch):
+    monkeypatch.setattr(cache_module, "_redis", lambda: None)
+    with app.app_context():
+        app.config["ANALYTICS_CACHE_SECONDS"] = 60
+        app.config["GEOCODE_CACHE_SECONDS"] = 600
+        cache_module.invalidate("analytics", "geocode")
+        assert get_summary(7)["total"] == 0
+
+        db.session.add(Address(name="A1"))
+        db.session.commit()
+        assert get_summary(7)["total"] == 1
+        before = counters_snapshot().get("cache_analytics_hits_total", 0)
+        assert get_summary(7)["total"] == 1
+        assert counters_snapshot()["cache_analytics_hits_total"] == before + 1
+
+        # bulk delete тоже сбрасывает кэш
+        Address.query.delete()
+        db.session.commit()
+        assert get_summary(7)["total"] == 0
+        db.session.add(Zone(description="z", color="#fff", geometry="{}"))
+        db.session.commit()
+        assert get_summary(7)["by_zone"] == {}
+
+        path = app.config["OFFLINE_GEOCODE_FILE"]
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump([{"display_name": "Минск, Немига 1", "lat": 53.9, "lon": 27.55}], fh)
+        assert geocode("немига")[0]["lat"] == 53.9
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump([{"display_name": "Минск, Немига 1", "lat": 53.91, "lon": 27.55}], fh)
+        assert geocode("немига")[0]["lat"] == 53.9  # результат из кэша до инвалидации
+        from app.services.geocode_service import invalidate_geocode_cache
+
+        invalidate_geocode_cache()
+        assert geocode("немига")[0]["lat"] == 53.91
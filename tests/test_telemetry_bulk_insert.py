@@ -0,0 +1,78 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from app.extensions import db
+from app.models import TrackingPoint
+from app.realtime.broker import _normalize_telemetry_payload
+from app.tracker.bulk_insert import AdaptiveBatcher, copy_text, insert_points, resolve_method
+
+
+def _points(n, now):
+    return [
+        _normalize_telemetry_payload({
+            "user_id": f"u{i % 3}",
+            "lat": 53.9 + i * 1e-4,
+            "lon": 27.5,
+            "ts": (now - timedelta(seconds=i)).isoformat(),
+            "flags": ["jump"] if i == 0 else [],
+            "note": "tab\there\nnewline \\ backslash",
+        })
+        for i in range(n)
+    ]
+
+
+def test_insert_points_executemany_on_sqlite(app):
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        assert resolve_method() == "executemany"
+        assert resolve_method("copy") == "executemany"
+
+        assert insert_points(_points(20, now)) == 20
+        db.session.commit()
+
+        assert TrackingPoint.query.count() == 20
+        first = TrackingPoint.query.filter_by(flags=1).one()
+        assert first.ts == now.replace(tzinfo=None)
+        assert json.loads(first.raw_json)["note"] == "tab\there\nnewline \\ backslash"
+
+
+def test_copy_text_escapes_and_nulls():
+    row = {
+        "session_id": None,
+        "user_id": "u1",
+        "ts": datetime(2026, 10, 18, 12, 0, 0),
+        "lat": 53.9,
+        "lon": 27.5,
+        "accuracy_m": None,
+        "kind": "live",
+        "speed_mps": None,
+        "bearing_deg": None,
+        "flags": 0,
+        "src": None,
+        "confidence": None,
+        "raw_json": 'a\tb\nc\\d',
+    }
+    line = copy_text([row])
+    assert line.endswith("\n") and line.count("\n") == 1
+    fields = line[:-1].split("\t")
+    assert len(fields) == 13
+    assert fields[0] == "\\N" and fields[2] == "2026-10-18 12:00:00"
+    assert fields[-1] == "a\\tb\\nc\\\\d"
+
+
+def test_adaptive_batcher_follows_load():
+    b = AdaptiveBatcher(min_batch=50, max_batch=400, min_interval=0.1, max_interval=1.0)
+    assert b.should_flush(50, now=b.last_flush)
+    assert not b.should_flush(10, now=b.last_flush)
+    assert b.should_flush(10, now=b.last_flush + b.interval)
+
+    # плотный поток: пачки заполняются — растёт размер, падает интервал
+    for _ in range(5):
+        b.record(b.batch_size, 0.01)
+    assert b.batch_size == 400 and b.interval == 0.1
+
+    # редкий поток: сбросы по таймеру неполными пачками
+    for _ in range(20):
+        b.record(3, 0.001)
+    assert b.batch_size == 50 and b.interval == 1.0
+    assert b.stats()["flushes"] == 25
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+from app.models import TrackingPoint
+from app.realtime import broker as broker_module
+from app.realtime.broker import consume_telemetry_stream
+
+
+class _FakeStreamRedis:
+    """In-memory Redis Streams + одна consumer group (только нужные команды)."""
+
+    def __init__(self):
+        self.entries = []
+        self.delivered = 0
+        self.pending = {}  # id -> [consumer, delivered_at, times_delivered]
+        self.groups = set()
+        self.acked = []
+        self.streams = {}
+        self.claim_starts = []
+
+    def add(self, payload, entry_id=None):
+        # ID как у Redis: <ms XADD>-<seq>
+        entry_id = entry_id or f"{int(time.time() * 1000)}-{len(self.entries)}"
+        self.entries.append((entry_id, {"payload": payload if isinstance(payload, str) else json.dumps(payload)}))
+        return entry_id
+
+    def _deliver(self, entry_id, consumer):
+        times = self.pending.get(entry_id, [None, 0, 0])[2]
+        self.pending[entry_id] = [consumer, time.monotonic(), times + 1]
+
+    async def xgroup_create(self, stream, group, id="0", mkstream=False):
+        if group in self.groups:
+            raise Exception("BUSYGROUP Consumer Group name already exists")
+        self.groups.add(group)
+
+    async def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        (stream, start), = streams.items()
+        if start == ">":
+            batch = self.entries[self.delivered:self.delivered + count]
+            self.delivered += len(batch)
+        else:
+            batch = [e for e in self.entries if self.pending.get(e[0], [None])[0] == consumer][:count]
+        for entry_id, _ in batch:
+            self._deliver(entry_id, consumer)
+        if not batch:
+            if block:
+                await asyncio.sleep(0.005)
+            return []
+        return [[stream, batch]]
+
+    async def xack(self, stream, group, *ids):
+        for entry_id in ids:
+            if self.pending.pop(entry_id, None) is not None:
+                self.acked.append(entry_id)
+        return len(ids)
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, start_id="0-0", count=100):
+        # как в Redis: любые простаивающие записи (и свои тоже), начиная с курсора
+        self.claim_starts.append(start_id)
+        now = time.monotonic()
+        ids = [e[0] for e in self.entries]
+        start = ids.index(start_id) if start_id in ids else 0
+        claimed, cursor = [], "0-0"
+        for entry_id, fields in self.entries[start:]:
+            p = self.pending.get(entry_id)
+            if not p or (now - p[1]) * 1000 < min_idle_time:
+                continue
+            if len(claimed) == count:
+                cursor = entry_id
+                break
+            self._deliver(entry_id, consumer)
+            claimed.append((entry_id, fields))
+        return [cursor, claimed, []]
+
+    async def xpending_range(self, stream, group, min, max, count, consumername=None):
+        p = self.pending.get(min)
+        if p is None:
+            return []
+        return [{"message_id": min, "consumer": p[0], "time_since_delivered": 0, "times_delivered": p[2]}]
+
+    async def xadd(self, stream, fields, **kw):
+        self.streams.setdefault(stream, []).append(fields)
+        return f"{len(self.streams[stream])}-0"
+
+
+def _point(uid, lat):
+    # тот же конверт, что публикует telemetry_node
+    return {"event": "AGENT_LOCATION_UPDATE", "data": {"user_id": uid, "lat": lat, "lon": 27.5, "ts": datetime.now(timezone.utc).isoformat()}}
+
+
+def _rust_entry(uid, lat, ts=None):
+    """Payload записи так, как его кладёт telemetry_node (serde WsMessage):
+    Option::None -> null, ``ts`` только если его прислало устройство."""
+    data = {"user_id": uid, "lat": lat, "lon": 27.5, "accuracy_m": None, "unit_label": None}
+    if ts is not None:
+        data["ts"] = ts
+    return json.dumps({"event": "AGENT_LOCATION_UPDATE", "data": data}, separators=(",", ":"))
+
+
+async def _run_consumer(redis, consumer, **kw):
+    stop = asyncio.Event()
+    task = asyncio.create_task(consume_telemetry_stream(redis, consumer=consumer, stop=stop, block_ms=5, **kw))
+    await asyncio.sleep(0.05)
+    stop.set()
+    await asyncio.wait_for(task, timeout=1)
+
+
+def test_stream_consumers_ack_and_reclaim(app):
+    redis = _FakeStreamRedis()
+    for i in range(3):
+        redis.add(_point("u1", 53.9 + i))
+    redis.add({"event": "AGENT_LOCATION_UPDATE", "data": {"lat": 1}})  # без user_id — ack без записи
+
+    async def scenario():
+        await redis.xgroup_create("telemetry_save_stream", "telemetry_writers")
+        # consumer A забрал 2 записи и «упал» до XACK
+        await redis.xreadgroup("telemetry_writers", "a", {"telemetry_save_stream": ">"}, count=2)
+        # consumer B дочитывает новые и через XAUTOCLAIM забирает зависшие у A
+        await _run_consumer(redis, "b", claim_idle_ms=0)
+
+    with app.app_context():
+        asyncio.run(scenario())
+        assert TrackingPoint.query.count() == 3
+        assert sorted(tp.lat for tp in TrackingPoint.query.all()) == [53.9, 54.9, 55.9]
+    assert redis.pending == {}
+    assert len(redis.acked) == 4
+
+
+def test_failed_flush_leaves_entries_pending(app, monkeypatch):
+    redis = _FakeStreamRedis()
+    redis.add(_point("u1", 53.9))
+
+    def _boom(points):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(broker_module, "flush_telemetry_batch", _boom)
+    with app.app_context():
+        asyncio.run(_run_consumer(redis, "a"))
+    assert list(redis.pending) == [redis.entries[0][0]] and redis.acked == []
+
+
+def test_stream_points_keep_device_time(app):
+    redis = _FakeStreamRedis()
+    device_fix = "2026-10-18T08:00:00+00:00"
+    redis.add(_rust_entry("u1", 53.9, ts=device_fix), entry_id="1792310400500-0")
+    # старая прошивка без ts: время постановки в стрим из ID записи, а не время чтения
+    redis.add(_rust_entry("u2", 54.0), entry_id="1792310401250-0")
+    redis.add(_rust_entry("u3", 54.1, ts=1792310300000), entry_id="1792310402000-0")
+
+    with app.app_context():
+        asyncio.run(_run_consumer(redis, "a"))
+        stored = {tp.user_id: tp.ts.replace(tzinfo=None) for tp in TrackingPoint.query.all()}
+    assert stored == {
+        "u1": datetime(2026, 10, 18, 8, 0),
+        "u2": datetime.fromtimestamp(1792310401.25, tz=timezone.utc).replace(tzinfo=None),
+        "u3": datetime.fromtimestamp(1792310300, tz=timezone.utc).replace(tzinfo=None),
+    }
+
+
+def test_poison_batch_goes_to_dead_letter_stream(app, monkeypatch):
+    redis = _FakeStreamRedis()
+    poison = [redis.add(_point("u1", 53.9 + i)) for i in range(3)]
+
+    def _boom(points):
+        raise RuntimeError("constraint violation")
+
+    monkeypatch.setattr(broker_module, "flush_telemetry_batch", _boom)
+    with app.app_context():
+        asyncio.run(_run_consumer(
+            redis, "a", claim_idle_ms=0, reclaim_every_sec=0, batch_size=2, max_deliveries=2,
+        ))
+
+    # после 2 неудачных доставок записи перенесены и подтверждены — PEL свободен
+    assert redis.pending == {} and sorted(redis.acked) == sorted(poison)
+    dead = redis.streams["telemetry_save_stream:dead"]
+    assert sorted(d["source_id"] for d in dead) == sorted(poison)
+    assert all(d["deliveries"] == 3 for d in dead)
+    assert json.loads(dead[0]["payload"])["data"]["user_id"] == "u1"
+    # XAUTOCLAIM продолжает с возвращённого курсора, а не всегда с 0-0
+    assert poison[2] in redis.claim_starts
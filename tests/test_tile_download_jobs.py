@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.extensions import db
+from app.services import tile_download_service as tds
+
+BOUNDS = (53.85, 53.9, 27.5, 27.6)  # z10..12 — 11 тайлов
+
+
+class _TileStub:
+    def __init__(self):
+        self.hits = []
+        self.flaky = set()  # путь -> один раз 503
+        self.broken = set()  # путь -> всегда 500
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.hits.append(self.path)
+                if self.path in stub.broken:
+                    code, body = 500, b""
+                elif self.path in stub.flaky:
+                    stub.flaky.discard(self.path)
+                    code, body = 503, b""
+                else:
+                    code, body = 200, b"PNG" + self.path.encode()
+                self.send_response(code)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def stub(app, monkeypatch):
+    s = _TileStub()
+    app.config.update(TILE_DOWNLOAD_URL=s.url + "/{z}/{x}/{y}.png", TILE_DOWNLOAD_CONCURRENCY=3, TILE_DOWNLOAD_RETRIES=2)
+    monkeypatch.setattr(tds, "BACKOFF_SEC", 0.01)
+    monkeypatch.setattr(tds, "FLUSH_SEC", 0.05)
+    # задания выполняются синхронно, без фонового потока
+    monkeypatch.setattr(tds, "start_job", lambda job_id: tds.run_job(job_id))
+    yield s
+    s.server.shutdown()
+
+
+def _create(target):
+    return tds.create_job(city="minsk", bounds=BOUNDS, zmin=10, zmax=12, set_name="t", target_dir=str(target))
+
+
+def _files(target):
+    return sorted(os.path.relpath(os.path.join(r, f), target) for r, _, fs in os.walk(target) for f in fs)
+
+
+def test_job_downloads_all_tiles_and_skips_existing(app, stub, tmp_path):
+    target = tmp_path / "tiles"
+    with app.app_context():
+        job = _create(target)
+        assert _create(target).id == job.id  # пока задание активно — подключаемся к нему
+        order = tds._TileOrder(job.params()["ranges"])
+        assert job.total == order.total == len({order.tile(i) for i in range(order.total)}) == 11
+
+        job = tds.run_job(job.id)
+        assert (job.status, job.done, job.cursor, job.downloaded, job.failed) == ("done", 11, 11, 11, 0)
+        assert tds.run_job(job.id) is None  # завершённое задание повторно не берётся
+        files = _files(target)
+        assert len(files) == 11 and all(f.endswith(".png") for f in files)
+        z, x, y = order.tile(3)
+        assert (target / str(z) / str(x) / f"{y}.png").read_bytes() == f"PNG/{z}/{x}/{y}.png".encode()
+
+        again = tds.run_job(_create(target).id)
+        assert (again.status, again.skipped, again.downloaded) == ("done", 11, 0)
+        assert len(stub.hits) == 11
+
+
+def test_retries_failed_tiles_and_resume(app, stub, tmp_path):
+    target = tmp_path / "tiles"
+    with app.app_context():
+        job = _create(target)
+        order = tds._TileOrder(job.params()["ranges"])
+        paths = ["/%d/%d/%d.png" % order.tile(i) for i in range(order.total)]
+        stub.flaky.update(paths[:4])
+        stub.broken.add(paths[7])
+
+        job = tds.run_job(job.id)
+        assert (job.status, job.downloaded, job.failed) == ("done", 10, 1)
+        assert job.failed_tiles() == [paths[7][1:-4]]
+        assert stub.hits.count(paths[0]) == 2 and stub.hits.count(paths[7]) == 3  # 1 + 2 повтора
+
+        stub.broken.clear()
+        stub.hits.clear()
+        job = tds.resume_job(job.id)
+        assert (job.status, job.downloaded, job.failed, job.failed_tiles()) == ("done", 11, 0, [])
+        assert stub.hits == [paths[7]]
+
+
+def test_retry_tiles_survive_crash_and_overflow_marks_partial(app, stub, tmp_path, monkeypatch):
+    target = tmp_path / "tiles"
+    with app.app_context():
+        job = _create(target)
+        order = tds._TileOrder(job.params()["ranges"])
+        keys = ["%d/%d/%d" % order.tile(i) for i in range(order.total)]
+        stub.broken.update("/%s.png" % k for k in keys[:3])
+        monkeypatch.setattr(tds, "MAX_FAILED_KEEP", 2)
+
+        job = tds.run_job(job.id)
+        # 3 неудачи, в список помещаются 2 — дыра не теряется молча
+        assert (job.status, job.failed, len(job.failed_tiles())) == ("partial", 3, 2)
+
+        # повтор неполного задания — полный проход с начала
+        stub.broken.clear()
+        job = tds.resume_job(job.id)
+        assert (job.status, job.failed, job.skipped, job.downloaded) == ("done", 0, 8, 3)
+
+        # воркер падает посреди повтора неудачных тайлов
+        for key in keys[:2]:
+            (target / f"{key}.png").unlink()
+        job.failed_json, job.failed = json.dumps(keys[:2]), 2
+        db.session.commit()
+        real_fetch = tds.fetch_tile
+
+        def fetch(session, url, target_dir, z, x, y, retries):
+            if "%d/%d/%d" % (z, x, y) == keys[1]:
+                raise KeyboardInterrupt("worker killed")
+            return real_fetch(session, url, target_dir, z, x, y, retries)
+
+        monkeypatch.setattr(tds, "fetch_tile", fetch)
+        monkeypatch.setattr(tds, "FLUSH_SEC", 0)
+        with pytest.raises(KeyboardInterrupt):
+            tds.run_job(tds.resume_job(job.id).id)
+
+        # неповторённый тайл остался в failed_json — следующий запуск его доберёт
+        db.session.rollback()
+        job = db.session.get(tds.TileDownloadJob, job.id)
+        assert keys[1] in job.failed_tiles() and job.failed == len(job.failed_tiles())
+
+        monkeypatch.setattr(tds, "fetch_tile", real_fetch)
+        job.status = "done"
+        db.session.commit()
+        job = tds.resume_job(job.id)
+        assert (job.status, job.failed, job.failed_tiles()) == ("done", 0, [])
+        assert len(_files(target)) == 11
+
+
+def test_stale_job_resumes_from_cursor_for_all_watchers(app, stub, tmp_path):
+    target = tmp_path / "tiles"
+    with app.app_context():
+        job = _create(target)
+        # воркер упал после 6 тайлов: cursor сохранён, heartbeat давно не обновлялся
+        job.status, job.cursor, job.done = "running", 6, 6
+        job.heartbeat_at = datetime.utcnow() - timedelta(seconds=tds.STALE_SEC + 5)
+        db.session.commit()
+
+        watchers = [tds.iter_progress(job.id, poll_sec=0.01) for _ in range(2)]
+        finals = [list(w)[-1] for w in watchers]
+        assert [f["status"] for f in finals] == ["done", "done"]
+        assert finals[0]["done"] == 11 and finals[0]["downloaded"] == 5
+
+        order = tds._TileOrder(job.params()["ranges"])
+        assert sorted(stub.hits) == sorted("/%d/%d/%d.png" % order.tile(i) for i in range(6, 11))
+
+
+def test_pack_rejected_while_download_active(app, client, tmp_path):
+    app.config["ADMIN_USERNAME"] = "admin"
+    with client.session_transaction() as sess:
+        sess["is_admin"] = True
+        sess["admin_username"] = "admin"
+    target = os.path.join(app.config["TILES_SETS_DIR"], "t")
+    os.makedirs(os.path.join(target, "10", "590"))
+    with app.app_context():
+        job_id = _create(target).id
+
+    resp = client.post("/api/map/sets/t:pack", json={"remove_dir": True})
+    assert resp.status_code == 409 and resp.get_json()["job"] == job_id
+    assert os.path.isdir(target) and not os.path.exists(target + ".mbtiles.part")
+
+    with app.app_context():
+        tds.cancel_job(job_id)
+    with client.session_transaction() as sess:
+        sess.pop("rl_offline_map_pack_set", None)
+    resp = client.post("/api/map/sets/t:pack", json={})
+    assert resp.status_code == 202
@@ -0,0 +1,106 @@
+import pytest
+from flask import Flask
+
+from app.observability.metrics import counters_snapshot
+from app.services import tile_store as ts
+
+
+def _make_set(root, zooms=(3, 4, 14)):
+    tiles = {}
+    for z in zooms:
+        for x in range(2):
+            p = root / str(z) / str(x)
+            p.mkdir(parents=True, exist_ok=True)
+            data = f"PNG {z}/{x}/0".encode() * 20
+            (p / "0.png").write_bytes(data)
+            tiles[(z, x, 0)] = data
+    return tiles
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    src = tmp_path / "minsk"
+    tiles = _make_set(src)
+    dest = str(tmp_path / "minsk.mbtiles")
+    ts.pack_directory(str(src), dest)
+    monkeypatch.setattr(ts, "_tile_cache", None)
+
+    app = Flask(__name__)
+    app.config.update(TILE_CACHE_MAX_BYTES=10_000, TILE_CACHE_MAX_ZOOM=4)
+    stores = {"dir": ts.DirTileStore(str(src)), "mbtiles": ts.open_mbtiles(dest)}
+
+    @app.get("/t/<kind>/<int:z>/<int:x>/<int:y>.png")
+    def tile(kind, z, x, y):
+        return ts.tile_response(stores[kind], z, x, y)
+
+    @app.get("/active/<kind>/<int:z>/<int:x>/<int:y>.png")
+    def active(kind, z, x, y):
+        return ts.tile_response(stores[kind], z, x, y, pinned=False)
+
+    return app, stores, tiles
+
+
+def test_cache_control_immutable_only_for_pinned_packed_sets(served):
+    app, stores, tiles = served
+    client = app.test_client()
+    v = stores["mbtiles"].stamp
+    cc = {
+        (prefix, kind): client.get(f"/{prefix}/{kind}/3/1/0.png?v={v}").headers["Cache-Control"]
+        for prefix in ("t", "active") for kind in stores
+    }
+    assert cc[("t", "mbtiles")] == f"public, max-age={ts.PACKED_MAX_AGE}, immutable"
+    assert cc[("t", "dir")] == f"public, max-age={ts.DIR_MAX_AGE}"
+    assert cc[("active", "mbtiles")] == cc[("active", "dir")] == f"public, max-age={ts.ACTIVE_MAX_AGE}"
+
+    # без версии или со старой версией (набор перепакован под тем же именем) — только ревалидация
+    for url in ("/t/mbtiles/3/1/0.png", "/t/mbtiles/3/1/0.png?v=0-0"):
+        r = client.get(url)
+        assert r.headers["Cache-Control"] == f"public, max-age={ts.ACTIVE_MAX_AGE}" and r.headers["ETag"]
+
+    r = client.get("/active/mbtiles/3/1/0.png")
+    again = client.get("/active/mbtiles/3/1/0.png", headers={"If-None-Match": r.headers["ETag"]})
+    assert again.status_code == 304 and "immutable" not in again.headers["Cache-Control"]
+
+
+def test_lru_caches_only_low_zoom_tiles_within_byte_budget(served, monkeypatch):
+    app, stores, tiles = served
+    client = app.test_client()
+    reads = []
+    real_get = ts.MBTilesStore.get_tile
+    monkeypatch.setattr(ts.MBTilesStore, "get_tile", lambda self, z, x, y: reads.append(z) or real_get(self, z, x, y))
+    before = counters_snapshot()
+
+    for _ in range(3):
+        for key, data in tiles.items():
+            assert client.get("/t/mbtiles/%d/%d/%d.png" % key).data == data
+    # z3/z4 прочитаны из SQLite один раз, z14 — каждый раз
+    assert sorted(reads) == [3, 3, 4, 4] + [14] * 6
+    cache = ts._tile_cache
+    assert cache.stats()["tiles"] == 4 and cache.bytes == sum(len(tiles[k]) for k in tiles if k[0] <= 4)
+    after = counters_snapshot()
+    assert after["tiles_cache_hits_total"] - before.get("tiles_cache_hits_total", 0) == 8
+
+    small = ts.TileCache(max_bytes=250, max_zoom=4)
+    for i in range(4):
+        small.put(("p", str(i)), b"x" * 100)
+        small.get(("p", "0"))
+    assert small.bytes <= 250 and small.get(("p", "0")) and small.get(("p", "1")) is None
+
+    app.config["TILE_CACHE_MAX_BYTES"] = 0
+    with app.app_context():
+        assert ts.get_tile_cache() is None
+
+
+def test_dir_tiles_are_streamed_from_file(served):
+    app, stores, tiles = served
+    client = app.test_client()
+    with app.test_request_context("/t/dir/14/1/0.png"):
+        resp = ts.tile_response(stores["dir"], 14, 1, 0)
+        # файл отдаётся как есть (wsgi.file_wrapper -> sendfile), без чтения в память
+        assert resp.direct_passthrough and resp.content_length == len(tiles[(14, 1, 0)])
+        resp.close()
+    r = client.get("/t/dir/14/1/0.png", headers={"Range": "bytes=0-3"})
+    assert r.status_code == 206 and r.data == b"PNG "
+    r = client.get("/t/dir/14/1/0.png", headers={"If-None-Match": r.headers["ETag"]})
+    assert r.status_code == 304
+    assert client.get("/t/dir/14/5/0.png").status_code == 404
@@ -0,0 +1,107 @@
+import json
+import os
+import sqlite3
+import threading
+
+import pytest
+from flask import Flask
+
+from app.services import tile_store as ts
+
+# z -> [(x, y)]
+TILES = {10: [(590, 329)], 11: [(1180, 658), (1181, 658), (1180, 659)], 12: [(2361, 1317)]}
+
+
+def _make_dir(root):
+    for z, xys in TILES.items():
+        for x, y in xys:
+            p = root / str(z) / str(x)
+            p.mkdir(parents=True, exist_ok=True)
+            (p / f"{y}.png").write_bytes(f"PNG {z}/{x}/{y}".encode() * 10)
+    (root / "11" / "1180" / "notes.txt").write_text("skip")
+    (root / "readme").write_text("skip")
+
+
+def test_pack_directory_stores_metadata_and_stats(tmp_path):
+    src = tmp_path / "minsk"
+    _make_dir(src)
+    dest = str(tmp_path / "minsk.mbtiles")
+
+    stats = ts.pack_directory(str(src), dest)
+    assert stats["total_tiles"] == 5 and not os.path.exists(dest + ts.PACKING_SUFFIX)
+
+    store = ts.open_set(str(tmp_path), "minsk")
+    assert isinstance(store, ts.MBTilesStore) and ts.open_set(str(tmp_path), "minsk") is store
+    dir_stats = ts.summarise_tiles(str(src))
+    packed = store.stats()
+    assert {k: packed[k] for k in dir_stats} == dir_stats
+    assert packed["levels"] == [{"z": 10, "tiles": 1}, {"z": 11, "tiles": 3}, {"z": 12, "tiles": 1}]
+    assert packed["name"] == "minsk" and len(packed["bounds"].split(",")) == 4
+
+    # статистика берётся из metadata, а не пересчитывается по таблице tiles
+    with sqlite3.connect(dest) as conn:
+        meta = dict(conn.execute("SELECT name, value FROM metadata"))
+        assert (meta["minzoom"], meta["maxzoom"], meta["tile_count"]) == ("10", "12", "5")
+        assert json.loads(meta["levels"]) == packed["levels"]
+
+
+def test_mbtiles_uses_tms_rows_and_reopens_after_repack(tmp_path):
+    src = tmp_path / "minsk"
+    _make_dir(src)
+    dest = str(tmp_path / "minsk.mbtiles")
+    ts.pack_directory(str(src), dest)
+
+    with sqlite3.connect(dest) as conn:
+        rows = set(conn.execute("SELECT zoom_level, tile_column, tile_row FROM tiles"))
+    assert (11, 1180, (1 << 11) - 1 - 659) in rows
+
+    store = ts.open_mbtiles(dest)
+    assert store.get_tile(11, 1180, 659) == (src / "11" / "1180" / "659.png").read_bytes()
+    assert store.get_tile(11, 1181, 659) is None and store.get_tile(3, 99, 0) is None
+
+    other_thread = []
+    t = threading.Thread(target=lambda: other_thread.append(store._conn()))
+    t.start()
+    t.join()
+
+    (src / "11" / "1181" / "659.png").write_bytes(b"new")
+    ts.pack_directory(str(src), dest)
+    fresh = ts.open_mbtiles(dest)
+    assert fresh is not store and fresh.etag(11, 1, 1) != store.etag(11, 1, 1)
+    assert fresh.get_tile(11, 1181, 659) == b"new" and fresh.stats()["total_tiles"] == 6
+    # соединения прежнего хранилища (всех потоков) закрыты — заменённый файл не держится
+    with pytest.raises(sqlite3.ProgrammingError):
+        other_thread[0].execute("SELECT 1")
+    assert store._conns == []
+
+
+def test_tile_response_etag_and_range(tmp_path):
+    src = tmp_path / "minsk"
+    _make_dir(src)
+    dest = str(tmp_path / "minsk.mbtiles")
+    ts.pack_directory(str(src), dest)
+    body = (src / "10" / "590" / "329.png").read_bytes()
+
+    app = Flask(__name__)
+    stores = {"dir": ts.DirTileStore(str(src)), "mbtiles": ts.open_mbtiles(dest)}
+
+    @app.get("/t/<kind>/<int:z>/<int:x>/<int:y>.png")
+    def tile(kind, z, x, y):
+        return ts.tile_response(stores[kind], z, x, y)
+
+    client = app.test_client()
+    for kind in ("dir", "mbtiles"):
+        r = client.get(f"/t/{kind}/10/590/329.png")
+        assert r.status_code == 200 and r.data == body and r.mimetype == "image/png"
+        assert r.headers["Accept-Ranges"] == "bytes"
+        assert r.headers["Cache-Control"] == ts.cache_control(stores[kind], pinned=True)
+        etag = r.headers["ETag"]
+
+        r = client.get(f"/t/{kind}/10/590/329.png", headers={"If-None-Match": etag})
+        assert r.status_code == 304 and r.data == b"" and r.headers["ETag"] == etag
+
+        r = client.get(f"/t/{kind}/10/590/329.png", headers={"Range": "bytes=4-9"})
+        assert r.status_code == 206 and r.data == body[4:10]
+        assert r.headers["Content-Range"] == f"bytes 4-9/{len(body)}"
+
+        assert client.get(f"/t/{kind}/10/590/330.png").status_code == 404
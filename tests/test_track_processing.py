@@ -0,0 +1,114 @@
+import math
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.duty.routes import _compute_stops
+from app.helpers import haversine_m
+from app.tracker.point_fields import FLAG_JUMP
+from app.tracker.track_processing import (
+    Track,
+    douglas_peucker,
+    find_stops,
+    jump_mask,
+    simplify_points,
+    tolerance_for_zoom,
+    visvalingam,
+)
+
+
+T0 = datetime(2026, 10, 18, 8, 0, 0)
+
+
+def _pt(k, lat, lon, flags=0):
+    return SimpleNamespace(session_id=1, ts=T0 + timedelta(seconds=5 * k), lat=lat, lon=lon, flags=flags)
+
+
+def _shift_track(seed=7):
+    """Езда — стоянка 3 мин — езда — короткая остановка 30 с — стоянка 2 мин, с шумом GPS."""
+    rnd = random.Random(seed)
+    pts, lat, lon = [], 53.9, 27.55
+
+    def add(n, dlat, dlon, noise):
+        nonlocal lat, lon
+        for _ in range(n):
+            lat += dlat
+            lon += dlon
+            pts.append(_pt(len(pts), lat + rnd.uniform(-noise, noise), lon + rnd.uniform(-noise, noise)))
+
+    add(40, 1e-4, 5e-5, 1e-6)
+    add(36, 0, 0, 2e-5)
+    add(30, -5e-5, 1e-4, 1e-6)
+    add(6, 0, 0, 1e-5)
+    add(20, 1e-4, 0, 1e-6)
+    add(24, 0, 0, 2e-5)
+    pts.insert(60, _pt(60, None, None))  # точка без координат рвёт окно, как и раньше
+    return pts
+
+
+def _reference_stops(points, radius_m=10.0, min_sec=60):
+    # прежний _compute_stops (поточечный haversine), только индексы кластеров
+    out, i = [], 0
+    while i < len(points) - 1:
+        j = i + 1
+        while j < len(points) and haversine_m(points[i].lat, points[i].lon, points[j].lat, points[j].lon) <= radius_m:
+            j += 1
+        if j - i >= 2 and (points[j - 1].ts - points[i].ts).total_seconds() >= min_sec:
+            out.append((i, j))
+            i = j
+            continue
+        i += 1
+    return out
+
+
+def test_find_stops_matches_reference_and_compute_stops(app):
+    points = _shift_track()
+    expected = _reference_stops(points)
+    assert len(expected) == 3  # первая стоянка разорвана точкой без координат
+    assert find_stops(Track.from_points(points)) == expected
+
+    with app.app_context():
+        stops = _compute_stops(points)
+    assert [(s.start_ts, s.end_ts, s.points_count) for s in stops] == [
+        (points[i].ts, points[j - 1].ts, j - i) for i, j in expected
+    ]
+    i, j = expected[0]
+    assert math.isclose(stops[0].center_lat, sum(p.lat for p in points[i:j]) / (j - i))
+    assert stops[0].duration_sec == int((points[j - 1].ts - points[i].ts).total_seconds())
+
+
+def test_jump_mask_drops_spikes_and_flagged_points():
+    points = [_pt(k, 53.9 + k * 1e-4, 27.55) for k in range(10)]
+    points[4].lat += 0.05  # ~5.5 км за 5 с и обратно
+    points[7].flags = FLAG_JUMP
+    keep = jump_mask(Track.from_points(points))
+    assert list(np.flatnonzero(~keep)) == [4, 7]
+
+    # быстрое, но непрерывное движение (~220 м/с «самолёт») — не выброс
+    fast = [_pt(k, 53.9 + k * 0.01, 27.55) for k in range(5)]
+    assert jump_mask(Track.from_points(fast)).all()
+
+
+def test_simplification_reduces_vertices_within_tolerance():
+    rnd = random.Random(1)
+    n = 5000
+    lat = np.array([53.9 + k * 2e-5 + rnd.uniform(-5e-6, 5e-6) for k in range(n)])
+    lon = np.array([27.55 + 0.01 * math.sin(k / 800.0) for k in range(n)])
+
+    tol = tolerance_for_zoom(16, 53.9)
+    assert 1.3 < tol < 1.5 and tolerance_for_zoom(12, 53.9) > tol
+
+    dp = douglas_peucker(lat, lon, tol)
+    vw = visvalingam(lat, lon, tol)
+    for idx in (dp, vw):
+        assert idx[0] == 0 and idx[-1] == n - 1 and np.all(np.diff(idx) > 0)
+        assert len(idx) < n // 5
+    assert len(douglas_peucker(lat, lon, tolerance_for_zoom(12, 53.9))) < len(dp)
+
+    points = [_pt(k, lat[k], lon[k]) for k in range(n)]
+    points[100].lat += 0.05
+    idx, info = simplify_points(points, zoom=16)
+    assert 100 not in set(idx.tolist())
+    assert info["total"] == n and info["kept"] == len(idx) and info["jumps_dropped"] == 1
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+
+from app.extensions import db
+from app.models import TrackerLastPosition, TrackingPoint
+from app.realtime.broker import _normalize_telemetry_payload, flush_telemetry_batch
+from app.tracker.last_position import get_last_position, upsert_last_positions
+from app.tracker.point_fields import FLAG_JUMP
+
+
+def _pt(uid, ts, lat=53.9, **meta):
+    # точка в том виде, в каком её кладёт в батч consumer telemetry_save_queue
+    return _normalize_telemetry_payload({
+        "user_id": uid,
+        "lat": lat,
+        "lon": 27.5,
+        "accuracy_m": 12.0,
+        "kind": "live",
+        "ts": ts.isoformat(),
+        **meta,
+    })
+
+
+def test_flush_batch_materializes_latest_point_per_user(app):
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        flush_telemetry_batch([
+            _pt("u1", now - timedelta(seconds=10), lat=1.0),
+            _pt("u1", now, lat=2.0, speed_mps=3.5, bearing_deg=90, flags=["jump"], src="gnss", confidence=0.7),
+            _pt("u2", now, lat=5.0),
+        ])
+
+        assert TrackingPoint.query.count() == 3
+        tp = TrackingPoint.query.filter_by(user_id="u1", lat=2.0).one()
+        assert (tp.speed_mps, tp.bearing_deg, tp.flags, tp.src, tp.confidence) == (3.5, 90.0, FLAG_JUMP, "gnss", 0.7)
+        assert TrackerLastPosition.query.count() == 2
+        lp = get_last_position("u1")
+        assert lp.lat == 2.0
+        assert lp.display_fields() == {
+            "speed_mps": 3.5,
+            "bearing_deg": 90.0,
+            "flags": ["jump"],
+            "source": "gnss",
+            "confidence": 0.7,
+        }
+        assert get_last_position("u2").display_fields()["source"] == "live"
+
+
+def test_upsert_ignores_older_points(app):
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        upsert_last_positions([_pt("u1", now, lat=2.0)])
+        db.session.commit()
+
+        # офлайн-буфер досылает старую точку — последняя позиция не откатывается
+        upsert_last_positions([_pt("u1", now - timedelta(minutes=5), lat=1.0)])
+        db.session.commit()
+        db.session.expire_all()
+        assert get_last_position("u1").lat == 2.0
+
+        upsert_last_positions([_pt("u1", now + timedelta(seconds=1), lat=3.0)])
+        db.session.commit()
+        db.session.expire_all()
+        assert get_last_position("u1").lat == 3.0
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+from app.extensions import db
+from app.maintenance import partitions
+from app.maintenance.partitions import (
+    ensure_future_partitions,
+    next_period,
+    parse_bound,
+    partition_name,
+    period_start,
+    purge_older_than,
+)
+from app.maintenance.retention import run_retention_cleanup
+from app.models import TrackerDeviceHealthLog, TrackingPoint
+
+
+def test_period_bounds_and_names():
+    ts = datetime(2026, 10, 15, 13, 45, tzinfo=timezone.utc)  # четверг
+
+    day = period_start(ts, "day")
+    assert day == datetime(2026, 10, 15)
+    assert next_period(day, "day") == datetime(2026, 10, 16)
+
+    week = period_start(ts, "week")
+    assert week == datetime(2026, 10, 12)
+    assert next_period(week, "week") == datetime(2026, 10, 19)
+    assert partition_name("tracking_points", week) == "tracking_points_p20261012"
+
+    assert parse_bound("FOR VALUES FROM ('2026-10-12 00:00:00') TO ('2026-10-19 00:00:00')") == (
+        datetime(2026, 10, 12),
+        datetime(2026, 10, 19),
+    )
+    assert parse_bound("DEFAULT") == (None, None)
+
+
+def _seed(now: datetime) -> None:
+    for d in range(10):
+        db.session.add(TrackingPoint(user_id="u1", ts=now - timedelta(days=d), lat=53.9, lon=27.5, kind="live"))
+        db.session.add(TrackerDeviceHealthLog(device_id="d1", user_id="u1", ts=now - timedelta(days=d)))
+    db.session.commit()
+
+
+def test_purge_falls_back_to_delete_on_sqlite(app):
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        _seed(now)
+        assert ensure_future_partitions(now) == {}
+
+        cutoff = now - timedelta(days=4, hours=12)
+        assert purge_older_than(TrackingPoint, cutoff, dry_run=True) == 5
+        assert TrackingPoint.query.count() == 10
+
+        assert purge_older_than(TrackingPoint, cutoff) == 5
+        assert purge_older_than(TrackerDeviceHealthLog, cutoff) == 5
+        db.session.commit()
+        assert TrackingPoint.query.count() == 5
+        assert TrackerDeviceHealthLog.query.count() == 5
+
+
+def test_retention_cleanup_deletes_old_tracking_points(app):
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        app.config["RETENTION_TRACK_DAYS"] = 7
+        _seed(now)
+
+        report = run_retention_cleanup(dry_run=False)
+        assert report["deleted"]["tracking_points"] == 3
+        assert TrackingPoint.query.count() == 7
+
+
+def test_failed_partition_create_is_skipped(app, monkeypatch):
+    """Ошибка одного CREATE откатывается до savepoint, остальные партиции создаются."""
+    now = datetime(2026, 10, 15, tzinfo=timezone.utc)
+    monkeypatch.setattr(partitions, "_is_postgres", lambda: True)
+    monkeypatch.setattr(partitions, "is_partitioned", lambda table: table == "tracking_points")
+    monkeypatch.setattr(partitions, "list_partitions", lambda table: [])
+    # SQLite не знает PARTITION OF: вместо DDL партиции — обычные таблицы, одна с ошибкой
+    broken = partition_name("tracking_points", datetime(2026, 10, 16))
+    monkeypatch.setattr(
+        partitions,
+        "_partition_ddl",
+        lambda table, name, lo, hi: f'CREATE TABLE "{name}" (x INTEGER)' if name != broken else "CREATE TABLE oops (",
+    )
+    with app.app_context():
+        app.config["TRACKING_PARTITION_INTERVAL"] = "day"
+        db.session.add(TrackingPoint(user_id="u1", ts=now, lat=53.9, lon=27.5, kind="live"))
+        created = ensure_future_partitions(now, ahead=2)
+        db.session.commit()
+
+        assert created == {"tracking_points": ["tracking_points_p20261015", "tracking_points_p20261017"]}
+        assert TrackingPoint.query.count() == 1
@@ -0,0 +1,141 @@
+import json
+
+from app.extensions import db
+from app.models import AdminUser, Address, Incident, Zone
+from app.services import cluster_service as cs
+from app.services import vector_tiles as vt
+
+from tests.conftest import login_admin
+
+MINSK = (53.9045, 27.5615)
+
+
+def _tile_of(lat, lon, z):
+    x, y = cs.project(lat, lon)
+    return z, int(x * (1 << z)), int(y * (1 << z))
+
+
+def test_encoder_round_trip_and_zone_clipping():
+    features = [
+        {"id": 7, "type": 1, "geometry": [(10, 20)], "properties": {"name": "Дом", "priority": -2, "ok": True, "x": None}},
+        {"id": 8, "type": 1, "geometry": [(4000, 5)], "properties": {"name": "Дом", "score": 0.5}},
+    ]
+    layer = vt.decode_tile(vt.encode_tile({"addresses": features}))["addresses"]
+    assert layer["extent"] == vt.EXTENT
+    first, second = layer["features"]
+    assert first == {"id": 7, "type": 1, "properties": {"name": "Дом", "priority": -2, "ok": True}, "geometry": [[(10, 20)]]}
+    assert second["geometry"] == [[(4000, 5)]] and second["properties"] == {"name": "Дом", "score": 0.5}
+
+    # большая зона (формат Leaflet) с дыркой (GeoJSON) режется по тайлу
+    leaflet = json.dumps({"latlngs": [{"lat": 50, "lng": 20}, {"lat": 50, "lng": 35}, {"lat": 57, "lng": 35}, {"lat": 57, "lng": 20}]})
+    geojson = {"type": "Polygon", "coordinates": [
+        [[20, 50], [35, 50], [35, 57], [20, 57], [20, 50]],
+        [[27.4, 53.8], [27.7, 53.8], [27.7, 54.0], [27.4, 54.0], [27.4, 53.8]],
+    ]}
+    assert vt.parse_zone_geometry(leaflet)[0][0][1] == (35.0, 50.0)
+    assert vt.parse_zone_geometry("{}") == [] and vt.parse_zone_geometry("oops") == []
+    z, x, y = _tile_of(*MINSK, 9)
+    convert = vt._to_tile(z, x, y)
+    outer = vt._tile_ring(vt.parse_zone_geometry(geojson)[0][0], convert, exterior=True)
+    hole = vt._tile_ring(vt.parse_zone_geometry(geojson)[0][1], convert, exterior=False)
+    lo, hi = -vt.BUFFER, vt.EXTENT + vt.BUFFER
+    # тайл целиком внутри зоны — внешнее кольцо стало квадратом тайла с буфером
+    assert sorted(outer) == sorted([(lo, lo), (hi, lo), (hi, hi), (lo, hi)])
+    assert vt._area2(outer) > 0 > vt._area2(hole)
+    assert all(lo <= px <= hi and lo <= py <= hi for px, py in hole)
+
+
+def test_tile_endpoint_layers_and_revalidation(app, client):
+    with app.app_context():
+        db.session.add_all([
+            Address(name="Немига 5", lat=MINSK[0], lon=MINSK[1], status="active", category="дом"),
+            Address(name="Гомель", lat=52.4345, lon=30.9754),
+            Incident(lat=MINSK[0], lon=MINSK[1], status="new", priority=2),
+            Zone(description="Центр", color="#f00", geometry=json.dumps(
+                {"latlngs": [{"lat": 53.85, "lng": 27.45}, {"lat": 53.85, "lng": 27.65}, {"lat": 53.95, "lng": 27.65}]})),
+        ])
+        db.session.commit()
+        address_id = Address.query.filter_by(name="Немига 5").one().id
+
+    z, x, y = _tile_of(*MINSK, 12)
+    rv = client.get(f"/api/geo/tiles/addresses/{z}/{x}/{y}.mvt")
+    assert rv.status_code == 200 and rv.mimetype == vt.MIME_TYPE
+    (feature,) = vt.decode_tile(rv.data)["addresses"]["features"]
+    assert feature["id"] == address_id and feature["type"] == 1
+    assert feature["properties"] == {"name": "Немига 5", "status": "active", "category": "дом"}
+    etag = rv.headers["ETag"]
+    assert client.get(f"/api/geo/tiles/addresses/{z}/{x}/{y}.mvt", headers={"If-None-Match": etag}).status_code == 304
+
+    assert client.get(f"/api/geo/tiles/addresses/{z}/{x + 3}/{y}.mvt").status_code == 204
+    assert client.get("/api/geo/tiles/addresses/2/4/0.mvt").status_code == 404
+    assert client.get("/api/geo/tiles/users/1/0/0.mvt").status_code == 404
+    assert client.get(f"/api/geo/tiles/incidents/{z}/{x}/{y}.mvt").status_code in (401, 403)
+
+    login_admin(client)
+    rv = client.get(f"/api/geo/tiles/incidents/{z}/{x}/{y}.mvt")
+    assert vt.decode_tile(rv.data)["incidents"]["features"][0]["properties"] == {"status": "new", "priority": 2}
+    rv = client.get(f"/api/geo/tiles/zones/{z}/{x}/{y}.mvt")
+    (zone,) = vt.decode_tile(rv.data)["zones"]["features"]
+    assert zone["type"] == 3 and zone["properties"]["color"] == "#f00" and len(zone["geometry"]) == 1
+
+
+def test_tiles_of_admin_without_zones_are_empty(app, client):
+    with app.app_context():
+        zone = Zone(description="Центр", color="#f00", geometry=json.dumps(
+            {"latlngs": [{"lat": 53.85, "lng": 27.45}, {"lat": 53.85, "lng": 27.65}, {"lat": 53.95, "lng": 27.65}]}))
+        db.session.add(zone)
+        db.session.flush()
+        db.session.add_all([
+            Address(name="В зоне", lat=MINSK[0], lon=MINSK[1], zone_id=zone.id),
+            Address(name="Без зоны", lat=MINSK[0], lon=MINSK[1] + 0.001),
+        ])
+        db.session.add(AdminUser(username="zoneless", password_hash="x", role="editor"))
+        db.session.commit()
+
+    z, x, y = _tile_of(*MINSK, 12)
+    # анонимный пользователь видит адреса как в /api/addresses — все
+    assert len(vt.decode_tile(client.get(f"/api/geo/tiles/addresses/{z}/{x}/{y}.mvt").data)["addresses"]["features"]) == 2
+
+    with client.session_transaction() as sess:
+        sess["is_admin"] = True
+        sess["admin_username"] = "zoneless"
+    assert client.get(f"/api/geo/tiles/addresses/{z}/{x}/{y}.mvt").status_code == 204
+    assert client.get(f"/api/geo/tiles/zones/{z}/{x}/{y}.mvt").status_code == 204
+
+
+def test_cache_evicts_only_tiles_touched_by_commit(app):
+    with app.app_context():
+        db.session.add_all([
+            Address(name="Минск", lat=MINSK[0], lon=MINSK[1]),
+            Address(name="Гомель", lat=52.4345, lon=30.9754),
+        ])
+        db.session.commit()
+        minsk_tile = _tile_of(*MINSK, 10)
+        gomel_tile = _tile_of(52.4345, 30.9754, 10)
+        first = vt.get_tile("addresses", *minsk_tile)
+        assert vt.get_tile("addresses", *minsk_tile) is first
+        vt.get_tile("addresses", *gomel_tile)
+        assert vt.cache_stats()["addresses"]["tiles"] == 2
+
+        # изменение в Гомеле не трогает тайл Минска
+        gomel = Address.query.filter_by(name="Гомель").one()
+        gomel.name = "Гомель, вокзал"
+        db.session.commit()
+        assert vt.cache_stats()["addresses"]["tiles"] == 1
+        assert vt.get_tile("addresses", *minsk_tile) is first
+        assert vt.decode_tile(vt.get_tile("addresses", *gomel_tile))["addresses"]["features"][0]["properties"]["name"] == "Гомель, вокзал"
+
+        # точка переезжает в Минск: вытесняются оба тайла (старое и новое место)
+        gomel.lat, gomel.lon = MINSK[0] + 0.01, MINSK[1]
+        db.session.commit()
+        assert vt.cache_stats()["addresses"]["tiles"] == 0
+        assert len(vt.decode_tile(vt.get_tile("addresses", *minsk_tile))["addresses"]["features"]) == 2
+        assert vt.get_tile("addresses", *gomel_tile) == b""
+
+        # bulk update — пересборка индекса и пустой кэш
+        Address.query.update({Address.status: "archived"})
+        db.session.commit()
+        stats = vt.cache_stats()["addresses"]
+        assert stats["builds"] == 2 and stats["tiles"] == 0
+        feats = vt.decode_tile(vt.get_tile("addresses", *minsk_tile))["addresses"]["features"]
+        assert {f["properties"]["status"] for f in feats} == {"archived"}
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""bench_geo_clusters.py
+
+Бенчмарк серверной кластеризации (app.services.cluster_service):
+время сборки пирамиды, обновления одной точки и запросов по bbox/zoom,
+размер JSON‑ответа по сравнению с выдачей всех точек слоя.
+
+Точки синтетические: --points по территории Беларуси, треть — вокруг
+Минска (плотный город), zone_id из --zones зон.
+
+Пример:
+  python tools/bench_geo_clusters.py --points 200000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+MINSK = (53.9045, 27.5615)
+VIEWS = [
+    ("country z6", (23.1, 51.2, 32.8, 56.2), 6),
+    ("region z9", (26.5, 53.4, 28.7, 54.4), 9),
+    ("city z12", (27.40, 53.83, 27.70, 53.97), 12),
+    ("street z16", (27.555, 53.900, 27.568, 53.908), 16),
+]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--points", type=int, default=200000)
+    ap.add_argument("--zones", type=int, default=8)
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+
+    from app.services import cluster_service as cs
+
+    rnd = random.Random(1)
+    rows = []
+    for rid in range(1, args.points + 1):
+        if rid % 3 == 0:
+            lat, lon = MINSK[0] + rnd.gauss(0, 0.05), MINSK[1] + rnd.gauss(0, 0.08)
+        else:
+            lat, lon = rnd.uniform(51.3, 56.1), rnd.uniform(23.2, 32.7)
+        rows.append((rid, lat, lon, rnd.randrange(args.zones) or None))
+
+    t0 = time.perf_counter()
+    index = cs.ClusterIndex.from_rows(rows)
+    build = time.perf_counter() - t0
+    raw_kb = len(json.dumps([{"id": r[0], "lat": round(r[1], 6), "lon": round(r[2], 6)} for r in rows])) / 1024
+    print(f"points={args.points} build={build:.2f}s all_points_json={raw_kb:.0f}KB")
+
+    t0 = time.perf_counter()
+    for i in range(args.queries):
+        rid = rnd.randint(1, args.points)
+        index.apply(rid, (MINSK[0] + rnd.uniform(-0.1, 0.1), MINSK[1] + rnd.uniform(-0.1, 0.1), None))
+    print(f"{'update':>12}: {(time.perf_counter() - t0) / args.queries * 1e3:7.3f} ms/point")
+
+    for label, bbox, z in VIEWS:
+        for zones in (None, {1, 2, None}):
+            t0 = time.perf_counter()
+            for _ in range(args.queries):
+                result = index.clusters(bbox, z, zones)
+            ms = (time.perf_counter() - t0) / args.queries * 1e3
+            kb = len(json.dumps(result)) / 1024
+            tag = "all zones" if zones is None else "3 zones"
+            print(f"{label:>12}: {ms:7.2f} ms  {kb:7.1f}KB  clusters={len(result['clusters'])} "
+                  f"points={len(result['points'])} total={result['total']} ({tag})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
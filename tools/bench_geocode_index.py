@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""bench_geocode_index.py
+
+Микро-бенчмарк офлайн‑геокодера: in-memory индекс
+(app.services.geocode_index.GeocodeIndex) против прежнего линейного
+поиска ``q in name.lower()`` по списку записей.
+
+Записи синтетические: «<город>, <улица> <номер>» на кириллице. Запросы —
+префиксы, целые слова, латиница (транслит), вхождение внутри слова,
+опечатки. Вывод — время сборки, память индекса и p50/p99 поиска.
+
+Пример:
+  python tools/bench_geocode_index.py --entries 100000 --queries 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+CITIES = ["Минск", "Брест", "Гродно", "Гомель", "Могилёв", "Витебск", "Барановичи", "Пинск", "Лида", "Орша"]
+STREETS = [
+    "Немига", "Притыцкого", "Независимости", "Кальварийская", "Сурганова", "Партизанский", "Якуба Коласа",
+    "Богдановича", "Московская", "Советская", "Ленина", "Пушкина", "Гагарина", "Кирова", "Октябрьская",
+    "Железнодорожная", "Шевченко", "Мира", "Победителей", "Тимирязева",
+]
+KINDS = ["улица", "проспект", "переулок", "бульвар"]
+
+
+def make_entries(n: int, seed: int = 1) -> list:
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        street = f"{rnd.choice(STREETS)}{'' if i % 7 else ' ' + str(i % 97)}"
+        name = f"{rnd.choice(CITIES)}, {rnd.choice(KINDS)} {street} {rnd.randint(1, 250)}"
+        out.append({"display_name": name, "lat": 53.0 + rnd.random(), "lon": 27.0 + rnd.random()})
+    return out
+
+
+def make_queries(n: int, seed: int = 2) -> list:
+    rnd = random.Random(seed)
+    pool = []
+    for s in STREETS:
+        pool += [s.lower()[:4], s, f"{rnd.choice(CITIES)} {s}", f"{s} {rnd.randint(1, 250)}"]
+    pool += ["nemiga", "pritytskogo 12", "minsk nezavisimosti", "ктябрьск", "Нимига", "Притыцкава"]
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def linear(entries: list, q: str, limit: int) -> list:
+    qn = q.lower()
+    return [e for e in entries if qn in (e.get("name") or e.get("display_name") or "").lower()][:limit]
+
+
+def pct(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--entries", type=int, default=100000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--limit", type=int, default=5)
+    args = ap.parse_args()
+
+    from app.services.geocode_index import GeocodeIndex
+
+    entries = make_entries(args.entries)
+    queries = make_queries(args.queries)
+
+    index = GeocodeIndex(entries)
+    mem = index.memory_bytes()
+    print(f"entries={len(index)} tokens={len(index.tokens)} build_ms={index.build_ms} "
+          f"index_mb={mem['index_total'] / 1e6:.1f}")
+
+    for name, fn in (("index", lambda q: index.search(q, args.limit)),
+                     ("linear", lambda q: linear(entries, q, args.limit))):
+        times, empty = [], 0
+        for q in queries[: args.queries if name == "index" else min(200, args.queries)]:
+            t0 = time.perf_counter()
+            res = fn(q)
+            times.append((time.perf_counter() - t0) * 1e6)
+            empty += not res
+        print(f"{name:>7}: p50={pct(times, 0.5):8.1f} us  p99={pct(times, 0.99):9.1f} us  empty={empty}/{len(times)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
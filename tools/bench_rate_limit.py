@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""bench_rate_limit.py
+
+Бенчмарк накладных расходов security.rate_limit.check_rate_limit на запрос:
+
+- legacy — как было: Redis.from_url на каждый вызов, INCR + EXPIRE;
+- pooled — общий пул и один EVALSHA (скользящее окно);
+- batch N — то же с RATE_LIMIT_LOCAL_BATCH=N;
+- memory — без Redis.
+
+Нагрузка как у /api/duty/bot/live_location: --idents ботов, лимит --limit
+в минуту, --threads потоков. Без доступного --redis-url меряется только memory.
+
+Пример:
+  python tools/bench_rate_limit.py --redis-url redis://127.0.0.1:6379/15 --requests 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def legacy_check(url: str, bucket: str, ident: str, limit: int, window_seconds: int) -> bool:
+    import redis
+
+    now = int(time.time())
+    key = f"rl:{bucket}:{(now // window_seconds) * window_seconds}:{ident}"
+    r = redis.Redis.from_url(url, decode_responses=True)
+    val = r.incr(key)
+    if val == 1:
+        r.expire(key, window_seconds + 5)
+    return int(val) <= limit
+
+
+def run(fn, n: int, threads: int, idents: int) -> float:
+    per = n // threads
+
+    def worker(t: int) -> None:
+        for i in range(per):
+            fn(f"bot{(t * per + i) % idents}")
+
+    ts = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return (time.perf_counter() - t0) / (per * threads) * 1e6
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--redis-url", default=os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/15"))
+    ap.add_argument("--requests", type=int, default=20000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--idents", type=int, default=50)
+    ap.add_argument("--limit", type=int, default=600)
+    args = ap.parse_args()
+
+    from flask import Flask
+
+    from app.security import rate_limit as rl
+
+    app = Flask(__name__)
+    redis_ok = False
+    try:
+        import redis
+
+        redis.Redis.from_url(args.redis_url, socket_connect_timeout=0.5).ping()
+        redis_ok = True
+    except Exception as exc:
+        print(f"redis unavailable ({exc.__class__.__name__}): memory only")
+
+    def bench(label: str, fn) -> None:
+        # уникальный bucket на прогон — счётчики не пересекаются
+        bucket = f"bench_{label.replace(' ', '_')}_{time.time_ns()}"
+
+        def call(ident: str) -> None:
+            with app.app_context():
+                fn(bucket, ident)
+
+        us = run(call, args.requests, args.threads, args.idents)
+        print(f"{label:>12}: {us:8.1f} us/check")
+
+    cases = [("memory", {"REDIS_URL": ""}, None)]
+    if redis_ok:
+        cases = [
+            ("legacy", {}, lambda b, i: legacy_check(args.redis_url, b, i, args.limit, 60)),
+            ("pooled", {"REDIS_URL": args.redis_url, "RATE_LIMIT_LOCAL_BATCH": 0}, None),
+            ("batch 10", {"REDIS_URL": args.redis_url, "RATE_LIMIT_LOCAL_BATCH": 10}, None),
+        ] + cases
+    for label, cfg, fn in cases:
+        app.config.update(cfg)
+        bench(label, fn or (lambda b, i: rl.check_rate_limit(b, i, args.limit, 60)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""bench_tile_serving.py
+
+Бенчмарк отдачи офлайн‑тайлов (app.services.tile_store.tile_response):
+тайлов в секунду при N параллельных клиентах для
+
+- каталога z/x/y.png (send_file);
+- MBTiles без кэша и с LRU горячих уровней (TILE_CACHE_MAX_ZOOM);
+- ревалидации по If-None-Match (304).
+
+Набор синтетический: уровни z0..--zmax вокруг Минска, тайлы по ~--tile-kb КБ.
+Запросы как у живой карты: 70% — низкие уровни (до --hot-zoom), остальное —
+верхние. Сервер — werkzeug threaded на 127.0.0.1, клиенты — requests.Session
+в потоках (keep-alive).
+
+Пример:
+  python tools/bench_tile_serving.py --clients 16 --requests 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+CENTER = (0.5759, 0.3297)  # Минск в долях мира по x/y (web mercator)
+
+
+def make_set(root: str, zmax: int, tile_kb: int, span: int) -> list:
+    """Каталог с тайлами: на каждом уровне до span x span тайлов вокруг центра."""
+    rnd = random.Random(1)
+    tiles = []
+    for z in range(zmax + 1):
+        n = 1 << z
+        side = min(span, n)
+        x0 = min(max(0, int(CENTER[0] * n) - side // 2), n - side)
+        y0 = min(max(0, int(CENTER[1] * n) - side // 2), n - side)
+        for x in range(x0, x0 + side):
+            xdir = os.path.join(root, str(z), str(x))
+            os.makedirs(xdir, exist_ok=True)
+            for y in range(y0, y0 + side):
+                with open(os.path.join(xdir, f"{y}.png"), "wb") as fh:
+                    fh.write(rnd.randbytes(tile_kb * 1024))
+                tiles.append((z, x, y))
+    return tiles
+
+
+def make_workload(tiles: list, n: int, hot_zoom: int) -> list:
+    rnd = random.Random(2)
+    hot = [t for t in tiles if t[0] <= hot_zoom]
+    cold = [t for t in tiles if t[0] > hot_zoom] or hot
+    return [rnd.choice(hot) if rnd.random() < 0.7 else rnd.choice(cold) for _ in range(n)]
+
+
+def run(url: str, workload: list, clients: int, etags: dict | None = None) -> tuple:
+    import requests
+
+    chunks = [workload[i::clients] for i in range(clients)]
+    statuses: dict = {}
+    lock = threading.Lock()
+
+    def worker(chunk: list) -> None:
+        s = requests.Session()
+        local: dict = {}
+        for z, x, y in chunk:
+            headers = {"If-None-Match": etags[(z, x, y)]} if etags else {}
+            r = s.get(f"{url}/{z}/{x}/{y}.png", headers=headers)
+            local[r.status_code] = local.get(r.status_code, 0) + 1
+        with lock:
+            for k, v in local.items():
+                statuses[k] = statuses.get(k, 0) + v
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in chunks]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return len(workload) / elapsed, statuses
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--zmax", type=int, default=14)
+    ap.add_argument("--span", type=int, default=12, help="тайлов по стороне на уровень")
+    ap.add_argument("--tile-kb", type=int, default=12)
+    ap.add_argument("--hot-zoom", type=int, default=10)
+    args = ap.parse_args()
+
+    import requests
+    from flask import Flask
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    from app.services import tile_store as ts
+
+    tmp = tempfile.mkdtemp(prefix="bench_tiles_")
+    src = os.path.join(tmp, "minsk")
+    tiles = make_set(src, args.zmax, args.tile_kb, args.span)
+    packed = ts.pack_directory(src, src + ts.MBTILES_EXT)
+    print(f"tiles={len(tiles)} data_mb={packed['size_bytes'] / 1e6:.1f} clients={args.clients} "
+          f"requests={args.requests}")
+
+    app = Flask(__name__)
+    stores = {"dir": ts.DirTileStore(src), "mbtiles": ts.open_mbtiles(src + ts.MBTILES_EXT)}
+
+    @app.get("/<kind>/<int:z>/<int:x>/<int:y>.png")
+    def tile(kind, z, x, y):
+        return ts.tile_response(stores[kind], z, x, y)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"  # keep-alive, как за gunicorn/nginx
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    workload = make_workload(tiles, args.requests, args.hot_zoom)
+
+    cases = [
+        ("dir (send_file)", "dir", {"TILE_CACHE_MAX_BYTES": 0}),
+        ("mbtiles, no cache", "mbtiles", {"TILE_CACHE_MAX_BYTES": 0}),
+        ("mbtiles + LRU", "mbtiles", {"TILE_CACHE_MAX_BYTES": 64 << 20, "TILE_CACHE_MAX_ZOOM": args.hot_zoom}),
+    ]
+    for label, kind, cfg in cases:
+        app.config.update(cfg)
+        run(f"{base}/{kind}", workload[:200], args.clients)  # прогрев
+        rate, statuses = run(f"{base}/{kind}", workload, args.clients)
+        print(f"{label:>20}: {rate:8.0f} tiles/s  {statuses}")
+
+    s = requests.Session()
+    etags = {t: s.get(f"{base}/mbtiles/{t[0]}/{t[1]}/{t[2]}.png").headers["ETag"] for t in set(workload)}
+    rate, statuses = run(f"{base}/mbtiles", workload, args.clients, etags)
+    print(f"{'revalidate (304)':>20}: {rate:8.0f} tiles/s  {statuses}")
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
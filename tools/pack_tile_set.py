@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""pack_tile_set.py
+
+Импорт набора офлайн‑тайлов из каталога ``z/x/y.png`` в один файл MBTiles
+(app.services.tile_store.pack_directory). По умолчанию результат кладётся
+рядом с каталогом как ``<каталог>.mbtiles`` — так его подхватывает
+/api/map/sets, если каталог лежит в TILES_SETS_DIR.
+
+После упаковки печатает время статистики набора: обход каталога
+против чтения metadata из MBTiles.
+
+Пример:
+  python tools/pack_tile_set.py data/tiles_sets/minsk
+  python tools/pack_tile_set.py data/tiles_download --out /tmp/download.mbtiles --name download
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("src", help="каталог набора (z/x/y.png)")
+    ap.add_argument("--out", help="путь к .mbtiles (по умолчанию <src>.mbtiles)")
+    ap.add_argument("--name", help="имя набора в metadata")
+    args = ap.parse_args()
+
+    from app.services import tile_store
+
+    src = os.path.normpath(args.src)
+    if not os.path.isdir(src):
+        print(f"каталог не найден: {src}", file=sys.stderr)
+        return 1
+    out = args.out or src + tile_store.MBTILES_EXT
+
+    stats = tile_store.pack_directory(
+        src, out, name=args.name,
+        progress=lambda n: print(f"\r  {n} tiles", end="", flush=True),
+    )
+    print(f"\r{out}: tiles={stats['total_tiles']} data_mb={stats['size_bytes'] / 1e6:.1f} "
+          f"file_mb={stats['file_bytes'] / 1e6:.1f} seconds={stats['seconds']}")
+
+    for label, store in (("dir", tile_store.DirTileStore(src)), ("mbtiles", tile_store.MBTilesStore(out))):
+        t0 = time.perf_counter()
+        total = store.stats()["total_tiles"]
+        print(f"{label:>8} stats: {(time.perf_counter() - t0) * 1e3:9.2f} ms  total_tiles={total}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -24,6 +24,8 @@ from compat_flask import Flask
 from ..extensions import db
 from ..sockets import broadcast_event_sync
 from .tg_notify import notify_admins_on_alert_event
+from .last_position import get_last_position
+from ..maintenance.partitions import ensure_future_partitions, purge_older_than
 from ..models import (
     TrackerDevice,
     TrackerDeviceHealth,
@@ -137,15 +139,19 @@ def _loop(app: Flask) -> None:
 def _run_retention(app: Flask, t: Thresholds) -> None:
     """Мягкая очистка старых данных, чтобы app.db не раздувалась бесконечно."""
     try:
+        # на Postgres заранее создаём партиции и удаляем устаревшие целиком (DROP),
+        # на SQLite — обычный DELETE
+        ensure_future_partitions()
+
         cutoff_points = _utcnow() - timedelta(days=max(7, int(t.retention_points_days)))
         # points
-        db.session.query(TrackingPoint).filter(TrackingPoint.ts < cutoff_points).delete(synchronize_session=False)
+        purge_older_than(TrackingPoint, cutoff_points)
         # old ended sessions snapshots are handled elsewhere; this is minimal
 
         cutoff_health_log = _utcnow() - timedelta(days=max(7, int(t.retention_health_log_days)))
         try:
             from ..models import TrackerDeviceHealthLog
-            db.session.query(TrackerDeviceHealthLog).filter(TrackerDeviceHealthLog.ts < cutoff_health_log).delete(synchronize_session=False)
+            purge_older_than(TrackerDeviceHealthLog, cutoff_health_log)
         except Exception:
             pass
 
@@ -162,10 +168,8 @@ def _last_point_ts(user_id: str) -> Optional[datetime]:
     if sess and sess.last_at:
         return sess.last_at
 
-    p = TrackingPoint.query.join(TrackingSession, TrackingPoint.session_id == TrackingSession.id) \
-        .filter(TrackingSession.user_id == user_id) \
-        .order_by(TrackingPoint.ts.desc()).first()
-    return p.ts if p else None
+    lp = get_last_position(user_id)
+    return lp.ts if lp else None
 
 
 def _upsert_alert(
@@ -0,0 +1,218 @@
+"""Быстрая пакетная запись точек трека в tracking_points.
+
+`flush_telemetry_batch` раньше писал каждую пачку через
+``db.session.bulk_insert_mappings`` — на пересменке, когда тысячи устройств
+переподключаются и досылают офлайн-буфер (до 500 точек на запрос, см.
+TRACKER_CONTRACT.md), ORM-вставка становится узким местом. Здесь:
+
+- Postgres: ``COPY tracking_points (...) FROM STDIN`` (text-формат) через
+  DBAPI-курсор текущей транзакции сессии (psycopg2 ``copy_expert`` или
+  psycopg 3 ``cursor.copy``); партиционированный родитель COPY принимает;
+- остальные БД (SQLite в dev/тестах): Core ``INSERT`` с executemany;
+- метод можно зафиксировать TELEMETRY_BULK_METHOD (auto|copy|executemany|orm).
+
+`AdaptiveBatcher` подбирает размер пачки и интервал сброса под нагрузку
+для consumer'ов очереди телеметрии (realtime/broker.py).
+
+Функции не коммитят — это делает вызывающий (одна транзакция с upsert
+последней позиции).
+"""
+
+from __future__ import annotations
+
+import io
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from ..extensions import db
+from ..models import TrackingPoint
+
+
+METHODS = ("auto", "copy", "executemany", "orm")
+
+# порядок колонок в COPY / executemany (id — из sequence)
+COLUMNS: Sequence[str] = (
+    "session_id",
+    "user_id",
+    "ts",
+    "lat",
+    "lon",
+    "accuracy_m",
+    "kind",
+    "speed_mps",
+    "bearing_deg",
+    "flags",
+    "src",
+    "confidence",
+    "raw_json",
+)
+
+_DEFAULTS: Dict[str, Any] = {"kind": "live", "flags": 0}
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _config_method() -> str:
+    try:
+        from compat_flask import current_app
+
+        method = str(current_app.config.get("TELEMETRY_BULK_METHOD") or "auto").strip().lower()
+    except Exception:
+        method = "auto"
+    return method if method in METHODS else "auto"
+
+
+def _utc_naive(ts: Any) -> Any:
+    # колонка ts — timestamp без зоны, храним UTC
+    if isinstance(ts, datetime) and ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _row(point: Dict[str, Any]) -> Dict[str, Any]:
+    row = {c: point.get(c, _DEFAULTS.get(c)) for c in COLUMNS}
+    row["ts"] = _utc_naive(row["ts"] or datetime.now(timezone.utc))
+    if row["flags"] is None:
+        row["flags"] = 0
+    return row
+
+
+def _copy_value(v: Any) -> str:
+    if v is None:
+        return "\\N"
+    if isinstance(v, datetime):
+        return v.isoformat(sep=" ")
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    return str(v).translate(_COPY_ESCAPES)
+
+
+def copy_text(rows: Iterable[Dict[str, Any]]) -> str:
+    """Строки в формате COPY ... FROM STDIN (text: TAB-разделитель, \\N = NULL)."""
+    out = io.StringIO()
+    for row in rows:
+        out.write("\t".join(_copy_value(row[c]) for c in COLUMNS))
+        out.write("\n")
+    return out.getvalue()
+
+
+def _copy(rows: List[Dict[str, Any]]) -> None:
+    sql = f"COPY {TrackingPoint.__tablename__} ({', '.join(COLUMNS)}) FROM STDIN"
+    data = copy_text(rows)
+    # соединение текущей транзакции сессии — COPY коммитится вместе с upsert'ом
+    dbapi_conn = db.session.connection().connection.driver_connection
+    cur = dbapi_conn.cursor()
+    try:
+        if hasattr(cur, "copy_expert"):  # psycopg2
+            cur.copy_expert(sql, io.StringIO(data))
+        else:  # psycopg 3
+            with cur.copy(sql) as cp:
+                cp.write(data)
+    finally:
+        cur.close()
+
+
+def _executemany(rows: List[Dict[str, Any]]) -> None:
+    db.session.execute(TrackingPoint.__table__.insert(), rows)
+
+
+def resolve_method(method: Optional[str] = None) -> str:
+    method = (method or _config_method()).lower()
+    dialect = db.session.get_bind().dialect.name
+    if method == "auto":
+        return "copy" if dialect == "postgresql" else "executemany"
+    if method == "copy" and dialect != "postgresql":
+        return "executemany"
+    return method
+
+
+def insert_points(points: List[Dict[str, Any]], *, method: Optional[str] = None) -> int:
+    """Вставить точки (dict'ы из _normalize_telemetry_payload) одной пачкой. Без commit."""
+    if not points:
+        return 0
+    method = resolve_method(method)
+    if method == "orm":
+        db.session.bulk_insert_mappings(TrackingPoint, points)
+        return len(points)
+    rows = [_row(p) for p in points]
+    if method == "copy":
+        _copy(rows)
+    else:
+        _executemany(rows)
+    return len(rows)
+
+
+class AdaptiveBatcher:
+    """Размер пачки и интервал сброса, подстраиваемые под входящий поток.
+
+    - пачка набралась раньше интервала (поток плотный) — размер x2, интервал /2:
+      меньше транзакций на точку и меньше задержка;
+    - сброс по таймеру неполной пачкой (поток редкий) — размер x0.75,
+      интервал x1.25 (до max): меньше мелких транзакций;
+    - сам сброс дольше интервала (БД не успевает) — размер x2, чтобы
+      амортизировать накладные расходы транзакции.
+    """
+
+    def __init__(
+        self,
+        *,
+        min_batch: int = 50,
+        max_batch: int = 5000,
+        min_interval: float = 0.1,
+        max_interval: float = 1.0,
+    ) -> None:
+        self.min_batch = max(1, int(min_batch))
+        self.max_batch = max(self.min_batch, int(max_batch))
+        self.min_interval = float(min_interval)
+        self.max_interval = max(self.min_interval, float(max_interval))
+        self.batch_size = self.min_batch
+        self.interval = self.max_interval / 2 if self.max_interval > self.min_interval else self.min_interval
+        self.last_flush = time.monotonic()
+        self.flushes = 0
+        self.points = 0
+        self.flush_seconds = 0.0
+
+    @classmethod
+    def from_config(cls) -> "AdaptiveBatcher":
+        try:
+            from compat_flask import current_app
+
+            cfg = current_app.config
+            return cls(
+                min_batch=int(cfg.get("TELEMETRY_BATCH_MIN", 50)),
+                max_batch=int(cfg.get("TELEMETRY_BATCH_MAX", 5000)),
+                min_interval=int(cfg.get("TELEMETRY_FLUSH_MIN_MS", 100)) / 1000.0,
+                max_interval=int(cfg.get("TELEMETRY_FLUSH_MAX_MS", 1000)) / 1000.0,
+            )
+        except Exception:
+            return cls()
+
+    def should_flush(self, pending: int, now: Optional[float] = None) -> bool:
+        if pending <= 0:
+            return False
+        now = time.monotonic() if now is None else now
+        return pending >= self.batch_size or (now - self.last_flush) >= self.interval
+
+    def record(self, n: int, duration: float, now: Optional[float] = None) -> None:
+        """Учесть сброс n точек за duration секунд и пересчитать параметры."""
+        now = time.monotonic() if now is None else now
+        self.flushes += 1
+        self.points += n
+        self.flush_seconds += duration
+        if n >= self.batch_size or duration > self.interval:
+            self.batch_size = min(self.max_batch, self.batch_size * 2)
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.batch_size = max(self.min_batch, int(self.batch_size * 0.75))
+            self.interval = min(self.max_interval, self.interval * 1.25)
+        self.last_flush = now
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batch_size": self.batch_size,
+            "interval_ms": int(self.interval * 1000),
+            "flushes": self.flushes,
+            "points": self.points,
+            "points_per_sec": round(self.points / self.flush_seconds, 1) if self.flush_seconds else None,
+        }
@@ -0,0 +1,221 @@
+"""Материализованная "последняя точка" пользователя (tracker_last_position).
+
+Раньше каждый горячий читатель (dashboard, SOS "последняя точка", алертинг
+stale_points) искал последнюю точку через ``ORDER BY ts DESC LIMIT 1`` по
+tracking_points и разбирал её raw_json. Теперь при приёме точек
+(бот, telemetry_save_queue) в той же транзакции делается upsert одной строки
+на пользователя — с уже разобранными display-полями.
+
+Upsert монотонный: строка обновляется только если новая точка не старше
+сохранённой (офлайн-буфер устройства может досылать старые точки позже).
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..extensions import db
+from ..models import TrackerLastPosition
+
+
+# типизированные display-поля; всё остальное из display_fields() уходит в extra_json
+_TYPED_FIELDS = ('speed_mps', 'bearing_deg', 'flags', 'source')
+
+_NUMERIC_DIAG: Tuple[Tuple[str, Any], ...] = (
+    ("confidence", float),
+    ("matches", int),
+    ("matches_wifi", int),
+    ("matches_cell", int),
+    ("rssi_diff_avg_db", float),
+    ("cell_diff_avg_db", float),
+    ("tiles_considered", int),
+    ("spread_m", float),
+    ("anchors_considered", int),
+    ("clusters_total", int),
+    ("clusters_used", int),
+)
+
+
+def display_fields(meta: Dict[str, Any], kind: Optional[str], *, infer_source: bool = True) -> Dict[str, Any]:
+    """Display-поля точки из её meta (raw_json): скорость, курс, флаги, источник, диагностика.
+
+    ``infer_source`` — подставлять source по kind, если устройство его не прислало.
+    """
+    out: Dict[str, Any] = {}
+
+    # base fields (used widely in UI)
+    spd = meta.get("speed_mps")
+    brg = meta.get("bearing_deg")
+    flags = meta.get("flags") or []
+    try:
+        out["speed_mps"] = float(spd) if spd is not None else None
+    except Exception:
+        out["speed_mps"] = None
+    try:
+        out["bearing_deg"] = float(brg) if brg is not None else None
+    except Exception:
+        out["bearing_deg"] = None
+    out["flags"] = flags if isinstance(flags, list) else []
+
+    # source/mode (MAX indoor diagnostics)
+    src = meta.get("src") or meta.get("source")
+    if not src and infer_source:
+        if kind == "est":
+            src = "wifi_est"
+        elif kind:
+            src = str(kind)
+        else:
+            src = "app"
+    if src:
+        out["source"] = str(src)
+
+    # numeric diagnostics for estimated points (optional)
+    for k, cast in _NUMERIC_DIAG:
+        if k in meta:
+            try:
+                out[k] = cast(meta.get(k))
+            except Exception:
+                out[k] = meta.get(k)
+
+    # string diagnostics (optional)
+    for k in ("method", "tile_id"):
+        if k in meta:
+            try:
+                out[k] = str(meta.get(k))
+            except Exception:
+                out[k] = meta.get(k)
+
+    # timestamps / misc
+    if "anchor_ts" in meta:
+        try:
+            out["anchor_ts"] = str(meta.get("anchor_ts"))
+        except Exception:
+            out["anchor_ts"] = meta.get("anchor_ts")
+
+    return out
+
+
+def _meta_of(point: Dict[str, Any]) -> Dict[str, Any]:
+    raw = point.get('raw_json')
+    if isinstance(raw, dict):
+        return raw
+    try:
+        meta = json.loads(raw) if raw else {}
+        return meta if isinstance(meta, dict) else {}
+    except Exception:
+        return {}
+
+
+def _ts_key(ts: Any) -> float:
+    """Ключ сравнения ts: naive считаем UTC (SQLite возвращает naive)."""
+    if not isinstance(ts, datetime):
+        return float('-inf')
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def _row_from_point(point: Dict[str, Any]) -> Dict[str, Any]:
+    meta = _meta_of(point)
+    kind = point.get('kind')
+    disp = display_fields(meta, kind)
+    extra = {k: v for k, v in disp.items() if k not in _TYPED_FIELDS}
+    device_id = point.get('device_id') or meta.get('device_id')
+    return {
+        'user_id': str(point['user_id']),
+        'device_id': str(device_id)[:32] if device_id else None,
+        'session_id': point.get('session_id'),
+        'ts': point.get('ts'),
+        'lat': point.get('lat'),
+        'lon': point.get('lon'),
+        'accuracy_m': point.get('accuracy_m'),
+        'kind': kind,
+        'speed_mps': disp.get('speed_mps'),
+        'bearing_deg': disp.get('bearing_deg'),
+        'flags_json': json.dumps(disp.get('flags') or [], ensure_ascii=False),
+        'source': str(disp['source'])[:32] if disp.get('source') else None,
+        'extra_json': json.dumps(extra, ensure_ascii=False) if extra else None,
+        'updated_at': datetime.now(timezone.utc),
+    }
+
+
+def _latest_per_user(points: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    latest: Dict[str, Dict[str, Any]] = {}
+    for p in points:
+        uid = p.get('user_id')
+        if uid is None or p.get('lat') is None or p.get('lon') is None:
+            continue
+        cur = latest.get(str(uid))
+        if cur is None or _ts_key(p.get('ts')) >= _ts_key(cur.get('ts')):
+            latest[str(uid)] = p
+    return list(latest.values())
+
+
+def upsert_last_positions(points: Iterable[Dict[str, Any]]) -> int:
+    """Обновить tracker_last_position по пачке точек (без commit).
+
+    ``points`` — словари в формате TrackingPoint (user_id, session_id, ts,
+    lat, lon, accuracy_m, kind, raw_json). Из пачки берётся самая свежая точка
+    на пользователя; на Postgres/SQLite это один ``INSERT .. ON CONFLICT DO
+    UPDATE .. WHERE`` на всю пачку. Вызывать до commit транзакции с точками.
+    Возвращает число затронутых пользователей.
+    """
+    rows = [_row_from_point(p) for p in _latest_per_user(points)]
+    if not rows:
+        return 0
+
+    table = TrackerLastPosition.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'cockroachdb', 'sqlite'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+        stmt = dialect_insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name != 'user_id'},
+            where=(table.c.ts == None) | (table.c.ts <= stmt.excluded.ts),  # noqa: E711
+        )
+        db.session.execute(stmt)
+        return len(rows)
+
+    # прочие СУБД: построчно через ORM
+    for row in rows:
+        cur = db.session.get(TrackerLastPosition, row['user_id'])
+        if cur is None:
+            db.session.add(TrackerLastPosition(**row))
+        elif _ts_key(row['ts']) >= _ts_key(cur.ts):
+            for k, v in row.items():
+                setattr(cur, k, v)
+    return len(rows)
+
+
+def upsert_last_position_for(point: Any) -> int:
+    """То же для одной ORM-точки TrackingPoint (эндпоинты бота)."""
+    return upsert_last_positions([{
+        'user_id': point.user_id,
+        'session_id': point.session_id,
+        'ts': point.ts,
+        'lat': point.lat,
+        'lon': point.lon,
+        'accuracy_m': point.accuracy_m,
+        'kind': point.kind,
+        'raw_json': point.raw_json,
+    }])
+
+
+def get_last_positions(user_ids: Iterable[str]) -> Dict[str, TrackerLastPosition]:
+    """Последние точки для набора пользователей — один запрос по PK."""
+    ids = sorted({str(u) for u in user_ids if u is not None})
+    if not ids:
+        return {}
+    rows = TrackerLastPosition.query.filter(TrackerLastPosition.user_id.in_(ids)).all()
+    return {r.user_id: r for r in rows}
+
+
+def get_last_position(user_id: str) -> Optional[TrackerLastPosition]:
+    return db.session.get(TrackerLastPosition, str(user_id))
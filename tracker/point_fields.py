@@ -0,0 +1,82 @@
+"""Типизированные поля точки трека (колонки TrackingPoint).
+
+Раньше speed/bearing/flags/src/confidence жили только в raw_json, и каждый
+читатель (KPI, гистерезис display-точки, dashboard) делал json.loads на
+каждую точку. Теперь они разбираются один раз при приёме и пишутся в
+колонки; флаги — битовой маской, чтобы считать их агрегатами SQL
+(``count(*) FILTER (WHERE flags & FLAG_JUMP <> 0)``).
+
+raw_json по-прежнему хранится целиком (диагностика wifi-оценок и т.п.).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+
+FLAG_JUMP = 1  # "jump": скачок координаты (фильтр на устройстве)
+FLAG_EST = 2   # "est": точка — Wi-Fi/cell оценка, а не GNSS
+
+# порядок важен: так флаги возвращаются обратно списком
+_FLAG_BITS = (("jump", FLAG_JUMP), ("est", FLAG_EST))
+
+
+def flags_to_mask(flags: Any) -> int:
+    """Список строковых флагов -> битовая маска (неизвестные флаги игнорируются)."""
+    if not isinstance(flags, (list, tuple, set)):
+        return 0
+    mask = 0
+    names = {str(f) for f in flags}
+    for name, bit in _FLAG_BITS:
+        if name in names:
+            mask |= bit
+    return mask
+
+
+def mask_to_flags(mask: Optional[int]) -> List[str]:
+    m = int(mask or 0)
+    return [name for name, bit in _FLAG_BITS if m & bit]
+
+
+def _float_or_none(v: Any) -> Optional[float]:
+    try:
+        return float(v) if v is not None else None
+    except Exception:
+        return None
+
+
+def point_columns(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Значения типизированных колонок TrackingPoint из meta (тело запроса/raw_json)."""
+    if not isinstance(meta, dict):
+        meta = {}
+    src = meta.get("src") or meta.get("source")
+    return {
+        "speed_mps": _float_or_none(meta.get("speed_mps")),
+        "bearing_deg": _float_or_none(meta.get("bearing_deg")),
+        "flags": flags_to_mask(meta.get("flags")),
+        "src": str(src)[:32] if src else None,
+        "confidence": _float_or_none(meta.get("confidence")),
+    }
+
+
+def is_est(kind: Optional[str], flags: Optional[int], src: Optional[str]) -> bool:
+    """Точка — оценка (wifi_est), а не GNSS."""
+    if kind == "est":
+        return True
+    if int(flags or 0) & FLAG_EST:
+        return True
+    return str(src or "").lower() == "wifi_est"
+
+
+def has_jump(flags: Optional[int]) -> bool:
+    return bool(int(flags or 0) & FLAG_JUMP)
+
+
+def source_of(kind: Optional[str], src: Optional[str]) -> str:
+    """Источник для UI: явный src, иначе по kind (est -> wifi_est)."""
+    if src:
+        return str(src)
+    if kind == "est":
+        return "wifi_est"
+    return str(kind) if kind else "app"
+
@@ -0,0 +1,297 @@
+"""Обработка трека смены на NumPy: расстояния, стоянки, упрощение, скачки.
+
+Раньше `_compute_stops` (app/duty/routes.py) шёл по точкам питоновским
+циклом с поточечным haversine, а SVG-снимок и ``/api/duty/admin/tracking``
+отдавали все точки сессии — за смену с интервалом 1–5 с это десятки тысяч
+вершин в полилинии. Здесь:
+
+- `haversine_m` — векторизованное расстояние (broadcast по массивам);
+- `jump_mask` — отбрасывание одиночных выбросов («туда и обратно» быстрее
+  ``max_speed_mps``) и точек с флагом FLAG_JUMP;
+- `find_stops` — та же семантика «пока рядом с якорем», что у прежнего
+  `_compute_stops`, но якоря, где стоянки заведомо нет, отсеиваются
+  векторно, а расстояния до якоря считаются блоками;
+- `douglas_peucker` / `visvalingam` — упрощение в локальной
+  равнопромежуточной проекции (метры), допуск по зуму — `tolerance_for_zoom`.
+
+Все функции работают с индексами, чтобы вызывающий мог вернуть исходные
+строки (TrackingPoint.to_dict()) только для оставленных вершин.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .point_fields import FLAG_JUMP
+
+
+EARTH_RADIUS_M = 6371000.0
+# метров на пиксель на экваторе при zoom=0 (тайлы 256 px, Web Mercator)
+_MPP_Z0 = 156543.03392
+
+METHODS = ("dp", "vw")
+DEFAULT_ZOOM = 16
+DEFAULT_MAX_SPEED_MPS = 70.0  # ~250 км/ч — быстрее по земле патруль не ездит
+
+
+def haversine_m(lat1: Any, lon1: Any, lat2: Any, lon2: Any) -> np.ndarray:
+    """Расстояние по большому кругу в метрах; аргументы — числа или массивы (broadcast).
+
+    NaN в координатах даёт NaN (сравнение ``<= radius`` тогда ложно).
+    """
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lon2) - np.asarray(lon1))
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _naive_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    if ts is not None and ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+class Track:
+    """Колонки трека массивами NumPy.
+
+    ``t_us`` — микросекунды от первой точки (int64, без потерь точности
+    timestamp'а), ``index`` — позиции в исходном списке точек.
+    """
+
+    __slots__ = ("lat", "lon", "t_us", "flags", "index")
+
+    def __init__(self, lat, lon, t_us, flags, index) -> None:
+        self.lat = lat
+        self.lon = lon
+        self.t_us = t_us
+        self.flags = flags
+        self.index = index
+
+    @classmethod
+    def from_points(cls, points: Sequence[Any]) -> "Track":
+        """Из объектов с атрибутами lat/lon/ts/flags (TrackingPoint)."""
+        n = len(points)
+        lat = np.array([np.nan if p.lat is None else p.lat for p in points], dtype=np.float64)
+        lon = np.array([np.nan if p.lon is None else p.lon for p in points], dtype=np.float64)
+        ts = np.array([_naive_utc(p.ts) for p in points], dtype="datetime64[us]")
+        t_us = (ts - ts[0]).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+        flags = np.array([int(getattr(p, "flags", 0) or 0) for p in points], dtype=np.int64)
+        return cls(lat, lon, t_us, flags, np.arange(n))
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def subset(self, mask: np.ndarray) -> "Track":
+        return Track(self.lat[mask], self.lon[mask], self.t_us[mask], self.flags[mask], self.index[mask])
+
+
+def jump_mask(track: Track, max_speed_mps: float = DEFAULT_MAX_SPEED_MPS) -> np.ndarray:
+    """Булева маска точек, которые оставляем.
+
+    Выброшены точки с FLAG_JUMP и одиночные выбросы: вход в точку и выход из
+    неё быстрее max_speed_mps, а перелёт «через» неё — нет. Продолжительное
+    быстрое движение (обе скорости высокие и перелёт тоже) не трогаем.
+    """
+    keep = (track.flags & FLAG_JUMP) == 0
+    n = len(track)
+    if n < 3 or not max_speed_mps or max_speed_mps <= 0:
+        return keep
+    lat, lon = track.lat, track.lon
+    dt = np.maximum(np.diff(track.t_us) / 1e6, 1.0)  # не делим на 0 при одинаковом ts
+    speed = haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:]) / dt
+    skip_dt = np.maximum((track.t_us[2:] - track.t_us[:-2]) / 1e6, 1.0)
+    skip_speed = haversine_m(lat[:-2], lon[:-2], lat[2:], lon[2:]) / skip_dt
+    spike = (speed[:-1] > max_speed_mps) & (speed[1:] > max_speed_mps) & (skip_speed <= max_speed_mps)
+    keep[1:-1] &= ~spike
+    return keep
+
+
+def _run_end(track: Track, i: int, radius_m: float) -> int:
+    """Первый индекс после i, дальше radius_m от точки i (или len(track))."""
+    n = len(track)
+    k, block = i + 1, 64
+    lat0, lon0 = track.lat[i], track.lon[i]
+    while k < n:
+        e = min(n, k + block)
+        far = ~(haversine_m(lat0, lon0, track.lat[k:e], track.lon[k:e]) <= radius_m)
+        if far.any():
+            return k + int(far.argmax())
+        k, block = e, block * 2
+    return n
+
+
+def find_stops(track: Track, radius_m: float = 10.0, min_sec: float = 60) -> List[Tuple[int, int]]:
+    """Стоянки как полуинтервалы [start, end) по позициям в track.
+
+    Якорь — точка i; стоянка — подряд идущие точки не дальше radius_m от
+    якоря, не меньше двух и длительностью >= min_sec. После стоянки
+    следующий якорь — первая точка за ней, иначе — i + 1.
+    Точки должны быть упорядочены по ts.
+    """
+    n = len(track)
+    stops: List[Tuple[int, int]] = []
+    if n < 2:
+        return stops
+    min_us = min_sec * 1_000_000
+    # Необходимое условие стоянки у якоря i: первая точка k с t[k] >= t[i] + min_sec
+    # существует и лежит в радиусе (она обязана войти в окно). Остальные якоря
+    # (движение, даже пешком) обходим без поточечного цикла.
+    k = np.searchsorted(track.t_us, track.t_us[:-1] + min_us)
+    inside = k < n
+    anchors = np.flatnonzero(inside)
+    k = np.maximum(k[anchors], anchors + 1)
+    near = haversine_m(track.lat[anchors], track.lon[anchors], track.lat[k], track.lon[k]) <= radius_m
+    step = haversine_m(track.lat[anchors], track.lon[anchors], track.lat[anchors + 1], track.lon[anchors + 1])
+    anchors = anchors[near & (step <= radius_m)]
+    i = 0
+    while i < n - 1:
+        pos = int(np.searchsorted(anchors, i))
+        if pos >= len(anchors):
+            break
+        i = int(anchors[pos])
+        j = _run_end(track, i, radius_m)
+        if track.t_us[j - 1] - track.t_us[i] >= min_us:
+            stops.append((i, j))
+            i = j
+            continue
+        i += 1
+    return stops
+
+
+def _local_xy(lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # равнопромежуточная проекция вокруг средней широты: на масштабе трека смены
+    # ошибка пренебрежимо мала, зато расстояния до отрезка — обычная евклидова геометрия
+    lat0 = float(np.nanmean(lat))
+    k = math.radians(1.0) * EARTH_RADIUS_M
+    return (lon - lon[0]) * k * math.cos(math.radians(lat0)), (lat - lat[0]) * k
+
+
+def _segment_dist(px, py, ax, ay, bx, by) -> np.ndarray:
+    dx, dy = bx - ax, by - ay
+    seg2 = dx * dx + dy * dy
+    if seg2 == 0:
+        return np.hypot(px - ax, py - ay)
+    u = np.clip(((px - ax) * dx + (py - ay) * dy) / seg2, 0.0, 1.0)
+    return np.hypot(px - (ax + u * dx), py - (ay + u * dy))
+
+
+def douglas_peucker(lat: np.ndarray, lon: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Индексы вершин, оставленных Дугласом–Пекером (допуск — метры до отрезка)."""
+    n = len(lat)
+    if n < 3 or tolerance_m <= 0:
+        return np.arange(n)
+    x, y = _local_xy(lat, lon)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        s, e = stack.pop()
+        if e - s < 2:
+            continue
+        d = _segment_dist(x[s + 1:e], y[s + 1:e], x[s], y[s], x[e], y[e])
+        k = int(d.argmax())
+        if d[k] > tolerance_m:
+            m = s + 1 + k
+            keep[m] = True
+            stack.append((s, m))
+            stack.append((m, e))
+    return np.flatnonzero(keep)
+
+
+def _triangle_areas(x, y, a, b, c) -> np.ndarray:
+    return 0.5 * np.abs((x[b] - x[a]) * (y[c] - y[a]) - (x[c] - x[a]) * (y[b] - y[a]))
+
+
+def visvalingam(lat: np.ndarray, lon: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Индексы вершин после Висвалингама–Уайетта.
+
+    Удаляем вершины с эффективной площадью треугольника < tolerance_m²
+    (тот же порядок допуска, что у Дугласа–Пекера, но сглаживает мелкий
+    «шум» равномернее).
+    """
+    n = len(lat)
+    if n < 3 or tolerance_m <= 0:
+        return np.arange(n)
+    x, y = _local_xy(lat, lon)
+    threshold = float(tolerance_m) ** 2
+    mid = np.arange(1, n - 1)
+    area = np.full(n, np.inf)
+    area[1:-1] = _triangle_areas(x, y, mid - 1, mid, mid + 1)
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    removed = np.zeros(n, dtype=bool)
+    heap = [(float(area[i]), i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+    while heap:
+        a, i = heapq.heappop(heap)
+        if removed[i] or a != area[i]:
+            continue  # устаревшая запись кучи
+        if a >= threshold:
+            break
+        removed[i] = True
+        p, q = prev[i], nxt[i]
+        nxt[p], prev[q] = q, p
+        for nb in (p, q):
+            if 0 < nb < n - 1:
+                # эффективная площадь не меньше только что удалённой
+                new = max(float(_triangle_areas(x, y, prev[nb], nb, nxt[nb])), a)
+                area[nb] = new
+                heapq.heappush(heap, (new, nb))
+    return np.flatnonzero(~removed)
+
+
+def tolerance_for_zoom(zoom: float, lat: float = 0.0, px: float = 1.0) -> float:
+    """Допуск упрощения в метрах: px экранных пикселей на zoom (Web Mercator)."""
+    zoom = min(max(float(zoom), 0.0), 22.0)
+    return px * _MPP_Z0 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def simplify(track: Track, tolerance_m: float, method: str = "dp") -> np.ndarray:
+    """Позиции (в track) вершин упрощённой линии; точки без координат пропускаются."""
+    valid = np.flatnonzero(~(np.isnan(track.lat) | np.isnan(track.lon)))
+    if method == "vw":
+        kept = visvalingam(track.lat[valid], track.lon[valid], tolerance_m)
+    else:
+        kept = douglas_peucker(track.lat[valid], track.lon[valid], tolerance_m)
+    return valid[kept]
+
+
+def simplify_points(
+    points: Sequence[Any],
+    *,
+    zoom: Optional[float] = None,
+    tolerance_m: Optional[float] = None,
+    method: str = "dp",
+    max_speed_mps: float = DEFAULT_MAX_SPEED_MPS,
+) -> Tuple[np.ndarray, dict]:
+    """Индексы points для отрисовки трека и сводка (для ответа API).
+
+    Сначала отбрасываются скачки (`jump_mask`), затем линия упрощается с
+    допуском tolerance_m или, если он не задан, 1 px на zoom.
+    """
+    method = method if method in METHODS else "dp"
+    track = Track.from_points(points)
+    if not len(track):
+        return np.zeros(0, dtype=np.int64), {"method": method, "tolerance_m": 0.0, "total": 0, "kept": 0, "jumps_dropped": 0}
+    keep = jump_mask(track, max_speed_mps)
+    clean = track.subset(keep)
+    if tolerance_m is None:
+        lat0 = float(np.nanmean(clean.lat)) if len(clean) and not np.isnan(clean.lat).all() else 0.0
+        tolerance_m = tolerance_for_zoom(DEFAULT_ZOOM if zoom is None else zoom, lat0)
+    idx = clean.index[simplify(clean, tolerance_m, method)]
+    info = {
+        "method": method,
+        "zoom": zoom,
+        "tolerance_m": round(float(tolerance_m), 3),
+        "total": len(track),
+        "kept": int(len(idx)),
+        "jumps_dropped": int(len(track) - int(keep.sum())),
+    }
+    return idx, info